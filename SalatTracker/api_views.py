@@ -13,19 +13,84 @@ from .models import PrayerTime, DailyPrayer
 from rest_framework.decorators import action
 from django.utils import timezone
 from rest_framework.permissions import IsAuthenticated
+from django.utils.decorators import method_decorator
+from .conditional import dashboard_condition, prayer_day_condition
+from .dashboard_snapshot import get_dashboard_snapshot, prayer_clock
+from .prayer_archive import archive_cutoff, archived_daily_prayer, has_archives
+from .calendar_export import (
+    iter_calendar_days, stream_ics, stream_json, stream_jsonl,
+    CONTENT_TYPES as CALENDAR_CONTENT_TYPES, MAX_RANGE_DAYS
+)
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+
+
+class DailyPrayerPagination(PageNumberPagination):
+    page_size = 31
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_RANGE_DAYS
+
+
+def _archived_day(user_id, prayer_date):
+    """A day missing from the hot tables, from the prayer archive (prayer_archive.py)"""
+    try:
+        day = datetime.strptime(str(prayer_date), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    return archived_daily_prayer(int(user_id), day)
 
 
 class DailyPrayerViewSet(viewsets.ModelViewSet):
     queryset = DailyPrayer.objects.all()
     serializer_class = DailyPrayerSerializer
+    pagination_class = DailyPrayerPagination
+
+    def get_queryset(self):
+        """
+        Optional ?user=, ?from= and ?to= (YYYY-MM-DD) filters over prayer_date.
+        Lists the hot table only: a ?from= reaching into archived months is
+        rejected, /api/prayer-calendar/ and the per-day endpoints read archives.
+        """
+        queryset = DailyPrayer.objects.prefetch_related('prayer_times').order_by('prayer_date', 'id')
+        params = self.request.query_params
+
+        if params.get('user'):
+            try:
+                queryset = queryset.filter(user_id=int(params['user']))
+            except ValueError:
+                raise ValidationError({"error": "Invalid user", "message": "user must be a user id"})
+
+        try:
+            from_date = datetime.strptime(params['from'], '%Y-%m-%d').date() if params.get('from') else None
+            to_date = datetime.strptime(params['to'], '%Y-%m-%d').date() if params.get('to') else None
+        except ValueError:
+            raise ValidationError({"error": "Invalid date format", "message": "Use YYYY-MM-DD format"})
+
+        if from_date:
+            cutoff = archive_cutoff()
+            if from_date < cutoff and has_archives(from_date, min(to_date or cutoff, cutoff - timedelta(days=1))):
+                raise ValidationError({
+                    "error": "Archived range",
+                    "message": f"Days before {cutoff} are archived, use /api/prayer-calendar/ for them"
+                })
+            queryset = queryset.filter(prayer_date__gte=from_date)
+        if to_date:
+            queryset = queryset.filter(prayer_date__lte=to_date)
+
+        return queryset
 
     @action(detail=False, methods=['GET'])
+    @method_decorator(prayer_day_condition)
     def get_daily_prayer_for_user_and_day(self, request, user_id, prayer_date):
         try:
             daily_prayer = DailyPrayer.objects.get(user=user_id, prayer_date=prayer_date)
             serializer = DailyPrayerSerializer(daily_prayer)
             return Response(serializer.data)
         except DailyPrayer.DoesNotExist:
+            archived = _archived_day(user_id, prayer_date)
+            if archived:
+                return Response(archived)
             return Response("Daily prayer not found for the given user and date", status=404)
 
 
@@ -34,6 +99,7 @@ class PrayerTimeViewSet(viewsets.ModelViewSet):
     serializer_class = PrayerTimeSerializer
 
     @action(detail=False, methods=['GET'])
+    @method_decorator(prayer_day_condition)
     def get_prayer_times_for_user_and_day(self, request, user_id, prayer_date):
         try:
             daily_prayer = DailyPrayer.objects.get(user=user_id, prayer_date=prayer_date)
@@ -42,6 +108,9 @@ class PrayerTimeViewSet(viewsets.ModelViewSet):
             serializer = PrayerTimeSerializer(prayer_times, many=True)
             return Response(serializer.data)
         except DailyPrayer.DoesNotExist:
+            archived = _archived_day(user_id, prayer_date)
+            if archived:
+                return Response(archived['prayer_times'])
             return Response({"error": "Prayer times not found for the given user and date"}, status=404)
 
 
@@ -61,6 +130,60 @@ class PrayerTimeFetch(APIView):
             return Response({"error": "User not found"}, status=404)
 
 
+class PrayerCalendarView(APIView):
+    """
+    Prayer times for a date range (up to a year) from a single range query.
+    Query params: from, to (YYYY-MM-DD, default today and a week on) and
+    output: jsonl (default, one day per line), json or ics (iCalendar export).
+    The response is streamed day by day.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+
+        try:
+            from_param = request.query_params.get('from')
+            start_date = datetime.strptime(from_param, '%Y-%m-%d').date() if from_param else date.today()
+            to_param = request.query_params.get('to')
+            end_date = datetime.strptime(to_param, '%Y-%m-%d').date() if to_param else start_date + timedelta(days=6)
+        except ValueError:
+            return Response({
+                "error": "Invalid date format",
+                "message": "Use YYYY-MM-DD format",
+                "example": "?from=2024-03-01&to=2024-03-31"
+            }, status=400)
+
+        if end_date < start_date:
+            return Response({"error": "Invalid date range", "message": "'to' must not be before 'from'"}, status=400)
+
+        if (end_date - start_date).days + 1 > MAX_RANGE_DAYS:
+            return Response({
+                "error": "Date range too large",
+                "message": f"At most {MAX_RANGE_DAYS} days per request"
+            }, status=400)
+
+        output = request.query_params.get('output', 'jsonl')
+        if output not in CALENDAR_CONTENT_TYPES:
+            return Response({
+                "error": "Invalid output",
+                "message": f"Use one of: {', '.join(CALENDAR_CONTENT_TYPES)}"
+            }, status=400)
+
+        days = iter_calendar_days(user, start_date, end_date)
+        if output == 'ics':
+            stream = stream_ics(days, user)
+        elif output == 'json':
+            stream = stream_json(days, start_date, end_date)
+        else:
+            stream = stream_jsonl(days)
+
+        response = StreamingHttpResponse(stream, content_type=CALENDAR_CONTENT_TYPES[output])
+        if output == 'ics':
+            response['Content-Disposition'] = f'attachment; filename="prayer-times-{start_date}-{end_date}.ics"'
+        return response
+
+
 class DashboardAPIView(APIView):
     """
     API endpoint that returns dashboard information with structure matching FastDashboardView:
@@ -71,9 +194,11 @@ class DashboardAPIView(APIView):
     - Timestamp and metadata
 
     Falls back to most recent prayer times if today's aren't available.
+    Served from the precomputed dashboard snapshot (see dashboard_snapshot.py).
     """
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(dashboard_condition)
     def get(self, request):
         user = request.user
         target_date = self._get_target_date(request)
@@ -90,15 +215,17 @@ class DashboardAPIView(APIView):
             'country': user.country
         }
 
+        # Everything but the clock comes from the precomputed snapshot
+        snapshot = get_dashboard_snapshot(user, target_date)
+
         # Get subscription info
-        current_plan = SubscriptionService.get_user_plan(user)
-        subscription_info = self._get_subscription_info(user, current_plan)
+        subscription_info = self._get_subscription_info(snapshot)
 
         # Get user preferences
-        preferences_info = self._get_preferences_info(user)
+        preferences_info = self._get_preferences_info(snapshot)
 
         # Get prayer data
-        prayer_data = self._get_prayer_data(user, target_date)
+        prayer_data = self._get_prayer_data(snapshot, target_date)
 
         # Build response matching FastDashboard structure
         response = {
@@ -122,218 +249,168 @@ class DashboardAPIView(APIView):
                 pass
         return date.today()
 
-    def _get_subscription_info(self, user, current_plan):
+    def _get_subscription_info(self, snapshot):
         """Get subscription information"""
-        try:
-            subscription = user.subscription
-            return {
-                'plan_name': current_plan.name,
-                'plan_type': current_plan.plan_type,
-                'price': float(current_plan.price),
-                'status': subscription.status,
-                'is_trial': subscription.is_trial,
-                'days_remaining': subscription.days_remaining,
-                'end_date': subscription.end_date.strftime('%b %d, %Y') if subscription.end_date else None,
-                'notifications_sent_today': subscription.notifications_sent_today,
-                'max_notifications_per_day': current_plan.max_notifications_per_day,
-                'features': current_plan.features_list
-            }
-        except:
-            # User has no subscription (basic plan)
+        current_plan = snapshot['current_plan'] or {}
+        plan_info = {
+            'plan_name': current_plan.get('name'),
+            'plan_type': current_plan.get('plan_type'),
+            'price': current_plan.get('price'),
+        }
+        subscription = snapshot['subscription']
+
+        if subscription:
             return {
-                'plan_name': current_plan.name,
-                'plan_type': current_plan.plan_type,
-                'price': float(current_plan.price),
-                'status': 'basic',
-                'is_trial': False,
-                'days_remaining': None,
-                'end_date': None,
-                'notifications_sent_today': 0,
-                'max_notifications_per_day': current_plan.max_notifications_per_day,
-                'features': current_plan.features_list
+                **plan_info,
+                'status': subscription['status'],
+                'is_trial': subscription['is_trial'],
+                'days_remaining': subscription['days_remaining'],
+                'end_date': subscription['end_date'],
+                'notifications_sent_today': subscription['notifications_sent_today'],
+                'max_notifications_per_day': current_plan.get('max_notifications_per_day'),
+                'features': current_plan.get('features')
             }
 
-    def _get_preferences_info(self, user):
+        # User has no subscription (basic plan)
+        return {
+            **plan_info,
+            'status': 'basic',
+            'is_trial': False,
+            'days_remaining': None,
+            'end_date': None,
+            'notifications_sent_today': 0,
+            'max_notifications_per_day': current_plan.get('max_notifications_per_day'),
+            'features': current_plan.get('features')
+        }
+
+    def _get_preferences_info(self, snapshot):
         """Get user preferences information"""
-        try:
-            preferences = user.preferences
+        preferences = snapshot['preferences']
+        if preferences:
             return {
                 'daily_summary': {
-                    'enabled': preferences.daily_prayer_summary_enabled,
-                    'method': preferences.daily_prayer_summary_message_method
+                    'enabled': preferences['daily_prayer_summary_enabled'],
+                    'method': preferences['daily_prayer_summary_message_method']
                 },
                 'pre_adhan_reminders': {
-                    'enabled': preferences.notification_before_prayer_enabled,
-                    'method': preferences.notification_before_prayer,
-                    'timing_minutes': preferences.notification_time_before_prayer
+                    'enabled': preferences['notification_before_prayer_enabled'],
+                    'method': preferences['notification_before_prayer'],
+                    'timing_minutes': preferences['notification_time_before_prayer']
                 },
                 'adhan_calls': {
-                    'enabled': preferences.adhan_call_enabled,
-                    'method': preferences.adhan_call_method
+                    'enabled': preferences['adhan_call_enabled'],
+                    'method': preferences['adhan_call_method']
                 }
             }
-        except UserPreferences.DoesNotExist:
-            # Return defaults if no preferences
-            return {
-                'daily_summary': {
-                    'enabled': True,
-                    'method': 'email'
-                },
-                'pre_adhan_reminders': {
-                    'enabled': True,
-                    'method': 'email',
-                    'timing_minutes': 15
-                },
-                'adhan_calls': {
-                    'enabled': True,
-                    'method': 'email'
-                }
+
+        # Return defaults if no preferences
+        return {
+            'daily_summary': {
+                'enabled': True,
+                'method': 'email'
+            },
+            'pre_adhan_reminders': {
+                'enabled': True,
+                'method': 'email',
+                'timing_minutes': 15
+            },
+            'adhan_calls': {
+                'enabled': True,
+                'method': 'email'
             }
+        }
 
-    def _get_prayer_data(self, user, target_date):
+    def _get_prayer_data(self, snapshot, target_date):
         """
         Get prayer data with availability status (matching FastDashboard structure)
         """
-        try:
-            # Try to get prayer times for target date
-            daily_prayer = DailyPrayer.objects.filter(
-                user=user,
-                prayer_date=target_date
-            ).prefetch_related('prayer_times').first()
-
-            if daily_prayer and daily_prayer.prayer_times.exists():
-                # Prayer times available
-                prayer_times = list(daily_prayer.prayer_times.all().order_by('prayer_time'))
-
-                # Format prayers
-                prayers = []
-                current_time = timezone.now().time()
-                is_today = target_date == date.today()
-
-                for pt in prayer_times:
-                    is_past = pt.prayer_time < current_time if is_today else False
-
-                    prayer_info = {
-                        'id': pt.id,
-                        'name': pt.prayer_name,
-                        'time': pt.prayer_time.strftime('%I:%M %p'),
-                        'time_24h': pt.prayer_time.strftime('%H:%M'),
-                        'is_past': is_past,
-                        'minutes_until': self._calculate_minutes_until(pt.prayer_time) if not is_past and is_today else None
-                    }
-                    prayers.append(prayer_info)
-
-                # Find next prayer
-                next_prayer = None
-                remaining_count = 0
-
-                if is_today:
-                    for prayer in prayers:
-                        if not prayer['is_past']:
-                            if next_prayer is None:
-                                next_prayer = {
-                                    'name': prayer['name'],
-                                    'time': prayer['time'],
-                                    'time_24h': prayer['time_24h'],
-                                    'minutes_remaining': prayer['minutes_until']
-                                }
-                            remaining_count += 1
-
-                return {
-                    'available': True,
-                    'date': target_date.strftime('%Y-%m-%d'),
-                    'weekday': daily_prayer.weekday_name,
-                    'fetch_needed': False,
-                    'daily_prayer_id': daily_prayer.id,
-                    'prayer_count': len(prayers),
-                    'prayers': prayers,
-                    'next_prayer': next_prayer,
-                    'remaining_count': remaining_count
+        daily_prayer = snapshot['daily_prayer']
+
+        if daily_prayer and daily_prayer['prayers']:
+            # Prayer times available
+            is_today = target_date == date.today()
+            prayers, next_prayer, remaining_count = prayer_clock(daily_prayer['prayers'], is_today)
+
+            if next_prayer:
+                next_prayer = {
+                    'name': next_prayer['name'],
+                    'time': next_prayer['time_12h'],
+                    'time_24h': next_prayer['time_24h'],
+                    'minutes_remaining': next_prayer['minutes_remaining']
                 }
 
-            elif daily_prayer:
-                # DailyPrayer exists but no prayer times
-                return {
-                    'available': False,
-                    'date': target_date.strftime('%Y-%m-%d'),
-                    'weekday': daily_prayer.weekday_name,
-                    'fetch_needed': True,
-                    'daily_prayer_id': daily_prayer.id,
-                    'prayer_count': 0,
-                    'message': 'Prayer times not available for this date'
-                }
-            else:
-                # Try fallback to most recent data
-                fallback_prayer = DailyPrayer.objects.filter(
-                    user=user
-                ).prefetch_related('prayer_times').order_by('-prayer_date').first()
-
-                if fallback_prayer and fallback_prayer.prayer_times.exists():
-                    prayer_times = list(fallback_prayer.prayer_times.all().order_by('prayer_time'))
-
-                    prayers = []
-                    for pt in prayer_times:
-                        prayers.append({
-                            'id': pt.id,
-                            'name': pt.prayer_name,
-                            'time': pt.prayer_time.strftime('%I:%M %p'),
-                            'time_24h': pt.prayer_time.strftime('%H:%M'),
-                            'is_past': True,  # All historical prayers are "past"
-                            'minutes_until': None
-                        })
-
-                    return {
-                        'available': True,
-                        'date': fallback_prayer.prayer_date.strftime('%Y-%m-%d'),
-                        'weekday': fallback_prayer.weekday_name,
-                        'fetch_needed': True,
-                        'is_fallback': True,
-                        'requested_date': target_date.strftime('%Y-%m-%d'),
-                        'fallback_message': f'Showing prayer times from {fallback_prayer.prayer_date.strftime("%B %d, %Y")} (most recent available)',
-                        'daily_prayer_id': fallback_prayer.id,
-                        'prayer_count': len(prayers),
-                        'prayers': prayers,
-                        'next_prayer': None,
-                        'remaining_count': 0
-                    }
-                else:
-                    # No data at all
-                    return {
-                        'available': False,
-                        'date': target_date.strftime('%Y-%m-%d'),
-                        'weekday': None,
-                        'fetch_needed': True,
-                        'daily_prayer_id': None,
-                        'prayer_count': 0,
-                        'message': 'No prayer times have been generated yet. Please fetch prayer times first.',
-                        'error': 'No prayer data available'
-                    }
-
-        except Exception as e:
+            return {
+                'available': True,
+                'date': target_date.strftime('%Y-%m-%d'),
+                'weekday': daily_prayer['weekday'],
+                'fetch_needed': False,
+                'daily_prayer_id': daily_prayer['id'],
+                'prayer_count': len(prayers),
+                'prayers': [self._format_prayer(prayer) for prayer in prayers],
+                'next_prayer': next_prayer,
+                'remaining_count': remaining_count
+            }
+
+        elif daily_prayer:
+            # DailyPrayer exists but no prayer times
             return {
                 'available': False,
                 'date': target_date.strftime('%Y-%m-%d'),
+                'weekday': daily_prayer['weekday'],
                 'fetch_needed': True,
-                'error': str(e),
-                'message': 'An error occurred while fetching prayer data'
+                'daily_prayer_id': daily_prayer['id'],
+                'prayer_count': 0,
+                'message': 'Prayer times not available for this date'
             }
 
-    def _calculate_minutes_until(self, prayer_time):
-        """Calculate minutes until a prayer time"""
-        now = timezone.now()
-        today = now.date()
+        # Try fallback to most recent data
+        fallback_prayer = snapshot['fallback']
 
-        # Combine today's date with prayer time
-        prayer_datetime = timezone.make_aware(
-            datetime.combine(today, prayer_time)
-        )
+        if fallback_prayer and fallback_prayer['prayers']:
+            # All historical prayers are "past"
+            prayers = [
+                dict(self._format_prayer(prayer), is_past=True, minutes_until=None)
+                for prayer in fallback_prayer['prayers']
+            ]
+            fallback_date = datetime.strptime(fallback_prayer['date'], '%Y-%m-%d')
 
-        # Calculate difference
-        time_diff = prayer_datetime - now
+            return {
+                'available': True,
+                'date': fallback_prayer['date'],
+                'weekday': fallback_prayer['weekday'],
+                'fetch_needed': True,
+                'is_fallback': True,
+                'requested_date': target_date.strftime('%Y-%m-%d'),
+                'fallback_message': f'Showing prayer times from {fallback_date.strftime("%B %d, %Y")} (most recent available)',
+                'daily_prayer_id': fallback_prayer['id'],
+                'prayer_count': len(prayers),
+                'prayers': prayers,
+                'next_prayer': None,
+                'remaining_count': 0
+            }
 
-        # Return minutes (can be negative if prayer already passed)
-        minutes = int(time_diff.total_seconds() / 60)
-        return minutes if minutes > 0 else 0
+        # No data at all
+        return {
+            'available': False,
+            'date': target_date.strftime('%Y-%m-%d'),
+            'weekday': None,
+            'fetch_needed': True,
+            'daily_prayer_id': None,
+            'prayer_count': 0,
+            'message': 'No prayer times have been generated yet. Please fetch prayer times first.',
+            'error': 'No prayer data available'
+        }
+
+    def _format_prayer(self, prayer):
+        """Format a snapshot prayer for the response"""
+        return {
+            'id': prayer['id'],
+            'name': prayer['name'],
+            'time': prayer['time_12h'],
+            'time_24h': prayer['time_24h'],
+            'is_past': prayer.get('is_past', False),
+            'minutes_until': prayer.get('minutes_remaining')
+        }
 
 
 
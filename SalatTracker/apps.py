@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SalattrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'SalatTracker'
+
+    def ready(self):
+        """Import signals so dashboard snapshots are invalidated on changes"""
+        import SalatTracker.signals
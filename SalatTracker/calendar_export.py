@@ -0,0 +1,123 @@
+# SalatTracker/calendar_export.py - Multi-day prayer calendar, streamed
+
+"""
+Serves a user's prayer times for a date range from a single range query over
+(user, prayer_date), which the DailyPrayer unique_together index covers. Rows
+are read with an iterator and written out day by day, so a year of timings is
+never held in memory as one list. Days in archived months are read from the
+archive files (prayer_archive.py) and merged in by date.
+"""
+
+import heapq
+import json
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from django.utils import timezone
+
+from muadhin.timezones import UTC, localize
+
+from .models import PrayerTime
+from .prayer_archive import has_archives, iter_archived_days
+
+MAX_RANGE_DAYS = 366
+ITERATOR_CHUNK_SIZE = 500
+
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'json': 'application/json',
+    'ics': 'text/calendar; charset=utf-8',
+}
+
+
+def iter_calendar_days(user, start_date, end_date):
+    """Yield one dict per day: {'date', 'weekday', 'prayers': [{'name', 'time'}]}"""
+    days = _iter_stored_days(user, start_date, end_date)
+    if not has_archives(start_date, end_date):
+        yield from days
+        return
+
+    previous = None
+    merged = heapq.merge(days, iter_archived_days(user.id, start_date, end_date), key=lambda day: day['date'])
+    for day in merged:
+        # A day both stored and archived (fetched again later) is served from the table
+        if day['date'] != previous:
+            yield day
+        previous = day['date']
+
+
+def _iter_stored_days(user, start_date, end_date):
+    rows = PrayerTime.objects.filter(
+        daily_prayer__user=user,
+        daily_prayer__prayer_date__range=(start_date, end_date),
+        prayer_time__isnull=False,
+    ).order_by(
+        'daily_prayer__prayer_date', 'prayer_time'
+    ).values_list(
+        'daily_prayer__prayer_date', 'daily_prayer__weekday_name', 'prayer_name', 'prayer_time'
+    ).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+    for (prayer_date, weekday), day_rows in groupby(rows, key=lambda row: (row[0], row[1])):
+        yield {
+            'date': prayer_date.strftime('%Y-%m-%d'),
+            'weekday': weekday,
+            'prayers': [
+                {'name': prayer_name, 'time': prayer_time.strftime('%H:%M')}
+                for _, _, prayer_name, prayer_time in day_rows
+            ],
+        }
+
+
+def stream_jsonl(days):
+    """JSON lines, one day per line"""
+    for day in days:
+        yield json.dumps(day) + '\n'
+
+
+def stream_json(days, start_date, end_date):
+    """A single JSON document written out in chunks"""
+    yield '{"from": "%s", "to": "%s", "days": [' % (start_date, end_date)
+    for i, day in enumerate(days):
+        yield (',' if i else '') + json.dumps(day)
+    yield ']}\n'
+
+
+def _ics_escape(text):
+    return str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def stream_ics(days, user, event_minutes=15):
+    """
+    iCalendar (RFC 5545) with one event per prayer. Times are written in UTC
+    (no VTIMEZONE needed), converted from the user's local prayer times.
+    """
+    tz_name = user.timezone or 'UTC'
+    stamp = timezone.now().strftime('%Y%m%dT%H%M%SZ')
+
+    yield (
+        'BEGIN:VCALENDAR\r\n'
+        'VERSION:2.0\r\n'
+        'PRODID:-//Muadhin//Prayer Times//EN\r\n'
+        'CALSCALE:GREGORIAN\r\n'
+        f'X-WR-CALNAME:{_ics_escape("Prayer Times")}\r\n'
+        f'X-WR-TIMEZONE:{tz_name}\r\n'
+    )
+
+    for day in days:
+        lines = []
+        for prayer in day['prayers']:
+            local = datetime.strptime(f"{day['date']} {prayer['time']}", '%Y-%m-%d %H:%M')
+            start = localize(local, tz_name).astimezone(UTC)
+            end = start + timedelta(minutes=event_minutes)
+            lines.append(
+                'BEGIN:VEVENT\r\n'
+                f"UID:{user.id}-{day['date']}-{prayer['name'].lower()}@muadhin\r\n"
+                f'DTSTAMP:{stamp}\r\n'
+                f"DTSTART:{start.strftime('%Y%m%dT%H%M%SZ')}\r\n"
+                f"DTEND:{end.strftime('%Y%m%dT%H%M%SZ')}\r\n"
+                f"SUMMARY:{_ics_escape(prayer['name'])}\r\n"
+                'END:VEVENT\r\n'
+            )
+        yield ''.join(lines)
+
+    yield 'END:VCALENDAR\r\n'
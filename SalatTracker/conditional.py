@@ -0,0 +1,138 @@
+# SalatTracker/conditional.py - ETag / Last-Modified for prayer and dashboard endpoints
+
+"""
+Clients poll the dashboard and prayer-time endpoints every few minutes while
+the timetable only changes once a day. These functions compute a version stamp
+for a resource without building its payload, for use with Django's
+``condition`` decorator, so unchanged data is answered with a 304.
+
+Dashboards use a weak ETag: besides the snapshot it covers which prayers are
+past, but not the per-minute countdown fields.
+"""
+
+import hashlib
+from datetime import datetime, date
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .dashboard_snapshot import get_dashboard_snapshot
+from .models import DailyPrayer
+
+
+def _hash(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _query_date(request):
+    """The ?date=YYYY-MM-DD the dashboard views use, defaulting to today"""
+    date_param = request.GET.get('date')
+    if date_param:
+        try:
+            return datetime.strptime(date_param, '%Y-%m-%d').date()
+        except ValueError:
+            pass
+    return date.today()
+
+
+def _past_count(prayers, target_date):
+    if target_date != date.today():
+        return 0
+    now = timezone.now().strftime('%H:%M:%S')
+    return sum(1 for prayer in prayers if f"{prayer['time_24h']}:00" < now)
+
+
+def dashboard_etag(request, *args, **kwargs):
+    """Weak ETag for a user's dashboard, from the cached snapshot"""
+    user = request.user
+    if not user.is_authenticated:
+        return None
+
+    target_date = _query_date(request)
+    snapshot = get_dashboard_snapshot(user, target_date)
+    daily_prayer = snapshot['daily_prayer']
+    if not daily_prayer or not daily_prayer['prayers']:
+        # Let the view run, it may need to fetch or fall back
+        return None
+
+    stamp = _hash(
+        user.id, user.username, user.email, user.get_full_name(),
+        user.city, user.country, user.timezone,
+        target_date, snapshot['built_at'], _past_count(daily_prayer['prayers'], target_date),
+    )
+    return f'W/"{stamp}"'
+
+
+def _prayer_day_version(request, user_id, prayer_date, past_before=None):
+    """
+    One aggregate query over the day's rows instead of serializing them.
+    With past_before, also counts prayers before that time (for is_past fields).
+    Memoized on the request, the condition decorator asks for ETag and Last-Modified.
+    """
+    memo_key = (user_id, str(prayer_date), past_before)
+    memo = getattr(request, '_prayer_day_versions', None)
+    if memo is None:
+        memo = request._prayer_day_versions = {}
+    if memo_key in memo:
+        return memo[memo_key]
+
+    annotations = {
+        'last_modified': Max('prayer_times__updated_at'),
+        'prayer_count': Count('prayer_times'),
+    }
+    if past_before is not None:
+        annotations['past_count'] = Count(
+            'prayer_times', filter=Q(prayer_times__prayer_time__lt=past_before)
+        )
+
+    try:
+        version = DailyPrayer.objects.filter(
+            user_id=user_id,
+            prayer_date=prayer_date
+        ).annotate(**annotations).values(
+            'id', 'weekday_name', 'is_email_notified', 'is_sms_notified', *annotations
+        ).first()
+    except (ValueError, ValidationError):
+        # Invalid date, the view reports it
+        version = None
+
+    memo[memo_key] = version
+    return version
+
+
+def prayer_day_etag(request, user_id, prayer_date, *args, **kwargs):
+    """Strong ETag for a user's prayer day (DailyPrayer and its PrayerTimes)"""
+    version = _prayer_day_version(request, user_id, prayer_date)
+    if not version:
+        return None
+    return f'"{_hash(user_id, prayer_date, *version.values())}"'
+
+
+def prayer_day_last_modified(request, user_id, prayer_date, *args, **kwargs):
+    """Last-Modified for a user's prayer times on a day"""
+    version = _prayer_day_version(request, user_id, prayer_date)
+    return version['last_modified'] if version else None
+
+
+def my_prayer_day_etag(request, *args, **kwargs):
+    """Prayer day ETag for the authenticated user and ?date= (today by default)"""
+    user = request.user
+    if not user.is_authenticated:
+        return None
+
+    target_date = _query_date(request)
+    # Today's responses also carry is_past for each prayer
+    past_before = timezone.now().time() if target_date == date.today() else None
+
+    version = _prayer_day_version(request, user.id, target_date, past_before)
+    if not version:
+        return None
+    return f'"{_hash(user.id, target_date, *version.values())}"'
+
+
+# Decorators for the views, apply with method_decorator()
+dashboard_condition = condition(etag_func=dashboard_etag)
+prayer_day_condition = condition(etag_func=prayer_day_etag, last_modified_func=prayer_day_last_modified)
+my_prayer_day_condition = condition(etag_func=my_prayer_day_etag)
@@ -0,0 +1,217 @@
+# SalatTracker/dashboard_snapshot.py - Precomputed per-user daily dashboard data
+
+"""
+The dashboard views all need the same data: the user's plan and subscription,
+preferences and the day's prayer times (or the most recent day as fallback).
+Instead of querying for it on every hit, we build a snapshot per user-day when
+timings are ingested and keep it in the cache. Only the time-dependent parts
+(is_past / minutes remaining) are computed at request time, see prayer_clock().
+
+Snapshots are invalidated by bumping a per-user version whenever preferences,
+subscription, offsets or prayer rows change (SalatTracker/signals.py).
+"""
+
+from datetime import datetime, date
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from subscriptions.models import UserSubscription
+from subscriptions.services.subscription_service import SubscriptionService
+from users.models import UserPreferences
+from .models import DailyPrayer
+
+SNAPSHOT_TIMEOUT = 60 * 60 * 24  # A snapshot is for one day
+VERSION_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def _version_key(user_id):
+    return f"dashboard_snapshot_version_{user_id}"
+
+
+def _snapshot_key(user_id, target_date, version):
+    return f"dashboard_snapshot_{user_id}_{target_date.isoformat()}_v{version}"
+
+
+def _get_version(user_id):
+    return cache.get(_version_key(user_id)) or 0
+
+
+def invalidate_dashboard_snapshot(user_id):
+    """Drop every cached snapshot of a user by moving to a new version"""
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # No version yet (or it expired), start a fresh one
+        cache.set(key, 1, VERSION_TIMEOUT)
+
+
+def invalidate_dashboard_snapshots(user_ids):
+    """
+    invalidate_dashboard_snapshot() for users whose rows were changed by a
+    queryset update() or raw delete, which send no post_save/post_delete
+    """
+    for user_id in set(user_ids) - {None}:
+        invalidate_dashboard_snapshot(user_id)
+
+
+def _plan_info(plan):
+    if plan is None:
+        return None
+    return {
+        'name': plan.name,
+        'plan_type': plan.plan_type,
+        'price': float(plan.price) if plan.price else 0.0,
+        'max_notifications_per_day': plan.max_notifications_per_day,
+        'features': plan.features_list,
+    }
+
+
+def _subscription_info(user):
+    try:
+        current_plan = _plan_info(SubscriptionService.get_user_plan(user))
+    except Exception:
+        current_plan = None
+
+    try:
+        subscription = UserSubscription.objects.select_related('plan').get(user=user)
+    except UserSubscription.DoesNotExist:
+        return current_plan, None
+
+    return current_plan, {
+        'status': subscription.status,
+        'is_trial': subscription.is_trial,
+        'days_remaining': subscription.days_remaining,
+        'end_date': subscription.end_date.strftime('%b %d, %Y') if subscription.end_date else None,
+        'notifications_sent_today': subscription.notifications_sent_today,
+        'plan': _plan_info(subscription.plan),
+    }
+
+
+def _preferences_info(user):
+    try:
+        prefs = UserPreferences.objects.get(user=user)
+    except UserPreferences.DoesNotExist:
+        return None
+    return {
+        'daily_prayer_summary_enabled': prefs.daily_prayer_summary_enabled,
+        'daily_prayer_summary_message_method': prefs.daily_prayer_summary_message_method,
+        'notification_before_prayer_enabled': prefs.notification_before_prayer_enabled,
+        'notification_before_prayer': prefs.notification_before_prayer,
+        'notification_time_before_prayer': prefs.notification_time_before_prayer,
+        'adhan_call_enabled': prefs.adhan_call_enabled,
+        'adhan_call_method': prefs.adhan_call_method,
+    }
+
+
+def _daily_prayer_info(daily_prayer):
+    if daily_prayer is None:
+        return None
+
+    # Sorted in Python so the prefetched rows are used as they are
+    prayer_times = sorted(daily_prayer.prayer_times.all(), key=lambda pt: pt.prayer_time)
+    return {
+        'id': daily_prayer.id,
+        'date': daily_prayer.prayer_date.strftime('%Y-%m-%d'),
+        'weekday': daily_prayer.weekday_name,
+        'is_email_notified': daily_prayer.is_email_notified,
+        'prayers': [
+            {
+                'id': pt.id,
+                'name': pt.prayer_name,
+                'time_24h': pt.prayer_time.strftime('%H:%M'),
+                'time_12h': pt.prayer_time.strftime('%I:%M %p'),
+                'is_sms_notified': pt.is_sms_notified,
+                'is_phonecall_notified': pt.is_phonecall_notified,
+            }
+            for pt in prayer_times
+        ],
+    }
+
+
+def build_dashboard_snapshot(user, target_date=None):
+    """Build a user's dashboard snapshot for a day and store it in the cache"""
+    if target_date is None:
+        target_date = date.today()
+
+    version = _get_version(user.id)
+    current_plan, subscription = _subscription_info(user)
+
+    daily_prayer = DailyPrayer.objects.filter(
+        user=user,
+        prayer_date=target_date
+    ).prefetch_related('prayer_times').first()
+
+    fallback = None
+    if daily_prayer is None:
+        fallback = DailyPrayer.objects.filter(
+            user=user
+        ).prefetch_related('prayer_times').order_by('-prayer_date').first()
+
+    snapshot = {
+        'date': target_date.strftime('%Y-%m-%d'),
+        'built_at': timezone.now().isoformat(),
+        'current_plan': current_plan,
+        'subscription': subscription,
+        'preferences': _preferences_info(user),
+        'daily_prayer': _daily_prayer_info(daily_prayer),
+        'fallback': _daily_prayer_info(fallback),
+    }
+
+    cache.set(_snapshot_key(user.id, target_date, version), snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def get_dashboard_snapshot(user, target_date=None):
+    """Get a user's dashboard snapshot for a day, building it on a cache miss"""
+    if target_date is None:
+        target_date = date.today()
+
+    snapshot = cache.get(_snapshot_key(user.id, target_date, _get_version(user.id)))
+    if snapshot is None:
+        snapshot = build_dashboard_snapshot(user, target_date)
+    return snapshot
+
+
+def refresh_dashboard_snapshot(user, target_date=None):
+    """Invalidate and rebuild, used right after timings are ingested"""
+    invalidate_dashboard_snapshot(user.id)
+    try:
+        return build_dashboard_snapshot(user, target_date)
+    except Exception as e:
+        # The snapshot is rebuilt on the next dashboard hit anyway
+        print(f"⚠️ Could not build dashboard snapshot for user {user.id}: {str(e)}")
+        return None
+
+
+def prayer_clock(prayers, is_today, now=None):
+    """
+    Add the time-dependent fields to a snapshot's prayers.
+    Returns (prayers, next_prayer, remaining_count); prayers get 'is_past' and
+    'minutes_remaining' (None when past or not today).
+    """
+    now = now or timezone.now()
+    current_time = now.time().replace(tzinfo=None)
+    today = now.date()
+
+    result = []
+    next_prayer = None
+    remaining_count = 0
+
+    for prayer in prayers:
+        prayer_time = datetime.strptime(prayer['time_24h'], '%H:%M').time()
+        is_past = prayer_time < current_time if is_today else False
+        minutes_remaining = None
+
+        if is_today and not is_past:
+            diff = datetime.combine(today, prayer_time) - datetime.combine(today, current_time)
+            minutes_remaining = max(0, int(diff.total_seconds() / 60))
+            remaining_count += 1
+
+        prayer = dict(prayer, is_past=is_past, minutes_remaining=minutes_remaining)
+        if next_prayer is None and minutes_remaining is not None:
+            next_prayer = prayer
+        result.append(prayer)
+
+    return result, next_prayer, remaining_count
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from SalatTracker import prayer_archive
+
+
+class Command(BaseCommand):
+    help = "Move months of DailyPrayer/PrayerTime rows older than PRAYER_ARCHIVE_AFTER_DAYS to archive files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list the months and their day counts')
+
+    def handle(self, *args, **options):
+        cutoff = prayer_archive.archive_cutoff()
+        months = prayer_archive.archive_old_prayers(dry_run=options['dry_run'])
+        for month in months:
+            if options['dry_run']:
+                self.stdout.write(f"  {month['month']}: {month['days']} days")
+            else:
+                self.stdout.write(f"  {month['month']}: {month['rows']} rows -> {month.get('path')}")
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(f"✅ {verb} {len(months)} months before {cutoff}"))
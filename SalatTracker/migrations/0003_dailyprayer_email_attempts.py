@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SalatTracker', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyprayer',
+            name='email_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -11,6 +11,7 @@ class DailyPrayer(models.Model):
     weekday_name = models.CharField(max_length=20, null=True, blank=True)
     is_email_notified = models.BooleanField(default=False)
     is_sms_notified = models.BooleanField(default=False)
+    email_attempts = models.PositiveSmallIntegerField(default=0)  # bulk daily summary sends tried
 
     class Meta:
         unique_together = ['user', 'prayer_date']  # Prevent duplicate daily prayers
@@ -0,0 +1,256 @@
+# SalatTracker/prayer_archive.py - Past prayer days moved out of the hot tables
+
+"""
+DailyPrayer and PrayerTime only need to hold a rolling window. Whole months
+that ended more than PRAYER_ARCHIVE_AFTER_DAYS ago are written to
+LOG_ARCHIVE_DIR/salattracker_prayers/YYYY-MM.csv.gz (see
+muadhin/partitioning.py for the naming) and deleted from both tables.
+SalatTracker.tasks.archive_old_prayers does this daily. Like log retention it
+refuses to run unless LOG_ARCHIVE_DIR is on persistent storage (the
+archive_data volume in production), since web reads the files back.
+
+An archive is an ordinary gzipped CSV (zcat works), one row per prayer time,
+written as one gzip member per user. A YYYY-MM.idx.json file next to it maps
+each user id to the offset and length of their member, so a history request
+decompresses that user's few hundred rows and nothing else.
+iter_archived_days() reads them back in calendar_export's day format, which
+is how PrayerCalendarView serves ranges that reach into archived months;
+archived_daily_prayer() reads one day in DailyPrayerSerializer's format for
+the per-day endpoints.
+"""
+
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+from datetime import date, datetime, time, timezone as dt_timezone
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import router, transaction
+
+from muadhin.partitioning import add_months, archive_files, archive_path, month_start, require_persistent_archive
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_NAME = 'salattracker_prayers'
+COLUMNS = [
+    'user_id', 'prayer_date', 'weekday_name', 'is_email_notified', 'is_sms_notified',
+    'prayer_name', 'prayer_time', 'prayer_is_sms_notified', 'prayer_is_phonecall_notified',
+]
+DELETE_BATCH_SIZE = 2000
+ITERATOR_CHUNK_SIZE = 2000
+
+
+def index_path(path: str) -> str:
+    return path[:-len('.csv.gz')] + '.idx.json'
+
+
+def _flag(value) -> str:
+    return '' if value is None else str(int(value))
+
+
+def _encode(row) -> List[str]:
+    user_id, prayer_date, weekday, email, sms, name, prayer_time, pt_sms, pt_call = row
+    return [
+        '' if user_id is None else str(user_id), prayer_date.isoformat(), weekday or '', _flag(email), _flag(sms),
+        name or '', prayer_time.isoformat() if prayer_time else '', _flag(pt_sms), _flag(pt_call),
+    ]
+
+
+def write_archive(path: str, rows: Iterable[Tuple]) -> Dict[str, int]:
+    """
+    Write rows (COLUMNS order, sorted by user) to path, one gzip member per
+    user, and its offset index. Returns {'rows', 'users'}.
+    """
+    index = {}
+    count = 0
+    with open(f'{path}.tmp', 'wb') as f:
+        f.write(gzip.compress((','.join(COLUMNS) + '\r\n').encode()))
+        for user_id, user_rows in groupby(rows, key=lambda row: row[0]):
+            out = io.StringIO()
+            writer = csv.writer(out)
+            for row in user_rows:
+                writer.writerow(_encode(row))
+                count += 1
+            offset = f.tell()
+            f.write(gzip.compress(out.getvalue().encode()))
+            if user_id is not None:
+                index[str(user_id)] = [offset, f.tell() - offset]
+    with open(f'{index_path(path)}.tmp', 'w') as f:
+        json.dump(index, f)
+    os.replace(f'{path}.tmp', path)
+    os.replace(f'{index_path(path)}.tmp', index_path(path))
+    return {'rows': count, 'users': len(index)}
+
+
+def _read_user_rows(path: str, user_id: int) -> Iterator[List[str]]:
+    try:
+        with open(index_path(path)) as f:
+            entry = json.load(f).get(str(user_id))
+    except (FileNotFoundError, ValueError):
+        # No index, scan the whole file
+        with gzip.open(path, 'rt', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from (row for row in reader if row[0] == str(user_id))
+        return
+    if entry is None:
+        return
+    offset, length = entry
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = gzip.decompress(f.read(length)).decode()
+    yield from csv.reader(io.StringIO(data, newline=''))
+
+
+def _iter_archived_rows(user_id: int, start_date: date, end_date: date) -> Iterator[Tuple]:
+    """A user's archived rows in [start_date, end_date] by (date, weekday), each group sorted by time"""
+    month = month_start(datetime.combine(start_date, time(), dt_timezone.utc))
+    last = month_start(datetime.combine(end_date, time(), dt_timezone.utc))
+    start, end = start_date.isoformat(), end_date.isoformat()
+    while month <= last:
+        # A month archived more than once: each (date, prayer) from its newest file
+        latest = {}
+        for path in reversed(archive_files(ARCHIVE_NAME, month)):
+            for row in _read_user_rows(path, user_id):
+                if start <= row[1] <= end:
+                    latest.setdefault((row[1], row[5]), row)
+        rows = sorted(latest.values(), key=lambda row: (row[1], row[6]))
+        for key, day_rows in groupby(rows, key=lambda row: (row[1], row[2])):
+            yield key, list(day_rows)
+        month = add_months(month, 1)
+
+
+def iter_archived_days(user_id: int, start_date: date, end_date: date) -> Iterator[Dict]:
+    """A user's archived days in [start_date, end_date], as calendar_export.iter_calendar_days yields them"""
+    for (prayer_date, weekday), rows in _iter_archived_rows(user_id, start_date, end_date):
+        yield {
+            'date': prayer_date,
+            'weekday': weekday or None,
+            'prayers': [{'name': row[5], 'time': row[6][:5]} for row in rows if row[5] and row[6]],
+        }
+
+
+def _decode_flag(value: str) -> Optional[bool]:
+    return None if value == '' else value == '1'
+
+
+def archived_daily_prayer(user_id: int, prayer_date: date) -> Optional[Dict]:
+    """
+    An archived day as DailyPrayerSerializer renders it, with 'archived' set
+    and None for what the archive doesn't keep (ids, timestamps, email
+    attempts). None when the day is not archived.
+    """
+    if not has_archives(prayer_date, prayer_date):
+        return None
+    for (day, weekday), rows in _iter_archived_rows(user_id, prayer_date, prayer_date):
+        return {
+            'id': None,
+            'prayer_times': [
+                {
+                    'id': None, 'prayer_name': row[5], 'prayer_time': row[6] or None,
+                    'is_sms_notified': _decode_flag(row[7]), 'is_phonecall_notified': _decode_flag(row[8]),
+                    'created_at': None, 'updated_at': None, 'daily_prayer': None,
+                }
+                for row in rows if row[5]
+            ],
+            'prayer_date': day,
+            'weekday_name': weekday or None,
+            'is_email_notified': _decode_flag(rows[0][3]),
+            'is_sms_notified': _decode_flag(rows[0][4]),
+            'email_attempts': None,
+            'user': user_id,
+            'archived': True,
+        }
+    return None
+
+
+def has_archives(start_date: date, end_date: date) -> bool:
+    month = month_start(datetime.combine(start_date, time(), dt_timezone.utc))
+    last = month_start(datetime.combine(end_date, time(), dt_timezone.utc))
+    while month <= last:
+        if archive_files(ARCHIVE_NAME, month):
+            return True
+        month = add_months(month, 1)
+    return False
+
+
+# Archiving
+
+def archive_cutoff(today: Optional[date] = None) -> date:
+    """First day kept in the hot tables: the start of the month holding today - PRAYER_ARCHIVE_AFTER_DAYS"""
+    from datetime import timedelta
+
+    day = (today or date.today()) - timedelta(days=settings.PRAYER_ARCHIVE_AFTER_DAYS)
+    return day.replace(day=1)
+
+
+def archive_month(month: datetime) -> Dict:
+    """
+    Write a month of DailyPrayer/PrayerTime rows to its archive and delete
+    them. Raises ImproperlyConfigured when LOG_ARCHIVE_DIR is not persistent.
+    """
+    from .dashboard_snapshot import invalidate_dashboard_snapshots
+    from .models import DailyPrayer, PrayerTime
+
+    require_persistent_archive()
+    start, end = month.date(), add_months(month, 1).date()
+    days = DailyPrayer.objects.filter(prayer_date__gte=start, prayer_date__lt=end)
+    last_id = days.order_by('-id').values_list('id', flat=True).first()
+    if last_id is None:
+        return {'month': f'{month:%Y-%m}', 'rows': 0}
+    # Days added while this runs are left for the next run
+    days = days.filter(id__lte=last_id)
+
+    users = set()
+
+    def rows():
+        for row in days.order_by('user_id', 'prayer_date', 'prayer_times__prayer_time').values_list(
+            'user_id', 'prayer_date', 'weekday_name', 'is_email_notified', 'is_sms_notified',
+            'prayer_times__prayer_name', 'prayer_times__prayer_time',
+            'prayer_times__is_sms_notified', 'prayer_times__is_phonecall_notified',
+        ).iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            users.add(row[0])
+            yield row
+
+    path = archive_path(ARCHIVE_NAME, month)
+    stats = write_archive(path, rows())
+    db = router.db_for_write(DailyPrayer)
+    try:
+        with transaction.atomic(using=db):
+            while True:
+                ids = list(days.values_list('id', flat=True)[:DELETE_BATCH_SIZE])
+                if not ids:
+                    break
+                # Raw deletes skip the per-row snapshot signals, users are invalidated once below
+                PrayerTime.objects.filter(daily_prayer_id__in=ids)._raw_delete(db)
+                DailyPrayer.objects.filter(id__in=ids)._raw_delete(db)
+    except Exception:
+        for stale in (path, index_path(path)):
+            os.remove(stale)
+        raise
+
+    invalidate_dashboard_snapshots(users)
+    logger.info(f"🗄️ Archived {stats['rows']} prayer rows for {month:%Y-%m} to {path}")
+    return {'month': f'{month:%Y-%m}', 'path': path, **stats}
+
+
+def archive_old_prayers(today: Optional[date] = None, dry_run: bool = False) -> List[Dict]:
+    """Archive every month before archive_cutoff(), oldest first"""
+    from .models import DailyPrayer
+
+    cutoff = archive_cutoff(today)
+    months = DailyPrayer.objects.filter(prayer_date__lt=cutoff).dates('prayer_date', 'month')
+    results = []
+    for month in months:
+        month = datetime.combine(month, time(), dt_timezone.utc)
+        if dry_run:
+            results.append({'month': f'{month:%Y-%m}', 'days': DailyPrayer.objects.filter(
+                prayer_date__gte=month.date(), prayer_date__lt=add_months(month, 1).date()).count()})
+        else:
+            results.append(archive_month(month))
+    return results
@@ -0,0 +1,124 @@
+# SalatTracker/rendering.py - Cohort-level rendering of daily prayer messages
+
+"""
+Users who share a timetable (same date and the same prayer times) get the
+same daily summary apart from their name. Instead of rendering the message
+for every user, we render it once per (timetable key, channel, locale) with
+a name slot in place of the username, and cache the compiled parts for the
+day. Per user we only join the parts around the (escaped) name.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.html import escape, strip_tags
+
+NAME_SLOT = '__muadhin_name_slot__'
+CACHE_TIMEOUT = 60 * 60 * 24  # Compiled messages are only valid for their day
+LOCAL_CACHE_MAX_ENTRIES = 512
+
+CHANNEL_EMAIL_HTML = 'email_html'
+CHANNEL_EMAIL_TEXT = 'email_text'
+CHANNEL_SMS = 'sms'
+CHANNEL_WHATSAPP = 'whatsapp'
+
+# Per-process memo in front of the shared cache, so a batch of users in the
+# same cohort never touches the cache backend more than once.
+_local_cache = {}
+
+
+class CompiledMessage:
+    """A message rendered once, with a slot for the recipient's name"""
+
+    def __init__(self, parts, escape_name=False):
+        self.parts = tuple(parts)
+        self.escape_name = escape_name
+
+    def render(self, name):
+        name = name or ''
+        if self.escape_name:
+            name = escape(name)
+        return name.join(self.parts)
+
+    def with_placeholder(self, placeholder):
+        """Fill the name slot with a provider placeholder such as %recipient.name%"""
+        return placeholder.join(self.parts)
+
+
+def timetable_key(daily_prayer, prayer_times):
+    """Stable key for everything in a daily summary except the user"""
+    raw = '|'.join(
+        [daily_prayer.prayer_date.isoformat(), daily_prayer.weekday_name or ''] +
+        [f"{pt.prayer_name}={pt.prayer_time.strftime('%H:%M')}" for pt in prayer_times]
+    )
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _render_email_html(daily_prayer, prayer_times):
+    context = {
+        'user': {'username': NAME_SLOT},
+        'prayer_date': daily_prayer.prayer_date,
+        'weekday_name': daily_prayer.weekday_name,
+        'prayer_times': prayer_times,
+    }
+    return render_to_string('SalatTracker/daily_prayer_email.html', context)
+
+
+def _render_whatsapp(daily_prayer, prayer_times):
+    message = f"🕌 Assalamu Alaikum, {NAME_SLOT}!\n\nToday's prayer times:\n"
+    for prayer_time in prayer_times:
+        message += f"• {prayer_time.prayer_name}: {prayer_time.prayer_time.strftime('%I:%M %p')}\n"
+    message += "\n📱 You'll receive reminders before each prayer time."
+    return message
+
+
+def _render_sms(daily_prayer, prayer_times):
+    message = f"Assalamu Alaikum, {NAME_SLOT}!\n\nToday's prayer times:\n"
+    for prayer_time in prayer_times:
+        message += f"{prayer_time.prayer_name}: {prayer_time.prayer_time.strftime('%I:%M %p')}\n"
+    return message
+
+
+def _compile(daily_prayer, prayer_times, channel):
+    """Render a channel's message with the name slot; returns (parts, escape_name)"""
+    if channel == CHANNEL_EMAIL_HTML:
+        return _render_email_html(daily_prayer, prayer_times).split(NAME_SLOT), True
+    if channel == CHANNEL_EMAIL_TEXT:
+        return strip_tags(_render_email_html(daily_prayer, prayer_times)).split(NAME_SLOT), False
+    if channel == CHANNEL_WHATSAPP:
+        return _render_whatsapp(daily_prayer, prayer_times).split(NAME_SLOT), False
+    if channel == CHANNEL_SMS:
+        return _render_sms(daily_prayer, prayer_times).split(NAME_SLOT), False
+    raise ValueError(f"Unknown daily summary channel: {channel}")
+
+
+def get_compiled_daily_summary(daily_prayer, prayer_times, channel, locale=None):
+    """Get the compiled daily summary for a cohort, rendering it at most once a day"""
+    locale = locale or settings.LANGUAGE_CODE
+    cache_key = f"daily_summary_{channel}_{locale}_{timetable_key(daily_prayer, prayer_times)}"
+
+    compiled = _local_cache.get(cache_key)
+    if compiled is not None:
+        return compiled
+
+    cached = cache.get(cache_key)
+    if cached is None:
+        with translation.override(locale):
+            parts, escape_name = _compile(daily_prayer, prayer_times, channel)
+        cached = (tuple(parts), escape_name)
+        cache.set(cache_key, cached, CACHE_TIMEOUT)
+
+    compiled = CompiledMessage(*cached)
+    if len(_local_cache) >= LOCAL_CACHE_MAX_ENTRIES:
+        _local_cache.clear()
+    _local_cache[cache_key] = compiled
+    return compiled
+
+
+def render_daily_summary(user, daily_prayer, prayer_times, channel, locale=None):
+    """Render a user's daily summary for a channel from the cohort's compiled message"""
+    compiled = get_compiled_daily_summary(daily_prayer, prayer_times, channel, locale)
+    return compiled.render(user.username)
@@ -0,0 +1,40 @@
+# SalatTracker/signals.py - Keep dashboard snapshots in sync with the data they are built from
+
+from functools import lru_cache
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from subscriptions.models import UserSubscription
+from users.models import UserPreferences, PrayerMethod, PrayerOffset
+from .dashboard_snapshot import invalidate_dashboard_snapshot
+from .models import DailyPrayer, PrayerTime
+
+
+@receiver([post_save, post_delete], sender=UserPreferences)
+@receiver([post_save, post_delete], sender=UserSubscription)
+@receiver([post_save, post_delete], sender=PrayerMethod)
+@receiver([post_save, post_delete], sender=PrayerOffset)
+@receiver([post_save, post_delete], sender=DailyPrayer)
+def invalidate_user_dashboard(sender, instance, **kwargs):
+    """Preferences, subscription, method/offset or prayer days changed"""
+    invalidate_dashboard_snapshot(instance.user_id)
+
+
+@lru_cache(maxsize=4096)
+def _daily_prayer_user(daily_prayer_id):
+    # A day never changes hands, so this is cached for the process
+    return DailyPrayer.objects.filter(pk=daily_prayer_id).values_list('user_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=PrayerTime)
+def invalidate_prayer_time_dashboard(sender, instance, **kwargs):
+    """A prayer time changed (new timing or notification flags)"""
+    if PrayerTime.daily_prayer.is_cached(instance):
+        user_id = instance.daily_prayer.user_id if instance.daily_prayer else None
+    elif instance.daily_prayer_id is not None:
+        user_id = _daily_prayer_user(instance.daily_prayer_id)
+    else:
+        user_id = None
+    if user_id is not None:
+        invalidate_dashboard_snapshot(user_id)
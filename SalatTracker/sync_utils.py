@@ -10,7 +10,11 @@ from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
 from .models import DailyPrayer, PrayerTime
+from .dashboard_snapshot import get_dashboard_snapshot, refresh_dashboard_snapshot
+from .rendering import render_daily_summary, CHANNEL_EMAIL_HTML, CHANNEL_EMAIL_TEXT
 from users.models import PrayerMethod, UserPreferences
+from users.services.geocoding import timings_request
+from muadhin.metrics import aladhan_fetch
 
 User = get_user_model()
 
@@ -31,16 +35,12 @@ def sync_fetch_prayer_times(user_id, date_str):
                 user=user, sn=1, name='Muslim World League'
             )
 
-        api_url = "http://api.aladhan.com/v1/timingsByCity"
-        params = {
-            "date": date_str,
-            "city": user.city,
-            "country": user.country,
-            "method": prayer_method.sn,
-        }
+        # By the geocoded coordinates when the city resolved (users/services/geocoding.py)
+        api_url, params = timings_request(user, date_str, prayer_method.sn)
 
         # Fetch from API with timeout
-        response = requests.get(api_url, params=params, timeout=30)
+        with aladhan_fetch('sync') as fetch:
+            response = fetch.record(requests.get(api_url, params=params, timeout=30))
         
         if response.status_code == 200:
             data = response.json().get("data", {}).get("timings", {})
@@ -78,6 +78,8 @@ def sync_fetch_prayer_times(user_id, date_str):
                 if created:
                     prayer_times_created += 1
 
+            refresh_dashboard_snapshot(user, gregorian_dt.date())
+
             return {
                 "status": "success",
                 "user_id": user_id,
@@ -118,18 +120,15 @@ def ensure_prayer_times_exist(user, target_date=None):
     if target_date is None:
         target_date = date.today()
     
-    # Check if prayer times already exist
-    daily_prayer = DailyPrayer.objects.filter(
-        user=user, 
-        prayer_date=target_date
-    ).prefetch_related('prayer_times').first()
+    # Check if prayer times already exist (from the cached dashboard snapshot)
+    daily_prayer = get_dashboard_snapshot(user, target_date)['daily_prayer']
     
-    if daily_prayer and daily_prayer.prayer_times.exists():
+    if daily_prayer and daily_prayer['prayers']:
         return {
             "status": "exists", 
-            "daily_prayer_id": daily_prayer.id,
+            "daily_prayer_id": daily_prayer['id'],
             "date": target_date.strftime('%Y-%m-%d'),
-            "prayer_count": daily_prayer.prayer_times.count(),
+            "prayer_count": len(daily_prayer['prayers']),
             "message": "Prayer times already exist"
         }
     
@@ -212,19 +211,9 @@ def sync_send_prayer_email(user, daily_prayer, prayer_times):
     NEW: Send prayer email synchronously
     """
     try:
-        # Render email template
-        context = {
-            'user': user,
-            'prayer_date': daily_prayer.prayer_date,
-            'weekday_name': daily_prayer.weekday_name,
-            'prayer_times': prayer_times,
-        }
-        
-        html_content = render_to_string(
-            'SalatTracker/daily_prayer_email.html', 
-            context
-        )
-        text_content = strip_tags(html_content)
+        # Render email template (once per timetable cohort)
+        html_content = render_daily_summary(user, daily_prayer, prayer_times, CHANNEL_EMAIL_HTML)
+        text_content = render_daily_summary(user, daily_prayer, prayer_times, CHANNEL_EMAIL_TEXT)
 
         # Send email
         email_subject = f"Daily Prayer Times for {daily_prayer.prayer_date}"
@@ -245,40 +234,27 @@ def sync_send_prayer_email(user, daily_prayer, prayer_times):
         raise
 
 
-def get_next_prayer_info(prayer_times):
+def get_next_prayer_info(prayers):
     """
     NEW: Calculate next prayer and remaining prayers for today
+    Takes dashboard snapshot prayers with the live fields from prayer_clock()
     """
-    if not prayer_times:
+    if not prayers:
         return None, 0
     
-    now = timezone.now()
-    current_time = now.time()
-    
-    next_prayer = None
-    remaining_count = 0
-    
-    for prayer_time in prayer_times:
-        if prayer_time.prayer_time > current_time:
-            if next_prayer is None:
-                next_prayer = prayer_time
-            remaining_count += 1
+    upcoming = [prayer for prayer in prayers if not prayer['is_past']]
     
-    if next_prayer:
-        # Calculate time until next prayer
-        next_prayer_datetime = datetime.combine(date.today(), next_prayer.prayer_time)
-        now_datetime = datetime.combine(date.today(), current_time)
-        time_diff = next_prayer_datetime - now_datetime
-        
-        minutes_remaining = int(time_diff.total_seconds() / 60)
+    if upcoming:
+        next_prayer = upcoming[0]
+        minutes_remaining = next_prayer['minutes_remaining'] or 0
         
         return {
-            'prayer_name': next_prayer.prayer_name,
-            'prayer_time': next_prayer.prayer_time.strftime('%I:%M %p'),
-            'prayer_time_24h': next_prayer.prayer_time.strftime('%H:%M'),
+            'prayer_name': next_prayer['name'],
+            'prayer_time': next_prayer['time_12h'],
+            'prayer_time_24h': next_prayer['time_24h'],
             'minutes_remaining': max(0, minutes_remaining),
             'time_until': format_time_remaining(minutes_remaining)
-        }, remaining_count
+        }, len(upcoming)
     else:
         # All prayers passed
         return {
@@ -307,25 +283,21 @@ def format_time_remaining(minutes):
             return f"{hours}h {remaining_minutes}m"
 
 
-def get_user_subscription_info(user):
+def get_user_subscription_info(snapshot):
     """
-    NEW: Get subscription info without dependencies on other modules
+    NEW: Get subscription info from the dashboard snapshot
     """
-    try:
-        # Try to get subscription info
-        subscription = getattr(user, 'subscription', None)
-        if subscription:
-            plan = subscription.plan
-            return {
-                'plan_name': plan.name,
-                'plan_type': plan.plan_type,
-                'price': float(plan.price) if plan.price else 0.0,
-                'status': subscription.status,
-                'is_trial': getattr(subscription, 'is_trial', False),
-                'max_notifications': getattr(plan, 'max_notifications_per_day', 15)
-            }
-    except Exception:
-        pass
+    subscription = snapshot.get('subscription')
+    if subscription and subscription.get('plan'):
+        plan = subscription['plan']
+        return {
+            'plan_name': plan['name'],
+            'plan_type': plan['plan_type'],
+            'price': plan['price'],
+            'status': subscription['status'],
+            'is_trial': subscription['is_trial'],
+            'max_notifications': plan['max_notifications_per_day']
+        }
     
     # Default/fallback subscription info
     return {
@@ -335,4 +307,4 @@ def get_user_subscription_info(user):
         'status': 'active',
         'is_trial': False,
         'max_notifications': 15
-    }
\ No newline at end of file
+    }
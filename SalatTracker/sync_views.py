@@ -5,6 +5,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from datetime import datetime, date, timedelta
 from django.utils import timezone
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
 from .models import DailyPrayer, PrayerTime
@@ -15,6 +16,9 @@ from .sync_utils import (
     get_next_prayer_info,
     get_user_subscription_info
 )
+from django.utils.decorators import method_decorator
+from .conditional import dashboard_condition, my_prayer_day_condition
+from .dashboard_snapshot import get_dashboard_snapshot, prayer_clock
 from users.models import UserPreferences
 
 User = get_user_model()
@@ -27,6 +31,7 @@ class SyncDashboardView(APIView):
     """
     permission_classes = [IsAuthenticated]
     
+    @method_decorator(dashboard_condition)
     def get(self, request):
         user = request.user
         today = date.today()
@@ -34,51 +39,43 @@ class SyncDashboardView(APIView):
         # Auto-ensure prayer times exist for today
         ensure_result = ensure_prayer_times_exist(user, today)
         
-        # Get prayer data
-        daily_prayer = DailyPrayer.objects.filter(
-            user=user, 
-            prayer_date=today
-        ).prefetch_related('prayer_times').first()
+        # Get prayer data from the precomputed snapshot (today, or most recent as fallback)
+        snapshot = get_dashboard_snapshot(user, today)
+        daily_prayer = snapshot['daily_prayer'] or snapshot['fallback']
         
         if not daily_prayer:
-            # Fallback to most recent data
-            daily_prayer = DailyPrayer.objects.filter(
-                user=user
-            ).prefetch_related('prayer_times').order_by('-prayer_date').first()
-            
-            if not daily_prayer:
-                return Response({
-                    'error': 'No prayer times available',
-                    'message': 'Unable to fetch prayer times. Please check your connection and try again.',
-                    'fetch_result': ensure_result,
-                    'user_info': self._get_user_info(user),
-                    'suggestions': [
-                        'Check your internet connection',
-                        'Verify your location settings',
-                        'Try the manual refresh button'
-                    ]
-                }, status=404)
-        
-        # Get prayer times
-        prayer_times = list(daily_prayer.prayer_times.all().order_by('prayer_time'))
-        is_today = daily_prayer.prayer_date == today
+            return Response({
+                'error': 'No prayer times available',
+                'message': 'Unable to fetch prayer times. Please check your connection and try again.',
+                'fetch_result': ensure_result,
+                'user_info': self._get_user_info(user),
+                'suggestions': [
+                    'Check your internet connection',
+                    'Verify your location settings',
+                    'Try the manual refresh button'
+                ]
+            }, status=404)
+        
+        # Live is_past/minutes on top of the precomputed prayer times
+        is_today = daily_prayer['date'] == today.strftime('%Y-%m-%d')
+        prayer_times, _, _ = prayer_clock(daily_prayer['prayers'], is_today=True)
         
         # Get user preferences
-        user_preferences = self._get_user_preferences(user)
+        user_preferences = snapshot['preferences']
         
         # Build comprehensive response
         response_data = {
             'user_info': self._get_user_info(user),
-            'subscription': get_user_subscription_info(user),
+            'subscription': get_user_subscription_info(snapshot),
             'fetch_info': {
                 'auto_fetch_result': ensure_result,
                 'data_source': 'today' if is_today else 'fallback',
-                'last_updated': daily_prayer.prayer_date.strftime('%Y-%m-%d')
+                'last_updated': daily_prayer['date']
             },
             'date_info': {
                 'today': today.strftime('%Y-%m-%d'),
-                'showing_date': daily_prayer.prayer_date.strftime('%Y-%m-%d'),
-                'weekday': daily_prayer.weekday_name,
+                'showing_date': daily_prayer['date'],
+                'weekday': daily_prayer['weekday'],
                 'is_current_day': is_today,
                 'hijri_date': None  # Can be added later
             }
@@ -102,13 +99,13 @@ class SyncDashboardView(APIView):
         
         # Add prayer list with notification info
         response_data['prayers'] = self._format_prayers_with_notifications(
-            prayer_times, user, user_preferences
+            prayer_times, user_preferences
         )
         
         # Add quick actions
         response_data['actions'] = {
             'can_refresh': True,
-            'can_send_summary': is_today and not daily_prayer.is_email_notified,
+            'can_send_summary': is_today and not daily_prayer['is_email_notified'],
             'can_update_preferences': True
         }
         
@@ -127,13 +124,6 @@ class SyncDashboardView(APIView):
             'country': user.country
         }
     
-    def _get_user_preferences(self, user):
-        """Get user preferences safely"""
-        try:
-            return user.preferences
-        except UserPreferences.DoesNotExist:
-            return None
-    
     def _get_fallback_next_prayer(self):
         """Return fallback next prayer info"""
         return {
@@ -144,28 +134,28 @@ class SyncDashboardView(APIView):
             'time_until': 'Refresh needed'
         }
     
-    def _format_prayers_with_notifications(self, prayer_times, user, user_preferences):
+    def _format_prayers_with_notifications(self, prayer_times, user_preferences):
         """Format prayer times with notification channel info"""
         prayers = []
         
         for prayer_time in prayer_times:
             prayer_info = {
-                'id': prayer_time.id,
-                'name': prayer_time.prayer_name,
-                'time_12h': prayer_time.prayer_time.strftime('%I:%M %p'),
-                'time_24h': prayer_time.prayer_time.strftime('%H:%M'),
-                'is_past': prayer_time.prayer_time < timezone.now().time(),
-                'notifications': self._get_notification_status(user, user_preferences),
+                'id': prayer_time['id'],
+                'name': prayer_time['name'],
+                'time_12h': prayer_time['time_12h'],
+                'time_24h': prayer_time['time_24h'],
+                'is_past': prayer_time['is_past'],
+                'notifications': self._get_notification_status(user_preferences),
                 'status': {
-                    'sms_notified': prayer_time.is_sms_notified,
-                    'call_notified': prayer_time.is_phonecall_notified
+                    'sms_notified': prayer_time['is_sms_notified'],
+                    'call_notified': prayer_time['is_phonecall_notified']
                 }
             }
             prayers.append(prayer_info)
         
         return prayers
     
-    def _get_notification_status(self, user, user_preferences):
+    def _get_notification_status(self, user_preferences):
         """Get notification channel status"""
         if not user_preferences:
             return {
@@ -176,18 +166,18 @@ class SyncDashboardView(APIView):
         
         return {
             'pre_prayer': {
-                'method': user_preferences.notification_before_prayer,
-                'enabled': user_preferences.notification_before_prayer_enabled,
-                'timing': f"{user_preferences.notification_time_before_prayer} min before"
+                'method': user_preferences['notification_before_prayer'],
+                'enabled': user_preferences['notification_before_prayer_enabled'],
+                'timing': f"{user_preferences['notification_time_before_prayer']} min before"
             },
             'at_prayer': {
-                'method': user_preferences.adhan_call_method,
-                'enabled': user_preferences.adhan_call_enabled,
+                'method': user_preferences['adhan_call_method'],
+                'enabled': user_preferences['adhan_call_enabled'],
                 'timing': 'At prayer time'
             },
             'daily_summary': {
-                'method': user_preferences.daily_prayer_summary_message_method,
-                'enabled': user_preferences.daily_prayer_summary_enabled,
+                'method': user_preferences['daily_prayer_summary_message_method'],
+                'enabled': user_preferences['daily_prayer_summary_enabled'],
                 'timing': 'Once daily'
             }
         }
@@ -315,6 +305,7 @@ class SyncPrayerTimesView(APIView):
     """
     permission_classes = [IsAuthenticated]
     
+    @method_decorator(my_prayer_day_condition)
     def get(self, request):
         user = request.user
         date_param = request.query_params.get('date')
@@ -405,16 +396,10 @@ class SyncHealthView(APIView):
         # Quick API test
         try:
             import requests
-            response = requests.get(
-                "http://api.aladhan.com/v1/timingsByCity",
-                params={
-                    "date": date.today().strftime('%d-%m-%Y'),
-                    "city": user.city,
-                    "country": user.country,
-                    "method": 1
-                },
-                timeout=10
-            )
+            from users.services.geocoding import timings_request
+
+            api_url, params = timings_request(user, date.today().strftime('%d-%m-%Y'), 1)
+            response = requests.get(api_url, params=params, timeout=10)
             health_info['api_access'] = 'operational' if response.status_code == 200 else f'error: {response.status_code}'
         except Exception as e:
             health_info['api_access'] = f'error: {str(e)}'
@@ -1,29 +1,42 @@
 from celery import shared_task
-from datetime import date, datetime, timedelta, time
-import pytz
+from datetime import date, datetime, timedelta, time, timezone as dt_timezone
+from functools import lru_cache
 from subscriptions.models import NotificationUsage
 from subscriptions.services.subscription_service import SubscriptionService
-from subscriptions.services.whatsapp_service import WhatsAppService
 from users.models import UserPreferences, PrayerMethod
+from users.services.geocoding import timings_request
 from SalatTracker.models import PrayerTime, DailyPrayer
+from SalatTracker.dashboard_snapshot import invalidate_dashboard_snapshots, refresh_dashboard_snapshot
 import requests
-from twilio.rest import Client
 from django.conf import settings
 from django.utils import timezone
-from rest_framework.response import Response
+from django.db.models import F
 from django.contrib.auth import get_user_model
 from django.core.mail import EmailMessage, EmailMultiAlternatives
 from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django_mailgun_mime.backends import MailgunMIMEBackend
+from django.utils.html import escape, strip_tags
 from django.utils.dateparse import parse_time
-from communications.services.notification_service import NotificationService
+from communications.services.notification_service import Delivery, NotificationService
+from communications.services.bulk_email_service import BulkEmailService, BulkEmailRecipient
+from muadhin.timezones import local_now, localize, next_midnights_utc
+from muadhin.metrics import aladhan_fetch, current_task_eta, observe_delivery_lag, scheduling_pass
+from SalatTracker.rendering import (
+    render_daily_summary, get_compiled_daily_summary, timetable_key,
+    CHANNEL_EMAIL_HTML, CHANNEL_EMAIL_TEXT, CHANNEL_SMS, CHANNEL_WHATSAPP
+)
 
 
 TWILIO_SID = settings.TWILIO_ACCOUNT_SID
 TWILIO_AUTH_TOKEN = settings.TWILIO_AUTH_TOKEN
 TWILIO_NUMBER = settings.TWILIO_PHONE_NUMBER
-twilio_client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
+
+
+@lru_cache(maxsize=1)
+def get_twilio_client():
+    """Created on first use, twilio is a slow import that most tasks never need"""
+    from twilio.rest import Client
+
+    return Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
 
 User = get_user_model()
 
@@ -96,14 +109,16 @@ def ensure_prayer_method(user):
 
 
 @shared_task
+@scheduling_pass('schedule_midnight_checks')
 def schedule_midnight_checks():
     """
     Celery task that schedules individual tasks to check each user's upcoming midnight.
     """
-    for user in User.objects.all():
-        user_timezone = pytz.timezone(user.timezone)
-        next_midnight = user.next_midnight
-        check_user_midnight.apply_async(args=[user.id], eta=next_midnight)
+    users = list(User.objects.values_list('id', 'timezone'))
+    midnights = next_midnights_utc(tz_name for _, tz_name in users)
+    for user_id, tz_name in users:
+        next_midnight = midnights[tz_name] - timedelta(minutes=5)
+        check_user_midnight.apply_async(args=[user_id], eta=next_midnight)
 
 @shared_task
 def check_user_midnight(user_id):
@@ -112,7 +127,7 @@ def check_user_midnight(user_id):
     """
     try:
         user = User.objects.get(id=user_id)
-        now = datetime.now(pytz.timezone(user.timezone))
+        now = local_now(user.timezone)
         time_to_midnight = user.next_midnight - now
         # Check if the task hasn't been scheduled in the last 24 hours
         last_scheduled = user.last_scheduled_time
@@ -145,15 +160,11 @@ def fetch_and_save_daily_prayer_times(user_id, date):
 
         prayer_method = ensure_prayer_method(user)
 
-        api_url = "http://api.aladhan.com/v1/timingsByCity"
-        params = {
-            "date": date,
-            "city": user.city,
-            "country": user.country,
-            "method": prayer_method.sn,
-        }
+        # By the geocoded coordinates when the city resolved (users/services/geocoding.py)
+        api_url, params = timings_request(user, date, prayer_method.sn)
 
-        response = requests.get(api_url, params=params)
+        with aladhan_fetch('task') as fetch:
+            response = fetch.record(requests.get(api_url, params=params))
         if response.status_code == 200:
             data = response.json().get("data", {}).get("timings", {})
             date_info = response.json()["data"]["date"]["gregorian"]
@@ -192,6 +203,9 @@ def fetch_and_save_daily_prayer_times(user_id, date):
                 if not created:
                     prayer_time_obj.prayer_time = parse_time(prayer_time)
                     prayer_time_obj.save()
+
+            # Timings changed, precompute the dashboard for this day
+            refresh_dashboard_snapshot(user, gregorian_dt.date())
                     
             # Call the function to send the daily prayer message
             send_daily_prayer_message.delay(user.id)
@@ -298,6 +312,10 @@ def send_daily_prayer_message(user_id):
         result = None
         
         try:
+            if method == 'email' and settings.DAILY_SUMMARY_EMAIL_BATCHING:
+                # Picked up by send_daily_summary_emails with the rest of the cohort
+                return {"status": "deferred", "reason": "Queued for bulk email delivery"}
+
             if method == 'email':
                 email_daily_prayerTime(user, daily_prayer, prayer_times)
                 daily_prayer.is_email_notified = True
@@ -305,21 +323,15 @@ def send_daily_prayer_message(user_id):
                 result = {"provider": "email", "message_id": "email_sent"}
             
             elif method == 'whatsapp':
-                # Create WhatsApp message
-                message = f"🕌 Assalamu Alaikum, {user.username}!\n\nToday's prayer times:\n"
-                for prayer_time in prayer_times:
-                    message += f"• {prayer_time.prayer_name}: {prayer_time.prayer_time.strftime('%I:%M %p')}\n"
-                message += "\n📱 You'll receive reminders before each prayer time."
+                # Rendered once per timetable cohort, only the name is per user
+                message = render_daily_summary(user, daily_prayer, prayer_times, CHANNEL_WHATSAPP)
                 
                 result = NotificationService.send_whatsapp(user, message, log_usage=True)
                 success = result.success
                 error_message = result.error_message if not result.success else None
             
             elif method == 'sms':
-                # Create SMS message
-                message = f"Assalamu Alaikum, {user.username}!\n\nToday's prayer times:\n"
-                for prayer_time in prayer_times:
-                    message += f"{prayer_time.prayer_name}: {prayer_time.prayer_time.strftime('%I:%M %p')}\n"
+                message = render_daily_summary(user, daily_prayer, prayer_times, CHANNEL_SMS)
                 
                 result = NotificationService.send_sms(user, message, log_usage=True)
                 daily_prayer.is_sms_notified = True
@@ -474,20 +486,16 @@ def email_daily_prayerTime(user, daily_prayer, prayer_times):
     Helper function to render and send the daily prayer email.
     """
     try:
-        # Render the email template with prayer times and date
-        context = {
-            'user': user,
-            'prayer_date': daily_prayer.prayer_date,
-            'weekday_name': daily_prayer.weekday_name,
-            'prayer_times': prayer_times,
-        }
-        email_body = render_to_string('SalatTracker/daily_prayer_email.html', context)
+        # The template is rendered once per timetable cohort, see SalatTracker/rendering.py
+        email_body = render_daily_summary(user, daily_prayer, prayer_times, CHANNEL_EMAIL_HTML)
 
         # Send the email
         email_subject = f"Daily Prayer Times for {daily_prayer.prayer_date}"
         
         # Check if Mailgun is configured, otherwise use default email backend
         if hasattr(settings, 'MAILGUN_API_KEY') and settings.MAILGUN_API_KEY:
+            from django_mailgun_mime.backends import MailgunMIMEBackend
+
             email = MailgunMIMEBackend(
                 api_key=settings.MAILGUN_API_KEY,
                 domain=settings.MAILGUN_DOMAIN_NAME
@@ -503,7 +511,7 @@ def email_daily_prayerTime(user, daily_prayer, prayer_times):
             # Use Django's default email backend
             email = EmailMultiAlternatives(
                 subject=email_subject,
-                body=strip_tags(email_body),
+                body=render_daily_summary(user, daily_prayer, prayer_times, CHANNEL_EMAIL_TEXT),
                 from_email=settings.DEFAULT_FROM_EMAIL,
                 to=[user.email]
             )
@@ -517,6 +525,114 @@ def email_daily_prayerTime(user, daily_prayer, prayer_times):
         raise
 
 
+@shared_task
+def send_daily_summary_emails(user_ids=None, now=None):
+    """
+    Send today's daily summary emails in bulk, today being each user's local date.
+    Users are grouped by timetable cohort and each cohort goes out as one batch
+    (Mailgun batch sends or a single SMTP connection), see BulkEmailService.
+    A user's summary is tried DAILY_SUMMARY_EMAIL_MAX_ATTEMPTS times (one per
+    run), and a failure is recorded once, when it is given up.
+    """
+    if user_ids is None and not settings.DAILY_SUMMARY_EMAIL_BATCHING:
+        return {"status": "skipped", "reason": "Bulk email delivery disabled"}
+
+    now = now or timezone.now()
+    max_attempts = settings.DAILY_SUMMARY_EMAIL_MAX_ATTEMPTS
+    utc_today = now.astimezone(dt_timezone.utc).date()
+
+    # Local dates are within a day of the UTC date, each row is checked against its user's
+    daily_prayers = DailyPrayer.objects.filter(
+        prayer_date__range=(utc_today - timedelta(days=1), utc_today + timedelta(days=1)),
+        is_email_notified=False,
+        email_attempts__lt=max_attempts,
+        user__receive_notifications=True,
+        user__preferences__daily_prayer_summary_enabled=True,
+        user__preferences__daily_prayer_summary_message_method='email',
+    ).select_related('user').prefetch_related('prayer_times')
+
+    if user_ids is not None:
+        daily_prayers = daily_prayers.filter(user_id__in=user_ids)
+
+    # Group users sharing a timetable so each cohort is rendered and sent once
+    cohorts = {}
+    for daily_prayer in daily_prayers:
+        user = daily_prayer.user
+        if daily_prayer.prayer_date != local_now(user.timezone, now).date():
+            continue
+        if not user.email or not user.can_send_notification('daily_summary'):
+            continue
+        prayer_times = list(daily_prayer.prayer_times.all())
+        key = timetable_key(daily_prayer, prayer_times)
+        cohorts.setdefault(key, (daily_prayer, prayer_times, []))[2].append(daily_prayer)
+
+    sent_count = 0
+    failed_count = 0
+    given_up_count = 0
+    api_calls = 0
+
+    for daily_prayer, prayer_times, members in cohorts.values():
+        html = get_compiled_daily_summary(daily_prayer, prayer_times, CHANNEL_EMAIL_HTML)
+        text = get_compiled_daily_summary(daily_prayer, prayer_times, CHANNEL_EMAIL_TEXT)
+        recipients = [
+            BulkEmailRecipient(
+                email=member.user.email,
+                variables={'name': member.user.username, 'html_name': escape(member.user.username)}
+            )
+            for member in members
+        ]
+
+        result = BulkEmailService.send_batch(
+            subject=f"Daily Prayer Times for {daily_prayer.prayer_date}",
+            html_template=html.with_placeholder('%recipient.html_name%'),
+            text_template=text.with_placeholder('%recipient.name%'),
+            recipients=recipients,
+        )
+        api_calls += result.api_calls
+
+        sent = set(result.sent)
+        delivered = [member for member in members if member.user.email in sent]
+        undelivered = [member for member in members if member.user.email not in sent]
+        given_up = [member for member in undelivered if member.email_attempts + 1 >= max_attempts]
+
+        DailyPrayer.objects.filter(id__in=[member.id for member in delivered]).update(
+            is_email_notified=True, email_attempts=F('email_attempts') + 1
+        )
+        DailyPrayer.objects.filter(id__in=[member.id for member in undelivered]).update(
+            email_attempts=F('email_attempts') + 1
+        )
+        # update() sends no post_save, is_email_notified is on the dashboard
+        invalidate_dashboard_snapshots(member.user_id for member in delivered)
+        for member in delivered:
+            member.user.record_notification_sent()
+
+        NotificationUsage.objects.bulk_create(
+            [NotificationUsage(user=member.user, notification_type='email', success=True) for member in delivered] +
+            [
+                NotificationUsage(
+                    user=member.user, notification_type='email', success=False,
+                    error_message=result.error_message
+                )
+                for member in given_up
+            ]
+        )
+
+        sent_count += len(delivered)
+        failed_count += len(undelivered)
+        given_up_count += len(given_up)
+
+    print(f"✅ Bulk daily summary emails: {sent_count} sent, {failed_count} failed "
+          f"({given_up_count} given up), {len(cohorts)} cohorts, {api_calls} calls")
+    return {
+        "status": "success",
+        "sent": sent_count,
+        "failed": failed_count,
+        "given_up": given_up_count,
+        "cohorts": len(cohorts),
+        "api_calls": api_calls,
+    }
+
+
 def send_pre_prayer_notification_email(email, prayer_name, prayer_time):
     """
     Helper function to send pre-prayer notification email.
@@ -535,6 +651,8 @@ def send_pre_prayer_notification_email(email, prayer_name, prayer_time):
         
         # Check if Mailgun is configured, otherwise use default email backend
         if hasattr(settings, 'MAILGUN_API_KEY') and settings.MAILGUN_API_KEY:
+            from django_mailgun_mime.backends import MailgunMIMEBackend
+
             email_backend = MailgunMIMEBackend(
                 api_key=settings.MAILGUN_API_KEY,
                 domain=settings.MAILGUN_DOMAIN_NAME
@@ -565,6 +683,7 @@ def send_pre_prayer_notification_email(email, prayer_name, prayer_time):
 
 
 @shared_task
+@scheduling_pass('schedule_notifications_for_day')
 def schedule_notifications_for_day(user_id, gregorian_date_formatted):
     """
     Schedule notifications for the day with proper error handling.
@@ -576,8 +695,7 @@ def schedule_notifications_for_day(user_id, gregorian_date_formatted):
         if not user.receive_notifications:
             return {"status": "skipped", "reason": "Notifications disabled for user"}
 
-        user_timezone = pytz.timezone(user.timezone)
-        current_date = user_timezone.localize(datetime.strptime(gregorian_date_formatted, '%Y-%m-%d')).date()
+        current_date = datetime.strptime(gregorian_date_formatted, '%Y-%m-%d').date()
 
         # Ensure user preferences exist
         user_preferences = ensure_user_preferences(user)
@@ -591,8 +709,8 @@ def schedule_notifications_for_day(user_id, gregorian_date_formatted):
         # Schedule notifications for each prayer time
         for prayer_time_obj in daily_prayer.prayer_times.all():
             # Create timezone-aware datetime for the prayer time
-            prayer_datetime = user_timezone.localize(
-                datetime.combine(current_date, prayer_time_obj.prayer_time)
+            prayer_datetime = localize(
+                datetime.combine(current_date, prayer_time_obj.prayer_time), user.timezone
             )
 
             # Calculate notification time (timezone-aware)
@@ -641,18 +759,24 @@ def send_pre_adhan_notification(user_id, prayer_name, prayer_time):
         success = False
         error_message = None
         result = None
+        delivery = Delivery('pre_adhan', prayer_name, current_task_eta())
         
         try:
             if method == 'email':
                 send_pre_prayer_notification_email(user.email, prayer_name, prayer_time)
                 success = True
                 result = {"provider": "email", "message_id": "email_sent"}
+                NotificationService.log_communication(
+                    user, 'email', 'email', True, delivery,
+                    recipient=user.email, dispatched_at=timezone.now()
+                )
             
             elif method == 'whatsapp':
                 result = NotificationService.send_whatsapp(
                     user, 
                     f'🕌 Prayer Time Reminder\n\nAssalamu Alaikum!\nIt\'s almost time for {prayer_name} prayer.\nPrayer time: {prayer_time.strftime("%I:%M %p")}\n\nMay Allah accept your prayers. 🤲',
-                    log_usage=True
+                    log_usage=True,
+                    delivery=delivery
                 )
                 success = result.success
                 error_message = result.error_message if not result.success else None
@@ -661,12 +785,14 @@ def send_pre_adhan_notification(user_id, prayer_name, prayer_time):
                 result = NotificationService.send_sms(
                     user,
                     f'Assalamu Alaikum! Prayer time ({prayer_name}) is approaching at {prayer_time.strftime("%I:%M %p")}.',
-                    log_usage=True
+                    log_usage=True,
+                    delivery=delivery
                 )
                 success = result.success
                 error_message = result.error_message if not result.success else None
             
             if success:
+                observe_delivery_lag(method, delivery.scheduled_at)
                 user.record_notification_sent()
                 
                 # Log the notification
@@ -674,7 +800,9 @@ def send_pre_adhan_notification(user_id, prayer_name, prayer_time):
                     user=user,
                     notification_type=method,
                     prayer_name=prayer_name,
-                    success=True
+                    success=True,
+                    scheduled_at=delivery.scheduled_at,
+                    dispatched_at=timezone.now()
                 )
                 
                 # Handle different result types (dict vs object)
@@ -804,6 +932,7 @@ def send_pre_adhan_notification(user_id, prayer_name, prayer_time):
 
 
 @shared_task
+@scheduling_pass('schedule_phone_calls_for_day')
 def schedule_phone_calls_for_day(user_id, date):
     """
     Schedule phone calls for the day with proper error handling.
@@ -812,9 +941,6 @@ def schedule_phone_calls_for_day(user_id, date):
         date = datetime.strptime(date, '%Y-%m-%d').date()
         user = User.objects.get(pk=user_id)
 
-        # Get user's timezone
-        user_timezone = pytz.timezone(user.timezone)
-
         # Ensure user preferences exist
         user_preferences = ensure_user_preferences(user)
 
@@ -828,11 +954,9 @@ def schedule_phone_calls_for_day(user_id, date):
             for prayer_time_obj in daily_prayer.prayer_times.all():
                 prayer_time = prayer_time_obj.prayer_time
                 # Create timezone-aware datetime for the call
-                call_datetime = user_timezone.localize(
-                    datetime.combine(date, prayer_time)
-                )
+                call_datetime = localize(datetime.combine(date, prayer_time), user.timezone)
                 make_call_and_play_audio.apply_async(
-                    (user.phone_number, adhan_audio_url, user.id),
+                    (user.phone_number, adhan_audio_url, user.id, prayer_time_obj.prayer_name),
                     eta=call_datetime
                 )
                 
@@ -846,10 +970,11 @@ def schedule_phone_calls_for_day(user_id, date):
 
             
 @shared_task
-def make_call_and_play_audio(recipient_phone_number, audio_url, user_id):
+def make_call_and_play_audio(recipient_phone_number, audio_url, user_id, prayer_name=None):
     """Make adhan call using the new provider system"""
     try:
         user = User.objects.get(pk=user_id)
+        delivery = Delivery('adhan_call', prayer_name, current_task_eta())
 
         # Check if user has notifications enabled
         if not user.receive_notifications:
@@ -863,8 +988,11 @@ def make_call_and_play_audio(recipient_phone_number, audio_url, user_id):
                 result = NotificationService.make_text_call(
                     user,
                     "🕌 Adhan - It's time for prayer! Allahu Akbar!",
-                    log_usage=True
+                    log_usage=True,
+                    delivery=delivery
                 )
+                if result.success:
+                    observe_delivery_lag('text_call', delivery.scheduled_at)
                 return {
                     "status": "success" if result.success else "error",
                     "method": "text_fallback",
@@ -880,9 +1008,10 @@ def make_call_and_play_audio(recipient_phone_number, audio_url, user_id):
             return {"status": "skipped", "reason": "Daily limit reached"}
         
         # Make the call using the new system
-        result = NotificationService.make_call(user, audio_url, log_usage=True)
+        result = NotificationService.make_call(user, audio_url, log_usage=True, delivery=delivery)
         
         if result.success:
+            observe_delivery_lag('call', delivery.scheduled_at)
             user.record_notification_sent()
             return {
                 "status": "success",
@@ -896,10 +1025,12 @@ def make_call_and_play_audio(recipient_phone_number, audio_url, user_id):
             text_result = NotificationService.make_text_call(
                 user,
                 "🕌 Adhan - It's time for prayer! Allahu Akbar!",
-                log_usage=True
+                log_usage=True,
+                delivery=delivery
             )
             
             if text_result.success:
+                observe_delivery_lag('text_call', delivery.scheduled_at)
                 user.record_notification_sent()
                 return {
                     "status": "success",
@@ -993,7 +1124,7 @@ def notify_prayer_time(prayer_time_id):
             return {"status": "error", "reason": "No phone number"}
         
         # Create Twilio client
-        client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
+        client = get_twilio_client()
 
         # Calculate SMS schedule time
         sms_time = prayer.prayer_time - timedelta(minutes=15)  
@@ -1029,3 +1160,13 @@ def notify_prayer_time(prayer_time_id):
     except Exception as e:
         print(f"❌ Error in notify_prayer_time for prayer {prayer_time_id}: {str(e)}")
         return {"status": "error", "reason": str(e)}
+
+
+@shared_task
+def archive_old_prayers():
+    """Move past months of DailyPrayer/PrayerTime rows to archive files (SalatTracker/prayer_archive.py)"""
+    from SalatTracker import prayer_archive
+
+    months = prayer_archive.archive_old_prayers()
+    return {'status': 'ok', 'months': [month['month'] for month in months],
+            'rows': sum(month['rows'] for month in months)}
@@ -1,3 +1,470 @@
-from django.test import TestCase
+from datetime import date, time
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from SalatTracker import rendering
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_timetable():
+    daily_prayer = SimpleNamespace(prayer_date=date(2024, 3, 1), weekday_name='Friday')
+    prayer_times = [
+        SimpleNamespace(prayer_name='Fajr', prayer_time=time(5, 30)),
+        SimpleNamespace(prayer_name='Dhuhr', prayer_time=time(13, 15)),
+    ]
+    return daily_prayer, prayer_times
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CohortRenderingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        rendering._local_cache.clear()
+
+    def test_sms_matches_per_user_message(self):
+        daily_prayer, prayer_times = make_timetable()
+        user = SimpleNamespace(username='amina')
+        message = rendering.render_daily_summary(user, daily_prayer, prayer_times, rendering.CHANNEL_SMS)
+        self.assertEqual(
+            message,
+            "Assalamu Alaikum, amina!\n\nToday's prayer times:\nFajr: 05:30 AM\nDhuhr: 01:15 PM\n"
+        )
+
+    def test_email_html_escapes_name_and_renders_once(self):
+        daily_prayer, prayer_times = make_timetable()
+        with self.assertTemplateUsed('SalatTracker/daily_prayer_email.html', count=1):
+            first = rendering.render_daily_summary(
+                SimpleNamespace(username='<b>x</b>'), daily_prayer, prayer_times, rendering.CHANNEL_EMAIL_HTML
+            )
+            second = rendering.render_daily_summary(
+                SimpleNamespace(username='yusuf'), daily_prayer, prayer_times, rendering.CHANNEL_EMAIL_HTML
+            )
+        self.assertIn('Assalamu Alaikum, &lt;b&gt;x&lt;/b&gt;!', first)
+        self.assertIn('Assalamu Alaikum, yusuf!', second)
+        self.assertNotIn(rendering.NAME_SLOT, second)
+
+    def test_different_timetables_do_not_share_renders(self):
+        daily_prayer, prayer_times = make_timetable()
+        other_times = [SimpleNamespace(prayer_name='Fajr', prayer_time=time(5, 45))]
+        self.assertNotEqual(
+            rendering.timetable_key(daily_prayer, prayer_times),
+            rendering.timetable_key(daily_prayer, other_times),
+        )
+
+
+
+class PrayerClockTests(SimpleTestCase):
+    def test_live_fields_from_snapshot_prayers(self):
+        from datetime import datetime, timezone as dt_timezone
+        from SalatTracker.dashboard_snapshot import prayer_clock
+
+        prayers = [
+            {'name': 'Fajr', 'time_24h': '05:30'},
+            {'name': 'Dhuhr', 'time_24h': '13:15'},
+            {'name': 'Asr', 'time_24h': '16:40'},
+        ]
+        now = datetime(2024, 3, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+        result, next_prayer, remaining = prayer_clock(prayers, is_today=True, now=now)
+
+        self.assertEqual([p['is_past'] for p in result], [True, False, False])
+        self.assertEqual(next_prayer['name'], 'Dhuhr')
+        self.assertEqual(next_prayer['minutes_remaining'], 75)
+        self.assertEqual(remaining, 2)
+        self.assertNotIn('is_past', prayers[0])
+
+
+class CalendarExportTests(SimpleTestCase):
+    days = [
+        {'date': '2024-03-01', 'weekday': 'Friday', 'prayers': [{'name': 'Fajr', 'time': '05:30'}]},
+        {'date': '2024-03-02', 'weekday': 'Saturday', 'prayers': [{'name': 'Fajr', 'time': '05:31'}]},
+    ]
+
+    def test_chunked_json_is_one_document(self):
+        import json
+        from SalatTracker.calendar_export import stream_json
+
+        body = json.loads(''.join(stream_json(iter(self.days), '2024-03-01', '2024-03-02')))
+        self.assertEqual(body['days'], self.days)
+
+    def test_ics_event_local_time_written_in_utc(self):
+        from SalatTracker.calendar_export import stream_ics
+
+        user = SimpleNamespace(id=7, timezone='Africa/Lagos')
+        ics = ''.join(stream_ics(iter(self.days[:1]), user))
+        self.assertTrue(ics.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertIn('DTSTART:20240301T043000Z\r\n', ics)
+        self.assertIn('DTEND:20240301T044500Z\r\n', ics)
+        self.assertNotIn('TZID', ics)
+        self.assertEqual(ics.count('BEGIN:VEVENT'), 1)
+
+
+class PrayerArchiveTests(SimpleTestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_month(self):
+        from datetime import datetime, timezone as dt_timezone
+        from muadhin.partitioning import archive_path
+        from SalatTracker.prayer_archive import ARCHIVE_NAME, write_archive
+
+        rows = [
+            (user_id, date(2024, 3, day), 'Friday', True, False, name, prayer_time, True, False)
+            for user_id in (3, 7, 12)
+            for day in (1, 2)
+            for name, prayer_time in (('Fajr', time(5, 30 + day)), ('Maghrib', time(18, 40)))
+        ]
+        path = archive_path(ARCHIVE_NAME, datetime(2024, 3, 1, tzinfo=dt_timezone.utc))
+        return path, write_archive(path, rows)
+
+    def test_reads_one_users_days_in_range(self):
+        from SalatTracker.prayer_archive import iter_archived_days
+
+        with self.settings(LOG_ARCHIVE_DIR=self.directory):
+            _, stats = self.write_month()
+            self.assertEqual(stats, {'rows': 12, 'users': 3})
+            days = list(iter_archived_days(7, date(2024, 2, 20), date(2024, 3, 1)))
+
+        self.assertEqual(days, [{'date': '2024-03-01', 'weekday': 'Friday', 'prayers': [
+            {'name': 'Fajr', 'time': '05:31'}, {'name': 'Maghrib', 'time': '18:40'},
+        ]}])
+
+    def test_archive_is_plain_gzipped_csv(self):
+        import csv
+        import gzip
+        import os
+        from SalatTracker.prayer_archive import COLUMNS, index_path, iter_archived_days
+
+        with self.settings(LOG_ARCHIVE_DIR=self.directory):
+            path, _ = self.write_month()
+            with gzip.open(path, 'rt', newline='') as f:
+                rows = list(csv.reader(f))
+            self.assertEqual(rows[0], COLUMNS)
+            self.assertEqual(rows[1], ['3', '2024-03-01', 'Friday', '1', '0', 'Fajr', '05:31:00', '1', '0'])
+            self.assertEqual(len(rows), 13)
+
+            # Without the index the file is scanned
+            os.remove(index_path(path))
+            self.assertEqual(len(list(iter_archived_days(12, date(2024, 3, 1), date(2024, 3, 31)))), 2)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DailySummaryEmailTaskTests(TestCase):
+    def make_day(self, username, tz_name, prayer_date):
+        from SalatTracker.models import DailyPrayer, PrayerTime
+        from users.models import CustomUser, UserPreferences
+
+        user = CustomUser.objects.create_user(username, f'{username}@example.com', 'pw', timezone=tz_name)
+        UserPreferences.objects.update_or_create(user=user, defaults={
+            'daily_prayer_summary_enabled': True, 'daily_prayer_summary_message_method': 'email',
+        })
+        day = DailyPrayer.objects.create(user=user, prayer_date=prayer_date, weekday_name='Friday')
+        PrayerTime.objects.create(daily_prayer=day, prayer_name='Fajr', prayer_time=time(5, 30))
+        return day
+
+    def test_sends_for_each_users_local_date(self):
+        from datetime import datetime, timezone as dt_timezone
+        from django.core import mail
+        from SalatTracker.tasks import send_daily_summary_emails
+
+        # 22:00 UTC on Mar 1 is 23:00 in Lagos and already Mar 2 in Kiritimati (UTC+14)
+        now = datetime(2024, 3, 1, 22, 0, tzinfo=dt_timezone.utc)
+        lagos = self.make_day('lagos', 'Africa/Lagos', date(2024, 3, 2))
+        kiritimati = self.make_day('kiritimati', 'Pacific/Kiritimati', date(2024, 3, 2))
+
+        with self.settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', MAILGUN_API_KEY=None):
+            result = send_daily_summary_emails(user_ids=[lagos.user_id, kiritimati.user_id], now=now)
+
+        self.assertEqual(result['sent'], 1)
+        self.assertEqual(mail.outbox[0].to, ['kiritimati@example.com'])
+        lagos.refresh_from_db()
+        self.assertFalse(lagos.is_email_notified)
+
+    def test_failures_are_capped_and_recorded_once(self):
+        from datetime import datetime, timezone as dt_timezone
+        from unittest import mock
+        from communications.services.bulk_email_service import BulkEmailResult
+        from subscriptions.models import NotificationUsage
+        from SalatTracker.tasks import send_daily_summary_emails
+
+        now = datetime(2024, 3, 2, 6, 0, tzinfo=dt_timezone.utc)
+        day = self.make_day('failing', 'Africa/Lagos', date(2024, 3, 2))
+        failed = BulkEmailResult(failed=['failing@example.com'], api_calls=1, error_message='SMTP down')
+
+        with self.settings(DAILY_SUMMARY_EMAIL_MAX_ATTEMPTS=3), \
+                mock.patch('SalatTracker.tasks.BulkEmailService.send_batch', return_value=failed) as send:
+            results = [send_daily_summary_emails(user_ids=[day.user_id], now=now) for _ in range(5)]
+
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual([r['given_up'] for r in results], [0, 0, 1, 0, 0])
+        self.assertEqual(
+            list(NotificationUsage.objects.filter(user_id=day.user_id).values_list('success', 'error_message')),
+            [(False, 'SMTP down')]
+        )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardInvalidationTests(TestCase):
+    def setUp(self):
+        from SalatTracker.models import DailyPrayer, PrayerTime
+        from users.models import CustomUser
+
+        cache.clear()
+        self.user = CustomUser.objects.create_user('dash', 'dash@example.com', 'pw')
+        self.day = DailyPrayer.objects.create(user=self.user, prayer_date=date(2024, 3, 2))
+        self.prayer_time = PrayerTime.objects.create(daily_prayer=self.day, prayer_name='Fajr', prayer_time=time(5, 30))
+
+    def version(self):
+        from SalatTracker.dashboard_snapshot import _get_version
+
+        return _get_version(self.user.id)
+
+    def test_prayer_time_save_looks_up_the_user_once(self):
+        from SalatTracker.models import PrayerTime
+
+        prayer_time = PrayerTime.objects.get(pk=self.prayer_time.pk)
+        prayer_time.save()
+        before = self.version()
+        with self.assertNumQueries(1):
+            prayer_time.is_sms_notified = True
+            prayer_time.save(update_fields=['is_sms_notified'])
+        self.assertEqual(self.version(), before + 1)
+
+    def test_bulk_send_invalidates_delivered_users(self):
+        from datetime import datetime, timezone as dt_timezone
+        from users.models import UserPreferences
+        from SalatTracker.tasks import send_daily_summary_emails
+
+        UserPreferences.objects.update_or_create(user=self.user, defaults={
+            'daily_prayer_summary_enabled': True, 'daily_prayer_summary_message_method': 'email',
+        })
+        before = self.version()
+        with self.settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', MAILGUN_API_KEY=None):
+            send_daily_summary_emails(user_ids=[self.user.id], now=datetime(2024, 3, 2, 6, tzinfo=dt_timezone.utc))
+
+        self.day.refresh_from_db()
+        self.assertTrue(self.day.is_email_notified)
+        self.assertGreater(self.version(), before)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from SalatTracker.models import DailyPrayer, PrayerTime
+        from users.models import CustomUser
+
+        cache.clear()
+        self.user = CustomUser.objects.create_user('etag', 'etag@example.com', 'pw')
+        self.day = DailyPrayer.objects.create(user=self.user, prayer_date=date(2024, 3, 2), weekday_name='Saturday')
+        self.fajr = PrayerTime.objects.create(daily_prayer=self.day, prayer_name='Fajr', prayer_time=time(5, 30))
+        PrayerTime.objects.create(daily_prayer=self.day, prayer_name='Dhuhr', prayer_time=time(12, 45))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_dashboard_not_modified_until_the_timetable_changes(self):
+        url = '/api/dashboard/?date=2024-03-02'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.fajr.prayer_time = time(5, 31)
+        self.fajr.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_prayer_day_etag(self):
+        url = f'/api/prayer-times/{self.user.id}/2024-03-02/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Day-level fields are part of the version too
+        self.day.is_sms_notified = True
+        self.day.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Days without rows are left to the view
+        self.assertEqual(self.client.get(f'/api/prayer-times/{self.user.id}/2024-03-03/').status_code, 404)
+
+    def test_prayer_day_last_modified(self):
+        from datetime import datetime, timezone as dt_timezone
+        from django.utils.http import http_date, parse_http_date
+        from SalatTracker.models import PrayerTime
+
+        url = f'/api/prayer-times/{self.user.id}/2024-03-02/'
+        PrayerTime.objects.filter(daily_prayer=self.day).update(
+            updated_at=datetime(2024, 3, 1, 22, tzinfo=dt_timezone.utc))
+        response = self.client.get(url)
+        last_modified = response['Last-Modified']
+        self.assertEqual(parse_http_date(last_modified), datetime(2024, 3, 1, 22, tzinfo=dt_timezone.utc).timestamp())
+
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        PrayerTime.objects.filter(pk=self.fajr.pk).update(updated_at=datetime(2024, 3, 2, 3, tzinfo=dt_timezone.utc))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Last-Modified'], http_date(datetime(2024, 3, 2, 3, tzinfo=dt_timezone.utc).timestamp()))
+
+
+class DailyPrayerListTests(TestCase):
+    def test_filters_and_rejects_bad_parameters(self):
+        from rest_framework.test import APIClient
+        from SalatTracker.models import DailyPrayer
+        from users.models import CustomUser
+
+        user = CustomUser.objects.create_user('history', 'history@example.com', 'pw')
+        for day in (1, 2, 3):
+            DailyPrayer.objects.create(user=user, prayer_date=date(2024, 3, day))
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.get('/api/daily-prayers/', {'user': user.id, 'from': '2024-03-02'})
+        self.assertEqual([day['prayer_date'] for day in response.data['results']], ['2024-03-02', '2024-03-03'])
+        self.assertEqual(client.get('/api/daily-prayers/', {'user': 'abc'}).status_code, 400)
+        self.assertEqual(client.get('/api/daily-prayers/', {'to': '03/03/2024'}).status_code, 400)
+
+
+class CalendarDaysTests(TestCase):
+    def test_prayers_without_a_time_are_skipped(self):
+        from SalatTracker.calendar_export import iter_calendar_days, stream_ics
+        from SalatTracker.models import DailyPrayer, PrayerTime
+        from users.models import CustomUser
+
+        user = CustomUser.objects.create_user('calendar', 'calendar@example.com', 'pw')
+        day = DailyPrayer.objects.create(user=user, prayer_date=date(2024, 3, 1), weekday_name='Friday')
+        PrayerTime.objects.create(daily_prayer=day, prayer_name='Fajr', prayer_time=time(5, 30))
+        PrayerTime.objects.create(daily_prayer=day, prayer_name='Sunrise', prayer_time=None)
+
+        days = list(iter_calendar_days(user, date(2024, 3, 1), date(2024, 3, 1)))
+        self.assertEqual(days[0]['prayers'], [{'name': 'Fajr', 'time': '05:30'}])
+        self.assertEqual(''.join(stream_ics(iter(days), user)).count('BEGIN:VEVENT'), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, PRAYER_ARCHIVE_AFTER_DAYS=90)
+class ArchiveMonthTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+        from SalatTracker.models import DailyPrayer, PrayerTime
+        from users.models import CustomUser
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.users = [CustomUser.objects.create_user(name, f'{name}@example.com', 'pw') for name in ('amina', 'bilal')]
+        for user in self.users:
+            for prayer_date in (date(2026, 6, 29), date(2026, 6, 30), date(2026, 7, 1)):
+                day = DailyPrayer.objects.create(user=user, prayer_date=prayer_date, weekday_name='Monday')
+                PrayerTime.objects.create(daily_prayer=day, prayer_name='Fajr', prayer_time=time(4, 10))
+                PrayerTime.objects.create(daily_prayer=day, prayer_name='Isha', prayer_time=time(21, 5))
+
+    def test_refuses_without_persistent_storage(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from SalatTracker.models import DailyPrayer
+        from SalatTracker.prayer_archive import archive_old_prayers
+
+        with self.settings(LOG_ARCHIVE_DIR=self.directory, LOG_ARCHIVE_PERSISTENT=False):
+            with self.assertRaises(ImproperlyConfigured):
+                archive_old_prayers(today=date(2026, 10, 19))
+        self.assertEqual(DailyPrayer.objects.count(), 6)
+
+    def test_moves_past_months_to_the_archive(self):
+        from SalatTracker.models import DailyPrayer, PrayerTime
+        from SalatTracker.prayer_archive import archive_old_prayers, has_archives, iter_archived_days
+
+        with self.settings(LOG_ARCHIVE_DIR=self.directory, LOG_ARCHIVE_PERSISTENT=True):
+            results = archive_old_prayers(today=date(2026, 10, 19))
+            self.assertEqual([(r['month'], r['rows'], r['users']) for r in results], [('2026-06', 8, 2)])
+            self.assertTrue(has_archives(date(2026, 6, 1), date(2026, 6, 30)))
+            days = list(iter_archived_days(self.users[1].id, date(2026, 6, 30), date(2026, 7, 31)))
+
+        self.assertEqual(days, [{'date': '2026-06-30', 'weekday': 'Monday', 'prayers': [
+            {'name': 'Fajr', 'time': '04:10'}, {'name': 'Isha', 'time': '21:05'},
+        ]}])
+        self.assertEqual(list(DailyPrayer.objects.values_list('prayer_date', flat=True).distinct()), [date(2026, 7, 1)])
+        self.assertEqual(PrayerTime.objects.count(), 4)
+
+    def test_history_endpoints_after_archiving(self):
+        from rest_framework.test import APIClient
+        from SalatTracker.prayer_archive import archive_old_prayers
+
+        user = self.users[1]
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.settings(LOG_ARCHIVE_DIR=self.directory, LOG_ARCHIVE_PERSISTENT=True):
+            archive_old_prayers(today=date(2026, 10, 19))
+
+            response = client.get(f'/api/prayer-times/{user.id}/2026-06-30/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [(p['prayer_name'], p['prayer_time'], p['is_sms_notified']) for p in response.data],
+                [('Fajr', '04:10:00', False), ('Isha', '21:05:00', False)]
+            )
+            self.assertEqual(client.get(f'/api/prayer-times/{user.id}/2026-06-15/').status_code, 404)
+
+            response = client.get('/api/daily-prayers/', {'user': user.id, 'from': '2026-06-01'})
+            self.assertEqual(response.status_code, 400)
+            response = client.get('/api/daily-prayers/', {'user': user.id, 'from': '2026-07-01'})
+            self.assertEqual([day['prayer_date'] for day in response.data['results']], ['2026-07-01'])
+
+    def test_month_archived_twice_reads_back_once(self):
+        from SalatTracker.models import DailyPrayer, PrayerTime
+        from SalatTracker.prayer_archive import archive_old_prayers, iter_archived_days
+
+        user = self.users[1]
+        with self.settings(LOG_ARCHIVE_DIR=self.directory, LOG_ARCHIVE_PERSISTENT=True):
+            archive_old_prayers(today=date(2026, 10, 19))
+            # The day is fetched again after its month was archived
+            day = DailyPrayer.objects.create(user=user, prayer_date=date(2026, 6, 30), weekday_name='Tuesday')
+            PrayerTime.objects.create(daily_prayer=day, prayer_name='Fajr', prayer_time=time(4, 12))
+            PrayerTime.objects.create(daily_prayer=day, prayer_name='Isha', prayer_time=time(21, 7))
+            results = archive_old_prayers(today=date(2026, 10, 19))
+            self.assertTrue(results[0]['path'].endswith('2026-06.1.csv.gz'))
+            days = list(iter_archived_days(user.id, date(2026, 6, 29), date(2026, 6, 30)))
+
+        self.assertEqual(days, [
+            {'date': '2026-06-29', 'weekday': 'Monday', 'prayers': [
+                {'name': 'Fajr', 'time': '04:10'}, {'name': 'Isha', 'time': '21:05'},
+            ]},
+            {'date': '2026-06-30', 'weekday': 'Tuesday', 'prayers': [
+                {'name': 'Fajr', 'time': '04:12'}, {'name': 'Isha', 'time': '21:07'},
+            ]},
+        ])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class PreAdhanNotificationBudgetTests(TestCase):
+    def test_email_reminder_query_budget(self):
+        from django.core import mail
+        from muadhin.task_profiler import assert_task_budget
+        from SalatTracker.tasks import send_pre_adhan_notification
+        from users.models import CustomUser
+
+        cache.clear()
+        user = CustomUser.objects.create_user('budget', 'budget@example.com', 'pw')
+
+        # user, subscription, plan, preferences; communication log, daily count, usage row
+        p = assert_task_budget(
+            send_pre_adhan_notification, args=(user.id, 'Fajr', time(5, 0)), max_queries=7, max_http_calls=0
+        )
+        self.assertEqual(p.queries, 7)
+        self.assertEqual([message.to for message in mail.outbox], [['budget@example.com']])
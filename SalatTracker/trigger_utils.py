@@ -6,7 +6,10 @@ from django.utils import timezone
 from django.utils.dateparse import parse_time
 from django.contrib.auth import get_user_model
 from .models import DailyPrayer, PrayerTime
+from .dashboard_snapshot import get_dashboard_snapshot, prayer_clock, refresh_dashboard_snapshot
 from users.models import PrayerMethod
+from users.services.geocoding import timings_request
+from muadhin.metrics import aladhan_fetch
 
 User = get_user_model()
 
@@ -34,15 +37,11 @@ def trigger_fetch_prayer_times(user_id, target_date=None):
             )
 
         # Call prayer times API
-        api_url = "http://api.aladhan.com/v1/timingsByCity"
-        params = {
-            "date": date_str,
-            "city": user.city,
-            "country": user.country,
-            "method": prayer_method.sn,
-        }
+        # By the geocoded coordinates when the city resolved (users/services/geocoding.py)
+        api_url, params = timings_request(user, date_str, prayer_method.sn)
 
-        response = requests.get(api_url, params=params, timeout=30)
+        with aladhan_fetch('trigger') as fetch:
+            response = fetch.record(requests.get(api_url, params=params, timeout=30))
         
         if response.status_code == 200:
             data = response.json().get("data", {}).get("timings", {})
@@ -84,6 +83,8 @@ def trigger_fetch_prayer_times(user_id, target_date=None):
                     prayer_time_obj.save(update_fields=['prayer_time'])
                     prayer_times_updated += 1
 
+            refresh_dashboard_snapshot(user, target_date)
+
             return {
                 "status": "success",
                 "user_id": user_id,
@@ -151,8 +152,10 @@ def check_prayer_times_availability(user, target_date=None):
             prayer_date=target_date
         ).prefetch_related('prayer_times').first()
         
-        if daily_prayer and daily_prayer.prayer_times.exists():
-            prayer_count = daily_prayer.prayer_times.count()
+        # len() of the prefetched rows instead of .exists()/.count() queries
+        prayer_count = len(daily_prayer.prayer_times.all()) if daily_prayer else 0
+
+        if prayer_count:
             return {
                 "available": True,
                 "daily_prayer_id": daily_prayer.id,
@@ -183,49 +186,40 @@ def check_prayer_times_availability(user, target_date=None):
 def get_dashboard_prayer_data(user, target_date=None):
     """
     Get prayer data for dashboard - returns immediately with availability status
+    Served from the precomputed dashboard snapshot, only is_past/minutes are live
     """
     if target_date is None:
         target_date = date.today()
     
-    availability = check_prayer_times_availability(user, target_date)
+    is_today = target_date == date.today()
+    daily_prayer = get_dashboard_snapshot(user, target_date)['daily_prayer']
     
-    if availability["available"]:
-        # Get prayer times
-        daily_prayer = DailyPrayer.objects.filter(
-            user=user, 
-            prayer_date=target_date
-        ).prefetch_related('prayer_times').first()
+    if daily_prayer and daily_prayer['prayers']:
+        prayers, next_prayer, remaining_count = prayer_clock(daily_prayer['prayers'], is_today)
+        if not is_today:
+            # Nothing is past on another day
+            remaining_count = len(prayers)
         
-        prayer_times = []
-        next_prayer = None
-        remaining_count = 0
-        current_time = timezone.now().time()
+        prayer_times = [
+            {
+                'id': prayer['id'],
+                'name': prayer['name'],
+                'time': prayer['time_24h'],
+                'time_12h': prayer['time_12h'],
+                'is_past': prayer['is_past'],
+                'is_sms_notified': prayer['is_sms_notified'],
+                'is_phonecall_notified': prayer['is_phonecall_notified']
+            }
+            for prayer in prayers
+        ]
         
-        for pt in daily_prayer.prayer_times.all().order_by('prayer_time'):
-            is_past = pt.prayer_time < current_time if target_date == date.today() else False
-            
-            prayer_times.append({
-                'id': pt.id,
-                'name': pt.prayer_name,
-                'time': pt.prayer_time.strftime('%H:%M'),
-                'time_12h': pt.prayer_time.strftime('%I:%M %p'),
-                'is_past': is_past,
-                'is_sms_notified': pt.is_sms_notified,
-                'is_phonecall_notified': pt.is_phonecall_notified
-            })
-            
-            # Calculate next prayer for today
-            if target_date == date.today() and not is_past and next_prayer is None:
-                next_prayer = {
-                    'name': pt.prayer_name,
-                    'time': pt.prayer_time.strftime('%I:%M %p'),
-                    'time_24h': pt.prayer_time.strftime('%H:%M'),
-                    'minutes_remaining': int((datetime.combine(target_date, pt.prayer_time) - 
-                                            datetime.combine(target_date, current_time)).total_seconds() / 60)
-                }
-            
-            if not is_past:
-                remaining_count += 1
+        if next_prayer:
+            next_prayer = {
+                'name': next_prayer['name'],
+                'time': next_prayer['time_12h'],
+                'time_24h': next_prayer['time_24h'],
+                'minutes_remaining': next_prayer['minutes_remaining']
+            }
         
         return {
             "has_prayer_times": True,
@@ -234,8 +228,8 @@ def get_dashboard_prayer_data(user, target_date=None):
             "remaining_prayers": remaining_count,
             "date_info": {
                 "date": target_date.strftime('%Y-%m-%d'),
-                "weekday": daily_prayer.weekday_name,
-                "is_today": target_date == date.today()
+                "weekday": daily_prayer['weekday'],
+                "is_today": is_today
             },
             "fetch_needed": False
         }
@@ -248,8 +242,8 @@ def get_dashboard_prayer_data(user, target_date=None):
             "date_info": {
                 "date": target_date.strftime('%Y-%m-%d'),
                 "weekday": None,
-                "is_today": target_date == date.today()
+                "is_today": is_today
             },
             "fetch_needed": True,
             "fetch_trigger_url": f"/api/trigger-fetch-prayer-times/"
-        }
\ No newline at end of file
+        }
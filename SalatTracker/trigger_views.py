@@ -12,7 +12,9 @@ from .trigger_utils import (
     get_dashboard_prayer_data,
     check_prayer_times_availability
 )
-from subscriptions.services.subscription_service import SubscriptionService
+from django.utils.decorators import method_decorator
+from .conditional import dashboard_condition, my_prayer_day_condition
+from .dashboard_snapshot import get_dashboard_snapshot
 
 User = get_user_model()
 
@@ -24,6 +26,7 @@ class FastDashboardView(APIView):
     """
     permission_classes = [IsAuthenticated]
     
+    @method_decorator(dashboard_condition)
     def get(self, request):
         user = request.user
         target_date = self._get_target_date(request)
@@ -40,14 +43,15 @@ class FastDashboardView(APIView):
             'country': user.country
         }
         
-        # Get subscription info
-        subscription_info = self._get_subscription_info(user)
+        # Subscription and preferences come from the precomputed snapshot
+        snapshot = get_dashboard_snapshot(user, target_date)
+        subscription_info = self._get_subscription_info(snapshot)
         
         # Get prayer data (returns immediately)
         prayer_data = get_dashboard_prayer_data(user, target_date)
         
         # Get user preferences
-        preferences_info = self._get_preferences_info(user)
+        preferences_info = self._get_preferences_info(snapshot)
         
         # Build response
         response = {
@@ -88,33 +92,33 @@ class FastDashboardView(APIView):
                 pass
         return date.today()
     
-    def _get_subscription_info(self, user):
+    def _get_subscription_info(self, snapshot):
         """Get subscription information"""
         try:
-            current_plan = SubscriptionService.get_user_plan(user)
-            subscription = getattr(user, 'subscription', None)
+            current_plan = snapshot['current_plan']
+            subscription = snapshot['subscription']
             
             if subscription:
                 return {
-                    'plan_name': current_plan.name,
-                    'plan_type': current_plan.plan_type,
-                    'price': float(current_plan.price),
-                    'status': subscription.status,
-                    'is_trial': getattr(subscription, 'is_trial', False),
-                    'days_remaining': getattr(subscription, 'days_remaining', None),
-                    'notifications_sent_today': getattr(subscription, 'notifications_sent_today', 0),
-                    'max_notifications_per_day': current_plan.max_notifications_per_day
+                    'plan_name': current_plan['name'],
+                    'plan_type': current_plan['plan_type'],
+                    'price': current_plan['price'],
+                    'status': subscription['status'],
+                    'is_trial': subscription['is_trial'],
+                    'days_remaining': subscription['days_remaining'],
+                    'notifications_sent_today': subscription['notifications_sent_today'],
+                    'max_notifications_per_day': current_plan['max_notifications_per_day']
                 }
             else:
                 return {
-                    'plan_name': current_plan.name,
-                    'plan_type': current_plan.plan_type,
-                    'price': float(current_plan.price),
+                    'plan_name': current_plan['name'],
+                    'plan_type': current_plan['plan_type'],
+                    'price': current_plan['price'],
                     'status': 'basic',
                     'is_trial': False,
                     'days_remaining': None,
                     'notifications_sent_today': 0,
-                    'max_notifications_per_day': current_plan.max_notifications_per_day
+                    'max_notifications_per_day': current_plan['max_notifications_per_day']
                 }
         except Exception:
             return {
@@ -125,18 +129,18 @@ class FastDashboardView(APIView):
                 'error': 'Could not load subscription info'
             }
     
-    def _get_preferences_info(self, user):
+    def _get_preferences_info(self, snapshot):
         """Get user preferences"""
         try:
-            prefs = user.preferences
+            prefs = snapshot['preferences']
             return {
-                'daily_summary_enabled': prefs.daily_prayer_summary_enabled,
-                'daily_summary_method': prefs.daily_prayer_summary_message_method,
-                'pre_prayer_enabled': prefs.notification_before_prayer_enabled,
-                'pre_prayer_method': prefs.notification_before_prayer,
-                'pre_prayer_timing': prefs.notification_time_before_prayer,
-                'adhan_call_enabled': prefs.adhan_call_enabled,
-                'adhan_call_method': prefs.adhan_call_method
+                'daily_summary_enabled': prefs['daily_prayer_summary_enabled'],
+                'daily_summary_method': prefs['daily_prayer_summary_message_method'],
+                'pre_prayer_enabled': prefs['notification_before_prayer_enabled'],
+                'pre_prayer_method': prefs['notification_before_prayer'],
+                'pre_prayer_timing': prefs['notification_time_before_prayer'],
+                'adhan_call_enabled': prefs['adhan_call_enabled'],
+                'adhan_call_method': prefs['adhan_call_method']
             }
         except Exception:
             return {
@@ -228,6 +232,7 @@ class CheckPrayerAvailabilityView(APIView):
     """
     permission_classes = [IsAuthenticated]
     
+    @method_decorator(my_prayer_day_condition)
     def get(self, request):
         user = request.user
         
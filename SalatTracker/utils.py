@@ -2,6 +2,7 @@ import requests
 from datetime import datetime
 from SalatTracker.tasks import schedule_notifications_for_day, schedule_phone_calls_for_day, send_daily_prayer_message
 from users.models import CustomUser, PrayerMethod
+from users.services.geocoding import timings_request
 from .models import PrayerTime
 from django.utils import timezone
 from rest_framework.response import Response
@@ -10,6 +11,7 @@ from django.utils import timezone
 from .models import DailyPrayer, PrayerTime
 from django.contrib.auth import get_user_model
 from django.utils.dateparse import parse_time
+from muadhin.metrics import aladhan_fetch
 
 
 User = get_user_model()
@@ -25,15 +27,11 @@ def fetch_and_save_prayer_times(user_id, date):
         # Create default or handle gracefully
         prayer_method = PrayerMethod.objects.create(user=user, sn=1, name='Muslim World League')
 
-    api_url = "http://api.aladhan.com/v1/timingsByCity"
-    params = {
-        "date": date,
-        "city": user.city,
-        "country": user.country,
-        "method": prayer_method.sn,
-    }
+    # By the geocoded coordinates when the city resolved (users/services/geocoding.py)
+    api_url, params = timings_request(user, date, prayer_method.sn)
 
-    response = requests.get(api_url, params=params)
+    with aladhan_fetch('utils') as fetch:
+        response = fetch.record(requests.get(api_url, params=params))
     if response.status_code == 200:
         data = response.json().get("data", {}).get("timings", {})
         date_info = response.json()["data"]["date"]["gregorian"]
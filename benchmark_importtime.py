@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Import-time report for web and worker cold starts.
+
+Runs `python -X importtime` on what a gunicorn worker (django.setup() and the
+URLconf) and a Celery worker (django.setup() and the task modules) import,
+parses the report and prints the median total and the slowest modules.
+
+    python benchmark_importtime.py                  # both targets, 5 runs each
+    python benchmark_importtime.py --target worker --runs 9 --top 30
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+TARGETS = {
+    'web': "import django; django.setup(); import muadhin.urls",
+    'worker': "import django; django.setup(); import SalatTracker.tasks, users.tasks, subscriptions.tasks",
+}
+
+# import time: self [us] | cumulative | imported package
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(stderr):
+    """{module: (self us, cumulative us)} and the total of the top-level imports"""
+    modules = {}
+    total = 0
+    for line in stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = int(match[1]), int(match[2]), match[3], match[4]
+        modules[module] = (self_us, cumulative_us)
+        if len(indent) == 1:
+            total += cumulative_us
+    return modules, total
+
+
+def run_once(code):
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'muadhin.settings')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode:
+        sys.exit(f"❌ Import failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def report(name, code, runs, top):
+    totals = []
+    self_times = defaultdict(list)
+    cumulative_times = defaultdict(list)
+    for _ in range(runs):
+        modules, total = run_once(code)
+        totals.append(total)
+        for module, (self_us, cumulative_us) in modules.items():
+            self_times[module].append(self_us)
+            cumulative_times[module].append(cumulative_us)
+
+    print(f"\n{name}: {statistics.median(totals) / 1000:.1f} ms median import time "
+          f"(min {min(totals) / 1000:.1f}, {runs} runs, {len(self_times)} modules)")
+
+    print(f"  Slowest by cumulative time (project modules):")
+    project = ('muadhin', 'users', 'SalatTracker', 'subscriptions', 'communications')
+    ranked = sorted(
+        ((statistics.median(times), module) for module, times in cumulative_times.items()
+         if module.split('.')[0] in project),
+        reverse=True,
+    )
+    for median_us, module in ranked[:top]:
+        print(f"    {median_us / 1000:8.1f} ms  {module}")
+
+    print(f"  Slowest by self time (all modules):")
+    ranked = sorted(((statistics.median(times), module) for module, times in self_times.items()), reverse=True)
+    for median_us, module in ranked[:top]:
+        print(f"    {median_us / 1000:8.1f} ms  {module}")
+    return statistics.median(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=sorted(TARGETS), action='append', help='Default: all targets')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    for name in args.target or sorted(TARGETS):
+        report(name, TARGETS[name], args.runs, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,12 @@
+from datetime import timedelta
+
 from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+
 from .models import ProviderConfiguration, CommunicationLog, ProviderStatus
+from .services.delivery_report import DEFAULT_GROUP_BY, GROUP_FIELDS, delivery_lag_report
 
 
 @admin.register(ProviderConfiguration)
@@ -19,25 +26,65 @@ class ProviderConfigurationAdmin(admin.ModelAdmin):
 
 @admin.register(CommunicationLog)
 class CommunicationLogAdmin(admin.ModelAdmin):
-    list_display = ('created_at', 'user', 'communication_type', 'provider_name', 'success', 'prayer_name', 'cost')
-    list_filter = ('communication_type', 'provider_name', 'success', 'prayer_name', 'created_at')
+    list_display = ('created_at', 'user', 'communication_type', 'provider_name', 'success', 'delivery_status', 'prayer_name', 'lag_display', 'cost')
+    list_filter = ('communication_type', 'provider_name', 'success', 'delivery_status', 'prayer_name', 'timezone_bucket', 'created_at')
     search_fields = ('user__username', 'user__email', 'provider_name', 'message_id')
     readonly_fields = ('created_at', 'raw_response')
     ordering = ('-created_at',)
+    change_list_template = 'admin/communications/communicationlog/change_list.html'
     
     def has_add_permission(self, request):
         return False  # Logs are created automatically
     
     def has_change_permission(self, request, obj=None):
         return False  # Logs should not be modified
+    
+    def lag_display(self, obj):
+        lag = obj.lag_seconds
+        return '-' if lag is None else f"{lag:.1f}s"
+    lag_display.short_description = 'Lag'
+    
+    def get_urls(self):
+        urls = [
+            path(
+                'delivery-lag/',
+                self.admin_site.admin_view(self.delivery_lag_view),
+                name='communications_communicationlog_delivery_lag',
+            ),
+        ]
+        return urls + super().get_urls()
+    
+    def delivery_lag_view(self, request):
+        """p50/p95/p99 delivery lag over the last ?days= (max 31), grouped by ?by="""
+        try:
+            days = min(max(int(request.GET.get('days', 7)), 1), 31)
+        except ValueError:
+            days = 7
+        group_by = [name for name in request.GET.getlist('by') if name in GROUP_FIELDS] or list(DEFAULT_GROUP_BY)
+        end = timezone.now()
+        start = end - timedelta(days=days)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Delivery lag',
+            'opts': self.model._meta,
+            'days': days,
+            'start': start,
+            'end': end,
+            'group_by': group_by,
+            'group_choices': list(GROUP_FIELDS),
+            'overall': delivery_lag_report(start, end, group_by=()),
+            'rows': delivery_lag_report(start, end, group_by=group_by),
+        }
+        return TemplateResponse(request, 'admin/communications/communicationlog/delivery_lag.html', context)
 
 
 @admin.register(ProviderStatus)
 class ProviderStatusAdmin(admin.ModelAdmin):
-    list_display = ('provider_name', 'country_code', 'is_healthy', 'success_rate_display', 'total_attempts', 'last_updated')
+    list_display = ('provider_name', 'country_code', 'is_healthy', 'success_rate_display', 'total_attempts', 'delivered_count', 'undelivered_count', 'last_updated')
     list_filter = ('is_healthy', 'provider_name', 'country_code')
     search_fields = ('provider_name', 'country_code')
-    readonly_fields = ('total_attempts', 'successful_attempts', 'failed_attempts', 'last_success_at', 'last_failure_at', 'created_at', 'last_updated')
+    readonly_fields = ('total_attempts', 'successful_attempts', 'failed_attempts', 'last_success_at', 'last_failure_at', 'delivered_count', 'undelivered_count', 'last_delivery_report_at', 'created_at', 'last_updated')
     ordering = ('-last_updated',)
     
     def success_rate_display(self, obj):
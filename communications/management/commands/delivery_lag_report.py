@@ -0,0 +1,59 @@
+import json
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from communications.services.delivery_report import DEFAULT_GROUP_BY, GROUP_FIELDS, delivery_lag_report
+
+
+class Command(BaseCommand):
+    help = 'Delivery lag (dispatched - scheduled) percentiles per prayer, channel, provider and timezone bucket'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Report on the last N days (default: 7)')
+        parser.add_argument('--since', type=str, help='Start date YYYY-MM-DD (UTC), overrides --days')
+        parser.add_argument('--until', type=str, help='End date YYYY-MM-DD (UTC, exclusive, default: now)')
+        parser.add_argument(
+            '--by', type=str, default=','.join(DEFAULT_GROUP_BY),
+            help=f"Comma-separated groups out of {', '.join(GROUP_FIELDS)}; empty for one overall row"
+        )
+        parser.add_argument('--slo', type=float, help='On-time threshold in seconds (default: DELIVERY_LAG_SLO_SECONDS)')
+        parser.add_argument('--json', action='store_true', help='Print rows as JSON')
+
+    def parse_date(self, value):
+        try:
+            return datetime.combine(datetime.strptime(value, '%Y-%m-%d').date(), time.min, tzinfo=dt_timezone.utc)
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        end = self.parse_date(options['until']) if options['until'] else timezone.now()
+        start = self.parse_date(options['since']) if options['since'] else end - timedelta(days=options['days'])
+        group_by = [name.strip() for name in options['by'].split(',') if name.strip()]
+
+        try:
+            rows = delivery_lag_report(start, end, group_by, slo_seconds=options['slo'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps([row.as_dict() for row in rows], indent=2))
+            return
+
+        self.stdout.write(f"📊 Delivery lag {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M} UTC (seconds)\n")
+        if not rows:
+            self.stdout.write("No scheduled notifications in this range")
+            return
+
+        header = [name.capitalize() for name in group_by] + ['Sent', 'Failed', 'p50', 'p95', 'p99', 'Max', 'On time']
+        table = [
+            [str(row.group[name] or '-') for name in group_by] + [
+                str(row.sent), str(row.failed), f"{row.p50:.1f}", f"{row.p95:.1f}", f"{row.p99:.1f}",
+                f"{row.max:.1f}", f"{row.within_slo:.1%}",
+            ]
+            for row in rows
+        ]
+        widths = [max(len(cell) for cell in column) for column in zip(header, *table)]
+        for line in [header] + table:
+            self.stdout.write('  '.join(cell.ljust(width) for cell, width in zip(line, widths)))
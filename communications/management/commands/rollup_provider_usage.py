@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from communications.services import usage_rollups
+
+
+class Command(BaseCommand):
+    help = "Fold new CommunicationLog rows into the provider usage rollups, or rebuild them from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Drop the rollups and recount every log row')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rows = usage_rollups.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt provider usage rollups from {rows} log rows"))
+            return
+
+        rows = 0
+        while True:
+            stats = usage_rollups.rollup_new_logs()
+            rows += stats['rows']
+            if stats['rows'] < usage_rollups.BATCH_SIZE:
+                break
+        self.stdout.write(self.style.SUCCESS(f"✅ Folded {rows} new log rows, up to id {stats['last_id']}"))
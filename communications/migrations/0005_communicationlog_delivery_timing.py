@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0004_voicecallsession'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='communicationlog',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='communicationlog',
+            name='scheduled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='communicationlog',
+            name='timezone_bucket',
+            field=models.CharField(blank=True, max_length=9, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='communicationlog',
+            index=models.Index(condition=models.Q(('scheduled_at__isnull', False)), fields=['scheduled_at'], include=('dispatched_at', 'communication_type', 'provider_name', 'prayer_name', 'timezone_bucket', 'success'), name='commlog_scheduled_at_idx'),
+        ),
+    ]
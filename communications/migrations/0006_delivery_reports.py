@@ -0,0 +1,64 @@
+# Generated by Django 5.1.7 on 2026-10-19 08:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0005_communicationlog_delivery_timing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='communicationlog',
+            name='delivery_status',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='communicationlog',
+            name='delivery_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='providerstatus',
+            name='delivered_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='providerstatus',
+            name='last_delivery_report_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='providerstatus',
+            name='undelivered_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='voicecallsession',
+            name='call_status',
+            field=models.CharField(blank=True, max_length=30, null=True),
+        ),
+        migrations.AddField(
+            model_name='voicecallsession',
+            name='cost',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='voicecallsession',
+            name='duration_seconds',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='voicecallsession',
+            name='status_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='communicationlog',
+            index=models.Index(fields=['message_id'], name='communicati_message_3e2190_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-19 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0006_delivery_reports'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProviderUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('provider_name', models.CharField(max_length=100)),
+                ('country_code', models.CharField(blank=True, default='', max_length=2)),
+                ('communication_type', models.CharField(max_length=20)),
+                ('success', models.BooleanField()),
+                ('count', models.IntegerField(default=0)),
+                ('cost_sum', models.DecimalField(decimal_places=6, default=0, max_digits=14)),
+                ('cost_count', models.IntegerField(default=0)),
+                ('lag_buckets', models.JSONField(default=list)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket_start', 'provider_name', 'country_code', 'communication_type', 'success'), name='provider_usage_rollup_key')],
+            },
+        ),
+    ]
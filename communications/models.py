@@ -73,6 +73,16 @@ class CommunicationLog(models.Model):
     country_code = models.CharField(max_length=2, null=True, blank=True)
     raw_response = models.JSONField(null=True, blank=True)
     
+    # Delivery timing: when the notification was due (the task's ETA) and when
+    # the provider accepted it. Only scheduled notifications have scheduled_at.
+    scheduled_at = models.DateTimeField(null=True, blank=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    timezone_bucket = models.CharField(max_length=9, null=True, blank=True)  # user's UTC offset, e.g. UTC+01:00
+    
+    # Provider delivery reports (communications/services/webhook_ingest.py)
+    delivery_status = models.CharField(max_length=20, null=True, blank=True)  # sent, delivered, failed
+    delivery_updated_at = models.DateTimeField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -82,11 +92,73 @@ class CommunicationLog(models.Model):
             models.Index(fields=['communication_type', 'created_at']),
             models.Index(fields=['provider_name', 'created_at']),
             models.Index(fields=['success', 'created_at']),
+            models.Index(fields=['message_id']),
+            # Delivery lag report: range scan on scheduled_at, covering on PostgreSQL
+            models.Index(
+                fields=['scheduled_at'],
+                include=['dispatched_at', 'communication_type', 'provider_name', 'prayer_name', 'timezone_bucket', 'success'],
+                condition=models.Q(scheduled_at__isnull=False),
+                name='commlog_scheduled_at_idx',
+            ),
         ]
     
     def __str__(self):
         status = "✅" if self.success else "❌"
         return f"{status} {self.communication_type} via {self.provider_name} to {self.recipient[:8]}***"
+    
+    @property
+    def lag_seconds(self):
+        if self.scheduled_at is None or self.dispatched_at is None:
+            return None
+        return (self.dispatched_at - self.scheduled_at).total_seconds()
+
+
+class ProviderUsageRollup(models.Model):
+    """
+    CommunicationLog counts per hour or day, provider, country, type and
+    outcome, kept up to date by communications.tasks.rollup_provider_usage
+    (see communications/services/usage_rollups.py)
+    """
+
+    GRANULARITIES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    granularity = models.CharField(max_length=4, choices=GRANULARITIES)
+    bucket_start = models.DateTimeField()
+    provider_name = models.CharField(max_length=100)
+    country_code = models.CharField(max_length=2, blank=True, default='')
+    communication_type = models.CharField(max_length=20)
+    success = models.BooleanField()
+
+    count = models.IntegerField(default=0)
+    cost_sum = models.DecimalField(max_digits=14, decimal_places=6, default=0)
+    cost_count = models.IntegerField(default=0)  # rows with a cost, for the average
+    # Delivery lag histogram, counts per usage_rollups.LAG_BUCKETS_SECONDS bucket
+    lag_buckets = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket_start', 'provider_name', 'country_code', 'communication_type', 'success'],
+                name='provider_usage_rollup_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket_start:%Y-%m-%d %H:00} {self.provider_name} {self.country_code}: {self.count}"
+
+
+class RollupCheckpoint(models.Model):
+    """Last source row folded into a rollup"""
+
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
 
 
 class ProviderStatus(models.Model):
@@ -110,6 +182,11 @@ class ProviderStatus(models.Model):
     last_failure_at = models.DateTimeField(null=True, blank=True)
     consecutive_failures = models.IntegerField(default=0)
     
+    # Final outcomes from delivery reports, counted once per message
+    delivered_count = models.IntegerField(default=0)
+    undelivered_count = models.IntegerField(default=0)
+    last_delivery_report_at = models.DateTimeField(null=True, blank=True)
+    
     # Time windows
     last_updated = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -182,6 +259,12 @@ class VoiceCallSession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     retrieved_at = models.DateTimeField(null=True, blank=True)
 
+    # Voice call events from Africa's Talking
+    call_status = models.CharField(max_length=30, null=True, blank=True)
+    duration_seconds = models.IntegerField(null=True, blank=True)
+    cost = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+    status_updated_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -193,9 +276,10 @@ class VoiceCallSession(models.Model):
         return f"{self.phone_number} - {self.call_type}"
 
     @classmethod
-    def cleanup_old_sessions(cls):
-        """Delete sessions older than 1 hour"""
+    def cleanup_old_sessions(cls, max_age=None):
+        """Delete sessions older than max_age (1 hour by default), return how many"""
         from django.utils import timezone
         from datetime import timedelta
-        cutoff = timezone.now() - timedelta(hours=1)
-        cls.objects.filter(created_at__lt=cutoff).delete()
+        cutoff = timezone.now() - (max_age or timedelta(hours=1))
+        deleted, _ = cls.objects.filter(created_at__lt=cutoff).delete()
+        return deleted
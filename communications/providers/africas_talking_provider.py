@@ -171,17 +171,12 @@ class AfricasTalkingProvider(CombinedProvider):
             # Remove + from phone number
             clean_number = formatted_number.replace('+', '')
 
-            # Store audio URL in database for callback to retrieve
-            # AT strips query params, so we use database with phone number as key
-            from communications.models import VoiceCallSession
+            # Store audio URL for the callback to retrieve
+            # AT strips query params, so sessions are keyed by phone number
+            from communications.services.voice_sessions import store_session
             from asgiref.sync import sync_to_async
 
-            # Create session in sync context
-            await sync_to_async(VoiceCallSession.objects.create)(
-                phone_number=formatted_number,
-                call_type='adhan_audio',
-                audio_url=audio_url
-            )
+            await sync_to_async(store_session)(formatted_number, 'adhan_audio', audio_url=audio_url)
 
             # Don't send callbackUrl in API request - use dashboard setting instead
             # Africa's Talking rejects custom callback URLs in API requests
@@ -194,7 +189,7 @@ class AfricasTalkingProvider(CombinedProvider):
 
             logger.info(f"🔔 Making AT voice call to {clean_number}:")
             logger.info(f"   Using dashboard callback URL (not sent in API request)")
-            logger.info(f"   Audio URL stored in DB: {audio_url}")
+            logger.info(f"   Audio URL stored for callback: {audio_url}")
             logger.info(f"   Phone number: {formatted_number}")
 
             response = requests.post(api_url, headers=headers, data=payload, timeout=30)
@@ -266,16 +261,11 @@ class AfricasTalkingProvider(CombinedProvider):
             # Remove + from phone number
             clean_number = formatted_number.replace('+', '')
 
-            # Store TTS message in database for callback to retrieve
-            from communications.models import VoiceCallSession
+            # Store TTS message for the callback to retrieve
+            from communications.services.voice_sessions import store_session
             from asgiref.sync import sync_to_async
 
-            # Create session in sync context
-            await sync_to_async(VoiceCallSession.objects.create)(
-                phone_number=formatted_number,
-                call_type='tts',
-                message=text_message
-            )
+            await sync_to_async(store_session)(formatted_number, 'tts', message=text_message)
 
             # Don't send callbackUrl in API request - use dashboard setting instead
 
@@ -69,6 +69,22 @@ class BaseProvider(ABC):
         
         return phone_number
 
+    def _run_sync(self, channel: str, country_code: str, coroutine) -> CommunicationResult:
+        """Run a provider coroutine to completion, timing it for muadhin_provider_request_seconds"""
+        import asyncio
+        from muadhin.metrics import time_provider_request
+
+        try:
+            loop = asyncio.get_event_loop()
+        except RuntimeError:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+
+        with time_provider_request(self.name, channel, country_code) as outcome:
+            result = loop.run_until_complete(coroutine)
+            outcome['success'] = result.success
+        return result
+
 
 class SMSProvider(BaseProvider):
     """Abstract base class for SMS providers"""
@@ -80,14 +96,7 @@ class SMSProvider(BaseProvider):
     
     def send_sms_sync(self, to_number: str, message: str, country_code: str = None) -> CommunicationResult:
         """Synchronous wrapper for send_sms"""
-        import asyncio
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        return loop.run_until_complete(self.send_sms(to_number, message, country_code))
+        return self._run_sync('sms', country_code, self.send_sms(to_number, message, country_code))
 
 
 class CallProvider(BaseProvider):
@@ -105,25 +114,11 @@ class CallProvider(BaseProvider):
     
     def make_call_sync(self, to_number: str, audio_url: str, country_code: str = None) -> CommunicationResult:
         """Synchronous wrapper for make_call"""
-        import asyncio
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        return loop.run_until_complete(self.make_call(to_number, audio_url, country_code))
+        return self._run_sync('call', country_code, self.make_call(to_number, audio_url, country_code))
     
     def make_text_call_sync(self, to_number: str, text_message: str, country_code: str = None) -> CommunicationResult:
         """Synchronous wrapper for make_text_call"""
-        import asyncio
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        return loop.run_until_complete(self.make_text_call(to_number, text_message, country_code))
+        return self._run_sync('text_call', country_code, self.make_text_call(to_number, text_message, country_code))
 
 
 class WhatsAppProvider(BaseProvider):
@@ -136,14 +131,7 @@ class WhatsAppProvider(BaseProvider):
     
     def send_whatsapp_sync(self, to_number: str, message: str, country_code: str = None) -> CommunicationResult:
         """Synchronous wrapper for send_whatsapp"""
-        import asyncio
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        return loop.run_until_complete(self.send_whatsapp(to_number, message, country_code))
+        return self._run_sync('whatsapp', country_code, self.send_whatsapp(to_number, message, country_code))
 
 
 class CombinedProvider(SMSProvider, CallProvider, WhatsAppProvider):
@@ -0,0 +1,151 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import requests
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BulkEmailRecipient:
+    """A recipient and the values substituted into %recipient.<name>% placeholders"""
+    email: str
+    variables: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class BulkEmailResult:
+    """Outcome of a bulk send"""
+    sent: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    api_calls: int = 0
+    provider_name: str = ""
+    error_message: Optional[str] = None
+
+    @property
+    def success(self):
+        return not self.failed
+
+
+class BulkEmailService:
+    """
+    Sends one templated email to many recipients in as few calls as possible.
+
+    Templates use Mailgun's ``%recipient.<name>%`` placeholders. With Mailgun
+    configured, recipients are sent up to MAILGUN_BATCH_SIZE per API call using
+    ``recipient-variables``; otherwise the placeholders are filled in locally
+    and all messages go over a single SMTP connection.
+    """
+
+    @staticmethod
+    def is_mailgun_configured() -> bool:
+        return bool(getattr(settings, 'MAILGUN_API_KEY', None) and getattr(settings, 'MAILGUN_DOMAIN_NAME', None))
+
+    @classmethod
+    def send_batch(cls, subject: str, html_template: str, text_template: str,
+                   recipients: List[BulkEmailRecipient], from_email: str = None) -> BulkEmailResult:
+        """Send the same templated email to every recipient"""
+        from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        recipients = [r for r in recipients if r.email]
+
+        if not recipients:
+            return BulkEmailResult()
+
+        if cls.is_mailgun_configured():
+            return cls._send_mailgun(subject, html_template, text_template, recipients, from_email)
+        return cls._send_smtp(subject, html_template, text_template, recipients, from_email)
+
+    @staticmethod
+    def substitute(template: str, variables: Dict[str, str]) -> str:
+        """Fill %recipient.<name>% placeholders the way Mailgun does"""
+        for name, value in variables.items():
+            template = template.replace(f"%recipient.{name}%", str(value))
+        return template
+
+    @classmethod
+    def _send_mailgun(cls, subject, html_template, text_template, recipients, from_email) -> BulkEmailResult:
+        result = BulkEmailResult(provider_name="mailgun")
+        batch_size = getattr(settings, 'MAILGUN_BATCH_SIZE', 1000)
+        url = f"{settings.MAILGUN_API_URL.rstrip('/')}/{settings.MAILGUN_DOMAIN_NAME}/messages"
+
+        with requests.Session() as session:
+            for i in range(0, len(recipients), batch_size):
+                batch = recipients[i:i + batch_size]
+                emails = [r.email for r in batch]
+                data = {
+                    'from': from_email,
+                    'to': emails,
+                    'subject': subject,
+                    'text': text_template,
+                    'html': html_template,
+                    # Makes Mailgun send an individual message to each address
+                    'recipient-variables': json.dumps({r.email: r.variables for r in batch}),
+                }
+
+                try:
+                    result.api_calls += 1
+                    response = session.post(url, auth=('api', settings.MAILGUN_API_KEY), data=data, timeout=30)
+                    response.raise_for_status()
+                    result.sent.extend(emails)
+                except requests.RequestException as e:
+                    logger.error(f"❌ Mailgun batch of {len(batch)} failed: {e}")
+                    result.failed.extend(emails)
+                    result.error_message = str(e)
+
+        logger.info(f"✅ Mailgun bulk send: {len(result.sent)} sent, {len(result.failed)} failed in {result.api_calls} calls")
+        return result
+
+    @classmethod
+    def _send_smtp(cls, subject, html_template, text_template, recipients, from_email) -> BulkEmailResult:
+        result = BulkEmailResult(provider_name="smtp", api_calls=1)
+        connection = get_connection()
+
+        try:
+            # One connection for the whole batch instead of one per message
+            connection.open()
+        except Exception as e:
+            logger.error(f"❌ SMTP connection for {len(recipients)} messages failed: {e}")
+            result.failed = [r.email for r in recipients]
+            result.error_message = str(e)
+            return result
+
+        try:
+            for recipient in recipients:
+                message = EmailMultiAlternatives(
+                    subject=subject,
+                    body=cls.substitute(text_template, recipient.variables),
+                    from_email=from_email,
+                    to=[recipient.email],
+                    connection=connection,
+                )
+                message.attach_alternative(cls.substitute(html_template, recipient.variables), "text/html")
+                # Each message succeeds or fails on its own, so a failure is
+                # never retried for recipients that already got theirs
+                try:
+                    if connection.send_messages([message]):
+                        result.sent.append(recipient.email)
+                    else:
+                        result.failed.append(recipient.email)
+                except Exception as e:
+                    logger.error(f"❌ SMTP send to {recipient.email} failed: {e}")
+                    result.failed.append(recipient.email)
+                    result.error_message = str(e)
+                    cls._reopen(connection)
+        finally:
+            connection.close()
+
+        logger.info(f"✅ SMTP bulk send: {len(result.sent)} sent, {len(result.failed)} failed")
+        return result
+
+    @staticmethod
+    def _reopen(connection):
+        """Start a fresh SMTP session after a failure, send_messages opens one per message if this fails too"""
+        try:
+            connection.close()
+            connection.open()
+        except Exception as e:
+            logger.warning(f"⚠️ Reopening the SMTP connection failed: {e}")
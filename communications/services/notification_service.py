@@ -1,21 +1,36 @@
+from dataclasses import dataclass
+from datetime import datetime
 from typing import Optional, List
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+import hashlib
 import logging
 
 from .provider_registry import ProviderRegistry
+from ..models import CommunicationLog
 from ..providers.base import CommunicationResult, SMSProvider, CallProvider, WhatsAppProvider
 from subscriptions.models import NotificationUsage
 from ..utils.country_codes import get_country_code
+from muadhin.timezones import utc_offset_label
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class Delivery:
+    """What a notification is for; logged with each send for the delivery lag report"""
+    notification_type: Optional[str] = None  # pre_adhan, adhan_call, daily_summary
+    prayer_name: Optional[str] = None
+    scheduled_at: Optional[datetime] = None  # when it was due, usually the Celery task's ETA
+
+
 class NotificationService:
     """Main service for sending notifications with automatic provider selection"""
     
     @staticmethod
-    def send_sms(user, message: str, log_usage: bool = True, preferred_provider: str = None) -> CommunicationResult:
+    def send_sms(user, message: str, log_usage: bool = True, preferred_provider: str = None,
+                 delivery: Optional[Delivery] = None) -> CommunicationResult:
         """Send SMS using the best available provider for user's country"""
         country_raw = getattr(user, 'country', 'NG')
         country_code = get_country_code(country_raw)
@@ -42,7 +57,8 @@ class NotificationService:
                         if log_usage:
                             NotificationService._log_usage(
                                 user, 'sms', result.provider_name, 
-                                True, result.message_id, result.cost
+                                True, result.message_id, result.cost,
+                                delivery=delivery, country_code=country_code, recipient=phone_number
                             )
                         
                         return result
@@ -78,7 +94,8 @@ class NotificationService:
                     if log_usage:
                         NotificationService._log_usage(
                             user, 'sms', result.provider_name, 
-                            True, result.message_id, result.cost
+                            True, result.message_id, result.cost,
+                            delivery=delivery, country_code=country_code, recipient=phone_number
                         )
                     
                     return result
@@ -101,13 +118,15 @@ class NotificationService:
         if log_usage:
             NotificationService._log_usage(
                 user, 'sms', 'failed', False,
-                error_message=error_result.error_message
+                error_message=error_result.error_message,
+                delivery=delivery, country_code=country_code, recipient=phone_number
             )
         
         return error_result
     
     @staticmethod
-    def make_call(user, audio_url: str, log_usage: bool = True) -> CommunicationResult:
+    def make_call(user, audio_url: str, log_usage: bool = True,
+                  delivery: Optional[Delivery] = None) -> CommunicationResult:
         """Make voice call using the best available provider"""
         country_raw = getattr(user, 'country', 'NG')
         country_code = get_country_code(country_raw)
@@ -142,7 +161,8 @@ class NotificationService:
                     if log_usage:
                         NotificationService._log_usage(
                             user, 'call', result.provider_name,
-                            True, result.message_id, result.cost
+                            True, result.message_id, result.cost,
+                            delivery=delivery, country_code=country_code, recipient=phone_number
                         )
                     
                     return result
@@ -165,13 +185,15 @@ class NotificationService:
         if log_usage:
             NotificationService._log_usage(
                 user, 'call', 'failed', False,
-                error_message=error_result.error_message
+                error_message=error_result.error_message,
+                delivery=delivery, country_code=country_code, recipient=phone_number
             )
         
         return error_result
     
     @staticmethod
-    def make_text_call(user, text_message: str, log_usage: bool = True) -> CommunicationResult:
+    def make_text_call(user, text_message: str, log_usage: bool = True,
+                       delivery: Optional[Delivery] = None) -> CommunicationResult:
         """Make text-to-speech call using the best available provider"""
         country_raw = getattr(user, 'country', 'NG')
         country_code = get_country_code(country_raw)
@@ -189,7 +211,7 @@ class NotificationService:
         
         if not call_providers:
             # Fallback to SMS if no call providers
-            return NotificationService.send_sms(user, f"🔊 {text_message}", log_usage)
+            return NotificationService.send_sms(user, f"🔊 {text_message}", log_usage, delivery=delivery)
         
         # Try providers in order of preference
         last_error = None
@@ -203,7 +225,8 @@ class NotificationService:
                     if log_usage:
                         NotificationService._log_usage(
                             user, 'call', result.provider_name,
-                            True, result.message_id, result.cost
+                            True, result.message_id, result.cost,
+                            delivery=delivery, country_code=country_code, recipient=phone_number
                         )
                     
                     return result
@@ -218,10 +241,11 @@ class NotificationService:
         
         # All providers failed, fallback to SMS
         logger.info("📱 Text call failed, falling back to SMS")
-        return NotificationService.send_sms(user, f"🔊 {text_message}", log_usage)
+        return NotificationService.send_sms(user, f"🔊 {text_message}", log_usage, delivery=delivery)
     
     @staticmethod
-    def send_whatsapp(user, message: str, log_usage: bool = True) -> CommunicationResult:
+    def send_whatsapp(user, message: str, log_usage: bool = True,
+                      delivery: Optional[Delivery] = None) -> CommunicationResult:
         """Send WhatsApp message using the best available provider"""
         country_raw = getattr(user, 'country', 'NG')
         country_code = get_country_code(country_raw)
@@ -239,7 +263,7 @@ class NotificationService:
         
         if not whatsapp_providers:
             # Fallback to SMS if no WhatsApp providers
-            return NotificationService.send_sms(user, f"💬 {message}", log_usage)
+            return NotificationService.send_sms(user, f"💬 {message}", log_usage, delivery=delivery)
         
         # Try providers in order of preference
         last_error = None
@@ -253,7 +277,8 @@ class NotificationService:
                     if log_usage:
                         NotificationService._log_usage(
                             user, 'whatsapp', result.provider_name,
-                            True, result.message_id, result.cost
+                            True, result.message_id, result.cost,
+                            delivery=delivery, country_code=country_code, recipient=whatsapp_number
                         )
                     
                     return result
@@ -268,22 +293,61 @@ class NotificationService:
         
         # All WhatsApp providers failed, fallback to SMS
         logger.info("📱 WhatsApp failed, falling back to SMS")
-        return NotificationService.send_sms(user, f"💬 {message}", log_usage)
+        return NotificationService.send_sms(user, f"💬 {message}", log_usage, delivery=delivery)
     
     @staticmethod
     def _log_usage(user, notification_type: str, provider_name: str, 
                    success: bool, message_id: str = None, cost: float = None,
-                   error_message: str = None):
+                   error_message: str = None, delivery: Delivery = None,
+                   country_code: str = None, recipient: str = ''):
         """Log notification usage for analytics and billing"""
+        delivery = delivery or Delivery()
+        dispatched_at = timezone.now() if success else None
         try:
             NotificationUsage.objects.create(
                 user=user,
                 notification_type=notification_type,
+                prayer_name=delivery.prayer_name,
                 success=success,
                 error_message=error_message,
+                scheduled_at=delivery.scheduled_at,
+                dispatched_at=dispatched_at,
             )
         except Exception as e:
             logger.error(f"Failed to log notification usage: {e}")
+
+        NotificationService.log_communication(
+            user, notification_type, provider_name, success, delivery,
+            message_id=message_id, cost=cost, error_message=error_message,
+            country_code=country_code, recipient=recipient, dispatched_at=dispatched_at,
+        )
+    
+    @staticmethod
+    def log_communication(user, communication_type: str, provider_name: str, success: bool,
+                          delivery: Delivery = None, message_id: str = None, cost: float = None,
+                          error_message: str = None, country_code: str = None, recipient: str = '',
+                          dispatched_at: datetime = None):
+        """Record a send in CommunicationLog, with when it was due and when it went out"""
+        delivery = delivery or Delivery()
+        try:
+            CommunicationLog.objects.create(
+                user=user,
+                communication_type=communication_type,
+                provider_name=provider_name,
+                recipient=hashlib.sha256((recipient or '').encode()).hexdigest()[:32],
+                message_id=message_id,
+                success=success,
+                error_message=error_message,
+                cost=cost,
+                prayer_name=delivery.prayer_name,
+                notification_type=delivery.notification_type,
+                country_code=(country_code or '')[:2] or None,
+                scheduled_at=delivery.scheduled_at,
+                dispatched_at=dispatched_at,
+                timezone_bucket=utc_offset_label(getattr(user, 'timezone', None), delivery.scheduled_at),
+            )
+        except Exception as e:
+            logger.error(f"Failed to log communication: {e}")
     
     @staticmethod
     def get_provider_status(country_code: str = None) -> dict:
@@ -0,0 +1,232 @@
+"""
+Hourly and daily provider usage rollups for the admin analytics endpoint.
+
+rollup_new_logs() folds CommunicationLog rows created since the last run
+(by id, RollupCheckpoint 'provider_usage') into ProviderUsageRollup: one row
+per hour and per day, provider, country, channel and success, with the count,
+the cost sum and a delivery lag histogram. The rows and the checkpoint are
+updated in one transaction, so every log row is counted exactly once.
+
+Ids are handed out when a row is inserted but become visible when its
+transaction commits, so a row can appear behind a checkpoint that has already
+moved past it. Only rows created more than SETTLE ago are folded, stopping at
+the first newer one, so the checkpoint never passes a row that may still be
+uncommitted. Writes to CommunicationLog are single short transactions.
+
+usage_summary() answers any range from whole-day rows plus hourly rows for
+the partial days at its edges, a few hundred rows at most, instead of
+scanning CommunicationLog. Ranges are widened to whole hours.
+"""
+
+import bisect
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+
+from ..models import CommunicationLog, ProviderUsageRollup, RollupCheckpoint
+
+CHECKPOINT = 'provider_usage'
+BATCH_SIZE = 5000
+
+# Longest a CommunicationLog insert can stay uncommitted
+SETTLE = timedelta(minutes=2)
+
+# Upper bounds in seconds, the last bucket is everything above
+LAG_BUCKETS_SECONDS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+def floor_hour(value: datetime) -> datetime:
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(value: datetime) -> datetime:
+    return floor_hour(value).replace(hour=0)
+
+
+def empty_buckets() -> List[int]:
+    return [0] * (len(LAG_BUCKETS_SECONDS) + 1)
+
+
+def lag_bucket(lag_seconds: float) -> int:
+    return bisect.bisect_left(LAG_BUCKETS_SECONDS, lag_seconds)
+
+
+def bucket_percentile(buckets: List[int], q: float) -> Optional[float]:
+    """
+    Upper bound of the bucket holding the q-th percentile (the last bound when
+    it is beyond it), None without samples
+    """
+    total = sum(buckets)
+    if not total:
+        return None
+    seen = 0
+    for i, count in enumerate(buckets):
+        seen += count
+        if seen >= q * total:
+            break
+    return LAG_BUCKETS_SECONDS[min(i, len(LAG_BUCKETS_SECONDS) - 1)]
+
+
+# Maintenance
+
+def rollup_new_logs(batch_size: int = BATCH_SIZE, now: Optional[datetime] = None) -> Dict:
+    """Fold up to batch_size new CommunicationLog rows, created before now - SETTLE, into the rollups"""
+    from django.utils import timezone
+
+    settled = (now or timezone.now()) - SETTLE
+    with transaction.atomic():
+        checkpoint, _ = RollupCheckpoint.objects.select_for_update().get_or_create(name=CHECKPOINT)
+        rows = list(
+            CommunicationLog.objects.filter(id__gt=checkpoint.last_id).order_by('id').values_list(
+                'id', 'created_at', 'provider_name', 'country_code', 'communication_type', 'success',
+                'cost', 'scheduled_at', 'dispatched_at',
+            )[:batch_size]
+        )
+        for i, row in enumerate(rows):
+            if row[1] >= settled:
+                # Everything from here on waits for the next run
+                del rows[i:]
+                break
+        if not rows:
+            return {'rows': 0, 'last_id': checkpoint.last_id}
+
+        deltas = defaultdict(lambda: {'count': 0, 'cost_sum': Decimal(0), 'cost_count': 0, 'lag_buckets': empty_buckets()})
+        for _, created_at, provider, country, channel, success, cost, scheduled_at, dispatched_at in rows:
+            hour = floor_hour(created_at)
+            for granularity, bucket_start in (('hour', hour), ('day', hour.replace(hour=0))):
+                delta = deltas[(granularity, bucket_start, provider, country or '', channel, success)]
+                delta['count'] += 1
+                if cost is not None:
+                    delta['cost_sum'] += cost
+                    delta['cost_count'] += 1
+                if scheduled_at is not None and dispatched_at is not None:
+                    lag = max(0.0, (dispatched_at - scheduled_at).total_seconds())
+                    delta['lag_buckets'][lag_bucket(lag)] += 1
+
+        _apply_deltas(deltas)
+        checkpoint.last_id = rows[-1][0]
+        checkpoint.save(update_fields=['last_id', 'updated_at'])
+    return {'rows': len(rows), 'last_id': checkpoint.last_id, 'rollups': len(deltas)}
+
+
+def _apply_deltas(deltas: Dict[Tuple, Dict]):
+    keys = list(deltas)
+    existing = {}
+    for granularity in ('hour', 'day'):
+        starts = {key[1] for key in keys if key[0] == granularity}
+        if not starts:
+            continue
+        for rollup in ProviderUsageRollup.objects.select_for_update().filter(
+            granularity=granularity, bucket_start__in=starts
+        ):
+            key = (rollup.granularity, rollup.bucket_start, rollup.provider_name, rollup.country_code,
+                   rollup.communication_type, rollup.success)
+            existing[key] = rollup
+
+    created, updated = [], []
+    for key, delta in deltas.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            granularity, bucket_start, provider, country, channel, success = key
+            created.append(ProviderUsageRollup(
+                granularity=granularity, bucket_start=bucket_start, provider_name=provider,
+                country_code=country, communication_type=channel, success=success, **delta,
+            ))
+            continue
+        rollup.count += delta['count']
+        rollup.cost_sum += delta['cost_sum']
+        rollup.cost_count += delta['cost_count']
+        buckets = rollup.lag_buckets or empty_buckets()
+        rollup.lag_buckets = [a + b for a, b in zip(buckets, delta['lag_buckets'])]
+        updated.append(rollup)
+
+    ProviderUsageRollup.objects.bulk_create(created, batch_size=500)
+    ProviderUsageRollup.objects.bulk_update(
+        updated, ['count', 'cost_sum', 'cost_count', 'lag_buckets'], batch_size=500
+    )
+
+
+def rebuild():
+    """Drop the rollups and fold every CommunicationLog row in again"""
+    with transaction.atomic():
+        ProviderUsageRollup.objects.all().delete()
+        RollupCheckpoint.objects.filter(name=CHECKPOINT).delete()
+    total = 0
+    while True:
+        rows = rollup_new_logs()['rows']
+        total += rows
+        if rows < BATCH_SIZE:
+            return total
+
+
+# Reading
+
+def split_range(start: datetime, end: datetime) -> Tuple[List[Tuple[datetime, datetime]], Optional[Tuple[datetime, datetime]]]:
+    """[start, end) widened to whole hours, as hourly ranges around a range of whole days (None if there is none)"""
+    start, end = floor_hour(start), floor_hour(end - timedelta(microseconds=1)) + HOUR
+    first_day = start if floor_day(start) == start else floor_day(start) + DAY
+    last_day = floor_day(end)
+    if first_day >= last_day:
+        return [(start, end)], None
+    hours = [(a, b) for a, b in ((start, first_day), (last_day, end)) if a < b]
+    return hours, (first_day, last_day)
+
+
+def rollups_for_range(start: datetime, end: datetime) -> Iterable[ProviderUsageRollup]:
+    """Rollup rows covering [start, end), whole days where possible"""
+    hours, days = split_range(start, end)
+    condition = Q()
+    for range_start, range_end in hours:
+        condition |= Q(granularity='hour', bucket_start__gte=range_start, bucket_start__lt=range_end)
+    if days:
+        condition |= Q(granularity='day', bucket_start__gte=days[0], bucket_start__lt=days[1])
+    return ProviderUsageRollup.objects.filter(condition)
+
+
+def usage_summary(start: datetime, end: datetime) -> Dict:
+    """
+    Totals per provider, country and channel for a range, in the shape of
+    AdminProviderAnalyticsAPIView's breakdowns
+    """
+    def bucket():
+        return {'count': 0, 'success_count': 0, 'total_cost': Decimal(0), 'cost_count': 0,
+                'providers': set(), 'lag_buckets': empty_buckets()}
+
+    total = bucket()
+    by_provider, by_country, by_type = defaultdict(bucket), defaultdict(bucket), defaultdict(bucket)
+
+    for rollup in rollups_for_range(start, end).only(
+        'provider_name', 'country_code', 'communication_type', 'success',
+        'count', 'cost_sum', 'cost_count', 'lag_buckets',
+    ):
+        for group in (total, by_provider[rollup.provider_name], by_country[rollup.country_code],
+                      by_type[rollup.communication_type]):
+            group['count'] += rollup.count
+            group['success_count'] += rollup.count if rollup.success else 0
+            group['total_cost'] += rollup.cost_sum
+            group['cost_count'] += rollup.cost_count
+            group['providers'].add(rollup.provider_name)
+            if rollup.lag_buckets:
+                group['lag_buckets'] = [a + b for a, b in zip(group['lag_buckets'], rollup.lag_buckets)]
+
+    return {
+        'total': total,
+        'by_provider': by_provider,
+        'by_country': by_country,
+        'by_type': by_type,
+    }
+
+
+def rolled_up_until() -> Optional[datetime]:
+    """created_at of the last log row in the rollups"""
+    checkpoint = RollupCheckpoint.objects.filter(name=CHECKPOINT).first()
+    if checkpoint is None:
+        return None
+    return CommunicationLog.objects.filter(id=checkpoint.last_id).values_list('created_at', flat=True).first()
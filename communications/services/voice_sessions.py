@@ -0,0 +1,163 @@
+"""
+Voice call sessions for the Africa's Talking voice callback.
+
+AT strips query parameters from the callback URL, so when a call is placed
+we keep what to play keyed by the dialled number, and the callback looks it
+up by callerNumber while the phone is ringing.
+
+Sessions live in Redis (voice:session:<number>, VOICE_SESSION_TTL seconds)
+with the callback's XML rendered when the call is placed. The callback runs
+one script: return the session already claimed for this AT sessionId, or
+take the number's pending session and keep it under the sessionId for AT's
+retries. It is a single O(1) round trip with no database access;
+persist_voice_session writes the VoiceCallSession row afterwards.
+
+Without Redis (the cache isn't Redis or it is marked unavailable) sessions
+go to the database as before.
+"""
+
+import json
+import logging
+import re
+from typing import Dict, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PHONE_KEY = 'voice:session:{phone}'
+SESSION_KEY = 'voice:session:at:{session_id}'
+
+# KEYS: session id key (may be empty), phone key. ARGV: TTL.
+# Returns {payload, 1 if claimed from the phone key now}.
+CLAIM_SCRIPT = """
+if KEYS[1] ~= '' then
+    local claimed = redis.call('GET', KEYS[1])
+    if claimed then return {claimed, 0} end
+end
+local pending = redis.call('GET', KEYS[2])
+if not pending then return {false, 0} end
+redis.call('DEL', KEYS[2])
+if KEYS[1] ~= '' then redis.call('SET', KEYS[1], pending, 'EX', ARGV[1]) end
+return {pending, 1}
+"""
+
+DEFAULT_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<Response><Say voice="woman">This is a test call from Muadhin.</Say></Response>'
+)
+
+
+def normalize_phone(phone_number: Optional[str]) -> str:
+    """+<digits>, whatever spacing or prefix the provider used"""
+    digits = re.sub(r'\D', '', phone_number or '')
+    return f'+{digits}' if digits else ''
+
+
+def render_call_xml(call_type: str, audio_url: Optional[str] = None, message: Optional[str] = None) -> str:
+    if call_type == 'adhan_audio':
+        body = (
+            '<Say voice="woman">Assalamu Alaikum. It is time for prayer.</Say>'
+            f'<Play url={quoteattr(audio_url or "")}/>'
+            '<Say voice="woman">May Allah accept your prayers.</Say>'
+        )
+    elif call_type == 'tts':
+        body = f'<Say voice="woman">{escape(message or "This is a message from Muadhin.")}</Say>'
+    else:
+        return DEFAULT_XML
+    return f'<?xml version="1.0" encoding="UTF-8"?><Response>{body}</Response>'
+
+
+def _client():
+    from muadhin.cache import redis_client
+
+    return redis_client()
+
+
+def store_session(phone_number: str, call_type: str, audio_url: Optional[str] = None,
+                  message: Optional[str] = None) -> Dict:
+    """Keep a call's session for the callback, before dialling"""
+    from redis.exceptions import RedisError
+    from muadhin.cache import mark_redis_unavailable
+
+    phone = normalize_phone(phone_number)
+    session = {
+        'phone_number': phone,
+        'call_type': call_type,
+        'audio_url': audio_url,
+        'message': message,
+        'created_at': timezone.now().isoformat(),
+        'xml': render_call_xml(call_type, audio_url, message),
+    }
+
+    client = _client()
+    if client is not None:
+        try:
+            client.set(PHONE_KEY.format(phone=phone), json.dumps(session), ex=settings.VOICE_SESSION_TTL)
+            return session
+        except RedisError as e:
+            mark_redis_unavailable(e)
+
+    from communications.models import VoiceCallSession
+
+    VoiceCallSession.objects.create(
+        phone_number=phone, call_type=call_type, audio_url=audio_url, message=message,
+    )
+    return session
+
+
+def claim_session(phone_number: Optional[str], session_id: Optional[str]) -> Optional[Dict]:
+    """The session to play for a ringing call, None if there is none"""
+    from redis.exceptions import RedisError
+    from muadhin.cache import mark_redis_unavailable
+
+    phone = normalize_phone(phone_number)
+    client = _client()
+    if client is not None:
+        try:
+            claim = client.register_script(CLAIM_SCRIPT)
+            payload, claimed_now = claim(
+                keys=[SESSION_KEY.format(session_id=session_id) if session_id else '', PHONE_KEY.format(phone=phone)],
+                args=[settings.VOICE_SESSION_TTL],
+            )
+        except RedisError as e:
+            mark_redis_unavailable(e)
+        else:
+            if not payload:
+                return None
+            session = json.loads(payload)
+            if claimed_now:
+                from communications.tasks import persist_voice_session
+
+                try:
+                    persist_voice_session.delay(session, session_id, timezone.now().isoformat())
+                except Exception as e:
+                    # The call still plays, only its VoiceCallSession row is missing
+                    logger.error(f"❌ Could not queue persisting voice session {session_id}: {e}")
+            return session
+
+    return _claim_from_database(phone, session_id)
+
+
+def _claim_from_database(phone: str, session_id: Optional[str]) -> Optional[Dict]:
+    from communications.models import VoiceCallSession
+
+    call_session = VoiceCallSession.objects.filter(
+        phone_number=phone,
+        retrieved_at__isnull=True
+    ).order_by('-created_at').first()
+    if call_session is None:
+        return None
+
+    call_session.retrieved_at = timezone.now()
+    call_session.session_id = session_id
+    call_session.save(update_fields=['retrieved_at', 'session_id'])
+    return {
+        'phone_number': phone,
+        'call_type': call_session.call_type,
+        'audio_url': call_session.audio_url,
+        'message': call_session.message,
+        'xml': render_call_xml(call_session.call_type, call_session.audio_url, call_session.message),
+    }
@@ -0,0 +1,378 @@
+"""
+Batched ingestion of provider webhooks (delivery reports, voice call events).
+
+At prayer time thousands of callbacks arrive within seconds. The webhook
+views only validate the payload and XADD a normalized event to a Redis
+stream (webhooks:events, trimmed to about STREAM_MAXLEN entries), then
+return. communications.tasks.ingest_webhook_events, run by Beat every few
+seconds on the ingest queue, reads the stream through a consumer group and
+applies each batch in one transaction:
+
+    sms_report   -> CommunicationLog.delivery_status, by provider message id
+    voice_event  -> VoiceCallSession call status/duration/cost, by AT sessionId
+    both         -> ProviderStatus delivered/undelivered counts
+
+Applying is idempotent on the provider message (or session) id: a report
+that doesn't change the stored status is skipped, and a message only counts
+towards ProviderStatus the first time it reaches a final status, so provider
+retries and redelivered stream entries are harmless. Entries are acked
+after their transaction commits; entries of a consumer that died are
+reclaimed after CLAIM_IDLE_MS.
+
+An event can arrive before its row exists (persist_voice_session runs after
+the callback, a send's log row is written after the provider answers), and
+the voice session of a call nobody answered never exists. Unmatched events
+go to a sorted set (webhooks:deferred) and are retried every
+UNMATCHED_RETRY_DELAY seconds until UNMATCHED_RETRY_SECONDS after they were
+received. Then they expire: a final voice event still counts towards
+ProviderStatus, by the country of the dialled number; an SMS report is
+dropped.
+
+If a batch fails, its events are applied one at a time. An entry that keeps
+failing is moved to webhooks:dead once it has been delivered MAX_DELIVERIES
+times, so one bad event can't hold up the stream.
+
+Without Redis, events are applied as they arrive.
+"""
+
+import json
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+STREAM = 'webhooks:events'
+GROUP = 'ingest'
+STREAM_MAXLEN = 100000
+BATCH_SIZE = 500
+CLAIM_IDLE_MS = 60000
+
+DEFERRED = 'webhooks:deferred'
+UNMATCHED_RETRY_DELAY = 30
+UNMATCHED_RETRY_SECONDS = 15 * 60
+
+DEAD_LETTER_STREAM = 'webhooks:dead'
+MAX_DELIVERIES = 5
+
+AFRICAS_TALKING = 'AfricasTalkingProvider'
+
+# Africa's Talking SMS delivery report statuses
+AT_SMS_STATUSES = {
+    'Sent': 'sent',
+    'Submitted': 'sent',
+    'Buffered': 'sent',
+    'Success': 'delivered',
+    'Rejected': 'failed',
+    'Failed': 'failed',
+}
+FINAL_STATUSES = {'delivered', 'failed'}
+
+
+class InvalidEvent(ValueError):
+    pass
+
+
+# Parsing (webhook views)
+
+def parse_at_sms_report(data) -> Dict:
+    message_id = data.get('id')
+    status = AT_SMS_STATUSES.get(data.get('status'))
+    if not message_id or status is None:
+        raise InvalidEvent(f"SMS report needs an id and a known status, got {data.get('status')!r}")
+    return {
+        'kind': 'sms_report',
+        'provider': AFRICAS_TALKING,
+        'message_id': message_id,
+        'status': status,
+        'failure_reason': data.get('failureReason') or None,
+        'received_at': timezone.now().isoformat(),
+    }
+
+
+def parse_at_voice_event(data) -> Dict:
+    session_id = data.get('sessionId')
+    if not session_id:
+        raise InvalidEvent("Voice event needs a sessionId")
+    try:
+        duration = int(data['durationInSeconds']) if data.get('durationInSeconds') else None
+        cost = str(float(data['amount'])) if data.get('amount') else None
+    except ValueError as e:
+        raise InvalidEvent(f"Voice event has a malformed duration or amount: {e}")
+    return {
+        'kind': 'voice_event',
+        'provider': AFRICAS_TALKING,
+        'session_id': session_id,
+        'status': data.get('status') or data.get('callSessionState') or None,
+        'active': data.get('isActive') == '1',
+        'duration': duration,
+        'cost': cost,
+        'phone_number': data.get('callerNumber') or data.get('phoneNumber'),
+        'received_at': timezone.now().isoformat(),
+    }
+
+
+# Queue
+
+def _client():
+    from muadhin.cache import redis_client
+
+    return redis_client()
+
+
+def enqueue(event: Dict) -> bool:
+    """Append an event to the stream, True if queued (False if it was applied right away)"""
+    from redis.exceptions import RedisError
+    from muadhin.cache import mark_redis_unavailable
+
+    client = _client()
+    if client is not None:
+        try:
+            client.xadd(STREAM, {'event': json.dumps(event)}, maxlen=STREAM_MAXLEN, approximate=True)
+            return True
+        except RedisError as e:
+            mark_redis_unavailable(e)
+    apply_events([event])
+    return False
+
+
+def consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _ensure_group(client):
+    from redis.exceptions import ResponseError
+
+    try:
+        client.xgroup_create(STREAM, GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def consume_batch(consumer: Optional[str] = None, count: int = BATCH_SIZE, block_ms: Optional[int] = None) -> Dict:
+    """Apply up to count stream entries, reclaimed stale ones first, and the unmatched events due for a retry"""
+    client = _client()
+    if client is None:
+        return {'read': 0}
+    consumer = consumer or consumer_name()
+    _ensure_group(client)
+
+    due = client.zrangebyscore(DEFERRED, '-inf', time.time(), start=0, num=count)
+    entries = client.xautoclaim(STREAM, GROUP, consumer, CLAIM_IDLE_MS, start_id='0-0', count=count)[1]
+    if not entries:
+        response = client.xreadgroup(GROUP, consumer, {STREAM: '>'}, count=count, block=block_ms)
+        entries = response[0][1] if response else []
+    if not entries and not due:
+        return {'read': 0}
+
+    # (stream entry id or None for a retried event, raw event, event)
+    items = [(None, member, json.loads(member)) for member in due]
+    dead = 0
+    done = []
+    for entry_id, fields in entries:
+        # Entries trimmed from the stream before being reclaimed have no fields
+        if not fields or b'event' not in fields:
+            done.append(entry_id)
+            continue
+        try:
+            items.append((entry_id, fields[b'event'], json.loads(fields[b'event'])))
+        except ValueError as e:
+            _dead_letter(client, entry_id, fields[b'event'], e)
+            dead += 1
+
+    retry = []
+    try:
+        stats = apply_events([event for _, _, event in items], retry)
+        done.extend(entry_id for entry_id, _, _ in items if entry_id is not None)
+    except Exception as e:
+        logger.error(f"❌ Applying {len(items)} webhook events failed, applying them one at a time: {e}")
+        stats, applied, dead_lettered = _apply_one_at_a_time(client, items, retry)
+        done.extend(applied)
+        dead += dead_lettered
+
+    if done:
+        client.xack(STREAM, GROUP, *done)
+    if due:
+        client.zrem(DEFERRED, *due)
+    if retry:
+        retry_at = time.time() + UNMATCHED_RETRY_DELAY
+        client.zadd(DEFERRED, {json.dumps(event, sort_keys=True): retry_at for event in retry})
+    return {'read': len(entries), 'retried': len(due), 'deferred': len(retry), 'dead_lettered': dead, **stats}
+
+
+def _apply_one_at_a_time(client, items, retry):
+    """Apply events in their own transactions, returns (stats, ids applied or dead-lettered, dead-lettered count)"""
+    stats = defaultdict(int)
+    done = []
+    dead = 0
+    for entry_id, raw, event in items:
+        try:
+            for key, value in apply_events([event], retry).items():
+                stats[key] += value
+        except Exception as e:
+            # A retried event is no longer pending in the stream, nothing would bring it back
+            if entry_id is not None and _times_delivered(client, entry_id) < MAX_DELIVERIES:
+                continue
+            _dead_letter(client, entry_id, raw, e)
+            dead += 1
+        if entry_id is not None:
+            done.append(entry_id)
+    return dict(stats), done, dead
+
+
+def _times_delivered(client, entry_id) -> int:
+    pending = client.xpending_range(STREAM, GROUP, min=entry_id, max=entry_id, count=1)
+    return pending[0]['times_delivered'] if pending else 0
+
+
+def _dead_letter(client, entry_id, raw, error):
+    logger.error(f"❌ Moving webhook event {entry_id!r} to {DEAD_LETTER_STREAM}: {error}")
+    client.xadd(DEAD_LETTER_STREAM, {
+        'event': raw,
+        'entry_id': entry_id or '',
+        'error': str(error)[:500],
+    }, maxlen=STREAM_MAXLEN, approximate=True)
+
+
+# Applying
+
+def apply_events(events: Iterable[Dict], retry: Optional[List[Dict]] = None) -> Dict:
+    """
+    Apply a batch of events in one transaction, see the module docstring.
+    Unmatched events still inside UNMATCHED_RETRY_SECONDS are added to retry
+    once the transaction commits; without a retry list they expire at once.
+    """
+    events = list(events)
+    stats = {'applied': 0, 'duplicate': 0, 'unmatched': 0, 'expired': 0}
+    outcomes = defaultdict(lambda: {'delivered': 0, 'undelivered': 0})
+    unmatched = []
+    to_retry = []
+
+    with transaction.atomic():
+        _apply_sms_reports([e for e in events if e['kind'] == 'sms_report'], stats, outcomes, unmatched)
+        _apply_voice_events([e for e in events if e['kind'] == 'voice_event'], stats, outcomes, unmatched)
+        expire_before = timezone.now() - timedelta(seconds=UNMATCHED_RETRY_SECONDS)
+        for event in unmatched:
+            if retry is not None and parse_datetime(event['received_at']) > expire_before:
+                to_retry.append(event)
+            else:
+                _expire(event, stats, outcomes)
+        _count_outcomes(outcomes)
+
+    if retry is not None:
+        retry.extend(to_retry)
+    return stats
+
+
+def _expire(event: Dict, stats: Dict, outcomes: Dict):
+    stats['expired'] += 1
+    if event['kind'] == 'voice_event' and not event['active']:
+        # A call that ended without a session: nobody answered
+        result = 'delivered' if event['duration'] else 'undelivered'
+        outcomes[(event['provider'], country_for_phone(event['phone_number']))][result] += 1
+
+
+def _apply_sms_reports(events: List[Dict], stats: Dict, outcomes: Dict, unmatched: List[Dict]):
+    from communications.models import CommunicationLog
+
+    if not events:
+        return
+    logs = defaultdict(list)
+    for log in CommunicationLog.objects.select_for_update().filter(
+        message_id__in={e['message_id'] for e in events}
+    ).only('id', 'message_id', 'provider_name', 'country_code', 'delivery_status', 'error_message'):
+        logs[(log.provider_name, log.message_id)].append(log)
+
+    changed = {}
+    for event in events:
+        matched = logs.get((event['provider'], event['message_id']))
+        if not matched:
+            stats['unmatched'] += 1
+            unmatched.append(event)
+            continue
+        for log in matched:
+            if log.delivery_status == event['status'] or log.delivery_status in FINAL_STATUSES:
+                stats['duplicate'] += 1
+                continue
+            log.delivery_status = event['status']
+            log.delivery_updated_at = parse_datetime(event['received_at'])
+            if event['failure_reason']:
+                log.error_message = event['failure_reason']
+            if event['status'] in FINAL_STATUSES:
+                result = 'delivered' if event['status'] == 'delivered' else 'undelivered'
+                outcomes[(log.provider_name, log.country_code or '')][result] += 1
+            changed[log.pk] = log
+            stats['applied'] += 1
+    CommunicationLog.objects.bulk_update(
+        changed.values(), ['delivery_status', 'delivery_updated_at', 'error_message'], batch_size=500
+    )
+
+
+def _apply_voice_events(events: List[Dict], stats: Dict, outcomes: Dict, unmatched: List[Dict]):
+    from communications.models import VoiceCallSession
+
+    if not events:
+        return
+    sessions = {
+        session.session_id: session
+        for session in VoiceCallSession.objects.select_for_update().filter(
+            session_id__in={e['session_id'] for e in events}
+        ).order_by('created_at')
+    }
+
+    changed = {}
+    for event in events:
+        session = sessions.get(event['session_id'])
+        if session is None:
+            stats['unmatched'] += 1
+            unmatched.append(event)
+            continue
+        if session.call_status == 'ended' or (event['active'] and session.call_status == event['status']):
+            stats['duplicate'] += 1
+            continue
+        session.call_status = event['status'] if event['active'] else 'ended'
+        if event['duration'] is not None:
+            session.duration_seconds = event['duration']
+        if event['cost'] is not None:
+            session.cost = event['cost']
+        session.status_updated_at = parse_datetime(event['received_at'])
+        if not event['active']:
+            result = 'delivered' if session.duration_seconds else 'undelivered'
+            outcomes[(event['provider'], country_for_phone(session.phone_number))][result] += 1
+        changed[session.pk] = session
+        stats['applied'] += 1
+    VoiceCallSession.objects.bulk_update(
+        changed.values(), ['call_status', 'duration_seconds', 'cost', 'status_updated_at'], batch_size=500
+    )
+
+
+def _count_outcomes(outcomes: Dict):
+    from communications.models import ProviderStatus
+
+    now = timezone.now()
+    for (provider_name, country_code), counts in outcomes.items():
+        ProviderStatus.objects.get_or_create(provider_name=provider_name, country_code=country_code)
+        ProviderStatus.objects.filter(provider_name=provider_name, country_code=country_code).update(
+            delivered_count=F('delivered_count') + counts['delivered'],
+            undelivered_count=F('undelivered_count') + counts['undelivered'],
+            last_delivery_report_at=now,
+        )
+
+
+def country_for_phone(phone_number: Optional[str]) -> str:
+    import phonenumbers
+
+    try:
+        return phonenumbers.region_code_for_number(phonenumbers.parse(phone_number or '')) or ''
+    except phonenumbers.NumberParseException:
+        return ''
@@ -0,0 +1,82 @@
+from celery import shared_task
+from django.utils.dateparse import parse_datetime
+
+from communications.models import VoiceCallSession
+from communications.services import usage_rollups, webhook_ingest
+
+# Stop draining after this many batches, Beat starts another run shortly
+MAX_BATCHES_PER_RUN = 20
+MAX_ROLLUP_BATCHES_PER_RUN = 20
+
+
+@shared_task
+def persist_voice_session(session, session_id, retrieved_at):
+    """
+    Record a voice call session claimed from Redis by the AT voice callback
+    (see communications/services/voice_sessions.py), off the callback's path.
+    """
+    call_session = VoiceCallSession.objects.create(
+        phone_number=session['phone_number'],
+        session_id=session_id,
+        call_type=session['call_type'],
+        audio_url=session.get('audio_url'),
+        message=session.get('message'),
+        retrieved_at=parse_datetime(retrieved_at),
+    )
+    # created_at is auto_now_add, keep when the call was placed instead
+    if session.get('created_at'):
+        VoiceCallSession.objects.filter(pk=call_session.pk).update(created_at=parse_datetime(session['created_at']))
+    return {'status': 'persisted', 'id': call_session.pk}
+
+
+@shared_task
+def ingest_webhook_events():
+    """Apply queued provider webhook events in batches (communications/services/webhook_ingest.py)"""
+    totals = {
+        'read': 0, 'retried': 0, 'applied': 0, 'duplicate': 0, 'unmatched': 0,
+        'deferred': 0, 'expired': 0, 'dead_lettered': 0,
+    }
+    consumer = webhook_ingest.consumer_name()
+    for _ in range(MAX_BATCHES_PER_RUN):
+        stats = webhook_ingest.consume_batch(consumer)
+        for key, value in stats.items():
+            totals[key] += value
+        if stats['read'] < webhook_ingest.BATCH_SIZE:
+            break
+    return {'status': 'ok', **totals}
+
+
+@shared_task
+def rollup_provider_usage():
+    """Fold new CommunicationLog rows into the provider usage rollups (communications/services/usage_rollups.py)"""
+    rows = 0
+    for _ in range(MAX_ROLLUP_BATCHES_PER_RUN):
+        stats = usage_rollups.rollup_new_logs()
+        rows += stats['rows']
+        if stats['rows'] < usage_rollups.BATCH_SIZE:
+            break
+    return {'status': 'ok', 'rows': rows, 'last_id': stats['last_id']}
+
+
+@shared_task
+def maintain_log_partitions():
+    """
+    Create the coming months' log partitions, expire months past their
+    retention (muadhin/partitioning.py) and delete old voice call sessions
+    """
+    from datetime import timedelta
+
+    from django.conf import settings
+
+    from muadhin import partitioning
+
+    created = partitioning.ensure_partitions()
+    sessions = VoiceCallSession.cleanup_old_sessions(timedelta(days=settings.VOICE_SESSION_RETENTION_DAYS))
+    # Raises when archiving would delete rows into a directory that isn't kept
+    expired = partitioning.apply_retention()
+    return {
+        'status': 'ok',
+        'created': created,
+        'expired': [str(action) for action in expired],
+        'voice_sessions_deleted': sessions,
+    }
@@ -1,3 +1,489 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
 
-# Create your tests here.
+from django.core import mail
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+
+from communications.services.bulk_email_service import BulkEmailService, BulkEmailRecipient
+
+
+class MailgunStandIn(BaseHTTPRequestHandler):
+    """Minimal local stand-in for the Mailgun messages API"""
+    requests = []
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        MailgunStandIn.requests.append((self.path, parse_qs(self.rfile.read(length).decode())))
+        body = json.dumps({'id': '<batch@mailgun>', 'message': 'Queued. Thank you.'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FlakyEmailBackend(LocmemEmailBackend):
+    """locmem backend that refuses one address, and counts the connections it opens"""
+    refused = 'user1@example.com'
+    opened = 0
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any(self.refused in message.to for message in messages):
+            raise ConnectionError('550 mailbox unavailable')
+        return super().send_messages(messages)
+
+
+def make_recipients(count):
+    return [
+        BulkEmailRecipient(email=f"user{i}@example.com", variables={'name': f"user{i}"})
+        for i in range(count)
+    ]
+
+
+class BulkEmailServiceTests(SimpleTestCase):
+    @override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        MAILGUN_API_KEY=None,
+    )
+    def test_smtp_batch_substitutes_recipient_variables(self):
+        result = BulkEmailService.send_batch(
+            subject='Daily Prayer Times',
+            html_template='<p>Salaam %recipient.name%</p>',
+            text_template='Salaam %recipient.name%',
+            recipients=make_recipients(3),
+            from_email='noreply@example.com',
+        )
+
+        self.assertEqual(result.provider_name, 'smtp')
+        self.assertEqual(len(result.sent), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[1].body, 'Salaam user1')
+        self.assertEqual(mail.outbox[1].alternatives[0][0], '<p>Salaam user1</p>')
+
+    @override_settings(EMAIL_BACKEND='communications.tests.FlakyEmailBackend', MAILGUN_API_KEY=None)
+    def test_smtp_failure_only_fails_that_recipient(self):
+        FlakyEmailBackend.opened = 0
+        result = BulkEmailService.send_batch(
+            subject='Daily Prayer Times',
+            html_template='<p>Salaam %recipient.name%</p>',
+            text_template='Salaam %recipient.name%',
+            recipients=make_recipients(3),
+            from_email='noreply@example.com',
+        )
+
+        self.assertEqual(result.sent, ['user0@example.com', 'user2@example.com'])
+        self.assertEqual(result.failed, ['user1@example.com'])
+        self.assertEqual([message.to for message in mail.outbox], [['user0@example.com'], ['user2@example.com']])
+        # The batch's connection, and a fresh one after the failure
+        self.assertEqual(FlakyEmailBackend.opened, 2)
+
+    def test_mailgun_batches_by_batch_size(self):
+        MailgunStandIn.requests = []
+        server = HTTPServer(('127.0.0.1', 0), MailgunStandIn)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        try:
+            with override_settings(
+                MAILGUN_API_KEY='key-test',
+                MAILGUN_DOMAIN_NAME='mg.example.com',
+                MAILGUN_API_URL=f"http://127.0.0.1:{server.server_port}/v3",
+                MAILGUN_BATCH_SIZE=2,
+            ):
+                result = BulkEmailService.send_batch(
+                    subject='Daily Prayer Times',
+                    html_template='<p>Salaam %recipient.name%</p>',
+                    text_template='Salaam %recipient.name%',
+                    recipients=make_recipients(5),
+                    from_email='noreply@example.com',
+                )
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(result.provider_name, 'mailgun')
+        self.assertEqual(result.api_calls, 3)
+        self.assertEqual(len(result.sent), 5)
+        self.assertEqual(len(MailgunStandIn.requests), 3)
+
+        path, data = MailgunStandIn.requests[0]
+        self.assertEqual(path, '/v3/mg.example.com/messages')
+        self.assertEqual(data['to'], ['user0@example.com', 'user1@example.com'])
+        self.assertEqual(json.loads(data['recipient-variables'][0])['user1@example.com'], {'name': 'user1'})
+
+
+class DeliveryReportTests(SimpleTestCase):
+    def test_percentiles_and_slo(self):
+        from communications.services.delivery_report import percentile, summarize
+
+        lags = [float(i) for i in range(100, 0, -1)]
+        row = summarize({'prayer': 'Fajr'}, lags, failed=2, slo_seconds=90)
+        self.assertEqual((row.sent, row.failed), (100, 2))
+        self.assertEqual((row.p50, row.p95, row.p99, row.max), (50.0, 95.0, 99.0, 100.0))
+        self.assertEqual(row.within_slo, 0.9)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+    def test_timezone_bucket_follows_dst(self):
+        from datetime import datetime, timezone
+        from muadhin.timezones import utc_offset_label
+
+        self.assertEqual(utc_offset_label('Asia/Kolkata'), 'UTC+05:30')
+        self.assertEqual(utc_offset_label('America/New_York', datetime(2026, 1, 15, tzinfo=timezone.utc)), 'UTC-05:00')
+        self.assertEqual(utc_offset_label('America/New_York', datetime(2026, 7, 15, tzinfo=timezone.utc)), 'UTC-04:00')
+
+
+class ScriptedRedisStandIn:
+    """Dict-backed stand-in for the redis client, running CLAIM_SCRIPT in Python"""
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+
+    def set(self, key, value, ex=None):
+        self.round_trips += 1
+        self.data[key] = value.encode()
+
+    def register_script(self, script):
+        def claim(keys, args):
+            self.round_trips += 1
+            session_key, phone_key = keys
+            if session_key and session_key in self.data:
+                return [self.data[session_key], 0]
+            pending = self.data.pop(phone_key, None)
+            if pending is None:
+                return [None, 0]
+            if session_key:
+                self.data[session_key] = pending
+            return [pending, 1]
+        return claim
+
+
+class VoiceSessionTests(SimpleTestCase):
+    def setUp(self):
+        from unittest import mock
+
+        self.redis = ScriptedRedisStandIn()
+        patcher = mock.patch('communications.services.voice_sessions._client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        persist = mock.patch('communications.tasks.persist_voice_session.delay')
+        self.persist = persist.start()
+        self.addCleanup(persist.stop)
+
+    def test_render_escapes(self):
+        from communications.services.voice_sessions import render_call_xml
+
+        xml = render_call_xml('tts', message='Fajr & <Sunrise>')
+        self.assertIn('<Say voice="woman">Fajr &amp; &lt;Sunrise&gt;</Say>', xml)
+        self.assertIn('<Play url="https://x/a.mp3?a=1&amp;b=2"/>', render_call_xml('adhan_audio', 'https://x/a.mp3?a=1&b=2'))
+
+    def test_callback_is_one_round_trip_without_database(self):
+        from communications.services.voice_sessions import store_session
+
+        store_session('+234 801 234 5678', 'adhan_audio', audio_url='https://cdn/adhan.mp3')
+        self.redis.round_trips = 0
+
+        # SimpleTestCase fails on any database query
+        response = self.client.post('/api/communications/callbacks/africastalking/voice/',
+                                    {'sessionId': 'ATVId_1', 'callerNumber': '2348012345678'})
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        self.assertIn(b'<Play url="https://cdn/adhan.mp3"/>', response.content)
+        self.assertEqual(self.redis.round_trips, 1)
+        self.persist.assert_called_once()
+        self.assertEqual(self.persist.call_args[0][1], 'ATVId_1')
+
+        # AT retrying the same session gets the same XML, nothing is persisted twice
+        retry = self.client.post('/api/communications/callbacks/africastalking/voice/',
+                                 {'sessionId': 'ATVId_1', 'callerNumber': '+2348012345678'})
+        self.assertEqual(retry.content, response.content)
+        self.persist.assert_called_once()
+
+        other = self.client.post('/api/communications/callbacks/africastalking/voice/',
+                                 {'sessionId': 'ATVId_2', 'callerNumber': '+2348012345678'})
+        self.assertIn(b'test call from Muadhin', other.content)
+
+    def test_claimed_session_returned_when_queueing_persist_fails(self):
+        from kombu.exceptions import OperationalError
+        from communications.services.voice_sessions import claim_session, store_session
+
+        store_session('+2348012345678', 'tts', message='Fajr')
+        self.persist.side_effect = OperationalError('broker down')
+        with self.assertLogs('communications.services.voice_sessions', 'ERROR'):
+            session = claim_session('+2348012345678', 'ATVId_3')
+        self.assertEqual(session['message'], 'Fajr')
+
+
+class StreamRedisStandIn:
+    """Single-consumer stand-in for the redis stream commands webhook_ingest uses"""
+
+    def __init__(self):
+        self.entries = []
+        self.pending = []
+        self.acked = []
+        self.dead = []
+        self.deferred = {}
+        self.times_delivered = 1
+
+    def xadd(self, stream, fields, maxlen=None, approximate=True):
+        if stream == 'webhooks:dead':
+            self.dead.append(fields)
+            return b'0-1'
+        entry_id = f'{len(self.entries) + len(self.pending) + 1}-0'.encode()
+        self.entries.append((entry_id, {key.encode(): value.encode() for key, value in fields.items()}))
+        return entry_id
+
+    def xpending_range(self, stream, group, min, max, count):
+        return [{'message_id': min, 'times_delivered': self.times_delivered}]
+
+    def zrangebyscore(self, key, low, high, start=None, num=None):
+        return [member for member, score in self.deferred.items() if score <= high][:num]
+
+    def zadd(self, key, mapping):
+        self.deferred.update({member.encode(): score for member, score in mapping.items()})
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.deferred.pop(member, None)
+
+    def xgroup_create(self, *args, **kwargs):
+        pass
+
+    def xautoclaim(self, *args, **kwargs):
+        return [b'0-0', [], []]
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        batch, self.entries = self.entries[:count], self.entries[count:]
+        self.pending.extend(batch)
+        return [[b'webhooks:events', batch]] if batch else []
+
+    def xack(self, stream, group, *ids):
+        self.acked.extend(ids)
+
+
+class WebhookIngestTests(SimpleTestCase):
+    def setUp(self):
+        from unittest import mock
+
+        self.redis = StreamRedisStandIn()
+        patcher = mock.patch('communications.services.webhook_ingest._client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_webhooks_validate_and_queue_without_database(self):
+        url = '/api/communications/callbacks/africastalking/sms/delivery/'
+        self.assertEqual(self.client.post(url, {'id': 'ATXid_1', 'status': 'Success'}).status_code, 200)
+        self.assertEqual(self.client.post(url, {'id': 'ATXid_2', 'status': 'Unknown'}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'status': 'Failed'}).status_code, 400)
+
+        events_url = '/api/communications/callbacks/africastalking/voice/events/'
+        self.assertEqual(self.client.post(events_url, {'sessionId': 'ATVId_1', 'isActive': '0',
+                                                       'durationInSeconds': '61', 'amount': '0.8'}).status_code, 200)
+        self.assertEqual(self.client.post(events_url, {'sessionId': 'ATVId_1', 'amount': 'free'}).status_code, 400)
+
+        queued = [json.loads(fields[b'event']) for _, fields in self.redis.entries]
+        self.assertEqual([(e['kind'], e.get('message_id') or e.get('session_id')) for e in queued],
+                         [('sms_report', 'ATXid_1'), ('voice_event', 'ATVId_1')])
+        self.assertEqual(queued[0]['status'], 'delivered')
+        self.assertEqual((queued[1]['active'], queued[1]['duration'], queued[1]['cost']), (False, 61, '0.8'))
+
+    def test_consume_batch_acks_after_applying(self):
+        from unittest import mock
+        from communications.services import webhook_ingest
+
+        for i in range(7):
+            webhook_ingest.enqueue(webhook_ingest.parse_at_sms_report({'id': f'ATXid_{i}', 'status': 'Sent'}))
+
+        with mock.patch.object(webhook_ingest, 'apply_events', return_value={'applied': 5}) as apply_events:
+            stats = webhook_ingest.consume_batch('test', count=5)
+        self.assertEqual(stats, {'read': 5, 'retried': 0, 'deferred': 0, 'dead_lettered': 0, 'applied': 5})
+        self.assertEqual([e['message_id'] for e in apply_events.call_args[0][0]], [f'ATXid_{i}' for i in range(5)])
+        self.assertEqual(len(self.redis.acked), 5)
+
+    def test_unmatched_events_are_retried_later(self):
+        from unittest import mock
+        from communications.services import webhook_ingest
+
+        webhook_ingest.enqueue(webhook_ingest.parse_at_sms_report({'id': 'ATXid_late', 'status': 'Success'}))
+
+        def unmatched(events, retry):
+            retry.extend(events)
+            return {'unmatched': len(events)}
+
+        with mock.patch.object(webhook_ingest, 'apply_events', side_effect=unmatched):
+            stats = webhook_ingest.consume_batch('test')
+        self.assertEqual((stats['read'], stats['deferred']), (1, 1))
+        self.assertEqual(self.redis.acked, [b'1-0'])
+        self.assertEqual(len(self.redis.deferred), 1)
+
+        # Not due yet, then due
+        with mock.patch.object(webhook_ingest, 'apply_events', return_value={'applied': 1}) as apply_events:
+            self.assertEqual(webhook_ingest.consume_batch('test'), {'read': 0})
+            with mock.patch('time.time', return_value=time.time() + webhook_ingest.UNMATCHED_RETRY_DELAY + 1):
+                stats = webhook_ingest.consume_batch('test')
+        self.assertEqual((stats['read'], stats['retried'], stats['applied']), (0, 1, 1))
+        self.assertEqual(apply_events.call_args[0][0][0]['message_id'], 'ATXid_late')
+        self.assertEqual(self.redis.deferred, {})
+
+    def test_failing_entries_are_dead_lettered_after_max_deliveries(self):
+        from unittest import mock
+        from communications.services import webhook_ingest
+
+        for i in range(3):
+            webhook_ingest.enqueue(webhook_ingest.parse_at_sms_report({'id': f'ATXid_{i}', 'status': 'Sent'}))
+
+        def poison(events, retry=None):
+            if any(event['message_id'] == 'ATXid_1' for event in events):
+                raise ValueError('poison')
+            return {'applied': len(events)}
+
+        with mock.patch.object(webhook_ingest, 'apply_events', side_effect=poison):
+            stats = webhook_ingest.consume_batch('test')
+            self.assertEqual((stats['applied'], stats['dead_lettered']), (2, 0))
+            self.assertEqual(self.redis.acked, [b'1-0', b'3-0'])
+
+            # Redelivered until MAX_DELIVERIES, then moved aside
+            self.redis.entries, self.redis.acked = [self.redis.pending[1]], []
+            self.redis.times_delivered = webhook_ingest.MAX_DELIVERIES
+            stats = webhook_ingest.consume_batch('test')
+        self.assertEqual(stats['dead_lettered'], 1)
+        self.assertEqual(self.redis.acked, [b'2-0'])
+        self.assertEqual(json.loads(self.redis.dead[0]['event'])['message_id'], 'ATXid_1')
+        self.assertIn('poison', self.redis.dead[0]['error'])
+
+
+class WebhookApplyTests(TestCase):
+    def test_unanswered_calls_count_as_undelivered_once_expired(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from communications.models import ProviderStatus
+        from communications.services import webhook_ingest
+
+        event = webhook_ingest.parse_at_voice_event({
+            'sessionId': 'ATVId_nobody', 'isActive': '0', 'callerNumber': '+2348031234567',
+        })
+        retry = []
+        stats = webhook_ingest.apply_events([event], retry)
+        self.assertEqual((stats['unmatched'], stats['expired'], retry), (1, 0, [event]))
+        self.assertFalse(ProviderStatus.objects.exists())
+
+        event['received_at'] = (
+            timezone.now() - timedelta(seconds=webhook_ingest.UNMATCHED_RETRY_SECONDS + 1)
+        ).isoformat()
+        retry = []
+        stats = webhook_ingest.apply_events([event], retry)
+        self.assertEqual((stats['expired'], retry), (1, []))
+        status = ProviderStatus.objects.get(provider_name=webhook_ingest.AFRICAS_TALKING, country_code='NG')
+        self.assertEqual((status.delivered_count, status.undelivered_count), (0, 1))
+
+
+class UsageRollupTests(SimpleTestCase):
+    def test_split_range_uses_whole_days(self):
+        from datetime import datetime, timezone
+        from communications.services.usage_rollups import split_range
+
+        def at(day, hour, minute=0):
+            return datetime(2026, 10, day, hour, minute, tzinfo=timezone.utc)
+
+        self.assertEqual(split_range(at(3, 13, 20), at(6, 9, 5)),
+                         ([(at(3, 13), at(4, 0)), (at(6, 0), at(6, 10))], (at(4, 0), at(6, 0))))
+        self.assertEqual(split_range(at(3, 0), at(5, 0)), ([], (at(3, 0), at(5, 0))))
+        self.assertEqual(split_range(at(3, 13, 20), at(3, 20, 5)), ([(at(3, 13), at(3, 21))], None))
+
+    def test_lag_histogram(self):
+        from communications.services.usage_rollups import bucket_percentile, empty_buckets, lag_bucket
+
+        buckets = empty_buckets()
+        for lag in [0.2] * 90 + [45] * 9 + [5000]:
+            buckets[lag_bucket(lag)] += 1
+        self.assertEqual(bucket_percentile(buckets, 0.5), 0.5)
+        self.assertEqual(bucket_percentile(buckets, 0.95), 60)
+        self.assertEqual(bucket_percentile(buckets, 1.0), 1800)
+        self.assertIsNone(bucket_percentile(empty_buckets(), 0.5))
+
+
+class UsageRollupDatabaseTests(TestCase):
+    def setUp(self):
+        from users.models import CustomUser
+
+        self.user = CustomUser.objects.create_user(
+            username='rollup', email='rollup@example.com', password='x', is_staff=True)
+
+    def log(self, created_at, provider='twilio', country='US', success=True, cost='0.0075'):
+        from communications.models import CommunicationLog
+
+        log = CommunicationLog.objects.create(
+            user=self.user, communication_type='sms', provider_name=provider, recipient='hash',
+            success=success, cost=cost, country_code=country,
+        )
+        # created_at is auto_now_add
+        CommunicationLog.objects.filter(id=log.id).update(created_at=created_at)
+        return log
+
+    def test_rows_are_folded_once_settled_in_id_order(self):
+        from datetime import datetime, timedelta, timezone
+        from communications.models import ProviderUsageRollup
+        from communications.services import usage_rollups
+
+        now = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+        settled = self.log(now - timedelta(minutes=10))
+        # Inserted first but still inside the settle window, e.g. committed late
+        self.log(now - timedelta(seconds=30), provider='africastalking', country='NG')
+        last = self.log(now - timedelta(minutes=5))
+
+        stats = usage_rollups.rollup_new_logs(now=now)
+        self.assertEqual((stats['rows'], stats['last_id']), (1, settled.id))
+
+        stats = usage_rollups.rollup_new_logs(now=now + usage_rollups.SETTLE)
+        self.assertEqual((stats['rows'], stats['last_id']), (2, last.id))
+        self.assertEqual(usage_rollups.rollup_new_logs(now=now + usage_rollups.SETTLE)['rows'], 0)
+
+        day = ProviderUsageRollup.objects.filter(granularity='day')
+        self.assertEqual(sum(rollup.count for rollup in day), 3)
+        self.assertEqual(day.get(provider_name='twilio').count, 2)
+        self.assertEqual(day.get(provider_name='africastalking').country_code, 'NG')
+        self.assertEqual(ProviderUsageRollup.objects.filter(granularity='hour', provider_name='twilio').count(), 1)
+        self.assertEqual(usage_rollups.rolled_up_until(), now - timedelta(minutes=5))
+
+    def test_admin_analytics_reads_the_rollups(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from rest_framework.test import APIClient
+        from communications.services import usage_rollups
+
+        yesterday = timezone.now() - timedelta(days=1)
+        self.log(yesterday)
+        self.log(yesterday, success=False)
+        self.log(yesterday, provider='africastalking', country='NG', cost='0.002')
+        self.log(timezone.now() - timedelta(days=40))
+        usage_rollups.rollup_new_logs()
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/communications/admin/analytics/', {'days': 30})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['overview']['total_communications'], 3)
+        self.assertEqual(response.data['overview']['successful_communications'], 2)
+        self.assertAlmostEqual(response.data['overview']['total_cost'], 0.017)
+        providers = {row['provider_name']: row['count'] for row in response.data['breakdown']['by_provider']}
+        self.assertEqual(providers, {'twilio': 2, 'africastalking': 1})
+
+        day = yesterday.date().isoformat()
+        response = client.get('/api/communications/admin/analytics/', {'start': day, 'end': day})
+        self.assertEqual(response.data['overview']['total_communications'], 3)
+        self.assertEqual(client.get('/api/communications/admin/analytics/', {'start': 'soon'}).status_code, 400)
+
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(client.get('/api/communications/admin/analytics/').status_code, 403)
@@ -4,7 +4,8 @@ from .views import (
     AdminProviderAnalyticsAPIView,
     TestNotificationAPIView,
     africas_talking_voice_callback,
-    africas_talking_voice_events
+    africas_talking_voice_events,
+    africas_talking_sms_delivery_reports
     )
 
 urlpatterns = [
@@ -14,5 +15,7 @@ urlpatterns = [
     # Africa's Talking voice callbacks
     path('callbacks/africastalking/voice/', africas_talking_voice_callback, name='at-voice-callback'),
     path('callbacks/africastalking/voice/events/', africas_talking_voice_events, name='at-voice-events'),
+    # Africa's Talking SMS delivery reports
+    path('callbacks/africastalking/sms/delivery/', africas_talking_sms_delivery_reports, name='at-sms-delivery'),
 
 ]
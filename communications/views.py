@@ -2,13 +2,12 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Sum, Avg, Q
 from django.utils import timezone
 from datetime import timedelta
 
 from .services.provider_registry import ProviderRegistry
 from .services.notification_service import NotificationService
-from .models import CommunicationLog, ProviderStatus
+from .models import ProviderStatus
 from .utils.country_codes import get_country_code
 
 from django.http import HttpResponse
@@ -70,54 +69,68 @@ class AdminProviderAnalyticsAPIView(APIView):
     permission_classes = [IsAdminUser]
     
     def get(self, request):
-        """Get comprehensive provider analytics"""
-        # Date range for analysis
-        days = int(request.query_params.get('days', 30))
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        # Get communication logs for the period
-        logs = CommunicationLog.objects.filter(
-            created_at__range=[start_date, end_date]
-        )
-        
-        # Overall statistics
-        total_communications = logs.count()
-        successful_communications = logs.filter(success=True).count()
-        total_cost = logs.aggregate(total=Sum('cost'))['total'] or 0
+        """Get comprehensive provider analytics, from the usage rollups (see communications/services/usage_rollups.py)"""
+        from communications.services.usage_rollups import bucket_percentile, rolled_up_until, usage_summary
+
+        # Date range for analysis: ?start=&end= (YYYY-MM-DD, end inclusive) or the last ?days=
+        try:
+            end_date, start_date, days = self._period(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        summary = usage_summary(start_date, end_date)
+        total = summary['total']
+        total_communications = total['count']
+        successful_communications = total['success_count']
+        total_cost = total['total_cost']
         
         # Provider breakdown
-        provider_stats = logs.values('provider_name').annotate(
-            count=Count('id'),
-            success_count=Count('id', filter=Q(success=True)),
-            total_cost=Sum('cost'),
-            avg_cost=Avg('cost')
-        ).order_by('-count')
+        provider_stats = sorted((
+            {
+                'provider_name': name,
+                'count': stats['count'],
+                'success_count': stats['success_count'],
+                'total_cost': stats['total_cost'],
+                'avg_cost': stats['total_cost'] / stats['cost_count'] if stats['cost_count'] else None,
+                'lag_p50': bucket_percentile(stats['lag_buckets'], 0.5),
+                'lag_p95': bucket_percentile(stats['lag_buckets'], 0.95),
+            }
+            for name, stats in summary['by_provider'].items()
+        ), key=lambda row: -row['count'])
         
         # Country breakdown
-        country_stats = logs.values('country_code').annotate(
-            count=Count('id'),
-            total_cost=Sum('cost'),
-            unique_providers=Count('provider_name', distinct=True)
-        ).order_by('-count')
+        country_stats = sorted((
+            {
+                'country_code': country or None,
+                'count': stats['count'],
+                'total_cost': stats['total_cost'],
+                'unique_providers': len(stats['providers']),
+            }
+            for country, stats in summary['by_country'].items()
+        ), key=lambda row: -row['count'])
         
         # Communication type breakdown
-        type_stats = logs.values('communication_type').annotate(
-            count=Count('id'),
-            success_count=Count('id', filter=Q(success=True)),
-            total_cost=Sum('cost')
-        ).order_by('-count')
+        type_stats = sorted((
+            {
+                'communication_type': channel,
+                'count': stats['count'],
+                'success_count': stats['success_count'],
+                'total_cost': stats['total_cost'],
+            }
+            for channel, stats in summary['by_type'].items()
+        ), key=lambda row: -row['count'])
         
         # Cost comparison (estimate savings vs all-Twilio)
-        twilio_cost_estimate = self._calculate_twilio_only_cost(logs)
+        twilio_cost_estimate = self._calculate_twilio_only_cost(country_stats)
         actual_cost = total_cost
-        estimated_savings = twilio_cost_estimate - actual_cost
+        estimated_savings = twilio_cost_estimate - float(actual_cost)
         
         return Response({
             'period': {
                 'days': days,
                 'start_date': start_date.date(),
-                'end_date': end_date.date()
+                'end_date': end_date.date(),
+                'rolled_up_until': rolled_up_until(),
             },
             'overview': {
                 'total_communications': total_communications,
@@ -133,43 +146,55 @@ class AdminProviderAnalyticsAPIView(APIView):
                 'savings_percentage': (estimated_savings / max(twilio_cost_estimate, 1)) * 100
             },
             'breakdown': {
-                'by_provider': list(provider_stats),
-                'by_country': list(country_stats),
-                'by_type': list(type_stats)
+                'by_provider': provider_stats,
+                'by_country': country_stats,
+                'by_type': type_stats
             },
-            'top_countries': self._get_top_countries_with_savings(),
+            'top_countries': self._get_top_countries_with_savings(country_stats),
         })
     
-    def _calculate_twilio_only_cost(self, logs):
+    def _period(self, request):
+        from django.utils.dateparse import parse_date
+        from datetime import datetime, time, timezone as dt_timezone
+
+        start_param = request.query_params.get('start')
+        if start_param:
+            start_day = parse_date(start_param)
+            end_day = parse_date(request.query_params.get('end', '')) if request.query_params.get('end') else None
+            if start_day is None or (request.query_params.get('end') and end_day is None):
+                raise ValueError("start and end must be YYYY-MM-DD")
+            end_date = (
+                datetime.combine(end_day + timedelta(days=1), time(), dt_timezone.utc) if end_day else timezone.now()
+            )
+            start_date = datetime.combine(start_day, time(), dt_timezone.utc)
+            if start_date >= end_date:
+                raise ValueError("start must be before end")
+            return end_date, start_date, (end_date - start_date).days
+
+        days = int(request.query_params.get('days', 30))
+        end_date = timezone.now()
+        return end_date, end_date - timedelta(days=days), days
+    
+    def _calculate_twilio_only_cost(self, country_stats):
         """Calculate what the cost would be if using only Twilio"""
-        twilio_cost = 0
         twilio_provider = ProviderRegistry.get_provider('twilio')
         
         if not twilio_provider:
             return 0
         
-        for log in logs:
-            country = log.country_code or 'US'
-            cost = twilio_provider.get_cost_per_message(country)
-            twilio_cost += cost
-        
-        return twilio_cost
+        return sum(
+            twilio_provider.get_cost_per_message(row['country_code'] or 'US') * row['count']
+            for row in country_stats
+        )
     
-    def _get_top_countries_with_savings(self):
+    def _get_top_countries_with_savings(self, country_stats):
         """Get top countries where we're saving the most money"""
-        # This would involve comparing actual costs vs Twilio costs by country
-        # Simplified version here
-        country_logs = CommunicationLog.objects.values('country_code').annotate(
-            count=Count('id'),
-            total_cost=Sum('cost')
-        ).order_by('-count')[:10]
-        
         savings_by_country = []
         twilio_provider = ProviderRegistry.get_provider('twilio')
         
-        for country_data in country_logs:
+        for country_data in country_stats[:10]:
             country = country_data['country_code'] or 'US'
-            actual_cost = country_data['total_cost'] or 0
+            actual_cost = float(country_data['total_cost'] or 0)
             
             if twilio_provider:
                 twilio_unit_cost = twilio_provider.get_cost_per_message(country)
@@ -182,7 +207,7 @@ class AdminProviderAnalyticsAPIView(APIView):
             savings_by_country.append({
                 'country': country,
                 'message_count': country_data['count'],
-                'actual_cost': float(actual_cost),
+                'actual_cost': actual_cost,
                 'estimated_twilio_cost': float(estimated_twilio_cost),
                 'savings': float(savings),
                 'savings_percentage': (savings / max(estimated_twilio_cost, 1)) * 100
@@ -262,81 +287,49 @@ class TestNotificationAPIView(APIView):
 def africas_talking_voice_callback(request):
     """
     Callback endpoint for Africa's Talking voice calls
-    This serves the TTS/Audio XML response
+    This serves the TTS/Audio XML response, rendered when the call was placed
+    (see communications/services/voice_sessions.py)
     """
-    from communications.models import VoiceCallSession
-    from django.utils import timezone
-
-    # Log ALL parameters received
-    logger.info(f"🔔 VOICE CALLBACK TRIGGERED!")
-    logger.info(f"   GET params: {dict(request.GET)}")
-    logger.info(f"   POST params: {dict(request.POST)}")
+    from communications.services.voice_sessions import DEFAULT_XML, claim_session
 
     # Get parameters from Africa's Talking
     session_id = request.GET.get('sessionId') or request.POST.get('sessionId')
     phone_number = request.GET.get('callerNumber') or request.POST.get('callerNumber')
 
-    logger.info(f"   Session: {session_id}, Phone: {phone_number}")
+    logger.info(f"🔔 Voice callback: session {session_id}, phone {phone_number}")
 
-    # Retrieve call data from database using phone number
     try:
-        call_session = VoiceCallSession.objects.filter(
-            phone_number=phone_number,
-            retrieved_at__isnull=True
-        ).order_by('-created_at').first()
-
-        if call_session:
-            logger.info(f"   ✅ Found DB session: {call_session.call_type}")
+        call_session = claim_session(phone_number, session_id)
+    except Exception as e:
+        logger.error(f"   ❌ Error retrieving session: {str(e)}")
+        call_session = None
 
-            if call_session.call_type == 'adhan_audio':
-                # Serve audio Adhan
-                audio_url = call_session.audio_url
-                logger.info(f"   🕌 Playing adhan audio: {audio_url}")
-                xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-        <Response>
-            <Say voice="woman">Assalamu Alaikum. It is time for prayer.</Say>
-            <Play url="{audio_url}"/>
-            <Say voice="woman">May Allah accept your prayers.</Say>
-        </Response>'''
+    if call_session:
+        logger.info(f"   ✅ Found session: {call_session['call_type']}")
+        xml_response = call_session['xml']
+    else:
+        logger.warning(f"   ⚠️ No session found for {phone_number}")
+        xml_response = DEFAULT_XML
 
-            elif call_session.call_type == 'tts':
-                # Serve TTS message
-                message = call_session.message or 'This is a message from Muadhin.'
-                xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-        <Response>
-            <Say voice="woman">{message}</Say>
-        </Response>'''
+    return HttpResponse(xml_response, content_type='application/xml')
 
-            else:
-                # Unknown call type
-                xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-        <Response>
-            <Say voice="woman">This is a test call from Muadhin.</Say>
-        </Response>'''
 
-            # Mark as retrieved and save session ID
-            call_session.retrieved_at = timezone.now()
-            call_session.session_id = session_id
-            call_session.save()
+def _enqueue_webhook(request, parse, label):
+    """Validate a provider webhook and queue it for batched ingestion"""
+    from communications.services.webhook_ingest import InvalidEvent, enqueue
 
-        else:
-            # No session found - default response
-            logger.warning(f"   ⚠️ No DB session found for {phone_number}")
-            xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-        <Response>
-            <Say voice="woman">This is a test call from Muadhin.</Say>
-        </Response>'''
+    try:
+        event = parse(request.POST)
+    except InvalidEvent as e:
+        logger.warning(f"⚠️ Rejected {label}: {e}")
+        return HttpResponse(status=400)
 
+    try:
+        enqueue(event)
     except Exception as e:
-        logger.error(f"   ❌ Error retrieving session: {str(e)}")
-        xml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-        <Response>
-            <Say voice="woman">This is a test call from Muadhin.</Say>
-        </Response>'''
-
-    logger.info(f"   Returning XML response")
-
-    return HttpResponse(xml_response, content_type='application/xml')
+        logger.error(f"Error queueing {label}: {str(e)}")
+        return HttpResponse(status=500)
+    return HttpResponse(status=200)
 
 
 @csrf_exempt
@@ -345,27 +338,20 @@ def africas_talking_voice_events(request):
     """
     Callback endpoint for Africa's Talking voice call status events
     Receives notifications about call status: ringing, answered, completed, failed, etc.
+    Applied to VoiceCallSession in batches, see communications/services/webhook_ingest.py
     """
-    try:
-        # Africa's Talking sends these parameters
-        is_active = request.POST.get('isActive')  # 0 = call ended, 1 = call active
-        session_id = request.POST.get('sessionId')
-        phone_number = request.POST.get('callerNumber') or request.POST.get('phoneNumber')
-        direction = request.POST.get('direction')  # Inbound or Outbound
-        status = request.POST.get('status')  # Answered, Ringing, Completed, Failed
-        duration = request.POST.get('durationInSeconds')
-        currency_code = request.POST.get('currencyCode')
-        amount = request.POST.get('amount')
+    from communications.services.webhook_ingest import parse_at_voice_event
 
-        # Log the event
-        logger.info(f"📞 Voice Event - Phone: {phone_number}, Status: {status}, Duration: {duration}s, Active: {is_active}")
-        logger.info(f"   Session: {session_id}, Direction: {direction}, Cost: {currency_code} {amount}")
+    return _enqueue_webhook(request, parse_at_voice_event, 'voice event')
 
-        # You can store this in database for analytics/debugging
-        # For now, just log it
 
-        return HttpResponse(status=200)
+@csrf_exempt
+@require_http_methods(["POST"])
+def africas_talking_sms_delivery_reports(request):
+    """
+    Callback endpoint for Africa's Talking SMS delivery reports
+    Applied to CommunicationLog in batches, see communications/services/webhook_ingest.py
+    """
+    from communications.services.webhook_ingest import parse_at_sms_report
 
-    except Exception as e:
-        logger.error(f"Error processing voice event: {str(e)}")
-        return HttpResponse(status=500)
+    return _enqueue_webhook(request, parse_at_sms_report, 'SMS delivery report')
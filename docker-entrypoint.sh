@@ -96,11 +96,28 @@ except Exception as e:
     echo "Django setup completed."
 }
 
+# Prometheus multiprocess mode (gunicorn and prefork Celery workers write
+# their samples here, see muadhin/metrics.py); stale files from a previous
+# run would be counted again, so start from an empty directory
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-multiproc}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # Determine the service type based on the command
 case "$1" in
     "celery")
         echo "Starting Celery worker..."
-        exec celery -A muadhin worker --loglevel=info
+        # Extra arguments go to the worker, e.g. "celery -X adhan" when the
+        # adhan queue has its own worker
+        shift
+        exec celery -A muadhin worker --loglevel=info "$@"
+        ;;
+    "celery-queue")
+        # Dedicated worker for one queue, with its settings from muadhin/celery.py
+        QUEUE="${2:?Usage: celery-queue <queue>}"
+        echo "Starting Celery worker for the $QUEUE queue..."
+        WORKER_ARGS=$(python -c "from muadhin.celery import worker_args; print(' '.join(worker_args('$QUEUE')))")
+        exec celery -A muadhin worker --loglevel=info $WORKER_ARGS
         ;;
     "celery-beat")
         echo "Starting Celery beat scheduler..."
@@ -0,0 +1,8 @@
+# Loaded by gunicorn from the working directory
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges from the Prometheus multiprocess files
+    from muadhin.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
@@ -0,0 +1,399 @@
+# muadhin/cache.py - Tiered cache: per-process LRU in front of Redis
+
+"""
+The default cache backend is Redis (the instance Celery already uses), with a
+small in-process LRU in front of it so hot keys (location lists, timezone
+lists, dashboard snapshot versions) are answered without a network round trip.
+
+Local entries live for at most LOCAL_TIMEOUT seconds (5 by default), which is
+also the longest another node can serve a value after it was changed or
+deleted elsewhere. Writes and deletes on this process update both tiers.
+
+If Redis cannot be reached the backend keeps working from the local tier only
+and retries Redis after RETRY_AFTER seconds, instead of failing every request.
+
+On top of any backend there are helpers for namespaced keys with versioned
+invalidation (invalidate_namespace() drops a whole namespace in O(1)) and
+get_or_set_locked(), which lets a single worker recompute a missing value
+while the others wait for it (cache stampede protection).
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.core.cache import cache as default_cache
+
+from muadhin.metrics import CACHE_REQUESTS
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.redis import RedisCache
+from django.utils.cache import patch_response_headers
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+REDIS_UNAVAILABLE = (RedisConnectionError, RedisTimeoutError)
+
+_MISSING = object()
+
+
+class _LocalTier:
+    """Thread-safe LRU of pickled values with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.redis_down_until = 0.0
+
+    def get(self, key, default=_MISSING):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires_at, payload = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+        return pickle.loads(payload)
+
+    def set(self, key, value, timeout):
+        # Pickled so callers can't mutate what other callers get back
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            self.entries[key] = (expires_at, payload)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            return self.entries.pop(key, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# One local tier per process and cache location, shared by the per-thread
+# backend instances Django creates
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    # Prefork workers start with an empty tier
+    os.register_at_fork(after_in_child=_local_tiers.clear)
+
+
+class TieredRedisCache(RedisCache):
+    """
+    Django's RedisCache with a per-process LRU tier in front.
+
+    Extra OPTIONS (not passed to redis-py):
+        LOCAL_MAX_ENTRIES: size of the local LRU (default 1000)
+        LOCAL_TIMEOUT: seconds a value is served locally (default 5)
+        RETRY_AFTER: seconds to stay local-only after Redis failed (default 5)
+    """
+
+    def __init__(self, server, params):
+        options = dict(params.get('OPTIONS') or {})
+        local_max_entries = int(options.pop('LOCAL_MAX_ENTRIES', 1000))
+        self.local_timeout = float(options.pop('LOCAL_TIMEOUT', 5))
+        self.retry_after = float(options.pop('RETRY_AFTER', 5))
+        # Fail fast when Redis is gone, the local tier takes over
+        options.setdefault('socket_connect_timeout', 0.5)
+        options.setdefault('socket_timeout', 0.5)
+        super().__init__(server, {**params, 'OPTIONS': options})
+
+        tier_key = (tuple(self._servers), self.key_prefix)
+        with _local_tiers_lock:
+            if tier_key not in _local_tiers:
+                _local_tiers[tier_key] = _LocalTier(local_max_entries)
+            self._local = _local_tiers[tier_key]
+
+    # Remote tier
+
+    def _remote(self, method, *args):
+        """Call the Redis client, or return _MISSING while Redis is unavailable"""
+        if self._local.redis_down_until > time.monotonic():
+            return _MISSING
+        try:
+            return getattr(self._cache, method)(*args)
+        except REDIS_UNAVAILABLE as e:
+            self._local.redis_down_until = time.monotonic() + self.retry_after
+            logger.warning(f"⚠️ Redis cache unavailable, serving from the local tier: {e}")
+            return _MISSING
+
+    def _local_timeout(self, backend_timeout, redis_available=True):
+        if not redis_available:
+            # Only copy there is, keep it for as long as asked
+            return backend_timeout
+        if backend_timeout is None:
+            return self.local_timeout
+        return min(self.local_timeout, backend_timeout)
+
+    def _store_local(self, key, value, backend_timeout, redis_available=True):
+        if backend_timeout is not None and backend_timeout <= 0:
+            self._local.delete(key)
+        else:
+            self._local.set(key, value, self._local_timeout(backend_timeout, redis_available))
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        value = self._local.get(key)
+        if value is not _MISSING:
+            CACHE_REQUESTS.labels('local_hit').inc()
+            return value
+
+        value = self._remote('get', key, _MISSING)
+        if value is _MISSING:
+            CACHE_REQUESTS.labels('miss').inc()
+            return default
+        CACHE_REQUESTS.labels('redis_hit').inc()
+        self._local.set(key, value, self.local_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        backend_timeout = self.get_backend_timeout(timeout)
+        result = self._remote('set', key, value, backend_timeout)
+        self._store_local(key, value, backend_timeout, result is not _MISSING)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        backend_timeout = self.get_backend_timeout(timeout)
+        added = self._remote('add', key, value, backend_timeout)
+
+        if added is _MISSING:
+            if self._local.get(key) is not _MISSING:
+                return False
+            self._store_local(key, value, backend_timeout, redis_available=False)
+            return True
+
+        if added:
+            self._store_local(key, value, backend_timeout)
+        else:
+            # Someone else holds the key, read it from Redis next time
+            self._local.delete(key)
+        return bool(added)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        backend_timeout = self.get_backend_timeout(timeout)
+        if backend_timeout is not None and backend_timeout <= 0:
+            self._local.delete(key)
+        touched = self._remote('touch', key, backend_timeout)
+        if touched is _MISSING:
+            return self._local.get(key) is not _MISSING
+        return touched
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        deleted_locally = self._local.delete(key)
+        deleted = self._remote('delete', key)
+        if deleted is _MISSING:
+            return deleted_locally
+        return deleted
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        if self._local.get(key) is not _MISSING:
+            return True
+        return self._remote('has_key', key) is True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        value = self._remote('incr', key, delta)
+        if value is _MISSING:
+            current = self._local.get(key)
+            if current is _MISSING:
+                raise ValueError("Key '%s' not found." % key)
+            value = current + delta
+            self._local.set(key, value, None)
+            return value
+        self._local.set(key, value, self.local_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        result = {}
+        remote_keys = []
+        for key in key_map:
+            value = self._local.get(key)
+            if value is _MISSING:
+                remote_keys.append(key)
+            else:
+                result[key_map[key]] = value
+
+        if remote_keys:
+            fetched = self._remote('get_many', remote_keys)
+            if fetched is not _MISSING:
+                for key, value in fetched.items():
+                    self._local.set(key, value, self.local_timeout)
+                    result[key_map[key]] = value
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if not data:
+            return []
+        safe_data = {self.make_and_validate_key(key, version=version): value for key, value in data.items()}
+        backend_timeout = self.get_backend_timeout(timeout)
+        result = self._remote('set_many', safe_data, backend_timeout)
+        for key, value in safe_data.items():
+            self._store_local(key, value, backend_timeout, result is not _MISSING)
+        return []
+
+    def delete_many(self, keys, version=None):
+        if not keys:
+            return
+        safe_keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        for key in safe_keys:
+            self._local.delete(key)
+        self._remote('delete_many', safe_keys)
+
+    def clear(self):
+        self._local.clear()
+        return self._remote('clear') is not _MISSING
+
+
+# Raw client
+
+def redis_client(cache=None):
+    """
+    The redis-py client behind a Redis cache backend, for data types the
+    cache API doesn't cover (hashes, pipelines). None for other backends and
+    while a TieredRedisCache has Redis marked unavailable.
+    """
+    cache = cache or default_cache
+    if not isinstance(cache, RedisCache):
+        return None
+    local = getattr(cache, '_local', None)
+    if local is not None and local.redis_down_until > time.monotonic():
+        return None
+    return cache._cache.get_client(write=True)
+
+
+def mark_redis_unavailable(error, cache=None):
+    """Have redis_client() and a TieredRedisCache skip Redis for a while after error"""
+    cache = cache or default_cache
+    local = getattr(cache, '_local', None)
+    if local is not None:
+        local.redis_down_until = time.monotonic() + cache.retry_after
+    logger.warning(f"⚠️ Redis unavailable: {error}")
+
+
+# Namespaces
+
+NAMESPACE_VERSION_KEY = 'ns:{namespace}'
+
+
+def namespace_version(namespace, cache=None):
+    cache = cache or default_cache
+    version_key = NAMESPACE_VERSION_KEY.format(namespace=namespace)
+    version = cache.get(version_key)
+    if version is None:
+        # Never expires, a reset to 1 could bring back stale entries
+        cache.add(version_key, 1, None)
+        version = cache.get(version_key) or 1
+    return version
+
+
+def namespaced_key(namespace, key, cache=None):
+    """Key inside a namespace, e.g. 'location:v3:countries_all_'"""
+    return f"{namespace}:v{namespace_version(namespace, cache)}:{key}"
+
+
+def invalidate_namespace(namespace, cache=None):
+    """Drop every key of a namespace by moving it to a new version"""
+    cache = cache or default_cache
+    version_key = NAMESPACE_VERSION_KEY.format(namespace=namespace)
+    try:
+        return cache.incr(version_key)
+    except ValueError:
+        cache.set(version_key, 2, None)
+        return 2
+
+
+# Stampede protection
+
+def get_or_set_locked(key, compute, timeout=DEFAULT_TIMEOUT, lock_timeout=30, wait=5.0, cache=None):
+    """
+    Like cache.get_or_set(), but on a miss only the worker that takes the lock
+    calls compute(); the others poll for its result for up to `wait` seconds
+    before computing it themselves. None results are not cached.
+    """
+    cache = cache or default_cache
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = compute()
+            if value is not None:
+                cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    deadline = time.monotonic() + wait
+    poll = 0.01
+    while time.monotonic() < deadline:
+        time.sleep(poll)
+        poll = min(poll * 2, 0.2)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if not cache.has_key(lock_key):
+            # The lock holder gave up (error or uncacheable result)
+            break
+
+    return compute()
+
+
+def cache_api_response(timeout, namespace, lock_timeout=30):
+    """
+    Stampede-protected replacement for cache_page() on DRF views, apply with
+    method_decorator(). Caches the data of 200 responses under the request's
+    full path in `namespace`, and sets the same Expires/Cache-Control headers
+    as cache_page().
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            path_hash = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+            key = namespaced_key(namespace, f"response:{path_hash}")
+            computed = {}
+
+            def compute():
+                response = view_func(request, *args, **kwargs)
+                computed['response'] = response
+                if response.status_code == 200 and hasattr(response, 'data'):
+                    return response.data
+                return None
+
+            data = get_or_set_locked(key, compute, timeout, lock_timeout=lock_timeout)
+            response = computed.get('response')
+            if response is None:
+                response = Response(data)
+            if response.status_code == 200:
+                patch_response_headers(response, timeout)
+            return response
+
+        return _wrapped_view
+
+    return decorator
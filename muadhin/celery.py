@@ -2,6 +2,8 @@ from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_init, worker_process_shutdown
+from kombu import Queue
 # from muadhin.celery_fix import getargspec
 # from SalatTracker.tasks import schedule_midnight_checks
 
@@ -25,13 +27,40 @@ app.conf.beat_schedule = {
         'task': 'subscriptions.tasks.send_expiry_warnings',
         'schedule': crontab(minute=0, hour=9),  # Run daily at 9 AM UTC
     },
+    'send_daily_summary_emails': {
+        'task': 'SalatTracker.tasks.send_daily_summary_emails',
+        'schedule': crontab(minute='*/10'),  # Bulk daily summaries (no-op unless DAILY_SUMMARY_EMAIL_BATCHING)
+    },
+    'ingest_webhook_events': {
+        'task': 'communications.tasks.ingest_webhook_events',
+        'schedule': 5.0,  # Apply queued delivery reports and voice events
+        'options': {'expires': 5},
+    },
+    'rollup_provider_usage': {
+        'task': 'communications.tasks.rollup_provider_usage',
+        'schedule': crontab(minute='*/5'),  # Provider analytics rollups
+    },
+    'maintain_log_partitions': {
+        'task': 'communications.tasks.maintain_log_partitions',
+        'schedule': crontab(hour=2, minute=30),  # Log partitions ahead, retention
+    },
+    'archive_old_prayers': {
+        'task': 'SalatTracker.tasks.archive_old_prayers',
+        'schedule': crontab(hour=3, minute=0),  # Past months of prayer days to archive files
+    },
 }
 
+# Recycle point of a prefork child, in KB. A child of the production image
+# sits around 100MB resident after Django has loaded; the worker containers in
+# docker-compose.prod.yml get (concurrency + 1) times this so the recycle
+# fires before the container limit does.
+WORKER_CHILD_MAX_MEMORY_KB = 128000
+
 # Memory optimization settings
 app.conf.update(
     # Worker settings for memory efficiency
     worker_max_tasks_per_child=100,  # Restart worker after 100 tasks to prevent memory leaks
-    worker_max_memory_per_child=400000,  # Restart worker if it uses more than 400MB (400MB in KB)
+    worker_max_memory_per_child=WORKER_CHILD_MAX_MEMORY_KB,  # Restart a child after a task that left it above this
     
     # Task settings
     task_acks_late=True,  # Acknowledge tasks only after completion
@@ -51,7 +80,100 @@ app.conf.update(
 )
 
 
+# Queue topology: time-critical delivery never waits behind bulk work.
+#   adhan          adhan calls and pre-adhan reminders, run at their ETA
+#   notifications  daily messages and summaries, activation emails
+#   ingest         prayer time fetches and the per-day scheduling fan-out
+#   housekeeping   subscription expiry and warnings
+#   celery         anything not routed
+# Run a worker per queue (docker-entrypoint.sh celery-queue <queue>) with the
+# settings below; a plain `celery worker` still consumes every queue. Raising a
+# concurrency means raising that worker's memory limit, see
+# WORKER_CHILD_MAX_MEMORY_KB.
+ADHAN_QUEUE = 'adhan'
+NOTIFICATIONS_QUEUE = 'notifications'
+INGEST_QUEUE = 'ingest'
+HOUSEKEEPING_QUEUE = 'housekeeping'
+DEFAULT_QUEUE = 'celery'
+
+QUEUE_WORKERS = {
+    # Calls are I/O bound and must start on time: many slots, no prefetch
+    ADHAN_QUEUE: {'concurrency': 8, 'prefetch_multiplier': 1},
+    NOTIFICATIONS_QUEUE: {'concurrency': 4, 'prefetch_multiplier': 4},
+    INGEST_QUEUE: {'concurrency': 4, 'prefetch_multiplier': 4},
+    HOUSEKEEPING_QUEUE: {'concurrency': 1, 'prefetch_multiplier': 1},
+    DEFAULT_QUEUE: {'concurrency': 2, 'prefetch_multiplier': 4},
+}
+
+TASK_ROUTES = {
+    'SalatTracker.tasks.send_pre_adhan_notification': ADHAN_QUEUE,
+    'SalatTracker.tasks.make_call_and_play_audio': ADHAN_QUEUE,
+    'SalatTracker.tasks.notify_prayer_time': ADHAN_QUEUE,
+
+    'SalatTracker.tasks.send_daily_prayer_message': NOTIFICATIONS_QUEUE,
+    'SalatTracker.tasks.send_daily_summary_emails': NOTIFICATIONS_QUEUE,
+    'users.tasks.send_activation_email': NOTIFICATIONS_QUEUE,
+
+    'users.tasks.check_and_schedule_daily_tasks': INGEST_QUEUE,
+    'users.tasks.process_user_chunk': INGEST_QUEUE,
+    'users.tasks.fetch_and_save_daily_prayer_times': INGEST_QUEUE,
+    'SalatTracker.tasks.fetch_and_save_daily_prayer_times': INGEST_QUEUE,
+    'SalatTracker.tasks.schedule_midnight_checks': INGEST_QUEUE,
+    'SalatTracker.tasks.check_user_midnight': INGEST_QUEUE,
+    'SalatTracker.tasks.schedule_notifications_for_day': INGEST_QUEUE,
+    'SalatTracker.tasks.schedule_phone_calls_for_day': INGEST_QUEUE,
+    'communications.tasks.persist_voice_session': INGEST_QUEUE,
+    'communications.tasks.ingest_webhook_events': INGEST_QUEUE,
+
+    'subscriptions.tasks.check_and_expire_subscriptions': HOUSEKEEPING_QUEUE,
+    'subscriptions.tasks.send_expiry_warnings': HOUSEKEEPING_QUEUE,
+    'communications.tasks.rollup_provider_usage': HOUSEKEEPING_QUEUE,
+    'communications.tasks.maintain_log_partitions': HOUSEKEEPING_QUEUE,
+    'SalatTracker.tasks.archive_old_prayers': HOUSEKEEPING_QUEUE,
+}
+
+app.conf.update(
+    task_queues=[Queue(name) for name in QUEUE_WORKERS],
+    task_default_queue=DEFAULT_QUEUE,
+    task_routes={task: {'queue': queue} for task, queue in TASK_ROUTES.items()},
+)
+
+
+def worker_args(queue):
+    """celery worker arguments for a dedicated worker of a queue"""
+    settings = QUEUE_WORKERS[queue]
+    return [
+        '-Q', queue,
+        '-n', f'{queue}@%h',
+        '--concurrency', str(settings['concurrency']),
+        '--prefetch-multiplier', str(settings['prefetch_multiplier']),
+    ]
+
+
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
+
+# Per-queue lag histograms (signal handlers)
+from muadhin import queue_metrics  # noqa: E402,F401
+# Per-task query/HTTP/wall time profiling when TASK_PROFILING is on
+from muadhin import task_profiler  # noqa: E402,F401
+
+
+@worker_init.connect
+def start_metrics_exporter(**kwargs):
+    """Serve Prometheus metrics from the main worker process, see muadhin/metrics.py"""
+    from django.conf import settings
+    from muadhin.metrics import start_worker_exporter
+
+    port = getattr(settings, 'WORKER_METRICS_PORT', 0)
+    if port:
+        start_worker_exporter(port)
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    from muadhin.metrics import mark_process_dead
+
+    mark_process_dead(pid or os.getpid())
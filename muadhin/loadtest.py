@@ -0,0 +1,595 @@
+"""
+End-to-end load test of the notification pipeline, without network or workers
+(see users/management/commands/loadtest_day.py).
+
+- Synthetic users are seeded across timezones (usernames start with PREFIX and
+  are deleted afterwards).
+- Aladhan timings come from a local HTTP server (FakeAladhanServer, via
+  ALADHAN_API_URL). SMS/voice/WhatsApp go to FakeProvider and email to
+  FakeEmailBackend. Each fake has a configurable latency and error rate.
+- One UTC day of the hourly scheduler (check_and_schedule_daily_tasks, the
+  PIPELINE_BEAT entries) is replayed through the real tasks, limited to the
+  seeded users. Housekeeping entries (expiry, archiving, partitions, rollups,
+  webhook ingestion) work on every row and are not replayed.
+- It refuses to run while the database holds users other than synthetic
+  ones: use an empty database (or the test database, as LoadTestRunTests does).
+
+Celery itself is simulated. apply_async()/delay() publish into an in-process
+queue. A task runs for real (real database, fake providers) once its ETA has
+come and one of its queue's worker slots is free in simulated time. Slot
+counts come from QUEUE_WORKERS in muadhin/celery.py. Task durations are
+measured, so lag reflects how long the pipeline takes on this machine.
+timezone.now() follows the simulated clock. Fake latencies advance that clock
+instead of sleeping, so a day for thousands of users runs in minutes.
+
+Tasks run in order of when they became ready. A task that waited for a slot
+can therefore run after tasks that became ready later on other queues, which
+is close enough for throughput and lag figures.
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import random
+import re
+import resource
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from uuid import uuid4
+
+from django.core.mail.backends.base import BaseEmailBackend
+
+from communications.providers.base import CombinedProvider, CommunicationResult
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'loadtest-'
+PROVIDER_NAME = 'loadtest'
+
+# Beat entries that drive the notification pipeline, replayed with user_ids
+PIPELINE_BEAT = ('check_and_schedule_daily_tasks',)
+
+# (timezone, city, country, weight): a few large markets and a long tail
+LOCATIONS = [
+    ('Africa/Lagos', 'Lagos', 'Nigeria', 40),
+    ('Europe/London', 'London', 'United Kingdom', 10),
+    ('America/New_York', 'New York', 'United States', 8),
+    ('Asia/Karachi', 'Karachi', 'Pakistan', 6),
+    ('Asia/Riyadh', 'Riyadh', 'Saudi Arabia', 6),
+    ('Asia/Jakarta', 'Jakarta', 'Indonesia', 5),
+    ('Africa/Cairo', 'Cairo', 'Egypt', 5),
+    ('Africa/Nairobi', 'Nairobi', 'Kenya', 4),
+    ('Asia/Kolkata', 'Hyderabad', 'India', 4),
+    ('Asia/Dubai', 'Dubai', 'United Arab Emirates', 3),
+    ('America/Toronto', 'Toronto', 'Canada', 3),
+    ('Australia/Sydney', 'Sydney', 'Australia', 2),
+    ('America/Los_Angeles', 'Los Angeles', 'United States', 2),
+    ('Asia/Kuala_Lumpur', 'Kuala Lumpur', 'Malaysia', 2),
+]
+
+# Local timings the fake Aladhan server starts from, shifted per city
+BASE_TIMINGS = {
+    'Fajr': (5, 10), 'Sunrise': (6, 30), 'Dhuhr': (12, 50), 'Asr': (16, 10), 'Sunset': (18, 55),
+    'Maghrib': (18, 55), 'Isha': (20, 10), 'Imsak': (5, 0), 'Midnight': (0, 50),
+    'Firstthird': (22, 50), 'Lastthird': (2, 50),
+}
+
+DELIVERY_TASKS = {
+    'SalatTracker.tasks.send_pre_adhan_notification': 'pre_adhan',
+    'SalatTracker.tasks.make_call_and_play_audio': 'adhan_call',
+}
+
+
+@dataclass
+class LoadTestConfig:
+    users: int = 100
+    seed: int = 1
+    day: Optional[datetime] = None  # UTC midnight the simulation starts at, default today
+    hours: int = 24
+    provider_latency_ms: float = 150
+    provider_error_rate: float = 0.01
+    email_latency_ms: float = 80
+    email_error_rate: float = 0.0
+    aladhan_latency_ms: float = 300
+    aladhan_error_rate: float = 0.0
+    keep: bool = False  # keep the seeded users and their data
+
+
+# The running simulation's clock; fakes wait on it instead of sleeping
+_clock = None
+
+
+def _sleep_ms(latency_ms: float, rng: random.Random):
+    """Wait around latency_ms (exponentially distributed, a long tail like real APIs)"""
+    if latency_ms <= 0:
+        return
+    seconds = rng.expovariate(1 / latency_ms) / 1000
+    if _clock is not None:
+        _clock.advance(seconds)
+    else:
+        time.sleep(seconds)
+
+
+# Fakes
+
+class FakeAladhanServer:
+    """timingsByCity and timings/<date> on a local port, e.g. http://127.0.0.1:PORT/v1/timingsByCity"""
+
+    def __init__(self, latency_ms: float = 0, error_rate: float = 0.0, seed: int = 1):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def timings(self, query: Dict[str, str]) -> Dict:
+        day = datetime.strptime(query['date'], '%d-%m-%Y')
+        place = query.get('city') or f"{query.get('latitude')},{query.get('longitude')}"
+        shift = sum(map(ord, place)) % 41 - 20  # -20..20 minutes per place
+        timings = {}
+        for name, (hour, minute) in BASE_TIMINGS.items():
+            minutes = (hour * 60 + minute + shift) % (24 * 60)
+            timings[name] = f"{minutes // 60:02d}:{minutes % 60:02d}"
+        return {
+            'code': 200,
+            'status': 'OK',
+            'data': {
+                'timings': timings,
+                'date': {'gregorian': {'date': query['date'], 'weekday': {'en': day.strftime('%A')}}},
+            },
+        }
+
+    def __enter__(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests += 1
+                _sleep_ms(fake.latency_ms, fake.rng)
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                by_coordinates = re.search(r'/timings/(\d{2}-\d{2}-\d{4})$', url.path)
+                if by_coordinates and {'latitude', 'longitude'} <= query.keys():
+                    query['date'] = by_coordinates[1]
+                elif not url.path.endswith('/timingsByCity'):
+                    query = {}
+                if 'date' not in query:
+                    status, body = 404, {'code': 404, 'status': 'Not Found'}
+                elif fake.rng.random() < fake.error_rate:
+                    status, body = 500, {'code': 500, 'status': 'Internal Server Error'}
+                else:
+                    status, body = 200, fake.timings(query)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeProvider(CombinedProvider):
+    """SMS, calls and WhatsApp that only sleep, failing at error_rate"""
+
+    def _validate_config(self) -> bool:
+        self.latency_ms = self.config.get('latency_ms', 0)
+        self.error_rate = self.config.get('error_rate', 0.0)
+        self.rng = random.Random(self.config.get('seed', 1))
+        self.sent = Counter()
+        return True
+
+    def get_supported_countries(self) -> list:
+        return []
+
+    def get_cost_per_message(self, country_code: str) -> float:
+        return 0.0
+
+    async def _send(self, channel: str) -> CommunicationResult:
+        _sleep_ms(self.latency_ms, self.rng)
+        self.sent[channel] += 1
+        if self.rng.random() < self.error_rate:
+            return CommunicationResult(success=False, error_message='Simulated provider error', provider_name=self.name)
+        return CommunicationResult(success=True, message_id=uuid4().hex, provider_name=self.name, cost=0.0)
+
+    async def send_sms(self, to_number, message, country_code=None):
+        return await self._send('sms')
+
+    async def make_call(self, to_number, audio_url, country_code=None):
+        return await self._send('call')
+
+    async def make_text_call(self, to_number, text_message, country_code=None):
+        return await self._send('text_call')
+
+    async def send_whatsapp(self, to_number, message, country_code=None):
+        return await self._send('whatsapp')
+
+
+class FakeEmailBackend(BaseEmailBackend):
+    """Email backend that only sleeps; latency and error rate are set by the harness"""
+    latency_ms = 0
+    error_rate = 0.0
+    rng = random.Random(1)
+    sent = 0
+
+    def send_messages(self, email_messages):
+        _sleep_ms(self.latency_ms, self.rng)
+        if self.rng.random() < self.error_rate:
+            if self.fail_silently:
+                return 0
+            raise ConnectionError('Simulated email error')
+        FakeEmailBackend.sent += len(email_messages)
+        return len(email_messages)
+
+
+# Simulated Celery
+
+class SimulatedClock:
+    """Virtual time: fixed between tasks, advancing with real time (and fake latencies) while one runs"""
+
+    def __init__(self, start: datetime):
+        self.set(start)
+
+    def set(self, moment: datetime):
+        self.base = moment
+        self.real_base = time.perf_counter()
+        self.waited = 0.0
+
+    def advance(self, seconds: float):
+        self.waited += seconds
+
+    def now(self) -> datetime:
+        return self.base + timedelta(seconds=time.perf_counter() - self.real_base + self.waited)
+
+
+@dataclass(order=True)
+class Job:
+    ready: datetime
+    seq: int
+    task: object = field(compare=False)
+    args: tuple = field(compare=False, default=())
+    kwargs: dict = field(compare=False, default_factory=dict)
+    eta: Optional[datetime] = field(compare=False, default=None)
+    published: Optional[datetime] = field(compare=False, default=None)
+    queue: str = field(compare=False, default='celery')
+    id: str = field(compare=False, default_factory=lambda: uuid4().hex)
+
+
+@dataclass
+class TaskStats:
+    durations: List[float] = field(default_factory=list)
+    queries: List[int] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+
+
+@dataclass
+class LoadTestReport:
+    config: LoadTestConfig
+    users: int
+    wall_seconds: float = 0.0
+    tasks: Dict[str, TaskStats] = field(default_factory=lambda: defaultdict(TaskStats))
+    queue_waits: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    delivery_lags: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    delivery_failures: Counter = field(default_factory=Counter)
+    catch_up: Counter = field(default_factory=Counter)  # due before they were scheduled (first day of a user)
+    pending: int = 0  # still queued when the simulated day ended
+    aladhan_requests: int = 0
+    provider_sends: Counter = field(default_factory=Counter)
+    emails: int = 0
+    rss_start_kb: int = 0
+    rss_peak_kb: int = 0
+
+    @property
+    def executed(self) -> int:
+        return sum(len(stats.durations) for stats in self.tasks.values())
+
+    @property
+    def busy_seconds(self) -> float:
+        return sum(sum(stats.durations) for stats in self.tasks.values())
+
+
+def beat_times(schedule, start: datetime, end: datetime):
+    """
+    When beat runs an entry in [start, end): each matching minute of a
+    crontab, or every interval from start for an interval schedule (a number
+    of seconds, a timedelta or celery.schedules.schedule)
+    """
+    from celery.schedules import crontab, schedule as interval_schedule
+
+    if isinstance(schedule, crontab):
+        moment = start
+        while moment < end:
+            if (moment.minute in schedule.minute and moment.hour in schedule.hour
+                    and moment.isoweekday() % 7 in schedule.day_of_week
+                    and moment.day in schedule.day_of_month and moment.month in schedule.month_of_year):
+                yield moment
+            moment += timedelta(minutes=1)
+        return
+
+    if isinstance(schedule, interval_schedule):
+        schedule = schedule.run_every
+    interval = schedule if isinstance(schedule, timedelta) else timedelta(seconds=schedule)
+    moment = start
+    while moment < end:
+        yield moment
+        moment += interval
+
+
+class SimulatedCelery:
+    def __init__(self, clock: SimulatedClock, report: LoadTestReport):
+        from muadhin.celery import DEFAULT_QUEUE, QUEUE_WORKERS, app
+
+        self.app = app
+        self.clock = clock
+        self.report = report
+        self.default_queue = DEFAULT_QUEUE
+        self.jobs = []
+        self.seq = itertools.count()
+        self.slots = {}
+        for queue, settings in QUEUE_WORKERS.items():
+            self.slots[queue] = [datetime.min.replace(tzinfo=dt_timezone.utc)] * settings['concurrency']
+
+    def queue_for(self, name: str) -> str:
+        return self.app.amqp.router.route({}, name)['queue'].name
+
+    def publish(self, task, args=None, kwargs=None, countdown=None, eta=None, **options):
+        from kombu.utils.json import dumps, loads
+
+        now = self.clock.now()
+        if eta is not None:
+            eta = eta if eta.tzinfo else eta.replace(tzinfo=dt_timezone.utc)
+        elif countdown:
+            eta = now + timedelta(seconds=countdown)
+        # A worker can't get a message before it is published, even with an ETA in the past
+        ready = max(eta, now) if eta else now
+        # Round trip through the JSON serializer like a real broker would
+        args, kwargs = loads(dumps([list(args or ()), kwargs or {}]))
+        queue = options.get('queue') or self.queue_for(task.name)
+        heapq.heappush(self.jobs, Job(
+            ready=ready, seq=next(self.seq), task=task, args=tuple(args), kwargs=kwargs,
+            eta=eta, published=now, queue=queue,
+        ))
+        from celery.result import AsyncResult
+        return AsyncResult(uuid4().hex, app=self.app)
+
+    def schedule_beat(self, start: datetime, end: datetime, user_ids: List[int]):
+        """Publish every run of the PIPELINE_BEAT entries in [start, end), for user_ids only"""
+        for name in PIPELINE_BEAT:
+            entry = self.app.conf.beat_schedule[name]
+            task = self.app.tasks[entry['task']]
+            for moment in beat_times(entry['schedule'], start, end):
+                heapq.heappush(self.jobs, Job(
+                    ready=moment, seq=next(self.seq), task=task, kwargs={'user_ids': user_ids},
+                    published=moment, queue=self.queue_for(task.name),
+                ))
+
+    def execute(self, job: Job, started: datetime) -> float:
+        from celery._state import _task_stack
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        task = job.task
+        self.clock.set(started)
+        task.push_request(
+            id=job.id, args=job.args, kwargs=job.kwargs, eta=job.eta.isoformat() if job.eta else None,
+            delivery_info={'routing_key': job.queue}, is_eager=False,
+        )
+        _task_stack.push(task)
+        connection.queries_log.clear()  # bounded deque, indexes break once it is full
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                try:
+                    result = task.run(*job.args, **job.kwargs)
+                except Exception as e:
+                    result = {'status': 'exception', 'reason': repr(e)}
+                duration = (self.clock.now() - started).total_seconds()
+        finally:
+            _task_stack.pop()
+            task.pop_request()
+
+        status = result.get('status', 'ok') if isinstance(result, dict) else 'ok'
+        stats = self.report.tasks[task.name]
+        stats.durations.append(duration)
+        stats.queries.append(len(queries.captured_queries))
+        stats.statuses[status] += 1
+
+        kind = DELIVERY_TASKS.get(task.name)
+        if kind and job.eta:
+            if job.eta < job.published:
+                self.report.catch_up[kind] += 1
+            elif status == 'success':
+                dispatched = started + timedelta(seconds=duration)
+                self.report.delivery_lags[kind].append((dispatched - job.eta).total_seconds())
+            elif status != 'skipped':
+                self.report.delivery_failures[kind] += 1
+        return duration
+
+    def run(self, end: datetime):
+        while self.jobs and self.jobs[0].ready < end:
+            job = heapq.heappop(self.jobs)
+            slots = self.slots.setdefault(job.queue, [datetime.min.replace(tzinfo=dt_timezone.utc)])
+            free_at = heapq.heappop(slots)
+            started = max(job.ready, free_at)
+            self.report.queue_waits[job.queue].append((started - job.ready).total_seconds())
+            duration = self.execute(job, started)
+            heapq.heappush(slots, started + timedelta(seconds=duration))
+        self.report.pending = len(self.jobs)
+
+
+# Seeding
+
+def seed_users(count: int, rng: random.Random) -> List[int]:
+    from django.contrib.auth import get_user_model
+    from subscriptions.models import SubscriptionPlan, UserSubscription
+    from users.models import PrayerMethod, UserPreferences
+
+    User = get_user_model()
+    cleanup()
+
+    plan = SubscriptionPlan.objects.create(
+        name='Load test (all channels)', plan_type='premium', country='LOADTEST', billing_cycle='lifetime',
+        price=0, is_active=False,
+        daily_prayer_summary_email=True, daily_prayer_summary_sms=True, daily_prayer_summary_whatsapp=True,
+        pre_adhan_email=True, pre_adhan_sms=True, pre_adhan_whatsapp=True,
+        adhan_call_text=True, adhan_call_audio=True, max_notifications_per_day=1000,
+    )
+
+    locations = [location for location in LOCATIONS for _ in range(location[3])]
+    users = []
+    for i in range(count):
+        tz_name, city, country, _ = rng.choice(locations)
+        users.append(User(
+            username=f"{PREFIX}{i}", email=f"{PREFIX}{i}@example.com", password='!',
+            timezone=tz_name, city=city, country=country,
+            phone_number=f"+2348{i:09d}", whatsapp_number=f"+2348{i:09d}",
+        ))
+    users = User.objects.bulk_create(users, batch_size=1000)
+    if users[0].pk is None:  # backends that don't return ids from bulk inserts
+        users = list(User.objects.filter(username__startswith=PREFIX))
+
+    UserPreferences.objects.bulk_create([
+        UserPreferences(
+            user=user,
+            daily_prayer_summary_message_method='email',
+            notification_before_prayer=rng.choice(['email', 'sms', 'whatsapp']),
+            adhan_call_method='call',
+        )
+        for user in users
+    ], batch_size=1000)
+    PrayerMethod.objects.bulk_create(
+        [PrayerMethod(user=user, sn=1, name='Muslim World League') for user in users], batch_size=1000
+    )
+    UserSubscription.objects.bulk_create(
+        [UserSubscription(user=user, plan=plan, status='active', end_date=None) for user in users], batch_size=1000
+    )
+    return [user.pk for user in users]
+
+
+def require_synthetic_database():
+    """Refuse to run against a database with real users, the tasks would write to their rows"""
+    from django.contrib.auth import get_user_model
+    from django.core.exceptions import ImproperlyConfigured
+
+    real = get_user_model().objects.exclude(username__startswith=PREFIX).count()
+    if real:
+        raise ImproperlyConfigured(
+            f"The database has {real} users that are not load test users, "
+            f"run the load test against an empty database"
+        )
+
+
+def cleanup():
+    from django.contrib.auth import get_user_model
+    from subscriptions.models import SubscriptionPlan
+
+    get_user_model().objects.filter(username__startswith=PREFIX).delete()
+    SubscriptionPlan.objects.filter(country='LOADTEST').delete()
+
+
+# Run
+
+def run_load_test(config: LoadTestConfig) -> LoadTestReport:
+    global _clock
+    from django.test.utils import override_settings
+
+    from communications.services.provider_registry import ProviderRegistry
+    from communications.utils.country_codes import get_country_code
+
+    from celery.app.task import Task
+    from muadhin.celery import app
+
+    require_synthetic_database()
+
+    # Register every app's tasks (autodiscovery), as a worker does at startup
+    app.loader.import_default_modules()
+
+    rng = random.Random(config.seed)
+    day = config.day or datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    end = day + timedelta(hours=config.hours)
+
+    report = LoadTestReport(config=config, users=config.users)
+    report.rss_start_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    clock = _clock = SimulatedClock(day)
+    celery = SimulatedCelery(clock, report)
+    provider = FakeProvider({'latency_ms': config.provider_latency_ms, 'error_rate': config.provider_error_rate,
+                             'seed': config.seed})
+    FakeEmailBackend.latency_ms = config.email_latency_ms
+    FakeEmailBackend.error_rate = config.email_error_rate
+    FakeEmailBackend.rng = random.Random(config.seed)
+    FakeEmailBackend.sent = 0
+
+    registry_state = (ProviderRegistry._providers, ProviderRegistry._country_preferences, ProviderRegistry._initialized)
+    countries = {get_country_code(country) for _, _, country, _ in LOCATIONS}
+    ProviderRegistry._providers = {PROVIDER_NAME: provider}
+    ProviderRegistry._country_preferences = {code.upper(): [PROVIDER_NAME] for code in countries if code}
+    ProviderRegistry._initialized = True
+
+    def apply_async(task, args=None, kwargs=None, countdown=None, eta=None, **options):
+        return celery.publish(task, args, kwargs, countdown=countdown, eta=eta, **options)
+
+    try:
+        with FakeAladhanServer(config.aladhan_latency_ms, config.aladhan_error_rate, config.seed) as aladhan, \
+                override_settings(
+                    ALADHAN_API_URL=aladhan.url,
+                    EMAIL_BACKEND='muadhin.loadtest.FakeEmailBackend',
+                    MAILGUN_API_KEY=None,
+                    DAILY_SUMMARY_EMAIL_BATCHING=False,
+                ), \
+                mock.patch('django.utils.timezone.now', clock.now), \
+                mock.patch.object(Task, 'apply_async', apply_async):
+            user_ids = seed_users(config.users, rng)
+            celery.schedule_beat(day, end, user_ids)
+            started = time.perf_counter()
+            celery.run(end)
+            report.wall_seconds = time.perf_counter() - started
+            report.aladhan_requests = aladhan.requests
+    finally:
+        ProviderRegistry._providers, ProviderRegistry._country_preferences, ProviderRegistry._initialized = registry_state
+        _clock = None
+        if not config.keep:
+            cleanup()
+
+    report.provider_sends = Counter(provider.sent)
+    report.emails = FakeEmailBackend.sent
+    report.rss_peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return report
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    from communications.services.delivery_report import percentile
+
+    ordered = sorted(values)
+    return {
+        'p50': percentile(ordered, 0.50),
+        'p95': percentile(ordered, 0.95),
+        'p99': percentile(ordered, 0.99),
+        'max': ordered[-1] if ordered else 0.0,
+    }
+
+
+def mean(values) -> float:
+    return statistics.fmean(values) if values else 0.0
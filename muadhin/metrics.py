@@ -0,0 +1,211 @@
+"""
+Prometheus metrics for the notification pipeline.
+
+    muadhin_delivery_lag_seconds           sent time - scheduled prayer/reminder time, per channel
+    muadhin_provider_request_seconds       provider API calls, per provider, channel, country and outcome
+    muadhin_aladhan_fetch_seconds          Aladhan timings requests
+    muadhin_aladhan_fetch_errors_total     failed Aladhan requests, per reason
+    muadhin_scheduling_pass_seconds        scheduler task runs, per task
+    muadhin_cache_requests_total           cache reads per result (local_hit, redis_hit, miss);
+                                           hit ratio = sum of *_hit / total
+    muadhin_celery_task_lag_seconds        task start - max(publish, ETA), per queue
+    muadhin_request_seconds                web request latency, per view, method and status class
+    muadhin_request_queries                SQL queries per web request, per view
+
+Web processes serve them at /metrics (metrics_view). Celery workers serve
+them on WORKER_METRICS_PORT from the main worker process.
+
+gunicorn and prefork Celery run several processes, and each one only counts
+what it handled. Set PROMETHEUS_MULTIPROC_DIR (an empty directory per
+service, docker-entrypoint.sh does) before the processes start. Every
+process then writes its samples there and the exporters aggregate the files.
+Without it the default in-process registry is used, which is fine for
+runserver and solo/threads workers.
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest,
+)
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_LAG = Histogram(
+    'muadhin_delivery_lag_seconds',
+    'Seconds between the scheduled prayer or reminder time and the send',
+    ['channel'],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800),
+)
+
+PROVIDER_REQUEST = Histogram(
+    'muadhin_provider_request_seconds',
+    'Latency of provider API calls',
+    ['provider', 'channel', 'country', 'outcome'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30),
+)
+
+ALADHAN_FETCH = Histogram(
+    'muadhin_aladhan_fetch_seconds',
+    'Latency of Aladhan prayer timings requests',
+    ['source'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30),
+)
+
+ALADHAN_FETCH_ERRORS = Counter(
+    'muadhin_aladhan_fetch_errors_total',
+    'Failed Aladhan prayer timings requests',
+    ['source', 'reason'],
+)
+
+SCHEDULING_PASS = Histogram(
+    'muadhin_scheduling_pass_seconds',
+    'Duration of scheduler task runs',
+    ['task'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+CACHE_REQUESTS = Counter(
+    'muadhin_cache_requests_total',
+    'Cache reads by result',
+    ['result'],
+)
+
+CELERY_TASK_LAG = Histogram(
+    'muadhin_celery_task_lag_seconds',
+    'Seconds between when a task could start (publish time or ETA) and when it started',
+    ['queue'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+REQUEST_LATENCY = Histogram(
+    'muadhin_request_seconds',
+    'Web request latency (RequestPerformanceMiddleware)',
+    ['view', 'method', 'status'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+REQUEST_QUERIES = Histogram(
+    'muadhin_request_queries',
+    'SQL queries per web request',
+    ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+)
+
+
+def observe_delivery_lag(channel: str, scheduled_at: Optional[datetime], sent_at: Optional[datetime] = None):
+    if scheduled_at is None:
+        return
+    sent_at = sent_at or datetime.now(dt_timezone.utc)
+    DELIVERY_LAG.labels(channel).observe(max(0.0, (sent_at - scheduled_at).total_seconds()))
+
+
+def current_task_eta() -> Optional[datetime]:
+    """ETA of the Celery task being run, the time a scheduled notification was due"""
+    from celery import current_task
+
+    eta = getattr(getattr(current_task, 'request', None), 'eta', None)
+    if not eta:
+        return None
+    return eta if isinstance(eta, datetime) else datetime.fromisoformat(eta)
+
+
+@contextmanager
+def time_provider_request(provider: str, channel: str, country: Optional[str]):
+    """Time a provider call; set `outcome['success']` from its result"""
+    outcome = {'success': False}
+    started = time.perf_counter()
+    try:
+        yield outcome
+    finally:
+        PROVIDER_REQUEST.labels(
+            provider, channel, (country or 'unknown').upper(), 'success' if outcome['success'] else 'failure'
+        ).observe(time.perf_counter() - started)
+
+
+class _AladhanFetch:
+    def __init__(self):
+        self.status_code = None
+
+    def record(self, response):
+        self.status_code = response.status_code
+        return response
+
+
+@contextmanager
+def aladhan_fetch(source: str):
+    """
+    Time an Aladhan request and count its failures:
+
+        with aladhan_fetch('task') as fetch:
+            response = fetch.record(requests.get(api_url, params=params, timeout=30))
+    """
+    fetch = _AladhanFetch()
+    started = time.perf_counter()
+    try:
+        yield fetch
+    except Exception as e:
+        ALADHAN_FETCH_ERRORS.labels(source, type(e).__name__).inc()
+        raise
+    finally:
+        ALADHAN_FETCH.labels(source).observe(time.perf_counter() - started)
+    if fetch.status_code is not None and fetch.status_code != 200:
+        ALADHAN_FETCH_ERRORS.labels(source, f'http_{fetch.status_code}').inc()
+
+
+def scheduling_pass(task: str):
+    """Decorator timing a scheduler task"""
+    return SCHEDULING_PASS.labels(task).time()
+
+
+# Exposition
+
+def _multiprocess_dir() -> Optional[str]:
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir')
+
+
+def collector_registry():
+    """The registry to expose: one aggregating every process's files in multiprocess mode"""
+    if not _multiprocess_dir():
+        return REGISTRY
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    """/metrics, for "Authorization: Bearer <METRICS_AUTH_TOKEN>"; without a token only under DEBUG"""
+    import hmac
+    from django.conf import settings
+    from django.http import HttpResponse, HttpResponseForbidden
+
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', '')
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(collector_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def start_worker_exporter(port: int):
+    from prometheus_client import start_http_server
+
+    if not _multiprocess_dir():
+        logger.warning("⚠️ PROMETHEUS_MULTIPROC_DIR is not set, prefork worker metrics won't be collected")
+    start_http_server(port, registry=collector_registry())
+    logger.info(f"✅ Celery metrics served on :{port}/metrics")
+
+
+def mark_process_dead(pid: int):
+    if _multiprocess_dir():
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,396 @@
+"""
+Monthly range partitions and retention for the log tables.
+
+On PostgreSQL, CommunicationLog and NotificationUsage can be partitioned by
+month on their timestamp. This is opt-in: `manage.py partition_logs --convert`
+rebuilds both tables through partition_table() (it locks and rewrites them,
+run it in a maintenance window) and `--revert` turns them back into plain
+tables. Each month is its own table named <table>_pYYYYMM, with its own copies
+of the indexes. Django still sees `id` as the primary key; in the database it
+is (id, <timestamp>), which partitioning requires.
+
+There is no default partition, DETACH PARTITION CONCURRENTLY refuses to run
+with one, so rows can only land in months that have a partition. Both
+timestamps are set on insert, and ensure_partitions() keeps the coming
+LOG_PARTITIONS_AHEAD months created (Beat runs
+communications.tasks.maintain_log_partitions daily, or run
+`manage.py partition_logs`).
+
+apply_retention() removes months older than LOG_RETENTION_MONTHS. A
+partitioned month is written to LOG_ARCHIVE_DIR/<table>/YYYY-MM.csv.gz first
+when LOG_RETENTION_ACTION is 'archive', then detached concurrently, which
+only briefly locks the parent, and dropped. Nothing is deleted row by row and
+the indexes only ever cover the retained months. Plain tables (not converted,
+or sqlite in development) archive and delete old months with plain queries.
+
+Archiving deletes the rows it wrote out, so it refuses to run unless
+LOG_ARCHIVE_DIR is on persistent storage, see archive_dir_is_persistent().
+"""
+
+import csv
+import gzip
+import logging
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection as default_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# table -> partition key
+PARTITIONED_TABLES = {
+    'communications_communicationlog': 'created_at',
+    'subscriptions_notificationusage': 'date_sent',
+}
+MONTH_PARTITION = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def month_start(value: datetime) -> datetime:
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f'{table}_p{month:%Y%m}'
+
+
+@dataclass
+class RetentionAction:
+    table: str
+    month: datetime
+    rows: Optional[int] = None
+    archive_path: Optional[str] = None
+
+    def __str__(self):
+        target = f" -> {self.archive_path}" if self.archive_path else ''
+        rows = '' if self.rows is None else f" ({self.rows} rows)"
+        return f"{self.table} {self.month:%Y-%m}{rows}{target}"
+
+
+# Converting tables
+
+def _is_partitioned(cursor, table: str) -> bool:
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))", [table]
+    )
+    return cursor.fetchone()[0]
+
+
+def is_partitioned(table: str, connection=None) -> bool:
+    connection = connection or default_connection
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        return _is_partitioned(cursor, table)
+
+
+def partition_table(table: str, connection=None) -> bool:
+    """Rebuild a table as monthly range partitions, keeping rows, indexes and foreign keys"""
+    return _convert(table, connection, partitioned=True)
+
+
+def unpartition_table(table: str, connection=None) -> bool:
+    """Reverse of partition_table()"""
+    return _convert(table, connection, partitioned=False)
+
+
+def _convert(table: str, connection, partitioned: bool) -> bool:
+    connection = connection or default_connection
+    if connection.vendor != 'postgresql':
+        return False
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if _is_partitioned(cursor, table) == partitioned:
+            return False
+        _rebuild_table(connection.ops.quote_name, cursor, table, PARTITIONED_TABLES[table], partitioned)
+    return True
+
+
+def _rebuild_table(qn, cursor, table: str, column: str, partitioned: bool):
+    old = f'{table}_old'
+
+    # Secondary indexes and foreign keys are recreated under the same names
+    cursor.execute(
+        """
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s AND indexname NOT IN (
+            SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u')
+        )
+        """,
+        [table, table],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+    cursor.execute("SELECT attidentity FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'id'", [table])
+    identity = cursor.fetchone()[0] != ''
+
+    cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(old)}')
+    cursor.execute(
+        f'CREATE TABLE {qn(table)} (LIKE {qn(old)} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS '
+        f'INCLUDING STORAGE)'
+        + (f' PARTITION BY RANGE ({qn(column)})' if partitioned else '')
+    )
+    if partitioned:
+        cursor.execute(f'SELECT MIN({qn(column)}) FROM {qn(old)}')
+        first = cursor.fetchone()[0] or datetime.now(dt_timezone.utc)
+        month = month_start(first)
+        last = add_months(month_start(datetime.now(dt_timezone.utc)), settings.LOG_PARTITIONS_AHEAD)
+        while month <= last:
+            _create_partition(cursor, qn, table, month)
+            month = add_months(month, 1)
+
+    cursor.execute(f'INSERT INTO {qn(table)} SELECT * FROM {qn(old)}')
+
+    if identity:
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {qn(table)}",
+            [table],
+        )
+    elif sequence:
+        # serial column: the copied default still uses the old table's sequence
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id')
+
+    cursor.execute(f'DROP TABLE {qn(old)}')
+    primary_key = f'id, {qn(column)}' if partitioned else 'id'
+    cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + "_pkey")} PRIMARY KEY ({primary_key})')
+    for _, definition in indexes:
+        definition = re.sub(r' ON (ONLY )?\S+ USING ', f' ON {qn(table)} USING ', definition, count=1)
+        cursor.execute(definition)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+
+
+def _create_partition(cursor, qn, table: str, month: datetime) -> bool:
+    """Create a month's partition, it gets the parent's indexes"""
+    name = partition_name(table, month)
+    cursor.execute('SELECT to_regclass(%s)', [name])
+    if cursor.fetchone()[0] is not None:
+        return False
+    cursor.execute(
+        f'CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)',
+        [month.isoformat(), add_months(month, 1).isoformat()],
+    )
+    return True
+
+
+# Maintenance
+
+def ensure_partitions(months_ahead: Optional[int] = None, now: Optional[datetime] = None,
+                      connection=None) -> List[str]:
+    """Create this month's and the next months_ahead months' partitions, return the new ones"""
+    connection = connection or default_connection
+    if connection.vendor != 'postgresql':
+        return []
+    months_ahead = settings.LOG_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    qn = connection.ops.quote_name
+    current = month_start(now or datetime.now(dt_timezone.utc))
+    created = []
+    for table in PARTITIONED_TABLES:
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                if not _is_partitioned(cursor, table):
+                    break
+                if _create_partition(cursor, qn, table, month):
+                    created.append(partition_name(table, month))
+    return created
+
+
+def partition_months(table: str, connection=None) -> List[datetime]:
+    """Months that have a partition, oldest first"""
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)",
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = []
+    for name in names:
+        match = MONTH_PARTITION.search(name)
+        if match:
+            months.append(datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc))
+    return sorted(months)
+
+
+def retention_months(table: str) -> Optional[int]:
+    return settings.LOG_RETENTION_MONTHS.get(table)
+
+
+def apply_retention(now: Optional[datetime] = None, dry_run: bool = False, connection=None) -> List[RetentionAction]:
+    """
+    Archive (or just drop) each table's months older than its retention.
+    Raises ImproperlyConfigured instead of archiving when LOG_ARCHIVE_DIR is
+    not on persistent storage.
+    """
+    connection = connection or default_connection
+    archive = settings.LOG_RETENTION_ACTION == 'archive'
+    current = month_start(now or datetime.now(dt_timezone.utc))
+    actions = []
+    for table, column in PARTITIONED_TABLES.items():
+        keep = retention_months(table)
+        if not keep:
+            continue
+        cutoff = add_months(current, -keep)
+        if is_partitioned(table, connection):
+            months = [month for month in partition_months(table, connection) if month < cutoff]
+            expire = _expire_partition
+        else:
+            months = [month for month in _row_months(table, column, connection) if month < cutoff]
+            expire = _expire_rows
+        for month in months:
+            action = RetentionAction(table, month)
+            if not dry_run:
+                if archive:
+                    require_persistent_archive()
+                expire(connection, table, column, month, action, archive)
+            actions.append(action)
+    return actions
+
+
+def _expire_partition(connection, table, column, month, action, archive):
+    """
+    Copy the partition out, detach it concurrently and drop it. Detaching
+    concurrently can't run in a transaction, and a detach interrupted half
+    way is left pending for the next run to finish.
+    """
+    qn = connection.ops.quote_name
+    name = partition_name(table, month)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = to_regclass(%s)", [name]
+        )
+        pending = cursor.fetchone()[0]
+        if archive:
+            # An interrupted run already wrote this month, overwrite its file
+            previous = archive_files(table, month) if pending else []
+            action.archive_path = previous[-1] if previous else archive_path(table, month)
+            action.rows = _copy_partition(connection, name, action.archive_path)
+        cursor.execute(
+            f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)} {"FINALIZE" if pending else "CONCURRENTLY"}'
+        )
+        if archive:
+            cursor.execute(f'SELECT COUNT(*) FROM {qn(name)}')
+            if cursor.fetchone()[0] != action.rows:
+                # Written to while it was being copied, the detached table is final
+                action.rows = _copy_partition(connection, name, action.archive_path)
+        cursor.execute(f'DROP TABLE {qn(name)}')
+    logger.info(f"🗄️ Expired partition {name} ({action})")
+
+
+def _copy_partition(connection, name: str, path: str) -> int:
+    """COPY a partition to an archive in one snapshot, return its row count"""
+    qn = connection.ops.quote_name
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        cursor.execute(f'SELECT COUNT(*) FROM {qn(name)}')
+        rows = cursor.fetchone()[0]
+        _copy_to_archive(cursor, f'SELECT * FROM {qn(name)}', path)
+    return rows
+
+
+def _copy_to_archive(cursor, query: str, path: str):
+    """COPY a query's rows into a gzipped CSV file with a header"""
+    with gzip.open(f'{path}.tmp', 'wb') as f:
+        cursor.copy_expert(f'COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)', f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _model_for(table: str):
+    from django.apps import apps
+
+    return next(model for model in apps.get_models() if model._meta.db_table == table)
+
+
+def _row_months(table, column, connection) -> List[datetime]:
+    from django.db.models.functions import TruncMonth
+
+    model = _model_for(table)
+    field = model._meta.get_field(column).name
+    return sorted({
+        month_start(month) for month in model.objects.using(connection.alias)
+        .annotate(month=TruncMonth(field, tzinfo=dt_timezone.utc)).values_list('month', flat=True).distinct()
+        if month is not None
+    })
+
+
+def _expire_rows(connection, table, column, month, action, archive):
+    model = _model_for(table)
+    field = model._meta.get_field(column).name
+    rows = model.objects.using(connection.alias).filter(**{
+        f'{field}__gte': month, f'{field}__lt': add_months(month, 1),
+    })
+    fields = model._meta.concrete_fields
+    with transaction.atomic(using=connection.alias):
+        if archive:
+            action.archive_path = archive_path(table, month)
+            values = rows.order_by('pk').values_list(*[f.attname for f in fields]).iterator()
+            write_csv_archive(action.archive_path, [f.column for f in fields], values)
+        action.rows, _ = rows.delete()
+
+
+def archive_path(table: str, month: datetime) -> str:
+    """LOG_ARCHIVE_DIR/<table>/YYYY-MM.csv.gz, numbered if that month was archived before"""
+    directory = os.path.join(settings.LOG_ARCHIVE_DIR, table)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{month:%Y-%m}.csv.gz')
+    n = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f'{month:%Y-%m}.{n}.csv.gz')
+        n += 1
+    return path
+
+
+def archive_dir_is_persistent() -> bool:
+    """
+    Whether LOG_ARCHIVE_DIR outlives the container: a mounted volume, or a
+    directory declared persistent with LOG_ARCHIVE_PERSISTENT
+    """
+    return settings.LOG_ARCHIVE_PERSISTENT or os.path.ismount(settings.LOG_ARCHIVE_DIR)
+
+
+def require_persistent_archive():
+    if not archive_dir_is_persistent():
+        raise ImproperlyConfigured(
+            f"LOG_ARCHIVE_DIR {settings.LOG_ARCHIVE_DIR} is not on persistent storage, refusing to archive "
+            "and delete rows. Mount a volume there or set LOG_ARCHIVE_PERSISTENT=true."
+        )
+
+
+def archive_files(table: str, month: datetime) -> List[str]:
+    """Existing archives of a month, in the order archive_path() numbered them"""
+    directory = os.path.join(settings.LOG_ARCHIVE_DIR, table)
+    paths = []
+    path = os.path.join(directory, f'{month:%Y-%m}.csv.gz')
+    while os.path.exists(path):
+        paths.append(path)
+        path = os.path.join(directory, f'{month:%Y-%m}.{len(paths)}.csv.gz')
+    return paths
+
+
+def write_csv_archive(path: str, columns: List[str], rows: Iterable) -> int:
+    """Write rows to a gzipped CSV file with a header, return the row count"""
+    count = 0
+    with gzip.open(f'{path}.tmp', 'wt', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    os.replace(f'{path}.tmp', path)
+    return count
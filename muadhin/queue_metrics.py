@@ -0,0 +1,257 @@
+"""
+Per-queue task latency for the Celery queues (see muadhin/celery.py).
+
+Every message is stamped with its publish time; when a worker starts the task
+the lag (start - max(published, eta)) is recorded in a histogram for its
+queue. For an adhan call with an ETA that is how late the call went out.
+
+Histograms are kept per process and in Redis, one hash per queue per minute
+(celery:lag:<queue>:<minute>, kept for a day), so lag_summary() can report
+over all workers. Recording never fails or delays a task: task_prerun only
+updates the process-local histogram and queues the observation, and a
+background thread writes queued observations to Redis in batches. Without
+Redis only the process-local histogram is updated.
+"""
+
+import logging
+import os
+import queue as queue_module
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from celery.signals import before_task_publish, task_prerun
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in ms, the last bucket is everything above
+LAG_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000)
+METRICS_TTL = 60 * 60 * 24
+KEY = 'celery:lag:{queue}:{minute}'
+# Observations waiting for the Redis writer; more are dropped (the local histogram still has them)
+MAX_PENDING = 10000
+WRITE_BATCH_SIZE = 500
+
+
+@dataclass
+class LagHistogram:
+    count: int = 0
+    sum_ms: int = 0
+    max_ms: int = 0
+    buckets: List[int] = field(default_factory=lambda: [0] * (len(LAG_BUCKETS_MS) + 1))
+
+    def observe(self, lag_ms: int):
+        self.count += 1
+        self.sum_ms += lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+        self.buckets[bucket_index(lag_ms)] += 1
+
+    def merge(self, other: 'LagHistogram'):
+        self.count += other.count
+        self.sum_ms += other.sum_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    @property
+    def mean_ms(self) -> float:
+        return self.sum_ms / self.count if self.count else 0.0
+
+    def percentile_ms(self, q: float) -> int:
+        """Upper bound of the bucket holding the q-th percentile (max_ms for the last one)"""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(LAG_BUCKETS_MS[i], self.max_ms) if i < len(LAG_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def as_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'mean_ms': round(self.mean_ms, 1),
+            'p50_ms': self.percentile_ms(0.5),
+            'p95_ms': self.percentile_ms(0.95),
+            'p99_ms': self.percentile_ms(0.99),
+            'max_ms': self.max_ms,
+        }
+
+
+def bucket_index(lag_ms: int) -> int:
+    for i, bound in enumerate(LAG_BUCKETS_MS):
+        if lag_ms <= bound:
+            return i
+    return len(LAG_BUCKETS_MS)
+
+
+_local: Dict[str, LagHistogram] = {}
+_local_lock = threading.Lock()
+
+
+def local_histograms() -> Dict[str, LagHistogram]:
+    """This process's histograms since start (or reset_local())"""
+    with _local_lock:
+        return {queue: LagHistogram(h.count, h.sum_ms, h.max_ms, list(h.buckets)) for queue, h in _local.items()}
+
+
+def reset_local():
+    with _local_lock:
+        _local.clear()
+
+
+def record_lag(queue: str, lag_seconds: float, now: Optional[float] = None):
+    """Observe a lag locally and queue it for the Redis writer thread"""
+    lag_ms = max(0, int(lag_seconds * 1000))
+    with _local_lock:
+        _local.setdefault(queue, LagHistogram()).observe(lag_ms)
+
+    from muadhin.metrics import CELERY_TASK_LAG
+    CELERY_TASK_LAG.labels(queue).observe(lag_ms / 1000)
+
+    try:
+        _pending_queue().put_nowait((queue, lag_ms, int((now or time.time()) // 60)))
+    except queue_module.Full:
+        pass
+
+
+_pending = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def _pending_queue() -> queue_module.Queue:
+    """This process's pending observations, starting its writer thread on first use (and after a fork)"""
+    global _pending, _writer_pid
+    if _writer_pid != os.getpid():
+        with _writer_lock:
+            if _writer_pid != os.getpid():
+                _pending = queue_module.Queue(MAX_PENDING)
+                threading.Thread(target=_write_forever, args=(_pending,), name='queue-lag-writer', daemon=True).start()
+                _writer_pid = os.getpid()
+    return _pending
+
+
+def _take_batch(pending: queue_module.Queue, block: bool) -> List:
+    batch = []
+    try:
+        batch.append(pending.get(block=block))
+        while len(batch) < WRITE_BATCH_SIZE:
+            batch.append(pending.get_nowait())
+    except queue_module.Empty:
+        pass
+    return batch
+
+
+def _write_forever(pending: queue_module.Queue):
+    while True:
+        batch = _take_batch(pending, block=True)
+        try:
+            _write(batch)
+        except Exception as e:
+            logger.debug(f"Could not write task lag: {e}")
+        finally:
+            for _ in batch:
+                pending.task_done()
+
+
+def flush():
+    """Wait until the writer thread has written this process's pending observations"""
+    if _writer_pid == os.getpid():
+        _pending.join()
+
+
+def _write(batch: List):
+    from muadhin.cache import mark_redis_unavailable, redis_client
+    from redis.exceptions import RedisError
+
+    client = redis_client()
+    if client is None or not batch:
+        return
+    max_ms = {}
+    try:
+        pipe = client.pipeline(transaction=False)
+        for queue, lag_ms, minute in batch:
+            key = KEY.format(queue=queue, minute=minute)
+            pipe.hincrby(key, 'count', 1)
+            pipe.hincrby(key, 'sum_ms', lag_ms)
+            pipe.hincrby(key, f'b{bucket_index(lag_ms)}', 1)
+            max_ms[key] = max(max_ms.get(key, 0), lag_ms)
+        keys = list(max_ms)
+        for key in keys:
+            pipe.expire(key, METRICS_TTL)
+            pipe.hget(key, 'max_ms')
+        results = pipe.execute()
+        # HINCRBY has no max, good enough for a per-minute max under contention
+        stored = results[3 * len(batch):][1::2]
+        pipe = client.pipeline(transaction=False)
+        for key, current in zip(keys, stored):
+            if max_ms[key] > int(current or 0):
+                pipe.hset(key, 'max_ms', max_ms[key])
+        pipe.execute()
+    except RedisError as e:
+        mark_redis_unavailable(e)
+
+
+def lag_summary(queue: str, minutes: int = 5, now: Optional[float] = None) -> LagHistogram:
+    """Lag histogram of a queue over the last minutes, across workers (this process only without Redis)"""
+    from muadhin.cache import mark_redis_unavailable, redis_client
+    from redis.exceptions import RedisError
+
+    client = redis_client()
+    if client is None:
+        return local_histograms().get(queue, LagHistogram())
+
+    current = int((now or time.time()) // 60)
+    total = LagHistogram()
+    try:
+        pipe = client.pipeline(transaction=False)
+        for minute in range(current - minutes + 1, current + 1):
+            pipe.hgetall(KEY.format(queue=queue, minute=minute))
+        for values in pipe.execute():
+            values = {k.decode(): int(v) for k, v in values.items()}
+            total.merge(LagHistogram(
+                count=values.get('count', 0),
+                sum_ms=values.get('sum_ms', 0),
+                max_ms=values.get('max_ms', 0),
+                buckets=[values.get(f'b{i}', 0) for i in range(len(LAG_BUCKETS_MS) + 1)],
+            ))
+    except RedisError as e:
+        mark_redis_unavailable(e)
+        return local_histograms().get(queue, LagHistogram())
+    return total
+
+
+def task_lag_seconds(request, now: Optional[float] = None) -> Optional[float]:
+    """Seconds between when a task could have started and now, None without a publish stamp"""
+    published = getattr(request, 'published_at', None)
+    if published is None:
+        return None
+    ready = float(published)
+    if request.eta:
+        eta = request.eta if isinstance(request.eta, datetime) else datetime.fromisoformat(request.eta)
+        ready = max(ready, eta.timestamp())
+    return (now or time.time()) - ready
+
+
+def task_queue(request) -> str:
+    return (request.delivery_info or {}).get('routing_key') or 'celery'
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault('published_at', time.time())
+
+
+@task_prerun.connect
+def record_task_lag(task=None, **kwargs):
+    try:
+        lag = task_lag_seconds(task.request)
+        if lag is not None:
+            record_lag(task_queue(task.request), lag)
+    except Exception as e:
+        logger.debug(f"Could not record task lag: {e}")
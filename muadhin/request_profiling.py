@@ -0,0 +1,251 @@
+"""
+Per-view latency and query counts for the web tier, with slow-request profiles.
+
+RequestPerformanceMiddleware times every request and counts its SQL queries
+(using muadhin.task_profiler's measurement), exported as
+
+    muadhin_request_seconds     per view, method and status class
+    muadhin_request_queries     per view
+
+For a streaming response (the prayer calendar export, say) the measurement
+continues while the content is streamed and the request is recorded when
+the stream ends, since that is where its queries run.
+
+Requests slower than REQUEST_SLOW_MS are written to a ring buffer of JSON
+files in REQUEST_PROFILE_DIR (the newest REQUEST_PROFILE_MAX are kept, shared
+by all processes of a host). With REQUEST_PROFILE_SAMPLE_RATE set (off by
+default), that fraction of requests run under cProfile, so some slow entries
+also carry a stack profile, as a pstats summary and a .prof file for
+snakeviz and the like. Staff can browse them at /admin/request-profiles/.
+"""
+
+import cProfile
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import random
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.utils.functional import LazyObject, empty
+
+from muadhin.metrics import REQUEST_LATENCY, REQUEST_QUERIES
+from muadhin.task_profiler import profile
+
+logger = logging.getLogger(__name__)
+
+STATS_LINES = 40
+_sequence = itertools.count()
+
+
+def view_label(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or match._func_path
+
+
+def user_id(request) -> Optional[int]:
+    """The authenticated user's id, without a query for a user nobody looked at"""
+    user = request.__dict__.get('user')
+    if isinstance(user, LazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    return getattr(user, 'pk', None)
+
+
+class RequestPerformanceMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = getattr(settings, 'REQUEST_PROFILE_SAMPLE_RATE', 0)
+        profiler = cProfile.Profile() if sample_rate and random.random() < sample_rate else None
+
+        with profile() as p:
+            if profiler is not None:
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Another profiler is already active in this thread
+                    profiler = None
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+
+        # Files keep their sendfile path and async streams are left alone
+        if response.streaming and not response.is_async and getattr(response, 'file_to_stream', None) is None:
+            response.streaming_content = self.measure_stream(request, response, response.streaming_content, p, profiler)
+        else:
+            self.safe_record(request, response, p, profiler)
+        return response
+
+    def measure_stream(self, request, response, content, p, profiler):
+        """Stream content, adding its queries and time to the view's measurement, then record"""
+        try:
+            with profile() as streamed:
+                if profiler is not None:
+                    try:
+                        profiler.enable()
+                    except ValueError:
+                        profiler = None
+                try:
+                    yield from content
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            for name in ('queries', 'db_ms', 'http_calls', 'http_ms'):
+                setattr(p, name, getattr(p, name) + getattr(streamed, name))
+            p.sql.extend(streamed.sql)
+            p.stop()
+            self.safe_record(request, response, p, profiler)
+
+    def safe_record(self, request, response, p, profiler):
+        try:
+            self.record(request, response, p, profiler)
+        except Exception as e:
+            logger.debug(f"Could not record request performance: {e}")
+
+    def record(self, request, response, p, profiler):
+        view = view_label(request)
+        REQUEST_LATENCY.labels(view, request.method, f'{response.status_code // 100}xx').observe(p.wall_ms / 1000)
+        REQUEST_QUERIES.labels(view).observe(p.queries)
+
+        if p.wall_ms < getattr(settings, 'REQUEST_SLOW_MS', 500):
+            return
+        save_slow_request({
+            'path': request.path,
+            'method': request.method,
+            'view': view,
+            'status': response.status_code,
+            'user_id': user_id(request),
+            **p.as_dict(),
+        }, profiler)
+
+
+# Ring buffer
+
+def profile_dir() -> str:
+    return getattr(settings, 'REQUEST_PROFILE_DIR')
+
+
+def save_slow_request(entry: Dict, profiler: Optional[cProfile.Profile] = None) -> str:
+    """Write a slow request (and its profile) and drop the oldest entries over REQUEST_PROFILE_MAX"""
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    now = time.time()
+    entry_id = f"{int(now * 1000)}-{os.getpid()}-{next(_sequence)}"
+    entry = {'id': entry_id, 'timestamp': now, 'profiled': profiler is not None, **entry}
+
+    if profiler is not None:
+        profiler.dump_stats(os.path.join(directory, f'{entry_id}.prof'))
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(STATS_LINES)
+        entry['stats'] = out.getvalue()
+
+    path = os.path.join(directory, f'{entry_id}.json')
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(entry, f)
+    os.replace(f'{path}.tmp', path)
+    prune(directory, getattr(settings, 'REQUEST_PROFILE_MAX', 200))
+    return entry_id
+
+
+def _entry_ids(directory: str) -> List[str]:
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    # ids are <ms timestamp>-<pid>-<sequence>, oldest first
+    return sorted(
+        (name[:-len('.json')] for name in names if name.endswith('.json')),
+        key=lambda entry_id: tuple(int(part) for part in entry_id.split('-')),
+    )
+
+
+def prune(directory: str, keep: int):
+    ids = _entry_ids(directory)
+    for entry_id in ids[:max(0, len(ids) - keep)]:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, entry_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def load_slow_request(entry_id: str) -> Optional[Dict]:
+    if os.path.basename(entry_id) != entry_id:
+        return None
+    try:
+        with open(os.path.join(profile_dir(), f'{entry_id}.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def slow_requests(view: Optional[str] = None, limit: Optional[int] = 100) -> List[Dict]:
+    """Buffered slow requests, slowest first"""
+    entries = []
+    for entry_id in _entry_ids(profile_dir()):
+        entry = load_slow_request(entry_id)
+        if entry and (view is None or entry['view'] == view):
+            entries.append(entry)
+    return sorted(entries, key=lambda entry: -entry['wall_ms'])[:limit]
+
+
+def profile_path(entry_id: str) -> Optional[str]:
+    if os.path.basename(entry_id) != entry_id:
+        return None
+    path = os.path.join(profile_dir(), f'{entry_id}.prof')
+    return path if os.path.exists(path) else None
+
+
+# Admin pages, wrapped in admin.site.admin_view in muadhin/urls.py
+
+def slow_requests_view(request):
+    from django.contrib import admin
+    from django.template.response import TemplateResponse
+
+    view = request.GET.get('view') or None
+    entries = slow_requests(view=view)
+    for entry in entries:
+        entry['at'] = datetime.fromtimestamp(entry['timestamp'], dt_timezone.utc)
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Slow requests',
+        'entries': entries,
+        'view': view,
+        'views': sorted({entry['view'] for entry in slow_requests(limit=None)}),
+        'slow_ms': getattr(settings, 'REQUEST_SLOW_MS', 500),
+        'sample_rate': getattr(settings, 'REQUEST_PROFILE_SAMPLE_RATE', 0),
+    }
+    return TemplateResponse(request, 'admin/request_profiles/list.html', context)
+
+
+def slow_request_view(request, entry_id):
+    from django.contrib import admin
+    from django.http import FileResponse, Http404
+    from django.template.response import TemplateResponse
+
+    if request.GET.get('download'):
+        path = profile_path(entry_id)
+        if path is None:
+            raise Http404
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{entry_id}.prof')
+
+    entry = load_slow_request(entry_id)
+    if entry is None:
+        raise Http404
+    context = {
+        **admin.site.each_context(request),
+        'title': f"{entry['method']} {entry['path']}",
+        'entry': entry,
+    }
+    return TemplateResponse(request, 'admin/request_profiles/detail.html', context)
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from datetime import timedelta
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 from celery.schedules import crontab
 import dj_database_url
@@ -63,6 +64,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'muadhin.request_profiling.RequestPerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -124,6 +126,10 @@ else:
         }
     }
 
+# Test databases are built from the models: subscriptions' data migrations
+# import the current models and can't run on an empty database
+DATABASES['default']['TEST'] = {'MIGRATE': False}
+
 # Additional Django settings for memory optimization
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB max upload
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024   # 5MB max file upload
@@ -175,10 +181,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # Static files with WhiteNoise
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Redis with a small per-process LRU in front, see muadhin/cache.py
+REDIS_CACHE_URL = os.environ.get('REDIS_CACHE_URL', 'redis://localhost:6379/1')
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
-        'LOCATION': os.path.join(BASE_DIR, 'file_cache/'),  # Use os.path.join to create an absolute path to the desired cache directory path
+        'BACKEND': 'muadhin.cache.TieredRedisCache',
+        'LOCATION': REDIS_CACHE_URL,
+        'KEY_PREFIX': 'muadhin',
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', 1000)),
+            'LOCAL_TIMEOUT': int(os.environ.get('CACHE_LOCAL_TIMEOUT', 5)),  # Max staleness across nodes
+        },
     }
 }
 
@@ -220,6 +234,60 @@ CELERY_TIMEZONE = 'UTC'
 # Celery Beat Configuration
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 
+# Prometheus metrics, see muadhin/metrics.py. /metrics requires
+# "Authorization: Bearer <METRICS_AUTH_TOKEN>", and is closed while the token
+# is unset unless DEBUG is on; workers serve their metrics on
+# WORKER_METRICS_PORT (0 disables).
+METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN', '')
+WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', 0))
+
+# Per-task SQL/HTTP/wall time profiling of Celery tasks, see
+# muadhin/task_profiler.py and `manage.py task_profile`
+TASK_PROFILING = os.environ.get('TASK_PROFILING', 'False').lower() == 'true'
+
+# Web request timing, see muadhin/request_profiling.py. Requests slower than
+# REQUEST_SLOW_MS are kept (the last REQUEST_PROFILE_MAX) for
+# /admin/request-profiles/. Opt-in: a REQUEST_PROFILE_SAMPLE_RATE fraction
+# (e.g. 0.05) of requests run under cProfile so slow ones come with a stack
+# profile
+REQUEST_SLOW_MS = int(os.environ.get('REQUEST_SLOW_MS', 500))
+REQUEST_PROFILE_SAMPLE_RATE = float(os.environ.get('REQUEST_PROFILE_SAMPLE_RATE', 0))
+REQUEST_PROFILE_MAX = int(os.environ.get('REQUEST_PROFILE_MAX', 200))
+REQUEST_PROFILE_DIR = os.environ.get(
+    'REQUEST_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'muadhin-request-profiles')
+)
+
+# How long a placed call's voice session waits in Redis for the Africa's
+# Talking callback, see communications/services/voice_sessions.py
+VOICE_SESSION_TTL = int(os.environ.get('VOICE_SESSION_TTL', 15 * 60))
+
+# Delivery lag report (communications/services/delivery_report.py): seconds
+# after the scheduled time a notification still counts as on time
+DELIVERY_LAG_SLO_SECONDS = int(os.environ.get('DELIVERY_LAG_SLO_SECONDS', 60))
+
+# Monthly log partitions (opt-in, manage.py partition_logs --convert) and
+# retention, see muadhin/partitioning.py. Months older than the retention (0 keeps everything) are archived to
+# LOG_ARCHIVE_DIR as gzipped CSV and dropped, or only dropped when
+# LOG_RETENTION_ACTION is 'drop'.
+LOG_RETENTION_MONTHS = {
+    'communications_communicationlog': int(os.environ.get('COMMUNICATION_LOG_RETENTION_MONTHS', 13)),
+    'subscriptions_notificationusage': int(os.environ.get('NOTIFICATION_USAGE_RETENTION_MONTHS', 13)),
+}
+LOG_RETENTION_ACTION = os.environ.get('LOG_RETENTION_ACTION', 'archive')
+LOG_ARCHIVE_DIR = os.environ.get('LOG_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+# Archiving deletes the archived rows, so it only runs when LOG_ARCHIVE_DIR is
+# a mount point (the archive_data volume in docker-compose.prod.yml) or this
+# says the directory is kept, e.g. on a plain server
+LOG_ARCHIVE_PERSISTENT = os.environ.get('LOG_ARCHIVE_PERSISTENT', 'False').lower() == 'true'
+LOG_PARTITIONS_AHEAD = int(os.environ.get('LOG_PARTITIONS_AHEAD', 3))
+
+# DailyPrayer/PrayerTime months that ended this many days ago move to archive
+# files under LOG_ARCHIVE_DIR, see SalatTracker/prayer_archive.py
+PRAYER_ARCHIVE_AFTER_DAYS = int(os.environ.get('PRAYER_ARCHIVE_AFTER_DAYS', 90))
+
+# Voice call sessions are kept this long for delivery reports and support
+VOICE_SESSION_RETENTION_DAYS = int(os.environ.get('VOICE_SESSION_RETENTION_DAYS', 30))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -259,6 +327,9 @@ SWAGGER_SETTINGS = {
 
 
 
+# Prayer timings API; the load test harness points this at a local fake
+ALADHAN_API_URL = os.environ.get('ALADHAN_API_URL', 'http://api.aladhan.com/v1')
+
 # TWILIO 
 
 TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
@@ -301,6 +372,14 @@ DEFAULT_FROM_EMAIL = os.getenv('EMAIL_HOST_USER')
 # EMAIL_BACKEND = 'django_mailgun_mime.backends.MailgunMIMEBackend'
 # MAILGUN_API_KEY = os.getenv('MAILGUN_API_KEY')
 # MAILGUN_DOMAIN_NAME = os.getenv('MAILGUN_DOMAIN_NAME')
+MAILGUN_API_URL = os.getenv('MAILGUN_API_URL', 'https://api.mailgun.net/v3')
+
+# Bulk email delivery: daily summaries go out in batches (Mailgun batch sends with
+# recipient variables, or one reused SMTP connection) instead of one email per user
+DAILY_SUMMARY_EMAIL_BATCHING = os.environ.get('DAILY_SUMMARY_EMAIL_BATCHING', 'False').lower() == 'true'
+# Sends per user and day before a failing daily summary is given up (and recorded)
+DAILY_SUMMARY_EMAIL_MAX_ATTEMPTS = int(os.environ.get('DAILY_SUMMARY_EMAIL_MAX_ATTEMPTS', 3))
+MAILGUN_BATCH_SIZE = 1000  # Mailgun's limit on recipients per API call
 
 # Communication Provider Configurations
 COMMUNICATION_PROVIDERS = {
@@ -349,3 +428,12 @@ GEONAMES_USERNAME = 'giwabdul'
 REST_COUNTRIES_API_URL = 'https://restcountries.com/v3.1'
 GEONAMES_API_URL = 'http://api.geonames.org'
 LOCATION_CACHE_TIMEOUT = 60 * 60 * 24  # 24 hours
+
+# Offline GeoNames subset for city search (users/services/city_index.py). The
+# Docker image builds it from cities15000 (see Dockerfile); elsewhere run
+# manage.py build_city_dataset, without it city search uses the GeoNames API
+CITY_DATASET_PATH = os.environ.get('CITY_DATASET_PATH', os.path.join(BASE_DIR, 'users', 'data', 'cities.tsv'))
+# Built from the dataset on first use and mmap'd by every process (users/services/mapped_city_index.py)
+CITY_INDEX_PATH = os.environ.get('CITY_INDEX_PATH', os.path.join(BASE_DIR, 'users', 'data', 'cities.idx'))
+# Countries with fewer offline cities than this are searched on the GeoNames API instead
+OFFLINE_CITIES_MIN_PER_COUNTRY = int(os.environ.get('OFFLINE_CITIES_MIN_PER_COUNTRY', 20))
@@ -0,0 +1,317 @@
+"""
+Opt-in per-task profiling for Celery tasks.
+
+With TASK_PROFILING on, every task run records its SQL query count, time
+spent in the database, outbound HTTP calls (anything going through
+requests, which covers Aladhan, Twilio and the regional SMS providers) and
+wall time. Samples are aggregated like queue_metrics: per process (the last
+WINDOW runs of each task, for percentiles) and in Redis, one hash per task per
+minute (celery:profile:<task>:<minute>, kept for a day) so
+`manage.py task_profile` can report over all workers.
+
+The same measurement backs the test helpers:
+
+    with profile() as p:
+        send_pre_adhan_notification.apply(args=(user.id, 'Fajr', '05:00'))
+    assert p.queries <= 3
+
+    assert_task_budget(send_pre_adhan_notification, args=(...), max_queries=3)
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from celery.signals import task_postrun, task_prerun
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 500
+PROFILE_TTL = 60 * 60 * 24
+KEY = 'celery:profile:{task}:{minute}'
+FIELDS = ('queries', 'db_ms', 'http_calls', 'http_ms', 'wall_ms')
+
+
+@dataclass
+class TaskProfile:
+    queries: int = 0
+    db_ms: float = 0.0
+    http_calls: int = 0
+    http_ms: float = 0.0
+    wall_ms: float = 0.0
+    sql: List[str] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def stop(self):
+        self.wall_ms = (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self) -> Dict:
+        return {name: round(getattr(self, name), 1) for name in FIELDS}
+
+
+@dataclass
+class TaskProfileSummary:
+    count: int = 0
+    totals: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(FIELDS, 0.0))
+    maxima: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(FIELDS, 0.0))
+
+    def observe(self, sample: Dict):
+        self.count += 1
+        for name in FIELDS:
+            self.totals[name] += sample[name]
+            self.maxima[name] = max(self.maxima[name], sample[name])
+
+    def mean(self, name: str) -> float:
+        return self.totals[name] / self.count if self.count else 0.0
+
+    def as_dict(self) -> Dict:
+        result = {'count': self.count}
+        for name in FIELDS:
+            result[f'mean_{name}'] = round(self.mean(name), 1)
+            result[f'max_{name}'] = round(self.maxima[name], 1)
+        return result
+
+
+# Measurement. A thread-local stack so profile() can nest inside a profiled task.
+
+_state = threading.local()
+
+
+def _active() -> List[TaskProfile]:
+    if not hasattr(_state, 'profiles'):
+        _state.profiles = []
+    return _state.profiles
+
+
+def _count_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        for p in _active():
+            p.queries += 1
+            p.db_ms += elapsed
+            p.sql.append(sql)
+
+
+_http_patched = False
+_patch_lock = threading.Lock()
+
+
+def _patch_requests():
+    """Time requests.Session.send, which requests.get() and the provider SDKs go through"""
+    global _http_patched
+    with _patch_lock:
+        if _http_patched:
+            return
+        import requests
+
+        send = requests.Session.send
+
+        def timed_send(self, request, **kwargs):
+            if not _active():
+                return send(self, request, **kwargs)
+            started = time.perf_counter()
+            try:
+                return send(self, request, **kwargs)
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                for p in _active():
+                    p.http_calls += 1
+                    p.http_ms += elapsed
+
+        requests.Session.send = timed_send
+        _http_patched = True
+
+
+def _install_query_wrappers():
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        if _count_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_count_query)
+
+
+def _start() -> TaskProfile:
+    _patch_requests()
+    _install_query_wrappers()
+    p = TaskProfile()
+    _active().append(p)
+    return p
+
+
+def _stop(p: TaskProfile) -> TaskProfile:
+    p.stop()
+    profiles = _active()
+    if p in profiles:
+        profiles.remove(p)
+    if not profiles:
+        from django.db import connections
+
+        for connection in connections.all(initialized_only=True):
+            if _count_query in connection.execute_wrappers:
+                connection.execute_wrappers.remove(_count_query)
+    return p
+
+
+@connection_created.connect
+def wrap_new_connection(connection=None, **kwargs):
+    """Count queries on connections first opened while profiling"""
+    if _active() and _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+@contextmanager
+def profile():
+    p = _start()
+    try:
+        yield p
+    finally:
+        _stop(p)
+
+
+def assert_task_budget(task, args=(), kwargs=None, max_queries=None, max_db_ms=None,
+                       max_http_calls=None, max_wall_ms=None) -> TaskProfile:
+    """Run a task eagerly and fail if it goes over any of the given budgets"""
+    with profile() as p:
+        result = task.apply(args=args, kwargs=kwargs or {})
+    if result.failed():
+        raise AssertionError(f"{task.name} raised {result.result!r}")
+
+    budgets = {'queries': max_queries, 'db_ms': max_db_ms, 'http_calls': max_http_calls, 'wall_ms': max_wall_ms}
+    over = [
+        f"{name} {getattr(p, name):.0f} > {limit}"
+        for name, limit in budgets.items() if limit is not None and getattr(p, name) > limit
+    ]
+    if over:
+        queries = '\n'.join(f"  {i}. {sql}" for i, sql in enumerate(p.sql, 1))
+        raise AssertionError(f"{task.name} over budget: {', '.join(over)}\nQueries:\n{queries}")
+    return p
+
+
+# Aggregation
+
+_local: Dict[str, deque] = {}
+_local_lock = threading.Lock()
+
+
+def local_samples() -> Dict[str, List[Dict]]:
+    """This process's last WINDOW samples per task"""
+    with _local_lock:
+        return {task: list(samples) for task, samples in _local.items()}
+
+
+def reset_local():
+    with _local_lock:
+        _local.clear()
+
+
+def percentile(values: List[float], q: float) -> float:
+    from communications.services.delivery_report import percentile as nearest_rank
+
+    return nearest_rank(sorted(values), q) if values else 0.0
+
+
+def record_profile(task_name: str, p: TaskProfile, now: Optional[float] = None):
+    sample = p.as_dict()
+    with _local_lock:
+        _local.setdefault(task_name, deque(maxlen=WINDOW)).append(sample)
+
+    from muadhin.cache import mark_redis_unavailable, redis_client
+    from redis.exceptions import RedisError
+
+    client = redis_client()
+    if client is None:
+        return
+    key = KEY.format(task=task_name, minute=int((now or time.time()) // 60))
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.hincrby(key, 'count', 1)
+        for name in FIELDS:
+            pipe.hincrbyfloat(key, f'sum_{name}', sample[name])
+        pipe.expire(key, PROFILE_TTL)
+        pipe.execute()
+        maxima = client.hmget(key, [f'max_{name}' for name in FIELDS])
+        higher = {
+            f'max_{name}': sample[name]
+            for name, current in zip(FIELDS, maxima) if sample[name] > float(current or 0)
+        }
+        if higher:
+            client.hset(key, mapping=higher)
+    except RedisError as e:
+        mark_redis_unavailable(e)
+
+
+def profile_summary(minutes: int = 15, now: Optional[float] = None) -> Dict[str, TaskProfileSummary]:
+    """Per-task totals over the last minutes, across workers (this process only without Redis)"""
+    from muadhin.cache import mark_redis_unavailable, redis_client
+    from redis.exceptions import RedisError
+
+    client = redis_client()
+    if client is None:
+        return _local_summary()
+
+    current = int((now or time.time()) // 60)
+    summaries: Dict[str, TaskProfileSummary] = {}
+    try:
+        keys = []
+        for minute in range(current - minutes + 1, current + 1):
+            keys.extend(client.scan_iter(match=KEY.format(task='*', minute=minute), count=500))
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        for key, values in zip(keys, pipe.execute()):
+            task_name = key.decode().split(':')[2]
+            values = {k.decode(): float(v) for k, v in values.items()}
+            summary = summaries.setdefault(task_name, TaskProfileSummary())
+            summary.count += int(values.get('count', 0))
+            for name in FIELDS:
+                summary.totals[name] += values.get(f'sum_{name}', 0.0)
+                summary.maxima[name] = max(summary.maxima[name], values.get(f'max_{name}', 0.0))
+    except RedisError as e:
+        mark_redis_unavailable(e)
+        return _local_summary()
+    return summaries
+
+
+def _local_summary() -> Dict[str, TaskProfileSummary]:
+    summaries = {}
+    for task_name, samples in local_samples().items():
+        summary = summaries.setdefault(task_name, TaskProfileSummary())
+        for sample in samples:
+            summary.observe(sample)
+    return summaries
+
+
+def profiling_enabled() -> bool:
+    from django.conf import settings
+
+    return getattr(settings, 'TASK_PROFILING', False)
+
+
+@task_prerun.connect
+def start_task_profile(task=None, **kwargs):
+    if not profiling_enabled():
+        return
+    try:
+        task.request._profile = _start()
+    except Exception as e:
+        logger.debug(f"Could not start task profile: {e}")
+
+
+@task_postrun.connect
+def record_task_profile(task=None, **kwargs):
+    p = getattr(task.request, '_profile', None)
+    if p is None:
+        return
+    task.request._profile = None
+    try:
+        record_profile(task.name, _stop(p))
+    except Exception as e:
+        logger.debug(f"Could not record task profile: {e}")
@@ -0,0 +1,82 @@
+"""
+zoneinfo-based timezone helpers for the scheduling hot paths.
+
+The schedulers used to call pytz.timezone(user.timezone) and localize() for
+every user on every pass. zoneinfo zones are plain tzinfo objects (no
+localize()/normalize() to forget), and get_zone() keeps them in an LRU so a
+pass over thousands of users loads each zone once.
+
+next_midnights_utc() computes "next local midnight in UTC" for a batch of
+users at once: users share a few hundred zones at most, so it is computed
+once per distinct zone rather than once per user.
+"""
+
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DEFAULT_TIMEZONE = 'Africa/Lagos'
+
+UTC = dt_timezone.utc
+
+
+@lru_cache(maxsize=1024)
+def _load_zone(name: str) -> Optional[ZoneInfo]:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def is_valid_timezone(name: Optional[str]) -> bool:
+    return bool(name) and _load_zone(name) is not None
+
+
+def get_zone(name: Optional[str]) -> ZoneInfo:
+    """The zone for an IANA name, DEFAULT_TIMEZONE for unknown or empty names"""
+    return (_load_zone(name) if name else None) or _load_zone(DEFAULT_TIMEZONE)
+
+
+def localize(naive: datetime, tz_name: Optional[str]) -> datetime:
+    """
+    Attach a user's zone to a naive local datetime. Times skipped or repeated
+    by a DST change resolve to the offset before the change (fold=0), so a
+    repeated autumn time is its first, summer-time occurrence. pytz's
+    localize() default (is_dst=False) agrees for skipped times but picks the
+    second, standard-time occurrence of a repeated one.
+    """
+    return naive.replace(tzinfo=get_zone(tz_name))
+
+
+def local_now(tz_name: Optional[str], now: Optional[datetime] = None) -> datetime:
+    return (now or datetime.now(UTC)).astimezone(get_zone(tz_name))
+
+
+def next_local_midnight(tz_name: Optional[str], now: Optional[datetime] = None) -> datetime:
+    """
+    The user's next local midnight, as an aware local datetime. Built from
+    tomorrow's date rather than by adding a day to "now", so the offset is
+    right across a DST change.
+    """
+    zone = get_zone(tz_name)
+    today = (now or datetime.now(UTC)).astimezone(zone).date()
+    return datetime.combine(today + timedelta(days=1), time.min, tzinfo=zone)
+
+
+def next_midnight_utc(tz_name: Optional[str], now: Optional[datetime] = None) -> datetime:
+    return next_local_midnight(tz_name, now).astimezone(UTC)
+
+
+def next_midnights_utc(tz_names: Iterable[Optional[str]], now: Optional[datetime] = None) -> Dict[Optional[str], datetime]:
+    """Next local midnight in UTC for each distinct zone name of a batch of users"""
+    now = now or datetime.now(UTC)
+    return {name: next_midnight_utc(name, now) for name in set(tz_names)}
+
+
+def utc_offset_label(tz_name: Optional[str], at: Optional[datetime] = None) -> str:
+    """The zone's UTC offset at a moment, e.g. 'UTC+05:30', used to bucket users by timezone"""
+    offset = (at or datetime.now(UTC)).astimezone(get_zone(tz_name)).utcoffset()
+    minutes = int(offset.total_seconds() // 60)
+    sign = '+' if minutes >= 0 else '-'
+    return f"UTC{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
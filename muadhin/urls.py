@@ -11,6 +11,9 @@ from rest_framework_simplejwt.views import TokenRefreshView
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from muadhin.metrics import metrics_view
+from muadhin.request_profiling import slow_request_view, slow_requests_view
+
 
 # Health check endpoint
 def healthz(request):
@@ -42,6 +45,8 @@ urlpatterns = [
     path('', RedirectView.as_view(url='/api/', permanent=False), name='home'),
 
     # Admin
+    path('admin/request-profiles/', admin.site.admin_view(slow_requests_view), name='request_profiles'),
+    path('admin/request-profiles/<str:entry_id>/', admin.site.admin_view(slow_request_view), name='request_profile'),
     path('admin/', admin.site.urls),
 
     # API endpoints
@@ -58,4 +63,7 @@ urlpatterns = [
 
     # Health check
     path('healthz/', healthz, name='healthz'),
+
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -101,7 +101,12 @@ class UserSubscriptionAdmin(admin.ModelAdmin):
     activate_subscriptions.short_description = 'Activate selected subscriptions'
 
     def cancel_subscriptions(self, request, queryset):
+        from SalatTracker.dashboard_snapshot import invalidate_dashboard_snapshots
+
+        user_ids = list(queryset.values_list('user_id', flat=True))
         count = queryset.update(status='cancelled')
+        # update() sends no post_save, the subscription is on the dashboard
+        invalidate_dashboard_snapshots(user_ids)
         self.message_user(request, f'Successfully cancelled {count} subscription(s).')
     cancel_subscriptions.short_description = 'Cancel selected subscriptions'
 
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0007_alter_subscriptionplan_max_notifications_per_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationusage',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notificationusage',
+            name='scheduled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -307,6 +307,8 @@ class NotificationUsage(models.Model):
     prayer_name = models.CharField(max_length=50, null=True, blank=True)
     success = models.BooleanField(default=True)
     error_message = models.TextField(null=True, blank=True)
+    scheduled_at = models.DateTimeField(null=True, blank=True)  # when it was due, for scheduled notifications
+    dispatched_at = models.DateTimeField(null=True, blank=True)  # when the provider accepted it
     
     class Meta:
         ordering = ['-date_sent']
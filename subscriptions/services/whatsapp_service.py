@@ -1,4 +1,3 @@
-from twilio.rest import Client
 from django.conf import settings
 import logging
 
@@ -9,6 +8,8 @@ class WhatsAppService:
     """Service for sending WhatsApp messages via Twilio"""
     
     def __init__(self):
+        from twilio.rest import Client
+
         self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
         self.from_number = f"whatsapp:{settings.TWILIO_WHATSAPP_NUMBER}"
     
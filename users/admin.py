@@ -214,7 +214,7 @@ class UserSubscriptionInline(admin.StackedInline):
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email', 'first_name', 'last_name', 'sex', 'city', 'country', 'timezone', 'phone_number', 'subscription_plan', 'subscription_status', 'last_scheduled_time', 'midnight_utc')
+    list_display = ('username', 'email', 'first_name', 'last_name', 'sex', 'city', 'country', 'timezone', 'phone_number', 'subscription_plan', 'subscription_status', 'last_scheduled_time', 'next_midnight_utc')
     list_filter = ('sex', 'country', 'timezone', 'subscription__status', 'subscription__plan__plan_type')
     search_fields = ('username', 'email', 'first_name', 'last_name', 'phone_number')
     actions = [setup_basic_plan_action, diagnose_users_action]
@@ -265,7 +265,9 @@ class UserPreferencesAdmin(admin.ModelAdmin):
 
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
-    list_display = ('user', 'latitude', 'longitude', 'timezone')
+    list_display = ('user', 'city', 'country_code', 'latitude', 'longitude', 'timezone', 'location_key', 'geocoded_at')
+    search_fields = ('user__username', 'city', 'location_key')
+    readonly_fields = ('geocoded_from', 'geocoded_at')
 
 @admin.register(PrayerMethod)
 class PrayerMethodAdmin(admin.ModelAdmin):
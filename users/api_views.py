@@ -6,7 +6,7 @@ from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import send_mail
 from django.urls import reverse
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from muadhin.cache import cache_api_response
 
 from subscriptions.services.subscription_service import SubscriptionService
 from .permissions import IsOwnerOrReadOnly
@@ -25,7 +25,8 @@ from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import CustomTokenObtainPairSerializer
 from rest_framework.decorators import action
-from .services.location_service import LocationService
+from .services.location_service import LocationService, LOCATION_CACHE_NAMESPACE
+from .services.timezone_catalog import catalog_response, get_timezone_catalog
 
 # Configure logger for this module
 logger = logging.getLogger(__name__)
@@ -1143,11 +1144,11 @@ class ProfileSettingsAPIView(APIView):
 class TimezonesAPIView(APIView):
     """
     API endpoint to get all available timezones
-    Cached for 24 hours since timezones rarely change
+    Served from the precomputed timezone catalog (users/services/timezone_catalog.py),
+    which is rebuilt at the next DST transition
     """
     permission_classes = [AllowAny]  # Public endpoint
     
-    @method_decorator(cache_page(60 * 60 * 24))  # Cache for 24 hours
     def get(self, request):
         """Get all available timezones grouped by continent"""
         
@@ -1155,129 +1156,8 @@ class TimezonesAPIView(APIView):
         filter_type = request.query_params.get('filter', 'common')  # 'all', 'common', 'continent'
         continent = request.query_params.get('continent', None)
         
-        if filter_type == 'all':
-            timezones = self._get_all_timezones()
-        elif filter_type == 'continent' and continent:
-            timezones = self._get_timezones_by_continent(continent)
-        else:  # default to common
-            timezones = self._get_common_timezones()
-        
-        return Response({
-            'timezones': timezones,
-            'total_count': len(timezones),
-            'filter_applied': filter_type,
-            'available_filters': ['all', 'common', 'continent'],
-            'available_continents': self._get_continents()
-        })
-    
-    def _get_common_timezones(self):
-        """Get commonly used timezones"""
-        common_zones = [
-            # Africa
-            'Africa/Lagos', 'Africa/Cairo', 'Africa/Johannesburg', 'Africa/Nairobi',
-            'Africa/Casablanca', 'Africa/Tunis', 'Africa/Algiers', 'Africa/Addis_Ababa',
-            
-            # Asia
-            'Asia/Dubai', 'Asia/Karachi', 'Asia/Kolkata', 'Asia/Jakarta',
-            'Asia/Tokyo', 'Asia/Shanghai', 'Asia/Seoul', 'Asia/Singapore',
-            'Asia/Bangkok', 'Asia/Manila', 'Asia/Riyadh', 'Asia/Tehran',
-            
-            # Europe
-            'Europe/London', 'Europe/Paris', 'Europe/Berlin', 'Europe/Rome',
-            'Europe/Madrid', 'Europe/Amsterdam', 'Europe/Brussels', 'Europe/Vienna',
-            
-            # Americas
-            'America/New_York', 'America/Los_Angeles', 'America/Chicago', 'America/Denver',
-            'America/Toronto', 'America/Vancouver', 'America/Mexico_City', 'America/Sao_Paulo',
-            
-            # Others
-            'Australia/Sydney', 'Australia/Melbourne', 'Pacific/Auckland'
-        ]
-        
-        return [
-            {
-                'value': tz,
-                'label': self._format_timezone_label(tz),
-                'continent': tz.split('/')[0] if '/' in tz else 'Other',
-                'city': tz.split('/')[-1].replace('_', ' ') if '/' in tz else tz,
-                'utc_offset': self._get_utc_offset(tz)
-            }
-            for tz in common_zones
-        ]
-    
-    def _get_all_timezones(self):
-        """Get all available timezones"""
-        all_zones = list(pytz.all_timezones)
-        
-        return [
-            {
-                'value': tz,
-                'label': self._format_timezone_label(tz),
-                'continent': tz.split('/')[0] if '/' in tz else 'Other',
-                'city': tz.split('/')[-1].replace('_', ' ') if '/' in tz else tz,
-                'utc_offset': self._get_utc_offset(tz)
-            }
-            for tz in sorted(all_zones)
-        ]
-    
-    def _get_timezones_by_continent(self, continent):
-        """Get timezones for a specific continent"""
-        continent_zones = [
-            tz for tz in pytz.all_timezones 
-            if tz.startswith(f"{continent}/")
-        ]
-        
-        return [
-            {
-                'value': tz,
-                'label': self._format_timezone_label(tz),
-                'continent': continent,
-                'city': tz.split('/')[-1].replace('_', ' '),
-                'utc_offset': self._get_utc_offset(tz)
-            }
-            for tz in sorted(continent_zones)
-        ]
-    
-    def _get_continents(self):
-        """Get list of available continents"""
-        continents = set()
-        for tz in pytz.all_timezones:
-            if '/' in tz:
-                continent = tz.split('/')[0]
-                continents.add(continent)
-        
-        return sorted(list(continents))
-    
-    def _format_timezone_label(self, timezone):
-        """Format timezone for display"""
-        if '/' not in timezone:
-            return timezone
-        
-        parts = timezone.split('/')
-        continent = parts[0]
-        city = parts[-1].replace('_', ' ')
-        
-        # Add UTC offset for better UX
-        utc_offset = self._get_utc_offset(timezone)
-        
-        return f"{city} ({continent}) - UTC{utc_offset}"
-    
-    def _get_utc_offset(self, timezone):
-        """Get current UTC offset for timezone"""
-        try:
-            from datetime import datetime
-            import pytz
-            
-            tz = pytz.timezone(timezone)
-            now = datetime.now(tz)
-            offset = now.strftime('%z')
-            
-            if offset:
-                # Format as +05:30 or -08:00
-                return f"{offset[:3]}:{offset[3:]}"
-            return "+00:00"
-        except:
-            return "+00:00"
+        catalog = get_timezone_catalog()
+        return catalog_response(request, catalog.body(filter_type, continent), catalog)
 
 
 # Add this endpoint for just getting user's current timezone info
@@ -1289,20 +1169,20 @@ class CurrentTimezoneAPIView(APIView):
         user = request.user
         
         try:
-            import pytz
-            from datetime import datetime
+            from datetime import datetime, timedelta, timezone as dt_timezone
             
-            user_tz = pytz.timezone(user.timezone)
-            now = datetime.now(user_tz)
+            info = get_timezone_catalog().zones[user.timezone]
+            # The catalog's offset holds until the next DST transition
+            now = datetime.now(dt_timezone(timedelta(seconds=info.offset_seconds)))
             
             return Response({
                 'current_timezone': user.timezone,
                 'formatted_name': user.timezone.replace('_', ' '),
-                'continent': user.timezone.split('/')[0] if '/' in user.timezone else 'Other',
-                'city': user.timezone.split('/')[-1].replace('_', ' ') if '/' in user.timezone else user.timezone,
+                'continent': info.continent,
+                'city': info.city,
                 'current_time': now.strftime('%Y-%m-%d %H:%M:%S'),
                 'utc_offset': now.strftime('%z'),
-                'is_dst': now.dst().total_seconds() != 0 if now.dst() else False
+                'is_dst': info.is_dst
             })
         except Exception as e:
             return Response({
@@ -1331,7 +1211,7 @@ class CountriesAPIView(APIView):
         super().__init__()
         self.location_service = LocationService()
     
-    @method_decorator(cache_page(60 * 60 * 12))  # Cache for 12 hours
+    @method_decorator(cache_api_response(60 * 60 * 12, namespace=LOCATION_CACHE_NAMESPACE))  # Cache for 12 hours
     def get(self, request):
         """Get countries with filtering and search"""
         
@@ -1367,7 +1247,8 @@ class CitiesAPIView(APIView):
     """
     Comprehensive cities API using GeoNames database
     
-    Data Source: GeoNames API (11M+ places worldwide)
+    Data Source: offline GeoNames subset (in-memory index), GeoNames API
+    (11M+ places worldwide) for countries the subset doesn't cover
     
     Features:
     - Cities, towns, villages for any country
@@ -1383,7 +1264,6 @@ class CitiesAPIView(APIView):
         super().__init__()
         self.location_service = LocationService()
     
-    @method_decorator(cache_page(60 * 60 * 6))  # Cache for 6 hours
     def get(self, request):
         """Get cities for a country with search and pagination"""
         
@@ -1412,7 +1292,10 @@ class CitiesAPIView(APIView):
                 'total_count': len(cities),
                 'search_query': search,
                 'limit_applied': limit,
-                'data_source': 'GeoNames API'
+                'data_source': (
+                    'GeoNames offline dataset'
+                    if self.location_service.has_offline_cities(country_code) else 'GeoNames API'
+                )
             })
             
         except Exception as e:
@@ -1469,24 +1352,24 @@ class LocationAutocompleteAPIView(APIView):
                         'flag': country.get('flag', '')
                     })
             
-            # Search cities
-            if country_code:
-                cities = self.location_service.get_cities_for_country(
-                    country_code=country_code.upper(),
-                    search=query,
-                    limit=limit
-                )
-                
-                for city in cities[:limit]:
-                    results.append({
-                        'type': 'city',
-                        'name': city['name'],
-                        'country_code': country_code.upper(),
-                        'admin1': city.get('admin1', ''),
-                        'display': f"{city['name']}, {city.get('admin1', country_code)}",
-                        'population': city.get('population', 0),
-                        'is_capital': city.get('is_capital', False)
-                    })
+            # Ranked city matches, in every country of the offline dataset if none given
+            cities = self.location_service.autocomplete_cities(
+                query,
+                country_code=country_code.upper(),
+                limit=limit - len(results)
+            )
+            
+            for city in cities:
+                city_country = city.get('country_code') or country_code.upper()
+                results.append({
+                    'type': 'city',
+                    'name': city['name'],
+                    'country_code': city_country,
+                    'admin1': city.get('admin1', ''),
+                    'display': f"{city['name']}, {city.get('admin1') or city_country}",
+                    'population': city.get('population', 0),
+                    'is_capital': city.get('is_capital', False)
+                })
             
             return Response({
                 'success': True,
@@ -0,0 +1,94 @@
+import random
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+import pytz
+from django.core.management.base import BaseCommand
+
+from muadhin.timezones import localize, next_midnights_utc
+
+# Roughly how users are spread over zones: a few large ones and a long tail
+ZONES = (
+    ['Africa/Lagos'] * 40 + ['Europe/London'] * 10 + ['America/New_York'] * 8 +
+    ['Asia/Karachi'] * 6 + ['Asia/Riyadh'] * 6 + ['Asia/Jakarta'] * 5 + ['Africa/Cairo'] * 5 +
+    ['Asia/Kolkata', 'Europe/Paris', 'Europe/Berlin', 'America/Chicago', 'America/Los_Angeles',
+     'America/Toronto', 'Asia/Dubai', 'Asia/Kuala_Lumpur', 'Africa/Nairobi', 'Africa/Casablanca',
+     'Australia/Sydney', 'Asia/Tehran', 'Asia/Kathmandu', 'Pacific/Auckland']
+)
+
+PRAYER_TIMES = [dt_time(5, 12), dt_time(13, 5), dt_time(16, 30), dt_time(19, 2), dt_time(20, 15)]
+
+
+def legacy_midnight_pass(tz_names, now):
+    """The pytz midnight check should_schedule_user ran per user"""
+    midnights = []
+    for tz_name in tz_names:
+        user_now = now.astimezone(pytz.timezone(tz_name))
+        next_midnight = user_now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        midnights.append(next_midnight.astimezone(pytz.utc))
+    return midnights
+
+
+def zoneinfo_midnight_pass(tz_names, now):
+    midnights = next_midnights_utc(tz_names, now)
+    return [midnights[tz_name] for tz_name in tz_names]
+
+
+def legacy_localize_pass(tz_names, day):
+    """The pytz localize() of each prayer time schedule_notifications_for_day did"""
+    etas = []
+    for tz_name in tz_names:
+        user_timezone = pytz.timezone(tz_name)
+        for prayer_time in PRAYER_TIMES:
+            etas.append(user_timezone.localize(datetime.combine(day, prayer_time)))
+    return etas
+
+
+def zoneinfo_localize_pass(tz_names, day):
+    etas = []
+    for tz_name in tz_names:
+        for prayer_time in PRAYER_TIMES:
+            etas.append(localize(datetime.combine(day, prayer_time), tz_name))
+    return etas
+
+
+class Command(BaseCommand):
+    help = "Compare the pytz and zoneinfo scheduler passes on synthetic users"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='Synthetic users per pass')
+        parser.add_argument('--repeat', type=int, default=5, help='Passes per variant, the best is reported')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def time_pass(self, function, *args, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function(*args)
+            best = min(best, time.perf_counter() - started)
+        return best
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        tz_names = [rng.choice(ZONES) for _ in range(options['users'])]
+        now = datetime.now(pytz.utc)
+        repeat = options['repeat']
+
+        # The first comparison also warms both zone caches, as in a long-running worker
+        mismatches = sum(
+            old != new for old, new in zip(legacy_midnight_pass(tz_names, now), zoneinfo_midnight_pass(tz_names, now))
+        )
+        if mismatches:
+            self.stdout.write(f"⚠️ {mismatches} users get a different midnight (pytz keeps today's offset across a DST change)")
+
+        results = [
+            ('next midnight (should_schedule_user)', legacy_midnight_pass, zoneinfo_midnight_pass, now),
+            ('prayer etas (schedule_*_for_day)', legacy_localize_pass, zoneinfo_localize_pass, now.date()),
+        ]
+        for label, legacy, current, arg in results:
+            old = self.time_pass(legacy, tz_names, arg, repeat=repeat)
+            new = self.time_pass(current, tz_names, arg, repeat=repeat)
+            self.stdout.write(
+                f"{label}: pytz {old * 1000:.1f} ms, zoneinfo {new * 1000:.1f} ms "
+                f"({old / new:.1f}x) for {len(tz_names)} users"
+            )
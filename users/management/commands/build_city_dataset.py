@@ -0,0 +1,112 @@
+import csv
+import os
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.services.city_index import DATASET_COLUMNS, load_city_index
+from users.services.mapped_city_index import open_mapped_index
+
+# Columns of the GeoNames cities dumps (cities500.txt ... cities15000.txt)
+GEONAMES_ID, GEONAMES_NAME, GEONAMES_ASCII_NAME = 0, 1, 2
+GEONAMES_LATITUDE, GEONAMES_LONGITUDE = 4, 5
+GEONAMES_FEATURE_CODE, GEONAMES_COUNTRY_CODE, GEONAMES_ADMIN1_CODE = 7, 8, 10
+GEONAMES_POPULATION, GEONAMES_TIMEZONE = 14, 17
+
+
+class Command(BaseCommand):
+    help = 'Build the offline city dataset from a GeoNames cities dump (e.g. cities15000.txt)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dump', help='GeoNames cities dump file')
+        parser.add_argument(
+            '--admin1',
+            help='GeoNames admin1CodesASCII.txt, to store state/province names instead of codes'
+        )
+        parser.add_argument(
+            '--min-population',
+            type=int,
+            default=15000,
+            help='Skip places smaller than this (default: 15000)'
+        )
+        parser.add_argument(
+            '--countries',
+            help='Comma-separated ISO country codes to keep (default: all)'
+        )
+        parser.add_argument(
+            '--dataset-version',
+            default=date.today().strftime('%Y.%m'),
+            help='Dataset version written to the file header (default: YYYY.MM)'
+        )
+        parser.add_argument(
+            '--output',
+            default=settings.CITY_DATASET_PATH,
+            help='Output file (default: settings.CITY_DATASET_PATH)'
+        )
+        parser.add_argument(
+            '--index',
+            help='Also write the memory-mapped index here (e.g. settings.CITY_INDEX_PATH), '
+                 'instead of the first process building it'
+        )
+
+    def handle(self, *args, **options):
+        admin1_names = self._read_admin1(options['admin1']) if options['admin1'] else {}
+        countries = {
+            code.strip().upper() for code in (options['countries'] or '').split(',') if code.strip()
+        }
+
+        rows = []
+        try:
+            with open(options['dump'], encoding='utf-8', newline='') as f:
+                for record in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+                    if len(record) <= GEONAMES_TIMEZONE:
+                        continue
+                    country_code = record[GEONAMES_COUNTRY_CODE]
+                    population = int(record[GEONAMES_POPULATION] or 0)
+                    if population < options['min_population']:
+                        continue
+                    if countries and country_code not in countries:
+                        continue
+
+                    admin1_code = record[GEONAMES_ADMIN1_CODE]
+                    rows.append([
+                        record[GEONAMES_ID],
+                        record[GEONAMES_NAME],
+                        record[GEONAMES_ASCII_NAME],
+                        country_code,
+                        admin1_names.get(f"{country_code}.{admin1_code}", admin1_code),
+                        population,
+                        record[GEONAMES_LATITUDE],
+                        record[GEONAMES_LONGITUDE],
+                        record[GEONAMES_TIMEZONE],
+                        record[GEONAMES_FEATURE_CODE],
+                    ])
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['dump']}: {e}")
+
+        rows.sort(key=lambda row: (row[3], -row[5], row[1]))
+
+        os.makedirs(os.path.dirname(os.path.abspath(options['output'])), exist_ok=True)
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            f.write('# Muadhin offline city dataset, a subset of GeoNames (https://www.geonames.org, CC BY 4.0)\n')
+            f.write(f"# version: {options['dataset_version']}\n")
+            writer = csv.writer(f, delimiter='\t', quoting=csv.QUOTE_NONE, escapechar='\\', lineterminator='\n')
+            writer.writerow(DATASET_COLUMNS)
+            writer.writerows(rows)
+
+        load_city_index.cache_clear()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Wrote {len(rows)} cities to {options['output']} (version {options['dataset_version']})"
+        ))
+        if options['index']:
+            open_mapped_index(options['output'], options['index'])
+            self.stdout.write(self.style.SUCCESS(f"✅ Wrote the mapped index to {options['index']}"))
+
+    def _read_admin1(self, path):
+        names = {}
+        with open(path, encoding='utf-8', newline='') as f:
+            for record in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+                if len(record) >= 2:
+                    names[record[0]] = record[1]
+        return names
@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from users.services.geocoding import geocode_user
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Geocode users' city/country into their Location with the offline city dataset"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Also re-geocode users whose city/country did not change'
+        )
+
+    def handle(self, *args, **options):
+        resolved = unresolved = 0
+        users = User.objects.only('id', 'username', 'city', 'country').iterator(chunk_size=500)
+        for user in users:
+            if geocode_user(user, force=options['force']):
+                resolved += 1
+            else:
+                unresolved += 1
+                self.stdout.write(f"⚠️ {user.username}: no match for {user.city!r}, {user.country!r}")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Geocoded {resolved} users, {unresolved} unresolved"))
@@ -0,0 +1,89 @@
+from contextlib import nullcontext, redirect_stdout
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from muadhin.loadtest import LoadTestConfig, mean, percentiles, run_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a simulated UTC day of the scheduler and dispatchers for synthetic users, "
+        "with a fake Aladhan server and fake providers (see muadhin/loadtest.py). "
+        "Only runs against a database without real users"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--day', type=str, help='UTC day to simulate, YYYY-MM-DD (default: today)')
+        parser.add_argument('--hours', type=int, default=24)
+        parser.add_argument('--provider-latency-ms', type=float, default=150)
+        parser.add_argument('--provider-error-rate', type=float, default=0.01)
+        parser.add_argument('--email-latency-ms', type=float, default=80)
+        parser.add_argument('--email-error-rate', type=float, default=0.0)
+        parser.add_argument('--aladhan-latency-ms', type=float, default=300)
+        parser.add_argument('--aladhan-error-rate', type=float, default=0.0)
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic users and their data')
+
+    def handle(self, *args, **options):
+        day = None
+        if options['day']:
+            try:
+                day = datetime.strptime(options['day'], '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+            except ValueError:
+                raise CommandError(f"Invalid day '{options['day']}', expected YYYY-MM-DD")
+
+        config = LoadTestConfig(
+            users=options['users'], seed=options['seed'], day=day, hours=options['hours'],
+            provider_latency_ms=options['provider_latency_ms'], provider_error_rate=options['provider_error_rate'],
+            email_latency_ms=options['email_latency_ms'], email_error_rate=options['email_error_rate'],
+            aladhan_latency_ms=options['aladhan_latency_ms'], aladhan_error_rate=options['aladhan_error_rate'],
+            keep=options['keep'],
+        )
+        self.stdout.write(f"🚀 Simulating {config.hours}h for {config.users} users...")
+        # The tasks print a line per send, only shown with -v 2
+        try:
+            with redirect_stdout(StringIO()) if options['verbosity'] < 2 else nullcontext():
+                report = run_load_test(config)
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        self.print_report(report)
+
+    def print_report(self, report):
+        write = self.stdout.write
+        executed = report.executed
+        busy = report.busy_seconds
+
+        write(f"\n📈 Throughput")
+        write(f"  {executed} tasks in {report.wall_seconds:.1f}s wall, {busy:.1f}s of worker time "
+              f"with simulated latencies ({executed / busy if busy else 0:.1f} tasks/s per worker slot)")
+        write(f"  {busy / report.users if report.users else 0:.2f} worker-seconds per user per day, "
+              f"{report.pending} tasks still queued at the end")
+        sends = ', '.join(f"{channel} {count}" for channel, count in sorted(report.provider_sends.items()))
+        write(f"  Sent: {sends or 'nothing'}, email {report.emails}; Aladhan requests {report.aladhan_requests}")
+
+        write(f"\n⏱️ Delivery lag (dispatched - due, seconds)")
+        for kind in sorted(set(report.delivery_lags) | set(report.delivery_failures) | set(report.catch_up)):
+            stats = percentiles(report.delivery_lags[kind])
+            write(f"  {kind:>10}: {len(report.delivery_lags[kind])} sent, p50 {stats['p50']:.2f}, "
+                  f"p95 {stats['p95']:.2f}, p99 {stats['p99']:.2f}, max {stats['max']:.2f}; "
+                  f"{report.delivery_failures[kind]} failed, {report.catch_up[kind]} catch-up (due before scheduling)")
+
+        write(f"\n🚦 Queue wait (seconds)")
+        for queue, waits in sorted(report.queue_waits.items()):
+            stats = percentiles(waits)
+            write(f"  {queue:>13}: {len(waits)} tasks, p95 {stats['p95']:.2f}, max {stats['max']:.2f}")
+
+        write(f"\n🗄️ Per task (duration ms, DB queries)")
+        width = max((len(name) for name in report.tasks), default=0)
+        for name, stats in sorted(report.tasks.items(), key=lambda item: -sum(item[1].durations)):
+            durations = percentiles(stats.durations)
+            statuses = ', '.join(f"{status} {count}" for status, count in stats.statuses.most_common())
+            write(f"  {name:<{width}}  {len(stats.durations):>6}x  mean {mean(stats.durations) * 1000:7.1f}  "
+                  f"p95 {durations['p95'] * 1000:7.1f}  queries mean {mean(stats.queries):5.1f} "
+                  f"max {max(stats.queries)}  [{statuses}]")
+
+        write(f"\n💾 Peak RSS {report.rss_peak_kb / 1024:.0f} MB (started at {report.rss_start_kb / 1024:.0f} MB)")
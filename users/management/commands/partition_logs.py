@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from muadhin import partitioning
+
+
+class Command(BaseCommand):
+    help = "Create the coming months' log partitions and optionally expire months past their retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Rebuild the log tables as monthly partitions (locks and rewrites them)')
+        parser.add_argument('--revert', action='store_true',
+                            help='Rebuild partitioned log tables as plain tables (locks and rewrites them)')
+        parser.add_argument('--months-ahead', type=int, default=None,
+                            help='Months to create after the current one (default LOG_PARTITIONS_AHEAD)')
+        parser.add_argument('--apply-retention', action='store_true',
+                            help='Archive or drop months older than LOG_RETENTION_MONTHS')
+        parser.add_argument('--dry-run', action='store_true', help='With --apply-retention, only list the months')
+
+    def handle(self, *args, **options):
+        if options['convert'] and options['revert']:
+            raise CommandError("--convert and --revert can't be combined")
+        if connection.vendor != 'postgresql':
+            if options['convert'] or options['revert']:
+                raise CommandError(f"{connection.vendor} has no partitions")
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {connection.vendor} has no partitions, only retention applies"
+            ))
+        else:
+            for table in partitioning.PARTITIONED_TABLES:
+                if options['convert'] and partitioning.partition_table(table):
+                    self.stdout.write(self.style.SUCCESS(f"✅ Partitioned {table}"))
+                if options['revert'] and partitioning.unpartition_table(table):
+                    self.stdout.write(self.style.SUCCESS(f"✅ Turned {table} back into a plain table"))
+            created = partitioning.ensure_partitions(options['months_ahead'])
+            for name in created:
+                self.stdout.write(f"  + {name}")
+            self.stdout.write(self.style.SUCCESS(f"✅ Created {len(created)} partitions"))
+
+        if not options['apply_retention']:
+            return
+        actions = partitioning.apply_retention(dry_run=options['dry_run'])
+        verb = 'Would expire' if options['dry_run'] else 'Expired'
+        for action in actions:
+            self.stdout.write(f"  - {action}")
+        self.stdout.write(self.style.SUCCESS(f"✅ {verb} {len(actions)} months"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from muadhin.celery import QUEUE_WORKERS
+from muadhin.queue_metrics import lag_summary
+
+
+class Command(BaseCommand):
+    help = "Per-queue Celery task lag (start time - max(publish time, ETA)) over the last minutes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        for queue in QUEUE_WORKERS:
+            stats = lag_summary(queue, options['minutes']).as_dict()
+            self.stdout.write(
+                f"{queue:>13}: {stats['count']:>6} tasks, mean {stats['mean_ms']} ms, "
+                f"p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms, max {stats['max_ms']} ms"
+            )
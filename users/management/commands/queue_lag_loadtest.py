@@ -0,0 +1,87 @@
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from muadhin import queue_metrics
+from muadhin.celery import ADHAN_QUEUE, INGEST_QUEUE, QUEUE_WORKERS, app
+
+
+@app.task(name='loadtest.ingest')
+def ingest_task(duration_ms):
+    time.sleep(duration_ms / 1000)
+
+
+@app.task(name='loadtest.adhan')
+def adhan_task():
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Saturate the ingest queue and measure adhan ETA lag, with one worker for "
+        "both queues and with a dedicated adhan worker (in-process workers, memory broker)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingest-tasks', type=int, default=120)
+        parser.add_argument('--ingest-ms', type=int, default=500, help='Duration of each ingest task')
+        parser.add_argument('--adhan-tasks', type=int, default=30)
+        parser.add_argument('--adhan-every', type=float, default=0.3, help='Seconds between adhan ETAs')
+
+    def handle(self, *args, **options):
+        from celery.contrib.testing.worker import start_worker
+
+        def run(topology):
+            queue_metrics.reset_local()
+            ingest = QUEUE_WORKERS[INGEST_QUEUE]
+            if topology == 'shared':
+                workers = [({'queues': [INGEST_QUEUE, ADHAN_QUEUE]}, ingest)]
+            else:
+                workers = [({'queues': [INGEST_QUEUE]}, ingest), ({'queues': [ADHAN_QUEUE]}, QUEUE_WORKERS[ADHAN_QUEUE])]
+
+            contexts = [
+                start_worker(
+                    app, pool='threads', perform_ping_check=False, shutdown_timeout=60,
+                    concurrency=settings['concurrency'], prefetch_multiplier=settings['prefetch_multiplier'],
+                    **kwargs
+                )
+                for kwargs, settings in workers
+            ]
+            for context in contexts:
+                context.__enter__()
+            try:
+                for _ in range(options['ingest_tasks']):
+                    ingest_task.apply_async((options['ingest_ms'],), queue=INGEST_QUEUE)
+                start = datetime.now(dt_timezone.utc) + timedelta(seconds=0.5)
+                for i in range(options['adhan_tasks']):
+                    adhan_task.apply_async(queue=ADHAN_QUEUE, eta=start + timedelta(seconds=i * options['adhan_every']))
+
+                deadline = time.monotonic() + 120
+                while time.monotonic() < deadline:
+                    histograms = queue_metrics.local_histograms()
+                    done = {queue: h.count for queue, h in histograms.items()}
+                    if done.get(ADHAN_QUEUE, 0) >= options['adhan_tasks']:
+                        break
+                    time.sleep(0.1)
+            finally:
+                for context in reversed(contexts):
+                    context.__exit__(None, None, None)
+            return queue_metrics.local_histograms()
+
+        # In-process broker; lag is read from this process's histograms, not Redis
+        with override_settings(
+            CELERY_BROKER_URL='memory://',
+            CELERY_RESULT_BACKEND='cache+memory://',
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        ):
+            for topology in ('shared', 'dedicated'):
+                histograms = run(topology)
+                adhan = histograms.get(ADHAN_QUEUE, queue_metrics.LagHistogram()).as_dict()
+                ingest = histograms.get(INGEST_QUEUE, queue_metrics.LagHistogram()).as_dict()
+                self.stdout.write(
+                    f"{topology:>9}: adhan lag p50 {adhan['p50_ms']} ms, p95 {adhan['p95_ms']} ms, "
+                    f"max {adhan['max_ms']} ms ({adhan['count']} tasks) | "
+                    f"ingest lag p95 {ingest['p95_ms']} ms, max {ingest['max_ms']} ms"
+                )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from muadhin.task_profiler import profile_summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-task SQL queries, DB time, outbound HTTP and wall time over the last minutes "
+        "(needs TASK_PROFILING on the workers)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=15)
+        parser.add_argument('--sort', choices=['wall_ms', 'queries', 'db_ms', 'http_ms'], default='wall_ms',
+                            help='Sort by total of this field')
+
+    def handle(self, *args, **options):
+        summaries = profile_summary(options['minutes'])
+        if not summaries:
+            self.stdout.write("No profiled tasks, is TASK_PROFILING on?")
+            return
+
+        for name, summary in sorted(summaries.items(), key=lambda item: -item[1].totals[options['sort']]):
+            stats = summary.as_dict()
+            line = (
+                f"{name}: {stats['count']} runs | queries mean {stats['mean_queries']} max {stats['max_queries']:.0f} | "
+                f"db mean {stats['mean_db_ms']} ms | http mean {stats['mean_http_calls']} calls "
+                f"{stats['mean_http_ms']} ms | wall mean {stats['mean_wall_ms']} ms max {stats['max_wall_ms']} ms"
+            )
+            self.stdout.write(line)
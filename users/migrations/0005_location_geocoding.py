@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_add_receive_notifications_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='city',
+            field=models.CharField(blank=True, help_text='Canonical city name from the location dataset', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='country_code',
+            field=models.CharField(blank=True, max_length=2),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='geocoded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='geocoded_from',
+            field=models.CharField(blank=True, help_text='city|country as entered', max_length=201),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='location_key',
+            field=models.CharField(blank=True, db_index=True, help_text='Canonical location, e.g. NG/abuja, the same however the city was spelled', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_location_geocoding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='next_midnight_utc',
+            field=models.DateTimeField(blank=True, db_index=True, help_text="The user's next local midnight, advanced by the scheduler after it passes", null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-19 07:25
+
+import users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_customuser_next_midnight_utc'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='timezone',
+            field=models.CharField(choices=users.models.timezone_choices, default='Africa/Lagos', max_length=100),
+        ),
+    ]
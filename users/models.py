@@ -3,17 +3,19 @@ from django.db import models
 from django.contrib.auth import get_user_model
 import pytz
 from datetime import datetime, time, timedelta
-from phonenumbers import parse, is_valid_number, format_number, PhoneNumberFormat
 from django.core.exceptions import ValidationError
 from subscriptions.models import UserSubscription
 from subscriptions.services.subscription_service import SubscriptionService
+from muadhin.timezones import UTC, get_zone, is_valid_timezone, local_now, localize, next_midnight_utc
 
 
 # Get a list of all valid time zones
 all_timezones = pytz.all_timezones
 
-# Create a list of tuples in the format ('timezone', 'timezone')
-timezone_choices = [(tz, tz) for tz in all_timezones]
+# ('timezone', 'timezone') tuples, a callable so pytz only checks its ~600
+# zone files when the choices are first needed rather than at import
+def timezone_choices():
+    return [(tz, tz) for tz in all_timezones]
 
 # user = get_user_model()
 
@@ -26,6 +28,10 @@ class CustomUser(AbstractUser):
     phone_number = models.CharField(max_length=20, null=True, blank=True)
     last_scheduled_time = models.DateTimeField(null=True, blank=True)
     midnight_utc = models.TimeField(null=True, blank=True)
+    next_midnight_utc = models.DateTimeField(
+        null=True, blank=True, db_index=True,
+        help_text="The user's next local midnight, advanced by the scheduler after it passes"
+    )
     whatsapp_number = models.CharField(max_length=20, null=True, blank=True)
     twitter_handle = models.CharField(max_length=16, blank=True, null=True)
     receive_notifications = models.BooleanField(
@@ -38,29 +44,30 @@ class CustomUser(AbstractUser):
 
     def save(self, *args, **kwargs):
         # FIXED: Add timezone validation
-        if self.timezone not in pytz.all_timezones:
+        if not is_valid_timezone(self.timezone):
             self.timezone = "Africa/Lagos"  # fallback
-            
-        user_timezone = pytz.timezone(self.timezone)
-        now = datetime.now()
-        if now.tzinfo is None:
-            now = user_timezone.localize(now)
-        else:
-            now = now.astimezone(user_timezone)
-        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-        self.midnight_utc = midnight.astimezone(pytz.utc).time()
+
+        if self.next_midnight_utc is None or self.timezone != getattr(self, '_loaded_timezone', None):
+            self.next_midnight_utc = next_midnight_utc(self.timezone)
+            self.midnight_utc = self.next_midnight_utc.time()
         super().save(*args, **kwargs)
+        self._loaded_timezone = self.timezone
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # To recompute next_midnight_utc on save only when the timezone changed
+        instance._loaded_timezone = instance.__dict__.get('timezone')
+        return instance
 
     @property
     def next_midnight(self):
-        user_timezone = pytz.timezone(self.timezone)
-        now = datetime.now()
-        if now.tzinfo is None:
-            now = user_timezone.localize(now)
-        else:
-            now = now.astimezone(user_timezone)
-        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-        return midnight - timedelta(minutes=5)
+        now = datetime.now(UTC)
+        midnight = self.next_midnight_utc
+        if midnight is None or midnight <= now:
+            # Not advanced by the scheduler yet
+            midnight = next_midnight_utc(self.timezone, now)
+        return midnight.astimezone(get_zone(self.timezone)) - timedelta(minutes=5)
     
     @property
     def current_plan(self):
@@ -237,9 +244,8 @@ class UserPreferences(models.Model):
     def save(self, *args, **kwargs):
         # Calculate and store UTC time for 11:59 AM in the user's timezone
         try:
-            user_timezone = pytz.timezone(self.user.timezone)
-            local_time_1159 = datetime.combine(datetime.today(), time(11, 59))
-            utc_time_1159 = user_timezone.localize(local_time_1159).astimezone(pytz.utc).time()
+            local_time_1159 = datetime.combine(local_now(self.user.timezone).date(), time(11, 59))
+            utc_time_1159 = localize(local_time_1159, self.user.timezone).astimezone(UTC).time()
             self.utc_time_for_1159 = utc_time_1159
         except Exception:
             # Fallback if timezone calculation fails
@@ -286,6 +292,17 @@ class Location(models.Model):
     latitude = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
     timezone = models.CharField(max_length=50, null=True, blank=True)
+    # Filled in from the user's city/country on profile save (users/services/geocoding.py)
+    city = models.CharField(max_length=100, blank=True, help_text="Canonical city name from the location dataset")
+    country_code = models.CharField(max_length=2, blank=True)
+    location_key = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text="Canonical location, e.g. NG/abuja, the same however the city was spelled"
+    )
+    geocoded_from = models.CharField(max_length=201, blank=True, help_text="city|country as entered")
+    geocoded_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.user.username}'s location"
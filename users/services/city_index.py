@@ -0,0 +1,354 @@
+"""
+In-memory city index over the offline GeoNames subset (settings.CITY_DATASET_PATH).
+
+City search and autocomplete used to call the GeoNames API for every
+(country, search, limit) combination. The dataset is small enough to keep in
+memory instead: names are folded and kept in sorted arrays, so a prefix search
+is two bisects plus a sort of the matches by population, without any network.
+
+Names and queries are folded (case, diacritics: "Abúja" and "Ṣokoto" match
+"abuja" and "sokoto"). Autocomplete also tolerates typos through precomputed
+trigram postings, and ranks by match quality and population; the MAX_* caps
+bound the work per request.
+
+The dataset file is versioned (a "# version:" header line) and built from a
+GeoNames dump with `manage.py build_city_dataset`; the Docker image builds it
+from cities15000 at build time. Without it city search falls back to the
+GeoNames API. With settings.CITY_INDEX_PATH
+set, processes share a memory-mapped build of this index instead
+(mapped_city_index.py).
+"""
+
+import csv
+import logging
+import math
+import os
+import struct
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from heapq import nlargest
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DATASET_COLUMNS = [
+    'geoname_id', 'name', 'ascii_name', 'country_code', 'admin1',
+    'population', 'latitude', 'longitude', 'timezone', 'feature_code',
+]
+
+# Sorts after any character a name can contain
+_PREFIX_END = '\U0010ffff'
+
+# Autocomplete caps, they bound the work per request whatever the dataset size
+MAX_PREFIX_MATCHES = 2000  # prefix ranges larger than this are left to the postings
+MAX_POSTINGS = 5000  # per trigram, postings are kept largest city first
+MAX_FUZZY_CANDIDATES = 20  # candidates scored with edit distance
+MIN_SHARED_TRIGRAMS = 0.4  # share of the query's trigrams a fuzzy candidate needs
+POPULATION_WEIGHT = 0.2
+
+# Letters NFKD doesn't decompose into a base letter and a mark
+_FOLD_TABLE = str.maketrans({
+    'ı': 'i', 'ø': 'o', 'Ø': 'o', 'ł': 'l', 'Ł': 'l', 'đ': 'd', 'Đ': 'd',
+    'ð': 'd', 'þ': 'th', 'æ': 'ae', 'Æ': 'ae', 'œ': 'oe', 'Œ': 'oe',
+    'ʻ': '', 'ʼ': '', '’': '', "'": '', '-': ' ',
+})
+
+
+@dataclass(frozen=True, slots=True)
+class City:
+    geoname_id: int
+    name: str
+    ascii_name: str
+    country_code: str
+    admin1: str
+    population: int
+    latitude: float
+    longitude: float
+    timezone: str
+    feature_code: str
+
+    @property
+    def is_capital(self) -> bool:
+        return self.feature_code == 'PPLC'
+
+    def to_dict(self) -> Dict:
+        """Same shape as the cities returned by the GeoNames API path"""
+        return {
+            'name': self.name,
+            'admin1': self.admin1,
+            'admin2': '',
+            'population': self.population,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'timezone': self.timezone,
+            'feature_code': self.feature_code,
+            'is_capital': self.is_capital,
+            'geoname_id': self.geoname_id,
+            'country_code': self.country_code,
+        }
+
+
+def fold(text: str) -> str:
+    """Normalize a name or query for matching: case, diacritics, punctuation and spacing"""
+    decomposed = unicodedata.normalize('NFKD', text.translate(_FOLD_TABLE))
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def name_keys(city: City):
+    return {fold(city.name), fold(city.ascii_name)} - {''}
+
+
+def trigrams(key: str, complete: bool = True):
+    """
+    Padded trigrams of a folded key. Queries are matched as typed so far
+    (complete=False): they don't get the end-of-word trigram.
+    """
+    padded = f"  {key} " if complete else f"  {key}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein distance, computed in a band; max_distance + 1 once exceeded"""
+    over = max_distance + 1
+    if abs(len(a) - len(b)) > max_distance:
+        return over
+
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i] + [over] * len(b)
+        for j in range(max(1, i - max_distance), min(len(b), i + max_distance) + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char != b[j - 1]),
+            )
+        if min(current) > max_distance:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+def text_score(key: str, city: City) -> float:
+    """How well a folded query matches a city's names, 0 when it doesn't"""
+    best = 0.0
+    allowed = max(1, len(key) // 4)  # one typo per four characters
+    for name in name_keys(city):
+        if name == key:
+            return 1.0
+        if name.startswith(key):
+            best = max(best, 0.9)
+        elif f" {key}" in f" {name}":
+            # Start of a later word, e.g. "harcourt"
+            best = max(best, 0.8)
+        else:
+            distance = min(
+                edit_distance(key, name[:length], allowed)
+                for length in (len(key) - 1, len(key), len(key) + 1, len(name))
+            )
+            if distance <= allowed:
+                best = max(best, 0.7 * (1 - distance / (len(key) + 1)))
+    return best
+
+
+def population_score(population: int) -> float:
+    return min(1.0, math.log10(population + 1) / 7)
+
+
+class RankedSearch:
+    """
+    search() and autocomplete() on top of an index's primitives:
+    _prefix_positions(), _top_positions(), _postings(), city(), population()
+    and country_of().
+    """
+
+    def search(self, prefix: str = '', country_code: Optional[str] = None, limit: int = 100) -> List[City]:
+        """Cities whose name starts with prefix, largest first"""
+        country_code = country_code.upper() if country_code else None
+        key = fold(prefix)
+        if not key:
+            return [self.city(p) for p in self._top_positions(country_code, limit)]
+
+        matches = set(self._prefix_positions(key, country_code))
+        return [self.city(p) for p in nlargest(limit, matches, key=self.population)]
+
+    def autocomplete(self, query: str, country_code: Optional[str] = None, limit: int = 10) -> List[City]:
+        """
+        Ranked, typo- and accent-tolerant matches: exact and prefix matches
+        first, then trigram candidates checked with edit distance, each
+        weighted by population.
+        """
+        country_code = country_code.upper() if country_code else None
+        key = fold(query)
+        if not key:
+            return self.search('', country_code, limit)
+
+        candidates = set()
+        prefix_positions = self._prefix_positions(key, country_code)
+        if len(prefix_positions) <= MAX_PREFIX_MATCHES:
+            candidates.update(prefix_positions)
+
+        query_grams = trigrams(key, complete=False)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self._postings(gram)[:MAX_POSTINGS])
+        needed = max(1, math.ceil(len(query_grams) * MIN_SHARED_TRIGRAMS))
+        fuzzy = [
+            position for position, count in shared.items()
+            if count >= needed and (not country_code or self.country_of(position) == country_code)
+        ]
+        candidates.update(nlargest(MAX_FUZZY_CANDIDATES, fuzzy, key=lambda p: (shared[p], self.population(p))))
+
+        scored = []
+        for position in candidates:
+            city = self.city(position)
+            score = text_score(key, city)
+            if score:
+                scored.append((score + POPULATION_WEIGHT * population_score(city.population), city))
+        scored.sort(key=lambda item: -item[0])
+        return [city for _, city in scored[:limit]]
+
+
+class CityIndex(RankedSearch):
+    """Sorted-array prefix index per country and worldwide, and trigram postings"""
+
+    def __init__(self, cities: List[City], version: str = ''):
+        self.version = version
+        self.cities = cities
+
+        global_entries = []
+        country_entries = []
+        by_country = {}
+        postings = {}
+        for position, city in enumerate(cities):
+            grams = set()
+            for key in name_keys(city):
+                global_entries.append((key, position))
+                country_entries.append((f"{city.country_code}|{key}", position))
+                grams |= trigrams(key)
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+            by_country.setdefault(city.country_code, []).append(position)
+
+        global_entries.sort()
+        country_entries.sort()
+        self._global_keys = [key for key, _ in global_entries]
+        self._global_positions = [position for _, position in global_entries]
+        self._country_keys = [key for key, _ in country_entries]
+        self._country_positions = [position for _, position in country_entries]
+
+        def by_population(positions):
+            return sorted(positions, key=lambda p: -cities[p].population)
+
+        # Empty searches return the largest cities
+        self._by_population = {
+            country_code: by_population(positions) for country_code, positions in by_country.items()
+        }
+        self._all_by_population = by_population(range(len(cities)))
+        self._trigram_postings = {gram: by_population(positions) for gram, positions in postings.items()}
+
+    def __len__(self):
+        return len(self.cities)
+
+    def has_country(self, country_code: str) -> bool:
+        return country_code.upper() in self._by_population
+
+    def city(self, position: int) -> City:
+        return self.cities[position]
+
+    def population(self, position: int) -> int:
+        return self.cities[position].population
+
+    def country_of(self, position: int) -> str:
+        return self.cities[position].country_code
+
+    def _top_positions(self, country_code, limit):
+        positions = self._by_population.get(country_code, []) if country_code else self._all_by_population
+        return positions[:limit]
+
+    def _prefix_positions(self, key, country_code):
+        if country_code:
+            keys, positions, key = self._country_keys, self._country_positions, f"{country_code}|{key}"
+        else:
+            keys, positions = self._global_keys, self._global_positions
+        lo = bisect_left(keys, key)
+        hi = bisect_left(keys, key + _PREFIX_END, lo)
+        return positions[lo:hi]
+
+    def _postings(self, gram):
+        return self._trigram_postings.get(gram, [])
+
+
+def read_dataset(path: str):
+    """Read a dataset file, returns (cities, version)"""
+    version = ''
+    cities = []
+    with open(path, encoding='utf-8', newline='') as f:
+        rows = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+        header = None
+        for row in rows:
+            if not row:
+                continue
+            if row[0].startswith('#'):
+                if row[0].startswith('# version:'):
+                    version = row[0].split(':', 1)[1].strip()
+                continue
+            if header is None:
+                header = row
+                continue
+
+            record = dict(zip(header, row))
+            try:
+                cities.append(City(
+                    geoname_id=int(record['geoname_id'] or 0),
+                    name=record['name'],
+                    ascii_name=record['ascii_name'],
+                    country_code=record['country_code'].upper(),
+                    admin1=record['admin1'],
+                    population=int(record['population'] or 0),
+                    latitude=float(record['latitude']),
+                    longitude=float(record['longitude']),
+                    timezone=record['timezone'],
+                    feature_code=record['feature_code'],
+                ))
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Skipping bad city row {row}: {e}")
+    return cities, version
+
+
+@lru_cache(maxsize=4)
+def load_city_index(path: str, index_path: Optional[str] = None):
+    """
+    The memory-mapped index for a dataset when index_path is given (see
+    mapped_city_index.py), otherwise or if that fails an in-memory CityIndex
+    """
+    if index_path:
+        from .mapped_city_index import open_mapped_index
+        try:
+            index = open_mapped_index(path, index_path)
+            if index is not None:
+                return index
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Mapped city index {index_path} unavailable, loading in memory: {e}")
+
+    cities, version = read_dataset(path)
+    logger.info(f"Loaded city dataset {version or 'unversioned'} with {len(cities)} cities")
+    return CityIndex(cities, version)
+
+
+def get_city_index():
+    """The process-wide index for settings.CITY_DATASET_PATH, None if it can't be read"""
+    path = getattr(settings, 'CITY_DATASET_PATH', None)
+    if not path or not os.path.exists(path):
+        # Not built here (manage.py build_city_dataset), callers use the GeoNames API
+        return None
+    try:
+        return load_city_index(path, getattr(settings, 'CITY_INDEX_PATH', None))
+    except OSError as e:
+        logger.error(f"City dataset {path} unavailable: {e}")
+        return None
@@ -0,0 +1,189 @@
+"""
+Resolves a user's free-text city/country to coordinates and a canonical
+location key with the offline city dataset, once, when the profile is saved.
+
+The key ("NG/abuja") is the same for "Abuja", "ABUJA" or "Abuj", so caches
+of timetables or a local prayer-time calculator can key on it (or on the
+stored coordinates) instead of on whatever the user typed.
+
+timings_request() asks Aladhan for a geocoded user's timetable by those
+coordinates, and only falls back to the free-text timingsByCity lookup for
+users whose city didn't resolve.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import pycountry
+from django.conf import settings
+from django.utils import timezone
+
+from .city_index import edit_distance, fold, get_city_index, name_keys
+
+logger = logging.getLogger(__name__)
+
+# Free-text country names pycountry doesn't know
+COUNTRY_ALIASES = {
+    'uk': 'GB',
+    'england': 'GB',
+    'scotland': 'GB',
+    'wales': 'GB',
+    'usa': 'US',
+    'america': 'US',
+    'uae': 'AE',
+    'turkey': 'TR',
+    'russia': 'RU',
+    'ivory coast': 'CI',
+    'palestine': 'PS',
+}
+
+# Autocomplete candidates checked for a whole-name match
+GEOCODE_CANDIDATES = 10
+
+
+@dataclass
+class GeocodeResult:
+    city: str
+    country_code: str
+    admin1: str
+    latitude: float
+    longitude: float
+    timezone: str
+    location_key: str
+
+
+def location_key(country_code: str, city_name: str) -> str:
+    return f"{country_code}/{fold(city_name)}"[:64]
+
+
+def resolve_country_code(country: str) -> Optional[str]:
+    """ISO 3166 alpha-2 code for a country name or code, None if unknown"""
+    folded = fold(country or '')
+    if not folded:
+        return None
+    if folded in COUNTRY_ALIASES:
+        return COUNTRY_ALIASES[folded]
+    try:
+        return pycountry.countries.lookup(country.strip()).alpha_2
+    except LookupError:
+        pass
+    try:
+        return pycountry.countries.search_fuzzy(country.strip())[0].alpha_2
+    except LookupError:
+        return None
+
+
+def name_distance(key: str, city) -> int:
+    """
+    Edit distance between a folded name and a city's whole name or ASCII
+    name, allowing one typo per four characters; larger distances come back
+    as that limit + 1. Prefixes don't count: "York" is not New York City.
+    """
+    allowed = len(key) // 4
+    return min(edit_distance(key, name, allowed) for name in name_keys(city))
+
+
+def geocode(city: str, country: str) -> Optional[GeocodeResult]:
+    """
+    The dataset city in a country whose name matches the input exactly
+    (after folding) or within a typo or two, None if there is none
+    """
+    country_code = resolve_country_code(country)
+    index = get_city_index()
+    key = fold(city or '')
+    if not country_code or index is None or not key:
+        return None
+
+    candidates = index.autocomplete(city, country_code, limit=GEOCODE_CANDIDATES)
+    exact = [candidate for candidate in candidates if key in name_keys(candidate)]
+    close = [candidate for candidate in candidates if name_distance(key, candidate) <= len(key) // 4]
+    if not exact and not close:
+        return None
+
+    match = (exact or close)[0]
+    return GeocodeResult(
+        city=match.name,
+        country_code=match.country_code,
+        admin1=match.admin1,
+        latitude=match.latitude,
+        longitude=match.longitude,
+        timezone=match.timezone,
+        location_key=location_key(match.country_code, match.ascii_name or match.name),
+    )
+
+
+def geocoded_from(user) -> str:
+    """The input a Location was geocoded from, to skip unchanged profiles"""
+    return f"{user.city}|{user.country}"[:201]
+
+
+def geocode_user(user, force=False):
+    """
+    Geocode a user's city/country into their Location. Skips users whose
+    city/country didn't change since the last run unless force is set.
+    Returns the Location, or None if the city couldn't be resolved.
+    """
+    from users.models import Location
+
+    source = geocoded_from(user)
+    location = Location.objects.filter(user=user).first()
+    if location and location.geocoded_from == source and not force:
+        return location
+
+    result = geocode(user.city, user.country)
+    if result is None:
+        logger.info(f"Could not geocode {source!r} for user {user.id}")
+        if location and location.location_key:
+            # Don't keep coordinates of a city the user moved away from
+            location.latitude = location.longitude = None
+            location.city = location.country_code = location.location_key = ''
+            location.geocoded_from = source
+            location.geocoded_at = timezone.now()
+            location.save()
+        return None
+
+    location, _ = Location.objects.update_or_create(
+        user=user,
+        defaults={
+            'latitude': round(result.latitude, 6),
+            'longitude': round(result.longitude, 6),
+            'timezone': result.timezone,
+            'city': result.city,
+            'country_code': result.country_code,
+            'location_key': result.location_key,
+            'geocoded_from': source,
+            'geocoded_at': timezone.now(),
+        }
+    )
+    return location
+
+
+def geocoded_location(user):
+    """The user's Location if it was geocoded from their current city/country, else None"""
+    from users.models import Location
+
+    return Location.objects.filter(
+        user_id=user.pk, geocoded_from=geocoded_from(user),
+        latitude__isnull=False, longitude__isnull=False,
+    ).exclude(location_key='').only('latitude', 'longitude').first()
+
+
+def timings_request(user, date: str, method: int) -> Tuple[str, Dict]:
+    """
+    Aladhan URL and params for the user's timings on date (DD-MM-YYYY): by
+    coordinates when their city was geocoded, by city and country otherwise
+    """
+    location = geocoded_location(user)
+    if location is not None:
+        return f"{settings.ALADHAN_API_URL}/timings/{date}", {
+            "latitude": str(location.latitude),
+            "longitude": str(location.longitude),
+            "method": method,
+        }
+    return f"{settings.ALADHAN_API_URL}/timingsByCity", {
+        "date": date,
+        "city": user.city,
+        "country": user.country,
+        "method": method,
+    }
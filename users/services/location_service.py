@@ -1,12 +1,16 @@
 import requests
 import pycountry
-from django.core.cache import cache
+from muadhin.cache import get_or_set_locked, namespaced_key
+from .city_index import edit_distance, fold, get_city_index
 from django.conf import settings
 import logging
 from typing import List, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
+# invalidate_namespace(LOCATION_CACHE_NAMESPACE) drops all cached location data
+LOCATION_CACHE_NAMESPACE = 'location'
+
 
 class LocationService:
     """
@@ -26,12 +30,14 @@ class LocationService:
         """
         Get all countries from REST Countries API with fallback to pycountry
         """
-        cache_key = f"countries_{filter_type}_{search}"
-        cached_data = cache.get(cache_key)
-        
-        if cached_data:
-            return cached_data
-        
+        cache_key = namespaced_key(LOCATION_CACHE_NAMESPACE, f"countries_{filter_type}_{search}")
+        return get_or_set_locked(
+            cache_key,
+            lambda: self._load_countries(filter_type, search),
+            self.cache_timeout
+        )
+    
+    def _load_countries(self, filter_type: str, search: str) -> List[Dict]:
         try:
             # Try REST Countries API first
             countries = self._fetch_from_rest_countries()
@@ -49,28 +55,55 @@ class LocationService:
         if search:
             countries = self._search_countries(countries, search)
         
-        # Cache the result
-        cache.set(cache_key, countries, self.cache_timeout)
         return countries
     
     def get_cities_for_country(self, country_code: str, search: str = '', limit: int = 100) -> List[Dict]:
         """
-        Get cities for a country from GeoNames API
+        Get cities for a country from the offline dataset, or the GeoNames API
+        for countries it covers sparsely and searches it has no match for
         """
-        cache_key = f"cities_{country_code}_{search}_{limit}"
-        cached_data = cache.get(cache_key)
-        
-        if cached_data:
-            return cached_data
+        if self.has_offline_cities(country_code):
+            cities = [city.to_dict() for city in get_city_index().search(search, country_code, limit)]
+            if cities or not search:
+                return cities
         
+        cache_key = namespaced_key(LOCATION_CACHE_NAMESPACE, f"cities_{country_code}_{search}_{limit}")
+        return get_or_set_locked(
+            cache_key,
+            lambda: self._load_cities(country_code, search, limit),
+            self.cache_timeout
+        )
+    
+    def autocomplete_cities(self, query: str, country_code: str = '', limit: int = 10) -> List[Dict]:
+        """
+        Ranked, typo- and accent-tolerant city matches from the offline dataset,
+        in one country or all of them
+        """
+        if country_code and not self.has_offline_cities(country_code):
+            return self.get_cities_for_country(country_code, query, limit)[:limit]
+        index = get_city_index()
+        if index is None:
+            return []
+        cities = [city.to_dict() for city in index.autocomplete(query, country_code or None, limit)]
+        if not cities and country_code:
+            return self.get_cities_for_country(country_code, query, limit)[:limit]
+        return cities
+    
+    def has_offline_cities(self, country_code: str) -> bool:
+        """Whether the offline dataset holds at least OFFLINE_CITIES_MIN_PER_COUNTRY cities for the country"""
+        index = get_city_index()
+        if index is None or not index.has_country(country_code):
+            return False
+        minimum = getattr(settings, 'OFFLINE_CITIES_MIN_PER_COUNTRY', 20)
+        return len(index.search('', country_code, minimum)) >= minimum
+    
+    def _load_cities(self, country_code: str, search: str, limit: int) -> List[Dict]:
         try:
             cities = self._fetch_cities_from_geonames(country_code, search, limit)
         except Exception as e:
             logger.error(f"GeoNames API failed for {country_code}: {e}")
             cities = self._get_fallback_cities(country_code)
         
-        # Cache the result
-        cache.set(cache_key, cities, self.cache_timeout)
         return cities
     
     def _fetch_from_rest_countries(self) -> List[Dict]:
@@ -241,11 +274,30 @@ class LocationService:
         return [c for c in countries if c['code'] in muslim_codes]
     
     def _search_countries(self, countries: List[Dict], search: str) -> List[Dict]:
-        """Search countries by name or code"""
-        search_lower = search.lower()
-        return [
-            country for country in countries
-            if (search_lower in country['name'].lower() or 
-                search_lower in country['code'].lower() or
-                search_lower in country.get('official_name', '').lower())
-        ]
+        """
+        Search countries by name or code, accent-insensitive and ranked:
+        exact name or code, name prefix, word prefix, substring, then near
+        misses (typos)
+        """
+        key = fold(search)
+        if not key:
+            return countries
+        
+        ranked = []
+        for country in countries:
+            names = [fold(country['name']), fold(country.get('official_name', ''))]
+            if key in names or key == country['code'].lower() or key == country.get('code3', '').lower():
+                rank = 0
+            elif any(name.startswith(key) for name in names):
+                rank = 1
+            elif any(f" {key}" in f" {name}" for name in names):
+                rank = 2
+            elif any(key in name for name in names):
+                rank = 3
+            elif len(key) >= 4 and edit_distance(key, names[0][:len(key)], 1) <= 1:
+                rank = 4
+            else:
+                continue
+            ranked.append((rank, -country.get('population', 0), country['name'], country))
+        
+        return [country for *_, country in sorted(ranked, key=lambda item: item[:3])]
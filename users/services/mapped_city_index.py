@@ -0,0 +1,292 @@
+"""
+Read-only binary city index, memory-mapped by every process.
+
+Each gunicorn and Celery process used to hold its own copy of the city index.
+The index is instead written once to a file (users/data/cities.idx by default)
+and mmap'd: the OS keeps a single page-cache copy shared by all processes, a
+worker only faults in the pages it touches, and opening it is instant.
+
+Layout (little-endian):
+
+    header        MAGIC, format version, dataset version, counts and section offsets
+    records       fixed-size packed City records (RECORD)
+    strings       UTF-8 "name\\tascii_name\\tadmin1\\ttimezone\\tfeature_code" per record
+    global keys   sorted folded names: u32 offsets (n+1) into a key blob, u32 record positions
+    country keys  the same for b"CC|name"
+    population    u32 record positions, largest first, grouped by country
+    countries     (country code, start, count) into the population section, sorted by code
+    trigrams      sorted trigram keys (as above), u32 postings starts (n+1), u32 postings
+                  (record positions, largest first) for autocomplete
+
+Keys are compared as UTF-8 bytes, which sort in the same order as the
+strings. Offsets and positions are read through memoryview casts of the map,
+so a lookup copies nothing but the few short keys the bisect compares.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import List, Optional
+
+from .city_index import City, RankedSearch, name_keys, read_dataset, trigrams
+
+MAGIC = b'MCIX'
+FORMAT_VERSION = 2
+
+# magic, format, dataset version, records, global keys, country keys, countries,
+# trigrams, then offsets of: records, strings, global key offsets/blob/positions,
+# country key offsets/blob/positions, population, countries, trigram key
+# offsets/blob, postings starts, postings (and two spare)
+HEADER = struct.Struct('<4sH32sIIIII16Q')
+
+# geoname_id, population, latitude, longitude, country code, string length, string offset
+RECORD = struct.Struct('<IIdd2sHI')
+
+COUNTRY = struct.Struct('<2sII')
+
+_KEY_END = b'\xff'
+
+
+def _u32_array(values):
+    data = array('I', values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+
+def _key_section(entries):
+    """entries: sorted (key bytes, position), returns (offsets, blob, positions) bytes"""
+    offsets = [0]
+    blob = bytearray()
+    for key, _ in entries:
+        blob += key
+        offsets.append(len(blob))
+    return _u32_array(offsets), bytes(blob), _u32_array(position for _, position in entries)
+
+
+def write_index(cities: List[City], version: str, path: str):
+    """Write the binary index for a dataset, atomically replacing path"""
+    records = bytearray()
+    strings = bytearray()
+    global_entries = []
+    country_entries = []
+    by_country = {}
+    postings = {}
+
+    for position, city in enumerate(cities):
+        text = '\t'.join([city.name, city.ascii_name, city.admin1, city.timezone, city.feature_code]).encode('utf-8')
+        records += RECORD.pack(
+            city.geoname_id, city.population, city.latitude, city.longitude,
+            city.country_code.encode('ascii'), len(text), len(strings)
+        )
+        strings += text
+
+        grams = set()
+        for key in name_keys(city):
+            grams |= trigrams(key)
+            key = key.encode('utf-8')
+            global_entries.append((key, position))
+            country_entries.append((city.country_code.encode('ascii') + b'|' + key, position))
+        for gram in grams:
+            postings.setdefault(gram.encode('utf-8'), []).append(position)
+        by_country.setdefault(city.country_code, []).append(position)
+
+    global_entries.sort()
+    country_entries.sort()
+
+    population = []
+    countries = bytearray()
+    for country_code in sorted(by_country):
+        positions = sorted(by_country[country_code], key=lambda p: -cities[p].population)
+        countries += COUNTRY.pack(country_code.encode('ascii'), len(population), len(positions))
+        population.extend(positions)
+    all_by_population = sorted(range(len(cities)), key=lambda p: -cities[p].population)
+
+    gram_entries = sorted((gram, 0) for gram in postings)
+    postings_starts = [0]
+    postings_positions = []
+    for gram, _ in gram_entries:
+        postings_positions.extend(sorted(postings[gram], key=lambda p: -cities[p].population))
+        postings_starts.append(len(postings_positions))
+    gram_offsets, gram_blob, _ = _key_section(gram_entries)
+
+    sections = [
+        bytes(records),
+        bytes(strings),
+        *_key_section(global_entries),
+        *_key_section(country_entries),
+        _u32_array(population + all_by_population),
+        bytes(countries),
+        gram_offsets,
+        gram_blob,
+        _u32_array(postings_starts),
+        _u32_array(postings_positions),
+    ]
+
+    offsets = []
+    position = HEADER.size
+    for section in sections:
+        # 8-byte aligned so the u32 casts are aligned too
+        position += -position % 8
+        offsets.append(position)
+        position += len(section)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cities-', suffix='.idx')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(
+                MAGIC, FORMAT_VERSION, version.encode('utf-8')[:32],
+                len(cities), len(global_entries), len(country_entries), len(by_country), len(gram_entries),
+                *offsets, 0, 0
+            ))
+            for offset, section in zip(offsets, sections):
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(section)
+        # mkstemp creates 0600, workers may run as another user
+        os.chmod(tmp_path, 0o644)
+        # Processes that already mapped the old file keep reading it
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class MappedCityIndex(RankedSearch):
+    """Same interface as CityIndex, backed by an mmap'd index file"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        (magic, format_version, version, self._record_count, global_count, country_count,
+         country_table_count, self._gram_count, *offsets) = HEADER.unpack_from(self._map)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a city index (format {FORMAT_VERSION})")
+
+        self.version = version.rstrip(b'\0').decode('utf-8')
+        (self._records_at, self._strings_at,
+         global_offsets_at, self._global_blob_at, global_positions_at,
+         country_offsets_at, self._country_blob_at, country_positions_at,
+         population_at, countries_at, gram_offsets_at, self._gram_blob_at,
+         postings_starts_at, postings_at, *_) = offsets
+
+        self._global_offsets = self._u32(global_offsets_at, global_count + 1)
+        self._global_positions = self._u32(global_positions_at, global_count)
+        self._country_offsets = self._u32(country_offsets_at, country_count + 1)
+        self._country_positions = self._u32(country_positions_at, country_count)
+        self._population = self._u32(population_at, 2 * self._record_count)
+        self._gram_offsets = self._u32(gram_offsets_at, self._gram_count + 1)
+        self._postings_starts = self._u32(postings_starts_at, self._gram_count + 1)
+        self._postings_positions = self._u32(postings_at, self._postings_starts[self._gram_count])
+
+        self._countries = {}
+        for i in range(country_table_count):
+            code, start, count = COUNTRY.unpack_from(self._map, countries_at + i * COUNTRY.size)
+            self._countries[code.decode('ascii')] = (start, count)
+
+    def _u32(self, offset, count):
+        return self._view[offset:offset + 4 * count].cast('I')
+
+    def __len__(self):
+        return self._record_count
+
+    def has_country(self, country_code: str) -> bool:
+        return country_code.upper() in self._countries
+
+    def city(self, position: int) -> City:
+        geoname_id, population, latitude, longitude, country_code, length, offset = RECORD.unpack_from(
+            self._map, self._records_at + position * RECORD.size
+        )
+        start = self._strings_at + offset
+        name, ascii_name, admin1, timezone, feature_code = str(
+            self._view[start:start + length], 'utf-8'
+        ).split('\t')
+        return City(
+            geoname_id=geoname_id,
+            name=name,
+            ascii_name=ascii_name,
+            country_code=country_code.decode('ascii'),
+            admin1=admin1,
+            population=population,
+            latitude=latitude,
+            longitude=longitude,
+            timezone=timezone,
+            feature_code=feature_code,
+        )
+
+    def population(self, position: int) -> int:
+        return struct.unpack_from('<I', self._map, self._records_at + position * RECORD.size + 4)[0]
+
+    def _bisect(self, offsets, blob_at, count, key, lo=0):
+        while lo < count:
+            mid = (lo + count) // 2
+            if self._key_at(offsets, blob_at, mid) < key:
+                lo = mid + 1
+            else:
+                count = mid
+        return lo
+
+    def country_of(self, position: int) -> str:
+        offset = self._records_at + position * RECORD.size + 24
+        return str(self._view[offset:offset + 2], 'ascii')
+
+    def _key_at(self, offsets, blob_at, i):
+        # bytes() of a short key, the only copy in a lookup
+        return bytes(self._view[blob_at + offsets[i]:blob_at + offsets[i + 1]])
+
+    def _top_positions(self, country_code, limit):
+        if country_code:
+            start, count = self._countries.get(country_code, (0, 0))
+        else:
+            start, count = self._record_count, self._record_count
+        return self._population[start:start + min(count, limit)]
+
+    def _prefix_positions(self, key, country_code):
+        key = key.encode('utf-8')
+        if country_code:
+            offsets, blob_at, positions = self._country_offsets, self._country_blob_at, self._country_positions
+            key = country_code.encode('ascii') + b'|' + key
+        else:
+            offsets, blob_at, positions = self._global_offsets, self._global_blob_at, self._global_positions
+
+        count = len(positions)
+        lo = self._bisect(offsets, blob_at, count, key)
+        hi = self._bisect(offsets, blob_at, count, key + _KEY_END, lo)
+        return positions[lo:hi]
+
+    def _postings(self, gram):
+        gram = gram.encode('utf-8')
+        i = self._bisect(self._gram_offsets, self._gram_blob_at, self._gram_count, gram)
+        if i == self._gram_count or self._key_at(self._gram_offsets, self._gram_blob_at, i) != gram:
+            return ()
+        return self._postings_positions[self._postings_starts[i]:self._postings_starts[i + 1]]
+
+
+def _needs_build(dataset_path, index_path):
+    """Missing, older than the dataset, or written by another format version"""
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(dataset_path):
+        return True
+    with open(index_path, 'rb') as f:
+        header = f.read(6)
+    return header != struct.pack('<4sH', MAGIC, FORMAT_VERSION)
+
+
+def open_mapped_index(dataset_path: str, index_path: str) -> Optional[MappedCityIndex]:
+    """
+    Map the index file, (re)building it first when it is missing or older
+    than the dataset. Returns None where mmap'd u32 arrays can't be read as is.
+    """
+    if sys.byteorder != 'little':
+        return None
+
+    if _needs_build(dataset_path, index_path):
+        cities, version = read_dataset(dataset_path)
+        write_index(cities, version, index_path)
+
+    return MappedCityIndex(index_path)
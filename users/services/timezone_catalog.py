@@ -0,0 +1,225 @@
+"""
+Precomputed timezone catalog for the timezone endpoints.
+
+TimezonesAPIView used to build labels and UTC offsets for ~600 zones on every
+request. The catalog computes each zone's offset, DST flag, continent and
+label once per process and keeps the serialized (and gzipped) response bodies
+with their ETag, so a request is a dict lookup.
+
+Offsets change at DST transitions, so the catalog is valid until the next
+transition of any zone (or for a day at most, for tzdata updates) and is
+rebuilt on the first request after that.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+MAX_CATALOG_AGE = timedelta(days=1)
+
+COMMON_TIMEZONES = [
+    # Africa
+    'Africa/Lagos', 'Africa/Cairo', 'Africa/Johannesburg', 'Africa/Nairobi',
+    'Africa/Casablanca', 'Africa/Tunis', 'Africa/Algiers', 'Africa/Addis_Ababa',
+
+    # Asia
+    'Asia/Dubai', 'Asia/Karachi', 'Asia/Kolkata', 'Asia/Jakarta',
+    'Asia/Tokyo', 'Asia/Shanghai', 'Asia/Seoul', 'Asia/Singapore',
+    'Asia/Bangkok', 'Asia/Manila', 'Asia/Riyadh', 'Asia/Tehran',
+
+    # Europe
+    'Europe/London', 'Europe/Paris', 'Europe/Berlin', 'Europe/Rome',
+    'Europe/Madrid', 'Europe/Amsterdam', 'Europe/Brussels', 'Europe/Vienna',
+
+    # Americas
+    'America/New_York', 'America/Los_Angeles', 'America/Chicago', 'America/Denver',
+    'America/Toronto', 'America/Vancouver', 'America/Mexico_City', 'America/Sao_Paulo',
+
+    # Others
+    'Australia/Sydney', 'Australia/Melbourne', 'Pacific/Auckland'
+]
+
+AVAILABLE_FILTERS = ['all', 'common', 'continent']
+
+
+@dataclass(frozen=True)
+class TimezoneInfo:
+    name: str
+    continent: str
+    city: str
+    offset_seconds: int
+    is_dst: bool
+
+    @property
+    def utc_offset(self) -> str:
+        """+05:30 / -08:00"""
+        sign = '-' if self.offset_seconds < 0 else '+'
+        minutes = abs(self.offset_seconds) // 60
+        return f"{sign}{minutes // 60:02d}:{minutes % 60:02d}"
+
+    @property
+    def label(self) -> str:
+        if '/' not in self.name:
+            return self.name
+        return f"{self.city} ({self.continent}) - UTC{self.utc_offset}"
+
+    def as_option(self) -> Dict:
+        return {
+            'value': self.name,
+            'label': self.label,
+            'continent': self.continent,
+            'city': self.city,
+            'utc_offset': self.utc_offset,
+        }
+
+
+@dataclass
+class CachedBody:
+    content: bytes
+    gzipped: bytes
+    etag: str
+
+
+@dataclass
+class TimezoneCatalog:
+    built_at: datetime
+    valid_until: datetime
+    zones: Dict[str, TimezoneInfo]
+    continents: List[str]
+    _bodies: Dict[Tuple, CachedBody] = field(default_factory=dict)
+
+    def options(self, filter_type: str, continent: Optional[str] = None) -> List[Dict]:
+        if filter_type == 'all':
+            names = sorted(self.zones)
+        elif filter_type == 'continent' and continent:
+            names = sorted(name for name in self.zones if name.startswith(f"{continent}/"))
+        else:
+            names = [name for name in COMMON_TIMEZONES if name in self.zones]
+        return [self.zones[name].as_option() for name in names]
+
+    def body(self, filter_type: str, continent: Optional[str] = None) -> CachedBody:
+        """Serialized TimezonesAPIView response for a filter, built once per catalog"""
+        if filter_type not in AVAILABLE_FILTERS:
+            filter_type = 'common'
+        if filter_type != 'continent' or not continent:
+            continent = None
+        elif continent not in self.continents:
+            # Keeps the number of cached bodies bounded, the list is empty anyway
+            continent = ''
+
+        key = (filter_type, continent)
+        cached = self._bodies.get(key)
+        if cached is None:
+            timezones = self.options(filter_type, continent)
+            content = json.dumps({
+                'timezones': timezones,
+                'total_count': len(timezones),
+                'filter_applied': filter_type,
+                'available_filters': AVAILABLE_FILTERS,
+                'available_continents': self.continents,
+            }, separators=(',', ':')).encode('utf-8')
+            cached = CachedBody(
+                content=content,
+                gzipped=gzip.compress(content, mtime=0),
+                etag=f'"{hashlib.sha1(content).hexdigest()}"',
+            )
+            self._bodies[key] = cached
+        return cached
+
+
+def _split_name(name):
+    if '/' not in name:
+        return 'Other', name
+    return name.split('/')[0], name.split('/')[-1].replace('_', ' ')
+
+
+def _next_transition(tz, now):
+    """Next UTC offset change of a pytz zone after now (naive UTC), None if none is known"""
+    transitions = getattr(tz, '_utc_transition_times', None)
+    if not transitions:
+        return None
+    i = bisect_right(transitions, now)
+    return transitions[i] if i < len(transitions) else None
+
+
+def build_catalog(now: Optional[datetime] = None) -> TimezoneCatalog:
+    now = now or datetime.now(pytz.utc)
+    naive_now = now.astimezone(pytz.utc).replace(tzinfo=None)
+    valid_until = naive_now + MAX_CATALOG_AGE
+
+    zones = {}
+    continents = set()
+    for name in pytz.all_timezones:
+        tz = pytz.timezone(name)
+        local = now.astimezone(tz)
+        continent, city = _split_name(name)
+        if '/' in name:
+            continents.add(continent)
+        dst = local.dst()
+        zones[name] = TimezoneInfo(
+            name=name,
+            continent=continent,
+            city=city,
+            offset_seconds=int(local.utcoffset().total_seconds()),
+            is_dst=bool(dst and dst.total_seconds()),
+        )
+
+        transition = _next_transition(tz, naive_now)
+        if transition is not None and transition < valid_until:
+            valid_until = transition
+
+    return TimezoneCatalog(
+        built_at=now,
+        valid_until=pytz.utc.localize(valid_until),
+        zones=zones,
+        continents=sorted(continents),
+    )
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_timezone_catalog(now: Optional[datetime] = None) -> TimezoneCatalog:
+    """The process-wide catalog, rebuilt after the next DST transition"""
+    global _catalog
+    now = now or datetime.now(pytz.utc)
+    catalog = _catalog
+    if catalog is None or now >= catalog.valid_until:
+        with _catalog_lock:
+            if _catalog is None or now >= _catalog.valid_until:
+                _catalog = build_catalog(now)
+            catalog = _catalog
+    return catalog
+
+
+def catalog_response(request, body: CachedBody, catalog: TimezoneCatalog) -> HttpResponse:
+    """
+    Serve a pre-serialized body: 304 on a matching If-None-Match, gzipped
+    when the client accepts it, cacheable until the catalog expires
+    """
+    max_age = max(0, int((catalog.valid_until - datetime.now(pytz.utc)).total_seconds()))
+
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if body.etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(body.gzipped, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(body.content, content_type='application/json')
+
+    response['ETag'] = body.etag
+    response['Cache-Control'] = f"public, max-age={max_age}"
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
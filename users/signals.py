@@ -4,6 +4,7 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
 from .models import UserPreferences, PrayerMethod, PrayerOffset
+from .services.geocoding import geocode_user
 from subscriptions.models import SubscriptionPlan, UserSubscription
 
 
@@ -137,3 +138,19 @@ def save_user_profile(sender, instance, **kwargs):
             
     except Exception as e:
         print(f"❌ Error saving user profile for {instance.username}: {str(e)}")
+
+
+@receiver(post_save, sender=User)
+def geocode_user_location(sender, instance, update_fields=None, **kwargs):
+    """
+    Resolve the user's city/country to coordinates and a location key with the
+    local dataset. Cheap (no network) and skipped when city/country didn't change.
+    """
+    if kwargs.get('raw'):
+        return
+    if update_fields is not None and not {'city', 'country'} & set(update_fields):
+        return
+    try:
+        geocode_user(instance)
+    except Exception as e:
+        print(f"⚠️ Could not geocode location for {instance.username}: {str(e)}")
@@ -2,9 +2,11 @@ from celery import Celery, shared_task
 from celery.schedules import crontab
 # from .models import User  # Import your user profile model
 from SalatTracker.models import DailyPrayer, PrayerTime
+from SalatTracker.dashboard_snapshot import refresh_dashboard_snapshot
 from SalatTracker.tasks import fetch_and_save_daily_prayer_times, schedule_notifications_for_day, schedule_phone_calls_for_day, send_daily_prayer_message
 from django.contrib.auth import get_user_model
-import pytz
+from muadhin.timezones import next_midnight_utc, next_midnights_utc
+from muadhin.metrics import aladhan_fetch, scheduling_pass
 from datetime import datetime, timedelta
 from django.core.cache import cache
 from rest_framework.response import Response
@@ -16,6 +18,7 @@ from django.conf import settings
 import logging
 
 from users.models import PrayerMethod
+from users.services.geocoding import timings_request
 from django.db import models, transaction
 
 User = get_user_model()
@@ -67,11 +70,40 @@ def send_activation_email(self, user_id, token, activation_link):
             return {"status": "error", "reason": "Max retries exceeded", "error": str(e)}
 
 
+# How far ahead of a user's midnight their next day is scheduled; the
+# scheduler runs hourly so each midnight falls in exactly one run's window
+MIDNIGHT_WINDOW = timedelta(hours=1)
+
+
+def advance_next_midnights(now, user_ids=None):
+    """
+    Move next_midnight_utc past now for users whose midnight passed (or was
+    never set), one UPDATE per timezone. Keeps the stored value right across
+    DST changes without re-saving users. Returns the number of users updated.
+    """
+    stale = User.objects.filter(
+        models.Q(next_midnight_utc__isnull=True) | models.Q(next_midnight_utc__lte=now)
+    )
+    if user_ids is not None:
+        stale = stale.filter(id__in=user_ids)
+    tz_names = list(stale.values_list('timezone', flat=True).distinct())
+
+    updated = 0
+    for tz_name, midnight in next_midnights_utc(tz_names, now).items():
+        updated += stale.filter(timezone=tz_name).update(
+            next_midnight_utc=midnight,
+            midnight_utc=midnight.time(),
+        )
+    return updated
+
+
 @shared_task
-def check_and_schedule_daily_tasks():
+@scheduling_pass('check_and_schedule_daily_tasks')
+def check_and_schedule_daily_tasks(user_ids=None):
     """
     Optimized version that processes users in chunks to avoid memory issues
     Now includes check for missing today's prayer times
+    Only the given users when user_ids is set (muadhin/loadtest.py)
     """
     now = timezone.now()
     today = now.date()
@@ -81,20 +113,29 @@ def check_and_schedule_daily_tasks():
     # 2. Don't have prayer times for today
     # 3. Are within their midnight window and haven't been scheduled in 23+ hours
 
+    advanced = advance_next_midnights(now, user_ids)
+    if advanced:
+        logger.info(f"Advanced next midnight for {advanced} users")
+
     # First, get users without today's prayer times
     users_with_todays_prayers = DailyPrayer.objects.filter(
         prayer_date=today
     ).values_list('user_id', flat=True).distinct()
 
     # Get all user IDs that DON'T have today's prayers or have never been scheduled
-    user_ids_needing_prayers = User.objects.exclude(
+    candidates = User.objects.all() if user_ids is None else User.objects.filter(id__in=user_ids)
+    user_ids_needing_prayers = candidates.exclude(
         id__in=users_with_todays_prayers
     ).values_list('id', flat=True)
 
-    # Also add users who haven't been scheduled in 23+ hours (for tomorrow's prayers)
+    # Also add users whose midnight is within the window and who haven't been
+    # scheduled in 23+ hours (for tomorrow's prayers), an index range scan
     cutoff_time = now - timedelta(hours=23)
-    user_ids_for_tomorrow = User.objects.filter(
-        last_scheduled_time__lt=cutoff_time
+    user_ids_for_tomorrow = candidates.filter(
+        next_midnight_utc__gt=now,
+        next_midnight_utc__lte=now + MIDNIGHT_WINDOW,
+    ).filter(
+        models.Q(last_scheduled_time__isnull=True) | models.Q(last_scheduled_time__lt=cutoff_time)
     ).values_list('id', flat=True)
 
     # Combine both sets of user IDs (unique)
@@ -111,19 +152,20 @@ def check_and_schedule_daily_tasks():
 
 
 @shared_task
+@scheduling_pass('process_user_chunk')
 def process_user_chunk(user_ids, now_iso):
     """
     Process a small chunk of users to avoid memory issues
     """
     now = datetime.fromisoformat(now_iso.replace('Z', '+00:00'))
     
-    # Only select the fields we need and use iterator for memory efficiency
+    # Only select the fields we need; a chunk is a handful of users, evaluated once
     # Removed select_related('preferences') to avoid FieldError with .only()
     users = User.objects.filter(
         id__in=user_ids
     ).only(
-        'id', 'username', 'timezone', 'last_scheduled_time', 'midnight_utc'
-    ).iterator(chunk_size=10)
+        'id', 'username', 'timezone', 'last_scheduled_time', 'next_midnight_utc'
+    )
     
     processed_count = 0
     
@@ -181,20 +223,18 @@ def should_schedule_user(user, now):
             return True
 
         # PRIORITY 3: Only check midnight window if user already has today's prayers
-        user_timezone = pytz.timezone(user.timezone)
-        user_now = now.astimezone(user_timezone)
-
-        # Calculate next midnight in user's timezone
-        next_midnight = user_now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-        next_midnight_utc = next_midnight.astimezone(pytz.utc)
+        # Next midnight in user's timezone, maintained by advance_next_midnights
+        next_midnight = user.next_midnight_utc
+        if next_midnight is None or next_midnight <= now:
+            next_midnight = next_midnight_utc(user.timezone, now)
 
         # Check if we're within 1 hour of their next midnight
-        time_to_midnight = (next_midnight_utc - now).total_seconds()
+        time_to_midnight = (next_midnight - now).total_seconds()
 
         # Only schedule if:
         # 1. We're within 1 hour of their midnight (3600 seconds)
         # 2. They haven't been scheduled in the last 23 hours
-        if 0 < time_to_midnight < 3600:
+        if 0 < time_to_midnight <= MIDNIGHT_WINDOW.total_seconds():
             last_scheduled = user.last_scheduled_time
             if (now - last_scheduled) > timedelta(hours=23):
                 return True
@@ -226,16 +266,12 @@ def fetch_and_save_daily_prayer_times(user_id, date):
                 user=user, sn=1, name='Muslim World League'
             )
 
-        api_url = "http://api.aladhan.com/v1/timingsByCity"
-        params = {
-            "date": date,
-            "city": user.city,
-            "country": user.country,
-            "method": prayer_method.sn,
-        }
+        # By the geocoded coordinates when the city resolved (users/services/geocoding.py)
+        api_url, params = timings_request(user, date, prayer_method.sn)
 
         # Use timeout to prevent hanging requests
-        response = requests.get(api_url, params=params, timeout=30)
+        with aladhan_fetch('scheduler') as fetch:
+            response = fetch.record(requests.get(api_url, params=params, timeout=30))
         
         if response.status_code == 200:
             data = response.json().get("data", {}).get("timings", {})
@@ -272,6 +308,8 @@ def fetch_and_save_daily_prayer_times(user_id, date):
                         )
                         if not created:
                             prayer_time_obj.prayer_time = parse_time(prayer_time)
+                            # bulk_update skips auto_now, conditional GETs rely on updated_at
+                            prayer_time_obj.updated_at = timezone.now()
                             prayer_times_to_update.append(prayer_time_obj)
                     except Exception as e:
                         print(f"❌ Error creating prayer time {prayer_name}: {str(e)}")
@@ -279,7 +317,10 @@ def fetch_and_save_daily_prayer_times(user_id, date):
                 
                 # Bulk update if needed
                 if prayer_times_to_update:
-                    PrayerTime.objects.bulk_update(prayer_times_to_update, ['prayer_time'])
+                    PrayerTime.objects.bulk_update(prayer_times_to_update, ['prayer_time', 'updated_at'])
+
+            # Timings changed, precompute the dashboard for this day
+            refresh_dashboard_snapshot(user, gregorian_dt.date())
                     
             # Schedule related tasks asynchronously to avoid blocking
             send_daily_prayer_message.apply_async(args=[user.id], countdown=5)
@@ -1,3 +1,902 @@
-from django.test import TestCase
+import os
+import threading
+import time
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from muadhin.cache import TieredRedisCache, get_or_set_locked, invalidate_namespace, namespaced_key
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+# Hand-picked cities in the offline dataset format, the real dataset is built into the image
+SEED_CITIES = {
+    'CITY_DATASET_PATH': os.path.join(os.path.dirname(__file__), 'fixtures', 'cities_seed.tsv'),
+    'CITY_INDEX_PATH': None,
+}
+
+
+class CountingRedisClient:
+    """Dict-backed stand-in for RedisCacheClient that counts round trips"""
+
+    def __init__(self):
+        self.data = {}
+        self.calls = 0
+
+    def get(self, key, default):
+        self.calls += 1
+        return self.data.get(key, default)
+
+    def set(self, key, value, timeout):
+        self.calls += 1
+        self.data[key] = value
+
+    def delete(self, key):
+        self.calls += 1
+        return self.data.pop(key, None) is not None
+
+
+class FakeRedisHashes:
+    """Dict-backed stand-in for the hash and pipeline commands of a redis-py client"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.threads = []
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        self.threads.append(threading.current_thread())
+        return self
+
+    def hincrby(self, key, field, amount):
+        self.commands.append(lambda: self.hashes.setdefault(key, {}).__setitem__(
+            field, self.hashes.get(key, {}).get(field, 0) + amount))
+
+    def hset(self, key, field, value):
+        self.commands.append(lambda: self.hashes.setdefault(key, {}).__setitem__(field, value))
+
+    def hget(self, key, field):
+        self.commands.append(lambda: self.hashes.get(key, {}).get(field))
+
+    def hgetall(self, key):
+        self.commands.append(lambda: {k.encode(): str(v).encode() for k, v in self.hashes.get(key, {}).items()})
+
+    def expire(self, key, seconds):
+        self.commands.append(lambda: True)
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [command() for command in commands]
+
+
+class TieredRedisCacheTests(SimpleTestCase):
+    def make_cache(self, location):
+        return TieredRedisCache(location, {'OPTIONS': {'LOCAL_TIMEOUT': 5}})
+
+    def test_hot_keys_served_from_local_tier(self):
+        tiered = self.make_cache('redis://tiered-test-1:6379/0')
+        tiered._cache = CountingRedisClient()
+
+        tiered.set('countries', ['NG', 'SA'])
+        tiered._local.clear()
+        self.assertEqual(tiered.get('countries'), ['NG', 'SA'])
+        self.assertEqual(tiered.get('countries'), ['NG', 'SA'])
+        self.assertEqual(tiered._cache.calls, 2)  # one set, one get
+
+        tiered.delete('countries')
+        self.assertIsNone(tiered.get('countries'))
+
+    def test_falls_back_to_local_tier_without_redis(self):
+        tiered = self.make_cache('redis://127.0.0.1:1/0')
+
+        tiered.set('version', 1, None)
+        self.assertEqual(tiered.incr('version'), 2)
+        self.assertEqual(tiered.get('version'), 2)
+        self.assertTrue(tiered.add('lock', 1, 30))
+        self.assertFalse(tiered.add('lock', 1, 30))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CacheHelperTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidate_namespace_moves_keys(self):
+        key = namespaced_key('location', 'countries_all_')
+        cache.set(key, ['NG'])
+        invalidate_namespace('location')
+
+        new_key = namespaced_key('location', 'countries_all_')
+        self.assertNotEqual(key, new_key)
+        self.assertIsNone(cache.get(new_key))
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return ['Lagos', 'Kano']
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_set_locked('cities_NG', compute, 60)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['Lagos', 'Kano']] * 8)
+
+
+@override_settings(**SEED_CITIES)
+class CityIndexTests(SimpleTestCase):
+    def test_prefix_search_ranked_by_population(self):
+        from users.services.city_index import get_city_index
+
+        index = get_city_index()
+        self.assertTrue(index.version)
+
+        names = [city.name for city in index.search('ka', country_code='ng', limit=3)]
+        self.assertEqual(names, ['Kano', 'Kaduna', 'Katsina'])
+        self.assertEqual(index.search('', country_code='NG', limit=1)[0].name, 'Lagos')
+
+    def test_ascii_name_matches_and_worldwide_search(self):
+        from users.services.city_index import get_city_index
+
+        index = get_city_index()
+        self.assertEqual([city.name for city in index.search('fes', country_code='MA')], ['Fès'])
+        self.assertEqual(
+            [city.name for city in index.search('me', limit=3)],
+            ['Mexico City', 'Melbourne', 'Medan']
+        )
+
+    def test_mapped_index_matches_in_memory_index(self):
+        import tempfile
+        from django.conf import settings
+        from users.services.city_index import CityIndex, read_dataset
+        from users.services.mapped_city_index import open_mapped_index
+
+        cities, version = read_dataset(settings.CITY_DATASET_PATH)
+        in_memory = CityIndex(cities, version)
+
+        with tempfile.TemporaryDirectory() as directory:
+            mapped = open_mapped_index(settings.CITY_DATASET_PATH, f"{directory}/cities.idx")
+            self.assertEqual(mapped.version, version)
+            self.assertEqual(len(mapped), len(in_memory))
+            for prefix, country_code in [('ka', 'NG'), ('', 'TR'), ('i̇z', None), ('zu', 'CH'), ('s', None), ('xyz', None)]:
+                self.assertEqual(
+                    mapped.search(prefix, country_code, limit=5),
+                    in_memory.search(prefix, country_code, limit=5)
+                )
+            for query, country_code in [('ibaden', 'NG'), ('sao', None), ('harcourt', None), ('lgos', None)]:
+                self.assertEqual(
+                    mapped.autocomplete(query, country_code),
+                    in_memory.autocomplete(query, country_code)
+                )
+
+    def test_autocomplete_folds_accents_and_tolerates_typos(self):
+        from users.services.city_index import get_city_index
+
+        index = get_city_index()
+        first = lambda query, country_code=None: index.autocomplete(query, country_code, limit=3)[0].name
+        self.assertEqual(first('Abúja'), 'Abuja')
+        self.assertEqual(first('Ṣokoto', 'NG'), 'Sokoto')
+        self.assertEqual(first('izmir'), 'İzmir')
+        self.assertEqual(first('malmo'), 'Malmö')
+        self.assertEqual(first('Ibaden', 'NG'), 'Ibadan')
+        self.assertEqual(first('harcourt'), 'Port Harcourt')
+        # Larger cities first among equally good matches
+        self.assertEqual([c.name for c in index.autocomplete('ka', 'NG', limit=2)], ['Kano', 'Kaduna'])
+
+    def test_dataset_built_from_a_geonames_dump(self):
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from users.services.city_index import get_city_index
+
+        def record(geoname_id, name, ascii_name, country, admin1, population):
+            fields = [''] * 19
+            fields[0], fields[1], fields[2], fields[4], fields[5] = geoname_id, name, ascii_name, '1.5', '2.5'
+            fields[7], fields[8], fields[10], fields[14], fields[17] = 'PPL', country, admin1, population, 'UTC'
+            return '\t'.join(fields)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(f'{directory}/cities15000.txt', 'w') as f:
+                f.write('\n'.join([
+                    record('2332459', 'Lagos', 'Lagos', 'NG', '05', '9000000'),
+                    record('2548885', 'Fès', 'Fes', 'MA', '06', '964891'),
+                    record('1', 'Hamlet', 'Hamlet', 'NG', '05', '900'),
+                ]) + '\n')
+            with open(f'{directory}/admin1CodesASCII.txt', 'w') as f:
+                f.write('NG.05\tLagos\tLagos\t2332453\n')
+
+            dataset, index = f'{directory}/data/cities.tsv', f'{directory}/data/cities.idx'
+            call_command('build_city_dataset', f'{directory}/cities15000.txt', admin1=f'{directory}/admin1CodesASCII.txt',
+                         output=dataset, index=index, dataset_version='2026.10', stdout=StringIO())
+            with self.settings(CITY_DATASET_PATH=dataset, CITY_INDEX_PATH=index):
+                built = get_city_index()
+                self.assertEqual(built.version, '2026.10')
+                self.assertEqual(len(built), 2)
+                lagos = built.search('lag', 'NG')[0]
+                self.assertEqual((lagos.geoname_id, lagos.admin1), (2332459, 'Lagos'))
+                self.assertEqual(built.autocomplete('fes', 'MA')[0].name, 'Fès')
+
+    @override_settings(CACHES=LOCMEM_CACHE, OFFLINE_CITIES_MIN_PER_COUNTRY=20)
+    def test_sparse_countries_and_search_misses_use_geonames(self):
+        from unittest import mock
+        from users.services.location_service import LocationService
+
+        cache.clear()
+        service = LocationService()
+        live = [{'name': 'Springfield', 'country_code': 'US'}]
+        with mock.patch.object(LocationService, '_fetch_cities_from_geonames', return_value=live) as fetch:
+            # 38 Nigerian cities offline, only 11 American ones
+            self.assertTrue(service.has_offline_cities('NG'))
+            self.assertFalse(service.has_offline_cities('US'))
+
+            self.assertEqual(service.get_cities_for_country('NG', 'ka', 1)[0]['name'], 'Kano')
+            fetch.assert_not_called()
+
+            self.assertEqual(service.get_cities_for_country('US', 'spring'), live)
+            self.assertEqual(service.get_cities_for_country('NG', 'zzyzx'), live)
+            self.assertEqual(service.autocomplete_cities('zzyzx', 'NG'), live)
+            self.assertEqual(fetch.call_count, 3)
+
+    def test_country_search_is_ranked_and_accent_insensitive(self):
+        from users.services.location_service import LocationService
+
+        countries = [
+            {'code': 'CI', 'name': "Côte d'Ivoire", 'population': 26000000},
+            {'code': 'NE', 'name': 'Niger', 'population': 24000000},
+            {'code': 'NG', 'name': 'Nigeria', 'population': 206000000},
+            {'code': 'DZ', 'name': 'Algeria', 'population': 44000000},
+        ]
+        search = LocationService()._search_countries
+        self.assertEqual([c['code'] for c in search(countries, 'niger')], ['NE', 'NG'])
+        self.assertEqual([c['code'] for c in search(countries, 'cote')], ['CI'])
+        self.assertEqual([c['code'] for c in search(countries, 'nigerya')], ['NG'])
+
+
+@override_settings(**SEED_CITIES)
+class GeocodingTests(SimpleTestCase):
+    def test_spellings_resolve_to_one_location_key(self):
+        from users.services.geocoding import geocode
+
+        result = geocode('ABUJA', 'NIGERIA')
+        self.assertEqual(result.location_key, 'NG/abuja')
+        self.assertEqual(result.timezone, 'Africa/Lagos')
+        self.assertAlmostEqual(result.latitude, 9.05785)
+
+        self.assertEqual(geocode('Abúja ', 'ng').location_key, 'NG/abuja')
+        self.assertEqual(geocode('Abuj', 'Nigeria').location_key, 'NG/abuja')
+        self.assertEqual(geocode('Montreal', 'Canada').city, 'Montréal')
+
+    def test_unknown_places_are_not_geocoded(self):
+        from users.services.geocoding import geocode
+
+        self.assertIsNone(geocode('Atlantis', 'Nigeria'))
+        self.assertIsNone(geocode('Abuja', 'Narnia'))
+
+    def test_prefixes_and_near_misses_of_other_cities_are_not_geocoded(self):
+        from users.services.geocoding import geocode
+
+        self.assertIsNone(geocode('York', 'USA'))
+        self.assertIsNone(geocode('Ila', 'Nigeria'))
+        self.assertIsNone(geocode('Port', 'Nigeria'))
+        self.assertEqual(geocode('Port Harcourt', 'Nigeria').location_key, 'NG/port harcourt')
+        self.assertEqual(geocode('Ibaden', 'Nigeria').city, 'Ibadan')
+
+
+@override_settings(CACHES=LOCMEM_CACHE, **SEED_CITIES)
+class TimingsRequestTests(TestCase):
+    def test_geocoded_users_are_fetched_by_coordinates(self):
+        from users.models import CustomUser
+        from users.services.geocoding import timings_request
+
+        user = CustomUser.objects.create_user('coords', 'coords@example.com', 'pw', city='Abúja', country='Nigeria')
+        url, params = timings_request(user, '19-10-2026', 3)
+        self.assertTrue(url.endswith('/timings/19-10-2026'))
+        self.assertEqual((params['latitude'][:4], params['longitude'][:4], params['method']), ('9.05', '7.49', 3))
+
+        # Stale coordinates of a city the user moved away from are not used
+        user.city = 'Atlantis'
+        user.save()
+        url, params = timings_request(user, '19-10-2026', 3)
+        self.assertTrue(url.endswith('/timingsByCity'))
+        self.assertEqual((params['city'], params['date']), ('Atlantis', '19-10-2026'))
+
+    def test_daily_fetch_uses_the_coordinates(self):
+        from unittest import mock
+
+        from muadhin.loadtest import FakeAladhanServer
+        from SalatTracker.models import DailyPrayer
+        from SalatTracker.tasks import fetch_and_save_daily_prayer_times
+        from users.models import CustomUser
+
+        user = CustomUser.objects.create_user('fetch', 'fetch@example.com', 'pw', city='Kano', country='NG')
+        with FakeAladhanServer() as aladhan, self.settings(ALADHAN_API_URL=aladhan.url), \
+                mock.patch('SalatTracker.tasks.send_daily_prayer_message.delay'), \
+                mock.patch('SalatTracker.tasks.schedule_notifications_for_day.delay'), \
+                mock.patch('SalatTracker.tasks.schedule_phone_calls_for_day.delay'):
+            result = fetch_and_save_daily_prayer_times(user.id, '19-10-2026')
+            self.assertEqual(aladhan.requests, 1)
+        self.assertEqual(result['status'], 'success')
+        day = DailyPrayer.objects.get(user=user)
+        self.assertEqual((str(day.prayer_date), day.weekday_name), ('2026-10-19', 'Monday'))
+        self.assertTrue(day.prayer_times.exists())
+
+
+class TimezoneCatalogTests(SimpleTestCase):
+    def test_offsets_and_expiry_at_next_dst_transition(self):
+        from datetime import datetime
+        import pytz
+        from users.services.timezone_catalog import build_catalog
+
+        # The day before Europe's spring-forward (2024-03-31 01:00 UTC)
+        catalog = build_catalog(datetime(2024, 3, 30, 12, 0, tzinfo=pytz.utc))
+        self.assertEqual(catalog.zones['Asia/Kolkata'].utc_offset, '+05:30')
+        self.assertFalse(catalog.zones['Europe/London'].is_dst)
+        self.assertEqual(catalog.zones['Europe/London'].label, 'London (Europe) - UTC+00:00')
+        self.assertLessEqual(catalog.valid_until, datetime(2024, 3, 31, 1, 0, tzinfo=pytz.utc))
+
+        after = build_catalog(datetime(2024, 3, 31, 2, 0, tzinfo=pytz.utc))
+        self.assertTrue(after.zones['Europe/London'].is_dst)
+        self.assertEqual(after.zones['Europe/London'].utc_offset, '+01:00')
+
+    def test_pre_serialized_body_with_etag_and_gzip(self):
+        import gzip
+        import json
+        from rest_framework.test import APIRequestFactory
+        from users.api_views import TimezonesAPIView
+
+        factory = APIRequestFactory()
+        view = TimezonesAPIView.as_view()
+
+        response = view(factory.get('/api/users/timezones/', {'filter': 'continent', 'continent': 'Africa'},
+                                    HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(data['filter_applied'], 'continent')
+        self.assertIn('Africa/Lagos', [tz['value'] for tz in data['timezones']])
+        self.assertEqual(data['total_count'], len(data['timezones']))
+
+        not_modified = view(factory.get('/api/users/timezones/', {'filter': 'continent', 'continent': 'Africa'},
+                                        HTTP_IF_NONE_MATCH=response['ETag']))
+        self.assertEqual(not_modified.status_code, 304)
+
+
+class TimezoneHelperTests(SimpleTestCase):
+    def test_next_midnight_across_dst_change(self):
+        from datetime import datetime, timezone as dt_timezone
+        from muadhin.timezones import next_midnight_utc, next_midnights_utc
+
+        # Europe springs forward on 2024-03-31, the next midnight is still at UTC+0
+        now = datetime(2024, 3, 30, 12, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(next_midnight_utc('Europe/London', now), datetime(2024, 3, 31, 0, 0, tzinfo=dt_timezone.utc))
+        # ...and the one after at UTC+1
+        now = datetime(2024, 3, 31, 12, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(next_midnight_utc('Europe/London', now), datetime(2024, 3, 31, 23, 0, tzinfo=dt_timezone.utc))
+
+        midnights = next_midnights_utc(['Africa/Lagos', 'Asia/Kolkata', 'Africa/Lagos', 'Not/AZone'], now)
+        self.assertEqual(len(midnights), 3)
+        self.assertEqual(midnights['Asia/Kolkata'], datetime(2024, 3, 31, 18, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(midnights['Not/AZone'], midnights['Africa/Lagos'])
+
+    def test_next_midnight_falls_back_when_not_advanced(self):
+        from datetime import datetime, timedelta, timezone as dt_timezone
+        from users.models import CustomUser
+
+        user = CustomUser(timezone='Asia/Kolkata', next_midnight_utc=datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+        now = datetime.now(dt_timezone.utc)
+        self.assertTrue(now < user.next_midnight + timedelta(minutes=5) <= now + timedelta(days=1))
+        self.assertEqual((user.next_midnight + timedelta(minutes=5)).strftime('%H:%M'), '00:00')
+
+    def test_localize_matches_pytz(self):
+        from datetime import datetime
+        import pytz
+        from muadhin.timezones import localize
+
+        for tz_name in ['Africa/Lagos', 'America/New_York', 'Asia/Tehran']:
+            for naive in [datetime(2024, 1, 15, 5, 30), datetime(2024, 7, 15, 19, 45)]:
+                self.assertEqual(localize(naive, tz_name), pytz.timezone(tz_name).localize(naive))
+
+    def test_localize_across_dst_changes(self):
+        from datetime import datetime, timezone as dt_timezone
+        from muadhin.timezones import localize
+
+        utc = lambda naive: localize(naive, 'America/New_York').astimezone(dt_timezone.utc)
+        # 01:30 happens twice on 2024-11-03, the first (EDT, UTC-4) occurrence is used
+        self.assertEqual(utc(datetime(2024, 11, 3, 1, 30)), datetime(2024, 11, 3, 5, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(utc(datetime(2024, 11, 3, 2, 30)), datetime(2024, 11, 3, 7, 30, tzinfo=dt_timezone.utc))
+        # 02:30 is skipped on 2024-03-10 and read with the offset before the change (EST, UTC-5)
+        self.assertEqual(utc(datetime(2024, 3, 10, 2, 30)), datetime(2024, 3, 10, 7, 30, tzinfo=dt_timezone.utc))
+
+
+class QueueTopologyTests(SimpleTestCase):
+    def test_adhan_delivery_is_routed_apart_from_ingest(self):
+        from muadhin.celery import app
+
+        router = app.amqp.router
+        queue = lambda name: router.route({}, name)['queue'].name
+        self.assertEqual(queue('SalatTracker.tasks.make_call_and_play_audio'), 'adhan')
+        self.assertEqual(queue('SalatTracker.tasks.send_pre_adhan_notification'), 'adhan')
+        self.assertEqual(queue('users.tasks.fetch_and_save_daily_prayer_times'), 'ingest')
+        self.assertEqual(queue('subscriptions.tasks.check_and_expire_subscriptions'), 'housekeeping')
+        self.assertEqual(queue('some.unrouted.task'), 'celery')
+
+    def test_worker_containers_fit_their_children(self):
+        import yaml
+        from django.conf import settings
+        from muadhin.celery import QUEUE_WORKERS, WORKER_CHILD_MAX_MEMORY_KB, app
+
+        self.assertEqual(app.conf.worker_max_memory_per_child, WORKER_CHILD_MAX_MEMORY_KB)
+        with open(os.path.join(settings.BASE_DIR, 'docker-compose.prod.yml')) as f:
+            services = yaml.safe_load(f)['services']
+        for queue, worker in QUEUE_WORKERS.items():
+            service = 'celery' if queue == 'celery' else f'celery-{queue}'
+            limit = services[service]['deploy']['resources']['limits']['memory']
+            self.assertTrue(limit.endswith('M'), service)
+            # Every child at its recycle point plus the main process
+            needed_kb = (worker['concurrency'] + 1) * WORKER_CHILD_MAX_MEMORY_KB
+            self.assertGreaterEqual(int(limit[:-1]) * 1024, needed_kb, service)
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_lag_measured_from_eta(self):
+        from types import SimpleNamespace
+        from muadhin import queue_metrics
+
+        request = SimpleNamespace(published_at=1000.0, eta='1970-01-01T00:20:00+00:00',
+                                  delivery_info={'routing_key': 'adhan'})
+        self.assertEqual(queue_metrics.task_lag_seconds(request, now=1201.5), 1.5)
+        self.assertEqual(queue_metrics.task_queue(request), 'adhan')
+
+        queue_metrics.reset_local()
+        for lag in [0.01, 0.02, 0.03, 0.2, 4.0]:
+            queue_metrics.record_lag('adhan', lag)
+        stats = queue_metrics.lag_summary('adhan').as_dict()
+        self.assertEqual(stats['count'], 5)
+        self.assertEqual(stats['p50_ms'], 50)
+        self.assertEqual(stats['max_ms'], 4000)
+
+    def test_lag_written_to_redis_off_the_task_thread(self):
+        from unittest import mock
+        from muadhin import queue_metrics
+
+        client = FakeRedisHashes()
+        with mock.patch('muadhin.cache.redis_client', return_value=client):
+            for lag in [0.01, 0.2, 4.0]:
+                queue_metrics.record_lag('ingest', lag, now=600.0)
+            queue_metrics.flush()
+
+            self.assertNotIn(threading.current_thread(), client.threads)
+            stats = queue_metrics.lag_summary('ingest', minutes=1, now=600.0).as_dict()
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['max_ms'], 4000)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_aladhan_errors_counted_by_status(self):
+        from types import SimpleNamespace
+        from muadhin.metrics import ALADHAN_FETCH_ERRORS, aladhan_fetch
+
+        errors = ALADHAN_FETCH_ERRORS.labels('test', 'http_500')
+        before = errors._value.get()
+        with aladhan_fetch('test') as fetch:
+            fetch.record(SimpleNamespace(status_code=500))
+        with aladhan_fetch('test') as fetch:
+            fetch.record(SimpleNamespace(status_code=200))
+        self.assertEqual(errors._value.get(), before + 1)
+
+    @override_settings(METRICS_AUTH_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        for name in ('muadhin_delivery_lag_seconds', 'muadhin_provider_request_seconds',
+                     'muadhin_scheduling_pass_seconds', 'muadhin_cache_requests_total'):
+            self.assertIn(name, body)
+
+    def test_metrics_closed_without_a_token_unless_debug(self):
+        with override_settings(METRICS_AUTH_TOKEN='', DEBUG=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_AUTH_TOKEN='', DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class LoadTestHarnessTests(SimpleTestCase):
+    def test_fake_aladhan_server(self):
+        import requests
+        from muadhin.loadtest import FakeAladhanServer
+
+        with FakeAladhanServer() as aladhan:
+            response = requests.get(f"{aladhan.url}/timingsByCity", params={'date': '19-10-2026', 'city': 'Lagos'})
+        data = response.json()['data']
+        self.assertEqual(data['date']['gregorian'], {'date': '19-10-2026', 'weekday': {'en': 'Monday'}})
+        self.assertRegex(data['timings']['Fajr'], r'^\d\d:\d\d$')
+        self.assertEqual(aladhan.requests, 1)
+
+    def test_simulated_clock_skips_fake_latency(self):
+        from datetime import datetime, timezone
+        from muadhin.loadtest import SimulatedClock
+
+        clock = SimulatedClock(datetime(2026, 10, 19, tzinfo=timezone.utc))
+        clock.advance(90)
+        self.assertGreaterEqual((clock.now() - datetime(2026, 10, 19, tzinfo=timezone.utc)).total_seconds(), 90)
+        self.assertLess((clock.now() - datetime(2026, 10, 19, tzinfo=timezone.utc)).total_seconds(), 91)
+
+    def test_beat_times_for_crontab_and_interval_entries(self):
+        from datetime import datetime, timedelta, timezone
+        from celery.schedules import crontab, schedule
+        from muadhin.celery import app
+        from muadhin.loadtest import beat_times
+
+        start = datetime(2026, 10, 19, tzinfo=timezone.utc)
+        end = start + timedelta(hours=1)
+        self.assertEqual(len(list(beat_times(crontab(minute='*/10'), start, end))), 6)
+        self.assertEqual(list(beat_times(crontab(minute=0, hour=3), start, end)), [])
+        for interval in (5.0, timedelta(seconds=5), schedule(timedelta(seconds=5))):
+            times = list(beat_times(interval, start, end))
+            self.assertEqual(len(times), 720)
+            self.assertEqual(times[1] - times[0], timedelta(seconds=5))
+        for entry in app.conf.beat_schedule.values():
+            self.assertTrue(list(beat_times(entry['schedule'], start, start + timedelta(days=1))))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class LoadTestRunTests(TestCase):
+    def test_run_load_test_smoke(self):
+        from datetime import datetime, timezone
+        from django.contrib.auth import get_user_model
+        from muadhin.loadtest import PREFIX, LoadTestConfig, run_load_test
+
+        report = run_load_test(LoadTestConfig(
+            users=2, hours=1, day=datetime(2026, 10, 19, tzinfo=timezone.utc),
+            provider_latency_ms=0, email_latency_ms=0, aladhan_latency_ms=0,
+        ))
+        self.assertEqual(report.users, 2)
+        self.assertIn('users.tasks.check_and_schedule_daily_tasks', report.tasks)
+        # Housekeeping beat entries touch every row and are not replayed
+        self.assertNotIn('communications.tasks.ingest_webhook_events', report.tasks)
+        self.assertNotIn('subscriptions.tasks.check_and_expire_subscriptions', report.tasks)
+        for name, stats in report.tasks.items():
+            self.assertNotIn('exception', stats.statuses, name)
+        self.assertFalse(get_user_model().objects.filter(username__startswith=PREFIX).exists())
+
+    def test_refuses_a_database_with_real_users(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from SalatTracker.models import DailyPrayer
+        from users.models import CustomUser
+
+        CustomUser.objects.create_user('real', 'real@example.com', 'pw', city='Lagos', country='Nigeria')
+        with self.assertRaisesMessage(CommandError, '1 users that are not load test users'):
+            call_command('loadtest_day', '--users', '2', '--hours', '1', stdout=StringIO())
+        self.assertEqual(CustomUser.objects.count(), 1)
+        self.assertFalse(DailyPrayer.objects.exists())
+
+    def test_scheduler_scoped_to_user_ids(self):
+        from unittest import mock
+        from users.models import CustomUser
+        from users.tasks import check_and_schedule_daily_tasks
+
+        seeded = CustomUser.objects.create_user('loadtest-0', 'lt@example.com', 'pw')
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'pw')
+        CustomUser.objects.update(next_midnight_utc=None)
+        with mock.patch('users.tasks.process_user_chunk.delay') as chunk:
+            check_and_schedule_daily_tasks(user_ids=[seeded.id])
+        self.assertEqual([call.args[0] for call in chunk.call_args_list], [[seeded.id]])
+        other.refresh_from_db()
+        self.assertIsNone(other.next_midnight_utc)
+
+
+class TaskProfilerTests(SimpleTestCase):
+    def test_counts_queries_and_http(self):
+        import requests
+        from muadhin.loadtest import FakeAladhanServer
+        from muadhin.task_profiler import _count_query, profile
+
+        with FakeAladhanServer() as aladhan, profile() as outer:
+            with profile() as inner:
+                _count_query(lambda *args: None, 'SELECT 1', (), False, {})
+                requests.get(f"{aladhan.url}/timingsByCity", params={'date': '19-10-2026'})
+            requests.get(f"{aladhan.url}/timingsByCity", params={'date': '20-10-2026'})
+
+        self.assertEqual((inner.queries, inner.http_calls), (1, 1))
+        self.assertEqual((outer.queries, outer.http_calls), (1, 2))
+        self.assertEqual(inner.sql, ['SELECT 1'])
+        self.assertGreater(outer.wall_ms, 0)
+
+    def test_assert_task_budget(self):
+        from muadhin.celery import app
+        from muadhin.task_profiler import _count_query, assert_task_budget
+
+        @app.task(name='tests.three_queries')
+        def three_queries():
+            for _ in range(3):
+                _count_query(lambda *args: None, 'SELECT 1', (), False, {})
+
+        self.assertEqual(assert_task_budget(three_queries, max_queries=3).queries, 3)
+        with self.assertRaisesMessage(AssertionError, 'queries 3 > 2'):
+            assert_task_budget(three_queries, max_queries=2)
+
+    @override_settings(TASK_PROFILING=True)
+    def test_signals_record_local_samples(self):
+        from muadhin.celery import app
+        from muadhin import task_profiler
+
+        @app.task(name='tests.profiled')
+        def profiled():
+            return 'ok'
+
+        task_profiler.reset_local()
+        profiled.apply()
+        profiled.apply()
+        summary = task_profiler._local_summary()['tests.profiled']
+        self.assertEqual(summary.count, 2)
+        self.assertEqual(summary.maxima['queries'], 0)
+
+
+class RequestProfilingTests(SimpleTestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_slow_requests_saved_with_profile(self):
+        from muadhin.request_profiling import profile_path, slow_requests
+
+        with self.settings(REQUEST_PROFILE_DIR=self.directory, REQUEST_SLOW_MS=0, REQUEST_PROFILE_SAMPLE_RATE=1):
+            self.assertEqual(self.client.get('/healthz/').status_code, 200)
+            entries = slow_requests()
+
+        self.assertEqual(len(entries), 1)
+        entry = entries[0]
+        self.assertEqual((entry['view'], entry['status'], entry['queries']), ('healthz', 200, 0))
+        self.assertIn('function calls', entry['stats'])
+        with self.settings(REQUEST_PROFILE_DIR=self.directory):
+            self.assertIsNotNone(profile_path(entry['id']))
+            self.assertIsNone(profile_path('../' + entry['id']))
+
+    def test_ring_buffer_keeps_newest(self):
+        import os
+        from muadhin.request_profiling import save_slow_request, slow_requests
+
+        with self.settings(REQUEST_PROFILE_DIR=self.directory, REQUEST_PROFILE_MAX=3):
+            for wall_ms in (900, 800, 700, 600, 500):
+                save_slow_request({'view': 'v', 'wall_ms': wall_ms})
+            self.assertEqual([entry['wall_ms'] for entry in slow_requests()], [700, 600, 500])
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+
+    def test_streamed_content_is_measured(self):
+        from django.http import StreamingHttpResponse
+        from django.test import RequestFactory
+        from muadhin.request_profiling import RequestPerformanceMiddleware, slow_requests
+        from muadhin.task_profiler import _count_query
+
+        def days():
+            time.sleep(0.05)
+            _count_query(lambda *args: None, 'SELECT 1', (), False, {})
+            yield b'{"date": "2024-03-01"}\n'
+
+        middleware = RequestPerformanceMiddleware(lambda request: StreamingHttpResponse(days()))
+        with self.settings(REQUEST_PROFILE_DIR=self.directory, REQUEST_SLOW_MS=40):
+            response = middleware(RequestFactory().get('/api/prayers/calendar/'))
+            self.assertEqual(slow_requests(), [])
+
+            self.assertEqual(b''.join(response.streaming_content), b'{"date": "2024-03-01"}\n')
+            entries = slow_requests()
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['queries'], 1)
+        self.assertGreaterEqual(entries[0]['wall_ms'], 50)
+
+    def test_fast_requests_not_saved(self):
+        from muadhin.request_profiling import slow_requests
+
+        with self.settings(REQUEST_PROFILE_DIR=self.directory, REQUEST_SLOW_MS=60000):
+            self.client.get('/healthz/')
+            self.assertEqual(slow_requests(), [])
+
+
+class PartitioningTests(SimpleTestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_month_arithmetic(self):
+        from datetime import datetime, timedelta, timezone as dt_timezone
+        from muadhin.partitioning import add_months, month_start, partition_name
+
+        # 01:30 on Feb 1 in UTC+3 is still January in UTC
+        local = datetime(2026, 2, 1, 1, 30, tzinfo=dt_timezone(timedelta(hours=3)))
+        month = month_start(local)
+        self.assertEqual(month, datetime(2026, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(add_months(month, 11), datetime(2026, 12, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(add_months(month, 12), datetime(2027, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(add_months(month, -13), datetime(2024, 12, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partition_name('communications_communicationlog', month), 'communications_communicationlog_p202601')
+
+    def test_archive_files_never_overwritten(self):
+        import csv
+        import gzip
+        from datetime import datetime, timezone as dt_timezone
+        from muadhin.partitioning import archive_path, write_csv_archive
+
+        month = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+        with self.settings(LOG_ARCHIVE_DIR=self.directory):
+            first = archive_path('t', month)
+            self.assertEqual(write_csv_archive(first, ['id', 'note'], [(1, 'a,b'), (2, 'line\nbreak')]), 2)
+            second = archive_path('t', month)
+
+        self.assertTrue(first.endswith('/t/2025-03.csv.gz'))
+        self.assertTrue(second.endswith('/t/2025-03.1.csv.gz'))
+        with gzip.open(first, 'rt', newline='') as f:
+            self.assertEqual(list(csv.reader(f)), [['id', 'note'], ['1', 'a,b'], ['2', 'line\nbreak']])
+
+    def test_archiving_needs_persistent_storage(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from muadhin.partitioning import archive_dir_is_persistent, require_persistent_archive
+
+        with self.settings(LOG_ARCHIVE_DIR=self.directory, LOG_ARCHIVE_PERSISTENT=False):
+            self.assertFalse(archive_dir_is_persistent())
+            with self.assertRaises(ImproperlyConfigured):
+                require_persistent_archive()
+        with self.settings(LOG_ARCHIVE_DIR=self.directory, LOG_ARCHIVE_PERSISTENT=True):
+            self.assertTrue(archive_dir_is_persistent())
+        # A mount point counts without the setting
+        with self.settings(LOG_ARCHIVE_DIR='/', LOG_ARCHIVE_PERSISTENT=False):
+            self.assertTrue(archive_dir_is_persistent())
+
+
+class LogRetentionTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+        from users.models import CustomUser
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.user = CustomUser.objects.create_user('retention', 'retention@example.com', 'pw')
+
+    def log(self, created_at):
+        from communications.models import CommunicationLog
+
+        log = CommunicationLog.objects.create(
+            user=self.user, communication_type='sms', provider_name='twilio', recipient='hash', success=True,
+        )
+        # created_at is auto_now_add
+        CommunicationLog.objects.filter(id=log.id).update(created_at=created_at)
+        return log
+
+    def test_plain_tables_archive_old_months_only_to_persistent_storage(self):
+        import csv
+        import gzip
+        from datetime import datetime, timezone as dt_timezone
+        from django.core.exceptions import ImproperlyConfigured
+        from communications.models import CommunicationLog
+        from muadhin.partitioning import apply_retention
+
+        now = datetime(2026, 10, 19, tzinfo=dt_timezone.utc)
+        old = self.log(datetime(2025, 8, 31, 23, tzinfo=dt_timezone.utc))
+        kept = self.log(datetime(2025, 9, 1, tzinfo=dt_timezone.utc))
+
+        with self.settings(LOG_ARCHIVE_DIR=self.directory, LOG_ARCHIVE_PERSISTENT=False, LOG_RETENTION_ACTION='archive'):
+            with self.assertRaises(ImproperlyConfigured):
+                apply_retention(now=now)
+        self.assertEqual(CommunicationLog.objects.count(), 2)
+
+        with self.settings(LOG_ARCHIVE_DIR=self.directory, LOG_ARCHIVE_PERSISTENT=True, LOG_RETENTION_ACTION='archive'):
+            actions = apply_retention(now=now)
+        self.assertEqual([(a.table, a.month.date().isoformat(), a.rows) for a in actions],
+                         [('communications_communicationlog', '2025-08-01', 1)])
+        self.assertEqual(list(CommunicationLog.objects.values_list('id', flat=True)), [kept.id])
+        with gzip.open(actions[0].archive_path, 'rt', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[1][rows[0].index('id')], str(old.id))
+
+        # Dropping doesn't write anything, so it needs no archive directory
+        self.log(datetime(2025, 1, 5, tzinfo=dt_timezone.utc))
+        with self.settings(LOG_ARCHIVE_DIR=self.directory, LOG_ARCHIVE_PERSISTENT=False, LOG_RETENTION_ACTION='drop'):
+            self.assertEqual(len(apply_retention(now=now)), 1)
+        self.assertEqual(CommunicationLog.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs DATABASE_URL pointing at PostgreSQL')
+class PostgresPartitioningTests(TransactionTestCase):
+    """partition_logs --convert/--revert and retention against a real server"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.core.management import call_command
+        from users.models import CustomUser
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(call_command, 'partition_logs', '--revert', stdout=open(os.devnull, 'w'))
+        self.user = CustomUser.objects.create_user('partitions', 'partitions@example.com', 'pw')
+
+    def log(self, created_at=None):
+        from communications.models import CommunicationLog
+
+        log = CommunicationLog.objects.create(
+            user=self.user, communication_type='sms', provider_name='twilio', recipient='hash', success=True,
+        )
+        if created_at:
+            CommunicationLog.objects.filter(id=log.id).update(created_at=created_at)
+        return log
+
+    def primary_key(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'",
+                [table],
+            )
+            return cursor.fetchone()[0]
+
+    def test_convert_expire_and_revert(self):
+        import csv
+        import gzip
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from communications.models import CommunicationLog
+        from subscriptions.models import NotificationUsage
+        from muadhin import partitioning
+        from muadhin.partitioning import add_months, month_start
+
+        table = 'communications_communicationlog'
+        current = month_start(timezone.now())
+        old = self.log(add_months(current, -15))
+        kept = [self.log(add_months(current, -2)).id, self.log().id]
+        NotificationUsage.objects.create(user=self.user, notification_type='sms')
+
+        out = StringIO()
+        call_command('partition_logs', '--convert', stdout=out)
+        self.assertIn(f'Partitioned {table}', out.getvalue())
+        self.assertTrue(partitioning.is_partitioned(table))
+        self.assertTrue(partitioning.is_partitioned('subscriptions_notificationusage'))
+        self.assertEqual(self.primary_key(table), 'PRIMARY KEY (id, created_at)')
+        months = partitioning.partition_months(table)
+        self.assertEqual((months[0], months[-1]), (add_months(current, -15), add_months(current, 3)))
+        self.assertEqual(CommunicationLog.objects.count(), 3)
+
+        # The id sequence carries on and the month's partition takes the row
+        new = self.log()
+        self.assertGreater(new.id, max(kept))
+        kept.append(new.id)
+        self.assertEqual(partitioning.ensure_partitions(now=add_months(current, 1)),
+                         [partitioning.partition_name(table, add_months(current, 4)),
+                          partitioning.partition_name('subscriptions_notificationusage', add_months(current, 4))])
+
+        with self.settings(LOG_ARCHIVE_DIR=self.directory, LOG_ARCHIVE_PERSISTENT=True, LOG_RETENTION_ACTION='archive'):
+            actions = partitioning.apply_retention()
+        # The empty month after it goes too
+        self.assertEqual([(a.table, a.month, a.rows) for a in actions],
+                         [(table, add_months(current, -15), 1), (table, add_months(current, -14), 0)])
+        self.assertEqual(partitioning.partition_months(table)[0], add_months(current, -13))
+        self.assertEqual(sorted(CommunicationLog.objects.values_list('id', flat=True)), kept)
+        with gzip.open(actions[0].archive_path, 'rt', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[1][rows[0].index('id')], str(old.id))
+
+        call_command('partition_logs', '--revert', stdout=StringIO())
+        self.assertFalse(partitioning.is_partitioned(table))
+        self.assertEqual(self.primary_key(table), 'PRIMARY KEY (id)')
+        self.assertEqual(sorted(CommunicationLog.objects.values_list('id', flat=True)), kept)
+        self.assertGreater(self.log().id, max(kept))
+        self.assertEqual(NotificationUsage.objects.count(), 1)